@@ -9,6 +9,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 import redis
 from config.settings import Config
 
@@ -16,6 +18,12 @@ from config.settings import Config
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
+# 限额只由准入控制装饰器按接口声明（见 app.api.common.admission），不设全局默认限额。
+# 限流器是全局实例，同一进程中后台任务应用的 init_app 会替换计数存储，因此计数策略和
+# 行为选项固定在构造参数中：按滑动窗口计数，被限流的响应始终带 Retry-After 等响应头，
+# 存储不可用时回退到进程内计数
+limiter = Limiter(key_func=get_remote_address, strategy='moving-window', headers_enabled=True,
+                  swallow_errors=True, in_memory_fallback_enabled=True)
 redis_client = None
 
 
@@ -38,7 +46,9 @@ def create_app(config_class=Config):
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
-    CORS(app)
+    limiter.init_app(app)
+    # 跨域时前端需要读取限流响应的 Retry-After
+    CORS(app, expose_headers=['Retry-After'])
 
     # 初始化Redis客户端
     try:
@@ -181,6 +191,28 @@ def register_cli_commands(app):
         else:
             print("操作已取消")
 
+    @app.cli.command()
+    def index_cases():
+        """重建已解决案例的相似案例索引"""
+        from app.services.retrieval.case_index import rebuild_case_index
+
+        try:
+            indexed = rebuild_case_index()
+            print(f"✅ 已索引 {indexed} 个已解决案例")
+        except Exception as e:
+            print(f"❌ 重建案例索引失败: {str(e)}")
+
+    @app.cli.command()
+    def purge_checkpoints():
+        """清理过期的工作流步骤检查点"""
+        from app.services.ai.workflow_checkpoint import purge_expired_checkpoints
+
+        try:
+            removed = purge_expired_checkpoints()
+            print(f"✅ 已清理 {removed} 个过期的工作流检查点")
+        except Exception as e:
+            print(f"❌ 清理工作流检查点失败: {str(e)}")
+
 
 # 导入模型以确保它们被SQLAlchemy识别
 # 这些导入是必要的，即使看起来未使用，它们确保模型被正确注册
@@ -0,0 +1,119 @@
+"""
+准入控制
+
+调用大模型的接口单次耗时数十秒到数分钟，突发请求会让任务队列无限增长，用户长时间
+等待处于 PROCESSING 的节点。准入控制在请求进入时拒绝超出容量的工作：
+
+- 每用户和全局限额：基于 Flask-Limiter，计数保存在 Redis 中，多个Web进程共享；
+  调用大模型的接口（llm）与普通接口（cheap）使用独立的限额
+- 队列积压拒绝：请求会向交互车道提交任务时，车道排队数达到 ADMISSION_MAX_QUEUED
+  直接返回429，Retry-After 按当前积压和平均执行时长估算，已排队的任务不受影响
+
+被拒绝的请求返回统一的错误格式和 Retry-After 响应头，前端据此提示用户稍后重试。
+"""
+
+import math
+from functools import wraps
+from typing import Callable, Optional
+
+from flask import current_app
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_limiter.util import get_remote_address
+
+from app import limiter
+from app.utils.response_helper import rate_limit_error
+
+LLM_BUDGET = 'llm'
+CHEAP_BUDGET = 'cheap'
+
+_BUDGET_CONFIG = {
+    LLM_BUDGET: ('ADMISSION_LLM_USER_LIMIT', '10 per minute;60 per hour',
+                 'ADMISSION_LLM_GLOBAL_LIMIT', '120 per minute'),
+    CHEAP_BUDGET: ('ADMISSION_CHEAP_USER_LIMIT', '60 per minute',
+                   'ADMISSION_CHEAP_GLOBAL_LIMIT', '600 per minute'),
+}
+
+
+def user_key() -> str:
+    """限流键：已登录用户按用户ID，否则按客户端地址"""
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f'user:{identity}' if identity is not None else f'ip:{get_remote_address()}'
+
+
+def _global_key() -> str:
+    return 'all'
+
+
+def _config_limit(key: str, default: str) -> Callable[[], str]:
+    return lambda: current_app.config.get(key) or default
+
+
+def estimate_retry_after(queue, lane: str) -> int:
+    """
+    按车道积压估算客户端应等待的秒数
+
+    积压任务数除以车道线程数得到排在最后的任务需要等待的轮数，乘以该车道任务的平均执行时长。
+    没有执行时长统计时使用 ADMISSION_RETRY_AFTER_SECONDS。
+    """
+    default = current_app.config.get('ADMISSION_RETRY_AFTER_SECONDS', 30)
+    stats = queue.lane_stats().get(lane, {})
+    runs = [item['run_seconds'] for item in queue.metrics.snapshot() if item['lane'] == lane]
+    count = sum(run['count'] for run in runs)
+    if not count:
+        return default
+
+    average = sum(run['sum'] for run in runs) / count
+    rounds = math.ceil(stats.get('queued', 0) / max(stats.get('workers', 1), 1))
+    return int(min(max(rounds * average, 1), 600))
+
+
+def lane_backlog_retry_after(lane: str) -> Optional[int]:
+    """车道积压达到 ADMISSION_MAX_QUEUED 时返回建议的重试秒数，否则返回None"""
+    from app.services.infrastructure.task_queue import get_task_queue
+
+    queue = get_task_queue()
+    queued = queue.lane_stats().get(lane, {}).get('queued', 0)
+    if queued < current_app.config.get('ADMISSION_MAX_QUEUED', 20):
+        return None
+    current_app.logger.warning(f"任务车道 {lane} 积压 {queued} 个任务，拒绝新的请求")
+    return estimate_retry_after(queue, lane)
+
+
+def admission_control(budget: str, lane: Optional[str] = None):
+    """
+    准入控制装饰器，放在 jwt_required 之后（内层）以便按用户计数
+
+    Args:
+        budget: 限额类别，LLM_BUDGET 或 CHEAP_BUDGET
+        lane: 接口会向该任务车道提交任务时传入，车道积压过多时拒绝请求
+
+    用法:
+        @bp.route('/cases', methods=['POST'])
+        @jwt_required()
+        @admission_control(LLM_BUDGET, lane=INTERACTIVE_LANE)
+        def create_case():
+            ...
+    """
+    user_limit_key, user_default, global_limit_key, global_default = _BUDGET_CONFIG[budget]
+
+    def decorator(func):
+        limited = limiter.limit(_config_limit(user_limit_key, user_default), key_func=user_key)(func)
+        limited = limiter.shared_limit(_config_limit(global_limit_key, global_default),
+                                       scope=f'{budget}-global', key_func=_global_key)(limited)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # 先检查积压再计数：被拒绝的请求不消耗用户的限额
+            if lane is not None:
+                retry_after = lane_backlog_retry_after(lane)
+                if retry_after is not None:
+                    response, code = rate_limit_error('当前分析请求较多，请稍后重试')
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, code
+            return limited(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -7,7 +7,7 @@ API装饰器
 from functools import wraps
 from flask import jsonify, current_app
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-from app import db
+from app import db, limiter
 import logging
 
 logger = logging.getLogger(__name__)
@@ -65,11 +65,5 @@ def rate_limit(requests_per_minute: int = 60):
     Args:
         requests_per_minute: 每分钟允许的请求数
     """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # 这里可以实现基于Redis的速率限制
-            # 简化实现，实际项目中应该使用Flask-Limiter
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
+    from app.api.common.admission import user_key
+    return limiter.limit(f'{requests_per_minute} per minute', key_func=user_key)
@@ -0,0 +1,101 @@
+"""
+请求幂等
+
+新建案例和多轮交互每次都会创建新的节点，任务队列按 (案例, 节点) 去重识别不了客户端的重复提交
+（双击、超时后重试）。幂等控制在创建任何数据之前，按客户端重发时不变的键识别重复请求：
+
+- 请求带有 Idempotency-Key 头时以用户、接口路径和该值为键，保留 IDEMPOTENCY_KEY_TTL 秒
+- 未带时以用户、接口路径和请求体的摘要为键，只在 IDEMPOTENCY_WINDOW_SECONDS 内有效，
+  用户过后有意重复提问不受影响
+- 首个请求成功后保存其响应，重复请求直接返回保存的响应（带 Idempotent-Replayed 响应头）；
+  首个请求仍在处理时返回409；首个请求失败时释放键，客户端可以重试
+
+键保存在缓存服务中（Redis，多个Web进程共享；不可用时为进程内缓存）。
+"""
+
+import hashlib
+from functools import wraps
+from typing import Optional
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+
+from app.utils.response_helper import conflict_error
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_PREFIX = 'idempotency'
+
+# 处理中的占位保留时长（秒）：处理请求的进程异常退出时，键在此之后自动释放
+_PENDING_SECONDS = 120
+
+
+def _request_key(scope: str) -> Optional[tuple]:
+    """返回 (缓存键, 保留秒数)；保留秒数为0时不做幂等控制，返回None"""
+    config = current_app.config
+    client_key = request.headers.get(IDEMPOTENCY_HEADER)
+    if client_key:
+        material = f'{get_jwt_identity()}:{request.path}:key:{client_key}'
+        ttl = config.get('IDEMPOTENCY_KEY_TTL', 86400)
+    else:
+        material = f'{get_jwt_identity()}:{request.path}:body:{request.get_data(as_text=True)}'
+        ttl = config.get('IDEMPOTENCY_WINDOW_SECONDS', 30)
+    if ttl <= 0:
+        return None
+    digest = hashlib.sha256(material.encode('utf-8')).hexdigest()
+    return f'{IDEMPOTENCY_PREFIX}:{scope}:{digest}', ttl
+
+
+def _replay(saved: dict):
+    response = jsonify(saved['body'])
+    response.status_code = saved['code']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope: str):
+    """
+    幂等装饰器，放在 jwt_required 之后、admission_control 之前，重复请求不消耗限额
+
+    Args:
+        scope: 接口名称，作为键的命名空间
+
+    用法:
+        @bp.route('/cases', methods=['POST'])
+        @jwt_required()
+        @idempotent('create_case')
+        @admission_control(LLM_BUDGET, lane=INTERACTIVE_LANE)
+        def create_case():
+            ...
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            from app.services.storage.cache_service import get_cache_service
+
+            request_key = _request_key(scope)
+            if request_key is None:
+                return func(*args, **kwargs)
+
+            cache = get_cache_service()
+            key, ttl = request_key
+            if not cache.add_if_absent(key, {'state': 'pending'}, expire_time=min(_PENDING_SECONDS, ttl)):
+                saved: Optional[dict] = (cache.get_cached_result(key) or {}).get('data')
+                if saved and saved.get('state') == 'done':
+                    return _replay(saved)
+                return conflict_error('相同的请求正在处理，请勿重复提交')
+
+            try:
+                response = current_app.make_response(func(*args, **kwargs))
+            except Exception:
+                cache.delete_cache(key)
+                raise
+
+            body = response.get_json(silent=True) if response.is_json else None
+            if 200 <= response.status_code < 300 and body is not None:
+                cache.cache_result(key, {'state': 'done', 'code': response.status_code, 'body': body},
+                                   expire_time=ttl)
+            else:
+                cache.delete_cache(key)
+            return response
+        return wrapper
+    return decorator
@@ -11,11 +11,14 @@ from app.api.v1.analysis import analysis_bp as bp
 from app.utils.response_helper import (
     success_response, validation_error, internal_error
 )
-from app.services.ai.log_parsing_service import log_parsing_service
+from app.services.ai.log_parsing_service import parse_log_content
+from app.services.infrastructure.process_lane import run_cpu_bound
+from app.api.common.admission import LLM_BUDGET, admission_control
 
 
 @bp.route('/log-parsing', methods=['POST'])
 @jwt_required()
+@admission_control(LLM_BUDGET)
 def parse_log():
     """
     解析技术日志
@@ -60,9 +63,10 @@ def parse_log():
         # 获取上下文信息
         context_info = data.get('contextInfo', {})
 
-        # 调用真实的AI日志解析服务
+        # 调用真实的AI日志解析服务；大日志在进程车道中解析，不占用请求线程的GIL
         try:
-            analysis_result = log_parsing_service.parse_log(
+            analysis_result = run_cpu_bound(
+                parse_log_content,
                 log_type=log_type,
                 vendor=vendor,
                 log_content=log_content,
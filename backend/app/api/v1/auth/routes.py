@@ -91,6 +91,22 @@ def logout():
     return '', 204
 
 
+@bp.route('/stream-ticket', methods=['POST'])
+@jwt_required()
+def create_stream_ticket():
+    """
+    换取一次性推送票据接口
+
+    EventSource 无法设置请求头，SSE推送接口通过查询参数 ticket 认证，避免访问令牌出现在URL中。
+    票据有效期很短且只能使用一次。
+
+    Returns:
+        JSON: 包含 ticket 和有效秒数 expiresIn 的响应
+    """
+    from app.utils.sse import issue_stream_ticket
+    return success_response(issue_stream_ticket(get_jwt_identity()))
+
+
 @bp.route('/refresh', methods=['POST'])
 def refresh():
     """
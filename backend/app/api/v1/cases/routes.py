@@ -10,15 +10,26 @@ from app.api.v1.cases import cases_bp as bp
 from app.models.case import Case, Node, Edge
 from app.models.user import User
 from app.models.feedback import Feedback
+from app.services.ai.semantic_cache import remove_case_from_semantic_cache, update_from_feedback
+from app.services.ai.conversation_summary import invalidate_conversation_summary
 from app import db
 from datetime import datetime
+import time
 import uuid
 from app.utils.response_helper import (
     success_response, error_response, validation_error, not_found_error,
     internal_error, paginated_response
 )
 from app.services.retrieval.knowledge_service import knowledge_service
+from app.services.retrieval.case_index import get_case_index, search_similar_cases, submit_case_indexing
 from app.services.network.vendor_command_service import vendor_command_service
+from app.services.infrastructure.progress_bus import (
+    NODE_EVENT, PROGRESS_EVENT, case_topic, get_progress_bus, node_topic
+)
+from app.utils.sse import get_stream_identity, stream_auth_required, stream_progress
+from app.api.common.admission import CHEAP_BUDGET, LLM_BUDGET, admission_control
+from app.api.common.idempotency import idempotent
+from app.services.infrastructure.lanes import INTERACTIVE_LANE
 
 
 @bp.route('/', methods=['GET'])
@@ -140,6 +151,7 @@ def get_cases():
 
 @bp.route('/<case_id>/nodes/<node_id>/regenerate', methods=['POST'])
 @jwt_required()
+@admission_control(LLM_BUDGET)
 def regenerate_node(case_id, node_id):
     """
     重新生成节点内容
@@ -164,8 +176,8 @@ def regenerate_node(case_id, node_id):
 
         # 模拟调用AI服务重新生成内容
         # 在真实实现中，这里会调用一个类似 case_service.regenerate_node 的服务
-        from app.services.ai.llm_service import LLMService
-        llm_service = LLMService()
+        from app.services.ai.llm_service import get_llm_service
+        llm_service = get_llm_service()
 
         # 构建上下文
         parent_node = Node.query.get(node.parent_id) if node.parent_id else None
@@ -182,6 +194,8 @@ def regenerate_node(case_id, node_id):
         # 更新节点
         node.content = new_content
         node.updated_at = datetime.utcnow()
+        # 摘要覆盖了该节点时失效，下一轮对话重新生成
+        invalidate_conversation_summary(node.case, node.id)
         db.session.commit()
 
         return success_response({
@@ -253,6 +267,8 @@ def rate_node(case_id, node_id):
 
 @bp.route('/', methods=['POST'])
 @jwt_required()
+@idempotent('create_case')
+@admission_control(LLM_BUDGET, lane=INTERACTIVE_LANE)
 def create_case():
     """
     创建新案例
@@ -262,6 +278,9 @@ def create_case():
     - attachments: 附件列表 (可选)
     - useLanggraph: 是否使用langgraph Agent (可选，默认false)
     - vendor: 设备厂商 (可选)
+    - useCache: 是否复用语义相近问题的已有解决方案 (可选，默认true，仅langgraph Agent)
+
+    重试时带上相同的 Idempotency-Key 请求头，不会重复创建案例。
     """
     try:
         user_id = get_jwt_identity()
@@ -282,6 +301,7 @@ def create_case():
         attachments = data.get('attachments', [])
         use_langgraph = data.get('useLanggraph', False)
         vendor = data.get('vendor')
+        use_cache = data.get('useCache', True) is not False
 
         if not query or not query.strip():
             return jsonify({
@@ -318,7 +338,8 @@ def create_case():
                 'vendor': vendor,
                 'use_langgraph': use_langgraph,
                 'original_query': query,
-                'created_with_langgraph': use_langgraph
+                'created_with_langgraph': use_langgraph,
+                'use_semantic_cache': use_cache
             }
         )
         db.session.add(case)
@@ -377,7 +398,8 @@ def create_case():
                 from app.services import get_task_queue
 
                 queue = get_task_queue()
-                task = queue.enqueue(analyze_user_query, case.id, ai_node.id, query)
+                task = queue.enqueue(analyze_user_query, case.id, ai_node.id, query, lane='interactive',
+                                     dedupe_key=(case.id, ai_node.id))
                 current_app.logger.info(f"传统异步AI分析任务已提交: task_id={task.id}, case_id={case.id}")
         except Exception as e:
             current_app.logger.error(f"提交异步任务失败: {str(e)}")
@@ -412,6 +434,36 @@ def create_case():
         }), 500
 
 
+@bp.route('/similar', methods=['GET'])
+@jwt_required()
+@admission_control(CHEAP_BUDGET)
+def similar_cases():
+    """
+    查找相似的已解决案例
+
+    查询参数:
+    - query: 问题描述 (必需)
+    - vendor: 设备厂商 (可选)，只返回该厂商或通用的案例
+    - limit: 返回数量 (可选，默认5，最大20)
+    - excludeCaseId: 排除的案例ID (可选)
+    """
+    query = request.args.get('query', '').strip()
+    if not query:
+        return validation_error('query 参数是必需的')
+    try:
+        limit = min(max(int(request.args.get('limit', 5)), 1), 20)
+    except ValueError:
+        return validation_error('limit 必须是整数')
+
+    started_at = time.time()
+    cases = search_similar_cases(query, get_jwt_identity(), vendor=request.args.get('vendor') or None,
+                                 limit=limit, exclude_case_id=request.args.get('excludeCaseId'))
+    return success_response({
+        'cases': cases,
+        'tookMs': round((time.time() - started_at) * 1000, 1)
+    })
+
+
 @bp.route('/<case_id>', methods=['GET'])
 @jwt_required()
 def get_case_detail(case_id):
@@ -510,8 +562,9 @@ def update_case(case_id):
         if 'title' in data:
             case.title = data['title']
 
+        status_changed = 'status' in data and data['status'] != case.status
         if 'status' in data:
-            if data['status'] not in ['open', 'solved', 'closed']:
+            if data['status'] not in ['open', 'solved', 'resolved', 'closed']:
                 return jsonify({
                     'code': 400,
                     'status': 'error',
@@ -525,6 +578,10 @@ def update_case(case_id):
         case.updated_at = datetime.utcnow()
         db.session.commit()
 
+        # 已解决案例写入相似案例索引，改回其他状态时移除
+        if status_changed:
+            submit_case_indexing(case.id)
+
         return jsonify({
             'code': 200,
             'status': 'success',
@@ -572,6 +629,9 @@ def delete_case(case_id):
         # 删除案例（级联删除会自动删除相关的节点和边）
         db.session.delete(case)
         db.session.commit()
+        get_case_index().remove_case(case_id)
+        # 已删除案例的解决方案不再作为语义缓存的答案
+        remove_case_from_semantic_cache(case_id)
 
         return '', 204
 
@@ -590,6 +650,8 @@ def delete_case(case_id):
 
 @bp.route('/<case_id>/interactions', methods=['POST'])
 @jwt_required()
+@idempotent('handle_interaction')
+@admission_control(LLM_BUDGET, lane=INTERACTIVE_LANE)
 def handle_interaction(case_id):
     """
     处理多轮交互
@@ -599,6 +661,8 @@ def handle_interaction(case_id):
     - response: 用户响应数据 (必需)
     - retrievalWeight: 检索权重 (可选，默认0.7)
     - filterTags: 过滤标签 (可选)
+
+    重试时带上相同的 Idempotency-Key 请求头，不会重复创建节点。
     """
     try:
         user_id = get_jwt_identity()
@@ -731,7 +795,9 @@ def handle_interaction(case_id):
                     ai_processing_node.id,
                     response_data,
                     retrieval_weight,
-                    filter_tags
+                    filter_tags,
+                    lane='interactive',
+                    dedupe_key=(case_id, ai_processing_node.id)
                 )
                 current_app.logger.info(f"传统异步响应处理任务已提交: job_id={job.id}, case_id={case_id}")
         except Exception as e:
@@ -1019,7 +1085,7 @@ def get_case_status(case_id):
     """
     获取案例状态
 
-    返回案例的当前状态和处理中的节点信息，用于前端轮询
+    返回案例的当前状态和处理中的节点信息。需要持续跟踪进度时使用 /cases/<case_id>/events
     """
     try:
         user_id = get_jwt_identity()
@@ -1036,30 +1102,10 @@ def get_case_status(case_id):
                 }
             }), 404
 
-        # 查找处理中的节点
-        processing_nodes = Node.query.filter_by(
-            case_id=case_id,
-            status='PROCESSING'
-        ).all()
-
-        # 查找等待用户输入的节点
-        awaiting_nodes = Node.query.filter_by(
-            case_id=case_id,
-            status='AWAITING_USER_INPUT'
-        ).all()
-
         return jsonify({
             'code': 200,
             'status': 'success',
-            'data': {
-                'caseId': case.id,
-                'caseStatus': case.status,
-                'updatedAt': case.updated_at.isoformat() + 'Z',
-                'processingNodes': [node.to_dict() for node in processing_nodes],
-                'awaitingNodes': [node.to_dict() for node in awaiting_nodes],
-                'hasProcessingNodes': len(processing_nodes) > 0,
-                'hasAwaitingNodes': len(awaiting_nodes) > 0
-            }
+            'data': _build_case_status(case)
         })
 
     except Exception as e:
@@ -1074,6 +1120,100 @@ def get_case_status(case_id):
         }), 500
 
 
+@bp.route('/<case_id>/events', methods=['GET'])
+@stream_auth_required
+def stream_case_events(case_id):
+    """
+    推送案例处理进度（Server-Sent Events）
+
+    连接后先推送 snapshot 事件（内容与状态接口相同，另含最新的进度），之后推送：
+    - progress：Agent工作流步骤，含 step、progress、nodeId
+    - node：节点状态或内容变化，含完整的节点数据
+
+    EventSource 无法设置请求头，可通过查询参数 ticket 传递一次性推送票据（POST /auth/stream-ticket 获取）。
+    """
+    user_id = get_stream_identity()
+    case = Case.query.filter_by(id=case_id, user_id=user_id).first()
+    if not case:
+        return jsonify({
+            'code': 404,
+            'status': 'error',
+            'error': {
+                'type': 'NOT_FOUND',
+                'message': '案例不存在'
+            }
+        }), 404
+
+    def snapshot():
+        data = _build_case_status(db.session.get(Case, case_id))
+        latest = get_progress_bus().latest(case_topic(case_id), PROGRESS_EVENT)
+        data['progress'] = latest['data'] if latest else None
+        return data
+
+    return stream_progress([case_topic(case_id)], snapshot)
+
+
+@bp.route('/<case_id>/nodes/<node_id>/events', methods=['GET'])
+@stream_auth_required
+def stream_node_events(case_id, node_id):
+    """
+    推送节点的流式生成内容（Server-Sent Events）
+
+    连接后先推送 snapshot 事件（节点数据，生成中的节点 content 带有已生成的部分），之后推送：
+    - token：新生成的文本片段，含 delta 和片段在全文中的起始位置 offset
+    - node：节点状态或内容变化，节点不再处于处理中时推送 end 并结束连接
+
+    节点已处理完成时只推送快照。认证方式与案例进度推送相同。
+    """
+    user_id = get_stream_identity()
+    case = Case.query.filter_by(id=case_id, user_id=user_id).first()
+    node = Node.query.filter_by(id=node_id, case_id=case_id).first() if case else None
+    if not node:
+        return jsonify({
+            'code': 404,
+            'status': 'error',
+            'error': {
+                'type': 'NOT_FOUND',
+                'message': '案例不存在' if not case else '节点不存在'
+            }
+        }), 404
+
+    def snapshot():
+        return db.session.get(Node, node_id).to_dict()
+
+    def is_terminal(message):
+        return message['event'] == NODE_EVENT and message['data'].get('status') != 'PROCESSING'
+
+    return stream_progress([node_topic(node_id)], snapshot,
+                           is_terminal=is_terminal,
+                           is_finished=lambda state: state.get('status') != 'PROCESSING')
+
+
+def _build_case_status(case):
+    """案例的当前状态和处理中、等待用户输入的节点"""
+    # 查找处理中的节点
+    processing_nodes = Node.query.filter_by(
+        case_id=case.id,
+        status='PROCESSING'
+    ).all()
+
+    # 查找等待用户输入的节点
+    awaiting_nodes = Node.query.filter_by(
+        case_id=case.id,
+        status='AWAITING_USER_INPUT'
+    ).all()
+
+    return {
+        'caseId': case.id,
+        'caseStatus': case.status,
+        'updatedAt': case.updated_at.isoformat() + 'Z',
+        'processingNodes': [node.to_dict() for node in processing_nodes],
+        'awaitingNodes': [node.to_dict() for node in awaiting_nodes],
+        'hasProcessingNodes': len(processing_nodes) > 0,
+        'hasAwaitingNodes': len(awaiting_nodes) > 0
+    }
+
+
 @bp.route('/<case_id>/feedback', methods=['PUT'])
 @jwt_required()
 def create_or_update_feedback(case_id):
@@ -1131,12 +1271,16 @@ def create_or_update_feedback(case_id):
 
         # 同步案例状态
         if feedback.outcome == 'solved':
-            case.status = 'solved'
-        elif case.status == 'solved': # 从 'solved' 改为其他状态
+            case.status = 'resolved'
+        elif case.status in ('solved', 'resolved'): # 从已解决改为其他状态
             case.status = 'open'
 
         db.session.commit()
 
+        # 已解决且评分较高的解决方案供语义相近的问题复用，否则移除
+        update_from_feedback(case, feedback)
+        submit_case_indexing(case.id)
+
         if is_new:
             return success_response(feedback.to_dict(), 201) # 201 Created
         else:
@@ -8,7 +8,7 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
 from app import db
 from app.api.v1.development import dev_bp as bp
-from app.services.ai.llm_service import LLMService
+from app.services.ai.llm_service import get_llm_service
 from app.models.prompt import PromptTemplate
 from app.services.storage.cache_service import get_cache_service
 from app.utils.monitoring import get_monitor
@@ -34,7 +34,7 @@ def test_analysis_prompt():
             }), 400
 
         # 调用LLM服务
-        llm_service = LLMService()
+        llm_service = get_llm_service()
         result = llm_service.analyze_query(
             query=query,
             context=context,
@@ -72,7 +72,7 @@ def test_clarification_prompt():
             }), 400
 
         # 调用LLM服务
-        llm_service = LLMService()
+        llm_service = get_llm_service()
         result = llm_service.generate_clarification(
             query=query,
             analysis=analysis,
@@ -112,7 +112,7 @@ def test_solution_prompt():
             }), 400
 
         # 调用LLM服务
-        llm_service = LLMService()
+        llm_service = get_llm_service()
         result = llm_service.generate_solution(
             query=query,
             context=context,
@@ -152,7 +152,7 @@ def test_conversation_prompt():
             }), 400
 
         # 调用LLM服务
-        llm_service = LLMService()
+        llm_service = get_llm_service()
         result = llm_service.continue_conversation(
             conversation_history=conversation_history,
             new_query=new_query,
@@ -190,7 +190,7 @@ def test_feedback_prompt():
             }), 400
 
         # 调用LLM服务
-        llm_service = LLMService()
+        llm_service = get_llm_service()
         result = llm_service.process_feedback(
             original_problem=original_problem,
             provided_solution=provided_solution,
@@ -432,7 +432,7 @@ def health_check():
     """健康检查端点"""
     try:
         # 测试LLM服务连接
-        llm_service = LLMService()
+        llm_service = get_llm_service()
 
         # 简单的连通性测试
         test_result = llm_service.analyze_query(
@@ -157,3 +157,49 @@ def debug_info():
         'status': 'success',
         'data': debug_data
     })
+
+
+@bp.route('/workflows', methods=['GET'])
+@jwt_required()
+def list_agent_workflows():
+    """已注册的Agent工作流及编译状态"""
+    from app.services.ai.agent_workflow import list_workflows
+
+    return jsonify({
+        'code': 200,
+        'status': 'success',
+        'data': {'workflows': list_workflows()}
+    })
+
+
+@bp.route('/workflows/reload', methods=['POST'])
+@jwt_required()
+def reload_agent_workflows():
+    """重新编译Agent工作流（仅管理员），修改节点代码后无需重启进程"""
+    from flask import request
+    from flask_jwt_extended import get_jwt_identity
+    from app.models.user import User
+    from app.services.ai.agent_workflow import reload_workflows
+
+    user_id = get_jwt_identity()
+    user = db.session.get(User, user_id)
+
+    if not user or not user.has_role('admin'):
+        return jsonify({
+            'code': 403,
+            'status': 'error',
+            'error': {
+                'type': 'FORBIDDEN',
+                'message': '需要管理员权限'
+            }
+        }), 403
+
+    data = request.get_json(silent=True) or {}
+    workflows = reload_workflows(reload_nodes=bool(data.get('reloadNodes', False)))
+    current_app.logger.info(f"Agent工作流已重新加载: {[item['name'] for item in workflows]}")
+
+    return jsonify({
+        'code': 200,
+        'status': 'success',
+        'data': {'workflows': workflows}
+    })
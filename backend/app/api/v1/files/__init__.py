@@ -8,4 +8,4 @@ from flask import Blueprint
 
 files_bp = Blueprint('files', __name__)
 
-from app.api.v1.files import routes
+from app.api.v1.files import routes, uploads
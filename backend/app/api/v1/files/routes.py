@@ -15,6 +15,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from app.api.v1.files import files_bp as bp
 from app.models.files import UserFile
+from app.utils.file_hash import save_stream_with_hash, FileTooLargeError
 from app import db
 
 
@@ -73,6 +74,86 @@ def create_thumbnail(file_path, max_size=(200, 200)):
         return None
 
 
+def _file_too_large_response(max_size, label='文件'):
+    return jsonify({
+        'code': 422,
+        'status': 'error',
+        'error': {
+            'type': 'UNPROCESSABLE_ENTITY',
+            'message': f'{label}大小超过限制，最大允许 {max_size // 1024 // 1024}MB'
+        }
+    }), 422
+
+
+def check_file_size(file_path, file_type, file_size, max_size=MAX_FILE_SIZE):
+    """已落盘文件超过大小限制时删除文件并返回错误响应，否则返回None"""
+    if file_size > max_size:
+        os.remove(file_path)
+        return _file_too_large_response(max_size)
+    if file_type == 'image' and file_size > MAX_IMAGE_SIZE:
+        os.remove(file_path)
+        return _file_too_large_response(MAX_IMAGE_SIZE, '图片文件')
+    return None
+
+
+def create_user_file(file_id, file_path, original_filename, file_size, file_type,
+                     mime_type, description, user_id, is_image=False):
+    """
+    为已落盘的文件创建缩略图、执行安全扫描并保存UserFile记录
+
+    普通上传和分片上传完成后共用此路径。
+    """
+    # 创建缩略图（如果是图片）
+    if is_image:
+        create_thumbnail(file_path)
+
+    # 模拟安全扫描（实际项目中应集成真实的安全扫描服务）
+    security_scan_status = 'clean'
+    security_scan_time = datetime.utcnow()
+    security_scan_details = {
+        'scanEngine': 'MockScanner',
+        'threats': [],
+        'score': 100
+    }
+
+    # 保存文件记录
+    user_file = UserFile(
+        id=file_id,
+        filename=os.path.basename(file_path),
+        original_filename=original_filename,
+        file_path=file_path,
+        file_size=file_size,
+        file_type=file_type,
+        mime_type=mime_type,
+        description=description,
+        user_id=user_id,
+        security_scan_status=security_scan_status,
+        security_scan_time=security_scan_time,
+        security_scan_details=security_scan_details
+    )
+
+    db.session.add(user_file)
+    db.session.commit()
+    return user_file
+
+
+def file_info_dict(user_file):
+    """上传成功响应中的文件信息"""
+    return {
+        'id': user_file.id,
+        'filename': user_file.original_filename,
+        'content_type': user_file.mime_type,
+        'size': user_file.file_size,
+        'description': user_file.description,
+        'url': f'/api/v1/files/{user_file.id}',
+        'uploaded_at': user_file.created_at.isoformat() + 'Z',
+        'security_scan': {
+            'status': user_file.security_scan_status,
+            'scan_time': user_file.security_scan_time.isoformat() + 'Z'
+        }
+    }
+
+
 @bp.route('', methods=['POST'])
 @jwt_required()
 def upload_file():
@@ -117,34 +198,8 @@ def upload_file():
                 }
             }), 422
 
-        # 检查文件大小
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)  # 重置文件指针
-
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({
-                'code': 422,
-                'status': 'error',
-                'error': {
-                    'type': 'UNPROCESSABLE_ENTITY',
-                    'message': f'文件大小超过限制，最大允许 {MAX_FILE_SIZE // 1024 // 1024}MB'
-                }
-            }), 422
-
-        # 对图片文件有更严格的大小限制
-        file_type = get_file_type(file.filename)
-        if file_type == 'image' and file_size > MAX_IMAGE_SIZE:
-            return jsonify({
-                'code': 422,
-                'status': 'error',
-                'error': {
-                    'type': 'UNPROCESSABLE_ENTITY',
-                    'message': f'图片文件大小超过限制，最大允许 {MAX_IMAGE_SIZE // 1024 // 1024}MB'
-                }
-            }), 422
-
         # 获取表单数据
+        file_type = get_file_type(file.filename)
         user_file_type = request.form.get('fileType', file_type)
         description = request.form.get('description', '')
 
@@ -159,60 +214,29 @@ def upload_file():
         os.makedirs(upload_folder, exist_ok=True)
         file_path = os.path.join(upload_folder, new_filename)
 
-        # 保存文件
-        file.save(file_path)
+        # 边读边写并在超限时中止，无需先定位到流末尾测量大小
+        try:
+            file_size, _ = save_stream_with_hash(file.stream, file_path, max_size=MAX_FILE_SIZE)
+        except FileTooLargeError:
+            return _file_too_large_response(MAX_FILE_SIZE)
         current_app.logger.info(f"File saved to: {file_path}")
 
-        # 创建缩略图（如果是图片）
-        thumbnail_path = None
-        if file_type == 'image':
-            thumbnail_path = create_thumbnail(file_path)
-
-        # 模拟安全扫描（实际项目中应集成真实的安全扫描服务）
-        security_scan_status = 'clean'
-        security_scan_time = datetime.utcnow()
-        security_scan_details = {
-            'scanEngine': 'MockScanner',
-            'threats': [],
-            'score': 100
-        }
-
-        # 保存文件记录
-        user_file = UserFile(
-            id=file_id,
-            filename=new_filename,
-            original_filename=filename,
-            file_path=file_path,
-            file_size=file_size,
-            file_type=user_file_type,
-            mime_type=file.content_type or mimetypes.guess_type(filename)[0],
-            description=description,
-            user_id=user_id,
-            security_scan_status=security_scan_status,
-            security_scan_time=security_scan_time,
-            security_scan_details=security_scan_details
+        # 对图片文件有更严格的大小限制
+        size_error = check_file_size(file_path, file_type, file_size)
+        if size_error is not None:
+            return size_error
+
+        user_file = create_user_file(
+            file_id, file_path, filename, file_size, user_file_type,
+            file.content_type or mimetypes.guess_type(filename)[0], description, user_id,
+            is_image=file_type == 'image'
         )
 
-        db.session.add(user_file)
-        db.session.commit()
-
         return jsonify({
             'code': 201,
             'status': 'success',
             'data': {
-                'file_info': {
-                    'id': user_file.id,
-                    'filename': user_file.original_filename,
-                    'content_type': user_file.mime_type,
-                    'size': user_file.file_size,
-                    'description': user_file.description,
-                    'url': f'/api/v1/files/{user_file.id}',
-                    'uploaded_at': user_file.created_at.isoformat() + 'Z',
-                    'security_scan': {
-                        'status': user_file.security_scan_status,
-                        'scan_time': user_file.security_scan_time.isoformat() + 'Z'
-                    }
-                }
+                'file_info': file_info_dict(user_file)
             }
         }), 201
 
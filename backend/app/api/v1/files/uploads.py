@@ -0,0 +1,266 @@
+"""
+分片上传接口路由
+
+大文件按分片上传：创建会话 -> 并发PUT分片（可断点续传） -> 完成上传。
+完成后组装好的文件交给普通上传相同的 UserFile / KnowledgeDocument 创建路径。
+"""
+
+import os
+import mimetypes
+from werkzeug.utils import secure_filename
+from flask import request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app.api.v1.files import files_bp as bp
+from app.api.v1.files.routes import (
+    allowed_file, get_file_type, create_user_file, file_info_dict,
+    ALL_ALLOWED_EXTENSIONS, MAX_IMAGE_SIZE
+)
+from app.services.storage.chunked_upload import ChunkedUploadError, get_chunked_upload_service
+from app import db
+
+
+UPLOAD_PURPOSES = ('attachment', 'knowledge')
+
+
+def _error_response(code, error_type, message, details=None):
+    error = {
+        'type': error_type,
+        'message': message
+    }
+    if details:
+        error['details'] = details
+    return jsonify({
+        'code': code,
+        'status': 'error',
+        'error': error
+    }), code
+
+
+def _upload_error_response(e):
+    return _error_response(e.status_code, e.error_type, e.message, e.details)
+
+
+@bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_upload_session():
+    """
+    创建分片上传会话
+
+    请求体:
+    - fileName: 文件名 (必需)
+    - fileSize: 文件总字节数 (必需)
+    - purpose: attachment（附件，默认）或 knowledge（知识文档）
+    - chunkSize: 分片大小 (可选)
+    - sha256: 整体SHA-256，完成时校验 (可选)
+    - mimeType: MIME类型 (可选)
+    - fileType / description: 附件字段 (可选)
+    - vendor / tags: 知识文档字段 (可选)
+    """
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+
+        raw_filename = data.get('fileName') or ''
+        filename = secure_filename(raw_filename)
+        if not filename:
+            return _error_response(400, 'INVALID_REQUEST', '缺少文件名')
+
+        purpose = data.get('purpose', 'attachment')
+        if purpose not in UPLOAD_PURPOSES:
+            return _error_response(400, 'INVALID_REQUEST', f'purpose必须是: {", ".join(UPLOAD_PURPOSES)}')
+
+        try:
+            total_size = int(data.get('fileSize'))
+            chunk_size = int(data['chunkSize']) if data.get('chunkSize') is not None else None
+        except (TypeError, ValueError):
+            return _error_response(400, 'INVALID_REQUEST', 'fileSize和chunkSize必须是整数')
+
+        if purpose == 'knowledge':
+            from app.api.v1.knowledge.documents import allowed_file as allowed_document, ALLOWED_EXTENSIONS
+            if not allowed_document(filename):
+                return _error_response(
+                    400, 'UNSUPPORTED_FILE_TYPE',
+                    f'不支持的文件类型，支持的类型: {", ".join(ALLOWED_EXTENSIONS)}'
+                )
+            tags = data.get('tags') or []
+            form_fields = {
+                'vendor': data.get('vendor', ''),
+                'tags': tags if isinstance(tags, list) else [tags]
+            }
+        else:
+            if not allowed_file(filename):
+                return _error_response(
+                    422, 'UNPROCESSABLE_ENTITY',
+                    f'不支持的文件类型，支持的扩展名: {", ".join(sorted(ALL_ALLOWED_EXTENSIONS))}'
+                )
+            file_type = get_file_type(filename)
+            if file_type == 'image' and total_size > MAX_IMAGE_SIZE:
+                return _error_response(
+                    422, 'UNPROCESSABLE_ENTITY',
+                    f'图片文件大小超过限制，最大允许 {MAX_IMAGE_SIZE // 1024 // 1024}MB'
+                )
+            form_fields = {
+                'fileType': data.get('fileType', file_type),
+                'description': data.get('description', '')
+            }
+
+        session = get_chunked_upload_service().create_session(
+            user_id=user_id,
+            filename=filename,
+            total_size=total_size,
+            purpose=purpose,
+            chunk_size=chunk_size,
+            mime_type=data.get('mimeType') or mimetypes.guess_type(filename)[0],
+            expected_sha256=data.get('sha256'),
+            form_fields=form_fields
+        )
+
+        return jsonify({
+            'code': 201,
+            'status': 'success',
+            'data': session.to_dict()
+        }), 201
+
+    except ChunkedUploadError as e:
+        db.session.rollback()
+        return _upload_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Create upload session error: {str(e)}")
+        return _error_response(500, 'INTERNAL_ERROR', '创建上传会话失败')
+
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(upload_id):
+    """
+    查询上传会话状态
+
+    断线重连后根据 missingParts 只重传缺失的分片。
+    """
+    try:
+        session = get_chunked_upload_service().get_session(upload_id, get_jwt_identity())
+        return jsonify({
+            'code': 200,
+            'status': 'success',
+            'data': session.to_dict()
+        })
+
+    except ChunkedUploadError as e:
+        return _upload_error_response(e)
+    except Exception as e:
+        current_app.logger.error(f"Get upload session error: {str(e)}")
+        return _error_response(500, 'INTERNAL_ERROR', '获取上传会话失败')
+
+
+@bp.route('/uploads/<upload_id>/parts/<int:part_number>', methods=['PUT'])
+@jwt_required()
+def upload_part(upload_id, part_number):
+    """
+    上传一个分片
+
+    请求体为分片原始字节，分片序号从1开始。除最后一个分片外，每个分片大小必须等于chunkSize。
+    可选请求头 X-Part-SHA256 用于校验分片完整性。
+    """
+    try:
+        service = get_chunked_upload_service()
+        session = service.get_session(upload_id, get_jwt_identity())
+        part = service.write_part(
+            session, part_number, request.stream,
+            part_sha256=request.headers.get('X-Part-SHA256')
+        )
+
+        return jsonify({
+            'code': 200,
+            'status': 'success',
+            'data': {
+                'uploadId': upload_id,
+                'partNumber': part.part_number,
+                'size': part.size,
+                'sha256': part.sha256
+            }
+        })
+
+    except ChunkedUploadError as e:
+        db.session.rollback()
+        return _upload_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Upload part error: {str(e)}")
+        return _error_response(500, 'INTERNAL_ERROR', '分片上传失败')
+
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    """
+    完成分片上传
+
+    校验所有分片和整体SHA-256后，将组装好的文件交给附件或知识文档的创建路径。
+    """
+    try:
+        user_id = get_jwt_identity()
+        service = get_chunked_upload_service()
+        session = service.get_session(upload_id, user_id)
+
+        filename = session.original_filename
+        file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        new_filename = f"{session.id}.{file_extension}" if file_extension else session.id
+        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+        file_path = os.path.join(upload_folder, new_filename)
+
+        content_hash = service.complete_session(session, file_path)
+        session.result_id = session.id
+        db.session.commit()
+
+        form_fields = session.form_fields or {}
+        if session.purpose == 'knowledge':
+            from app.api.v1.knowledge.documents import create_document_from_upload
+            return create_document_from_upload(
+                session.id, file_path, filename, session.total_size, content_hash,
+                session.mime_type, form_fields.get('vendor', ''), form_fields.get('tags', []), user_id
+            )
+
+        file_type = get_file_type(filename)
+        user_file = create_user_file(
+            session.id, file_path, filename, session.total_size,
+            form_fields.get('fileType', file_type), session.mime_type,
+            form_fields.get('description', ''), user_id,
+            is_image=file_type == 'image'
+        )
+
+        return jsonify({
+            'code': 201,
+            'status': 'success',
+            'data': {
+                'file_info': file_info_dict(user_file)
+            }
+        }), 201
+
+    except ChunkedUploadError as e:
+        db.session.rollback()
+        return _upload_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Complete upload error: {str(e)}")
+        return _error_response(500, 'INTERNAL_ERROR', '完成上传失败')
+
+
+@bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(upload_id):
+    """取消分片上传并删除已接收的数据"""
+    try:
+        service = get_chunked_upload_service()
+        session = service.get_session(upload_id, get_jwt_identity())
+        service.abort_session(session)
+        return '', 204
+
+    except ChunkedUploadError as e:
+        db.session.rollback()
+        return _upload_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Abort upload error: {str(e)}")
+        return _error_response(500, 'INTERNAL_ERROR', '取消上传失败')
@@ -9,12 +9,25 @@ import uuid
 from werkzeug.utils import secure_filename
 from flask import request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from app.api.v1.knowledge import knowledge_bp as bp
 from app.models.knowledge import KnowledgeDocument, ParsingJob
+from app.utils.file_hash import save_stream_with_hash
+from app.utils.response_helper import service_unavailable_error
+from app.utils.sse import get_stream_identity, stream_auth_required, stream_progress
+from app.services.infrastructure.progress_bus import (
+    PROGRESS_EVENT, STATUS_EVENT, document_topic, get_progress_bus
+)
 from app import db
 from datetime import datetime
 
 
+# 小于该大小的文档在解析队列中优先处理
+SMALL_DOCUMENT_SIZE = 5 * 1024 * 1024  # 5MB
+
+# 解析已结束的文档状态，进度推送接口对这些文档只返回当前状态
+DOCUMENT_FINAL_STATUSES = ('INDEXED', 'FAILED')
+
 # 允许的文件类型
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'md', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
 
@@ -84,53 +97,14 @@ def upload_document():
         upload_folder = current_app.config['UPLOAD_FOLDER']
         os.makedirs(upload_folder, exist_ok=True)
         file_path = os.path.join(upload_folder, new_filename)
-        file.save(file_path)
-
-        # 保存文档记录
-        document = KnowledgeDocument(
-            id=file_id,
-            filename=new_filename,
-            original_filename=filename,
-            file_path=file_path,
-            file_size=os.path.getsize(file_path),
-            mime_type=file.mimetype,
-            vendor=vendor,
-            tags=tags,
-            user_id=user_id
-        )
 
-        db.session.add(document)
-        db.session.flush()
+        # 落盘的同时计算内容指纹，无需再次读取文件
+        file_size, content_hash = save_stream_with_hash(file.stream, file_path)
 
-        # 创建解析任务
-        parsing_job = ParsingJob(
-            document_id=document.id
+        return create_document_from_upload(
+            file_id, file_path, filename, file_size, content_hash,
+            file.mimetype, vendor, tags, user_id
         )
-        db.session.add(parsing_job)
-        db.session.commit()
-
-        # 触发异步解析任务
-        try:
-            from app.services.document.document_service import parse_document
-            from app.services import get_task_queue
-
-            queue = get_task_queue()
-            job = queue.enqueue(parse_document, parsing_job.id)
-            current_app.logger.info(f"异步解析任务已提交: job_id={job.id}")
-        except Exception as e:
-            # 如果服务还未实现或Redis不可用，暂时跳过
-            current_app.logger.warning(f"Document parsing service not available: {str(e)}")
-            # 在测试环境中不应该阻塞API响应
-
-        return jsonify({
-            'code': 200,
-            'status': 'success',
-            'data': {
-                'docId': document.id,
-                'status': 'QUEUED',
-                'message': '文档已加入处理队列'
-            }
-        })
 
     except Exception as e:
         current_app.logger.error(f"Upload document error: {str(e)}")
@@ -144,6 +118,196 @@ def upload_document():
         }), 500
 
 
+def create_document_from_upload(file_id, file_path, original_filename, file_size, content_hash,
+                                mime_type, vendor, tags, user_id):
+    """
+    为已落盘的上传文件创建知识文档并提交解析任务
+
+    普通上传和分片上传完成后共用此路径。相同内容已入库时删除新文件并复用已有解析结果。
+
+    Returns:
+        Flask响应
+    """
+    # 相同内容已入库时直接复用其解析结果，跳过IDP解析和向量化
+    canonical = _find_canonical_document(content_hash)
+    if canonical is not None:
+        os.remove(file_path)
+        document = _link_duplicate_document(
+            canonical, file_id, original_filename, mime_type, vendor, tags, user_id
+        )
+        db.session.commit()
+        return _duplicate_upload_response(document)
+
+    # 保存文档记录
+    document = KnowledgeDocument(
+        id=file_id,
+        filename=os.path.basename(file_path),
+        original_filename=original_filename,
+        file_path=file_path,
+        file_size=file_size,
+        mime_type=mime_type,
+        vendor=vendor,
+        tags=tags,
+        content_hash=content_hash,
+        user_id=user_id
+    )
+
+    db.session.add(document)
+    db.session.flush()
+
+    # 创建解析任务
+    parsing_job = ParsingJob(
+        document_id=document.id
+    )
+    db.session.add(parsing_job)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 并发上传了相同内容：对方已抢先登记指纹，改为复用对方的解析结果
+        db.session.rollback()
+        canonical = _find_canonical_document(content_hash)
+        if canonical is None:
+            raise
+        os.remove(file_path)
+        document = _link_duplicate_document(
+            canonical, file_id, original_filename, mime_type, vendor, tags, user_id
+        )
+        db.session.commit()
+        return _duplicate_upload_response(document)
+
+    # 触发异步解析任务
+    try:
+        from app.services.document.document_service import parse_document
+        from app.services import get_task_queue
+
+        # 入库车道内小文档优先，避免几页的手册排在数百页的大文档之后
+        queue = get_task_queue()
+        job = queue.enqueue(
+            parse_document, parsing_job.id,
+            job_id=parsing_job.id,
+            job_timeout='30m',
+            lane='ingestion',
+            priority=1 if file_size < SMALL_DOCUMENT_SIZE else 0,
+            dedupe_key=document.id
+        )
+        current_app.logger.info(f"异步解析任务已提交: job_id={job.id}")
+    except Exception as e:
+        # 如果服务还未实现或Redis不可用，暂时跳过
+        current_app.logger.warning(f"Document parsing service not available: {str(e)}")
+        # 在测试环境中不应该阻塞API响应
+
+    return jsonify({
+        'code': 200,
+        'status': 'success',
+        'data': {
+            'docId': document.id,
+            'status': 'QUEUED',
+            'message': '文档已加入处理队列'
+        }
+    })
+
+
+def _find_canonical_document(content_hash):
+    """
+    查找持有指定内容指纹的规范文档
+
+    解析失败的文档不能作为复用来源，此时释放其指纹，由新上传的文档重新解析。
+    """
+    canonical = KnowledgeDocument.query.filter_by(content_hash=content_hash).first()
+    if canonical is not None and canonical.status == 'FAILED':
+        canonical.content_hash = None
+        db.session.flush()
+        return None
+    return canonical
+
+
+def _link_duplicate_document(canonical, file_id, original_filename, mime_type, vendor, tags, user_id):
+    """创建复用规范文档文件、分块和向量的重复文档记录"""
+    document = KnowledgeDocument(
+        id=file_id,
+        filename=canonical.filename,
+        original_filename=original_filename,
+        file_path=canonical.file_path,
+        file_size=canonical.file_size,
+        mime_type=mime_type or canonical.mime_type,
+        vendor=vendor,
+        tags=tags,
+        user_id=user_id,
+        source_document_id=canonical.id,
+        status=canonical.status,
+        progress=canonical.progress,
+        error_message=canonical.error_message,
+        processed_at=canonical.processed_at,
+        parsing_summary=canonical.parsing_summary
+    )
+    db.session.add(document)
+    current_app.logger.info(f"检测到重复文档，复用解析结果: doc_id={file_id}, source={canonical.id}")
+    return document
+
+
+def _duplicate_upload_response(document):
+    """重复上传的响应，status反映被复用文档的当前解析状态"""
+    return jsonify({
+        'code': 200,
+        'status': 'success',
+        'data': {
+            'docId': document.id,
+            'status': document.status,
+            'deduplicated': True,
+            'sourceDocId': document.source_document_id,
+            'message': '文档内容已存在，已复用已有的解析结果'
+        }
+    })
+
+
+def _has_content_dependents(document):
+    """是否仍有未删除的文档复用该文档的解析内容"""
+    return KnowledgeDocument.query.filter(
+        KnowledgeDocument.source_document_id == document.id,
+        KnowledgeDocument.id != document.id,
+        KnowledgeDocument.is_deleted == False
+    ).count() > 0
+
+
+def _remove_document_content(document):
+    """删除文档的向量索引、物理文件和解析产物，并释放其内容指纹"""
+    try:
+        from app.services.storage.vector_db_config import vector_db_config
+        from app.services.storage.weaviate_vector_db import WeaviateVectorDB
+
+        # 使用统一的向量数据库配置
+        vector_db = WeaviateVectorDB(vector_db_config.config)
+        vector_db.delete_document(document.id)
+        current_app.logger.info(f"向量索引已删除: {document.id}")
+    except Exception as vector_error:
+        current_app.logger.warning(f"删除向量索引失败: {str(vector_error)}")
+
+    # 其他文档（如解除复用后重新解析的文档）仍引用同一文件时保留物理文件
+    file_in_use = KnowledgeDocument.query.filter(
+        KnowledgeDocument.file_path == document.file_path,
+        KnowledgeDocument.id != document.id,
+        KnowledgeDocument.is_deleted == False
+    ).count() > 0
+
+    try:
+        if document.file_path and os.path.exists(document.file_path) and not file_in_use:
+            os.remove(document.file_path)
+            current_app.logger.info(f"物理文件已删除: {document.file_path}")
+    except Exception as file_error:
+        current_app.logger.warning(f"删除物理文件失败: {str(file_error)}")
+
+    if document.parsing_result_ref:
+        try:
+            from app.services.storage.artifact_store import get_artifact_store
+            get_artifact_store().delete(document.parsing_result_ref)
+        except Exception as artifact_error:
+            current_app.logger.warning(f"删除解析产物失败: {str(artifact_error)}")
+        document.parsing_result_ref = None
+
+    document.content_hash = None
+
+
 @bp.route('/documents', methods=['GET'])
 @jwt_required()
 def get_documents():
@@ -272,9 +436,12 @@ def get_document_detail(doc_id):
                 'progress': document.progress,
                 'fileSize': document.file_size,
                 'mimeType': document.mime_type,
+                'sourceDocId': document.source_document_id,
                 'errorMessage': document.error_message,
                 'uploadedAt': document.uploaded_at.isoformat() + 'Z' if document.uploaded_at else None,
                 'processedAt': document.processed_at.isoformat() + 'Z' if document.processed_at else None,
+                'parsingSummary': document.parsing_summary,
+                'hasParsingResult': _parsing_result_owner(document).parsing_result_ref is not None,
                 'parsingJob': {
                     'id': parsing_job.id,
                     'status': parsing_job.status,
@@ -298,6 +465,80 @@ def get_document_detail(doc_id):
         }), 500
 
 
+@bp.route('/documents/<doc_id>/parsing-result', methods=['GET'])
+@jwt_required()
+def get_document_parsing_result(doc_id):
+    """
+    获取文档的完整解析结果
+
+    解析结果体积较大，不随文档详情返回，仅在调用此接口时从产物存储加载。
+    """
+    try:
+        user_id = get_jwt_identity()
+
+        document = KnowledgeDocument.query.filter_by(
+            id=doc_id,
+            user_id=int(user_id),
+            is_deleted=False
+        ).first()
+
+        if not document:
+            return jsonify({
+                'code': 404,
+                'status': 'error',
+                'error': {
+                    'type': 'NOT_FOUND',
+                    'message': '文档不存在'
+                }
+            }), 404
+
+        owner = _parsing_result_owner(document)
+        parsing_result = None
+        if owner.parsing_result_ref:
+            from app.services.storage.artifact_store import get_artifact_store
+            parsing_result = get_artifact_store().load(owner.parsing_result_ref)
+
+        if parsing_result is None:
+            return jsonify({
+                'code': 404,
+                'status': 'error',
+                'error': {
+                    'type': 'NOT_FOUND',
+                    'message': '解析结果不存在'
+                }
+            }), 404
+
+        return jsonify({
+            'code': 200,
+            'status': 'success',
+            'data': {
+                'docId': document.id,
+                'parsingSummary': document.parsing_summary,
+                'parsingResult': parsing_result
+            }
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Get document parsing result error: {str(e)}")
+        return jsonify({
+            'code': 500,
+            'status': 'error',
+            'error': {
+                'type': 'INTERNAL_ERROR',
+                'message': '获取解析结果时发生错误'
+            }
+        }), 500
+
+
+def _parsing_result_owner(document):
+    """复用其他文档解析结果的重复文档，其解析产物由规范文档持有"""
+    if document.source_document_id:
+        canonical = db.session.get(KnowledgeDocument, document.source_document_id)
+        if canonical is not None:
+            return canonical
+    return document
+
+
 @bp.route('/documents/<doc_id>/status', methods=['GET'])
 @jwt_required()
 def get_document_status(doc_id):
@@ -318,20 +559,10 @@ def get_document_status(doc_id):
                 }
             }), 404
 
-        # 查询最新的解析任务
-        latest_job = ParsingJob.query.filter_by(document_id=doc_id).order_by(ParsingJob.created_at.desc()).first()
-
-        status_data = {
-            'docId': document.id,
-            'documentStatus': document.status,
-            'lastChecked': datetime.utcnow().isoformat(),
-            'job': latest_job.to_dict() if latest_job else None
-        }
-
         return jsonify({
             'code': 200,
             'status': 'success',
-            'data': status_data
+            'data': _build_document_status(document)
         })
 
     except Exception as e:
@@ -346,6 +577,56 @@ def get_document_status(doc_id):
         }), 500
 
 
+@bp.route('/documents/<doc_id>/events', methods=['GET'])
+@stream_auth_required
+def stream_document_events(doc_id):
+    """
+    推送文档解析进度（Server-Sent Events）
+
+    连接后先推送 snapshot 事件（内容与状态接口相同，另含最新的进度），之后推送：
+    - progress：解析阶段，含 step、progress、status
+    - status：解析结束（INDEXED / FAILED），推送后连接结束
+
+    文档已处于最终状态时只推送 snapshot。EventSource 无法设置请求头，可通过查询参数 ticket 传递一次性推送票据。
+    """
+    user_id = get_stream_identity()
+    document = KnowledgeDocument.query.filter_by(id=doc_id, user_id=int(user_id), is_deleted=False).first()
+    if not document:
+        return jsonify({
+            'code': 404,
+            'status': 'error',
+            'error': {
+                'type': 'NOT_FOUND',
+                'message': '文档不存在'
+            }
+        }), 404
+
+    def snapshot():
+        data = _build_document_status(db.session.get(KnowledgeDocument, doc_id))
+        latest = get_progress_bus().latest(document_topic(doc_id), PROGRESS_EVENT)
+        data['progress'] = latest['data'] if latest else None
+        return data
+
+    return stream_progress(
+        [document_topic(doc_id)], snapshot,
+        is_terminal=lambda message: message['event'] == STATUS_EVENT,
+        is_finished=lambda state: state['documentStatus'] in DOCUMENT_FINAL_STATUSES
+    )
+
+
+def _build_document_status(document):
+    """文档的解析状态和最新的解析任务"""
+    # 查询最新的解析任务
+    latest_job = ParsingJob.query.filter_by(document_id=document.id).order_by(ParsingJob.created_at.desc()).first()
+
+    return {
+        'docId': document.id,
+        'documentStatus': document.status,
+        'lastChecked': datetime.utcnow().isoformat(),
+        'job': latest_job.to_dict() if latest_job else None
+    }
+
+
 
 
 
@@ -470,31 +751,27 @@ def delete_document(doc_id):
             }), 404
 
         # 如果找到文档，说明用户有权限（因为已经按user_id过滤了）
-        
-        # 1. 删除向量索引
-        try:
-            from app.services.storage.vector_db_config import vector_db_config
-            from app.services.storage.weaviate_vector_db import WeaviateVectorDB
-            
-            # 使用统一的向量数据库配置
-            vector_db = WeaviateVectorDB(vector_db_config.config)
-            vector_db.delete_document(doc_id)
-            current_app.logger.info(f"向量索引已删除: {doc_id}")
-        except Exception as vector_error:
-            current_app.logger.warning(f"删除向量索引失败: {str(vector_error)}")
-
-        # 2. 删除物理文件
-        try:
-            if document.file_path and os.path.exists(document.file_path):
-                os.remove(document.file_path)
-                current_app.logger.info(f"物理文件已删除: {document.file_path}")
-        except Exception as file_error:
-            current_app.logger.warning(f"删除物理文件失败: {str(file_error)}")
 
-        # 3. 软删除文档记录
+        # 1. 删除向量索引和物理文件
+        #    复用其他文档内容的重复文档没有自己的向量和文件；
+        #    仍被其他文档复用的规范文档保留内容，待最后一个引用删除后再清理
+        if document.source_document_id:
+            current_app.logger.info(f"重复文档不持有解析内容，跳过向量与文件删除: {doc_id}")
+        elif _has_content_dependents(document):
+            current_app.logger.info(f"文档内容仍被其他文档复用，保留向量索引与文件: {doc_id}")
+        else:
+            _remove_document_content(document)
+
+        # 2. 软删除文档记录
         document.is_deleted = True
         document.updated_at = datetime.utcnow()
 
+        # 3. 被复用的规范文档已删除且不再有引用时，一并清理其内容
+        if document.source_document_id:
+            canonical = db.session.get(KnowledgeDocument, document.source_document_id)
+            if canonical and canonical.is_deleted and not _has_content_dependents(canonical):
+                _remove_document_content(canonical)
+
         db.session.commit()
 
         return '', 204
@@ -551,28 +828,37 @@ def reparse_document(doc_id):
                 }
             }), 409
 
+        previous = (document.status, document.error_message, document.source_document_id)
+
+        # 重复文档重新解析时解除复用关系，按自身ID重新生成分块和向量
+        if document.source_document_id:
+            document.source_document_id = None
+
         # 重置文档状态
         document.status = 'QUEUED'
         document.updated_at = datetime.utcnow()
         document.error_message = None
-
-        # 创建新的解析任务
-        parsing_job = ParsingJob(
-            document_id=document.id,
-            status='PENDING'
-        )
-        db.session.add(parsing_job)
         db.session.commit()
 
-        # TODO: 触发异步解析任务
-        # 这里应该调用实际的文档解析服务
-        current_app.logger.info(f"文档重新解析任务已创建: doc_id={doc_id}, job_id={parsing_job.id}")
+        # 创建解析任务并提交到入库车道；重复点击时返回仍在排队或执行的已有任务
+        from app.services.document.document_service import ParsingQueueUnavailable, submit_parsing_job
+        try:
+            job_id = submit_parsing_job(document.id)
+        except ParsingQueueUnavailable:
+            # 不在请求线程中解析，恢复文档原状态，由客户端稍后重试
+            document.status, document.error_message, document.source_document_id = previous
+            db.session.commit()
+            response, code = service_unavailable_error('解析任务队列暂不可用，请稍后重试')
+            response.headers['Retry-After'] = str(current_app.config.get('ADMISSION_RETRY_AFTER_SECONDS', 30))
+            return response, code
+        current_app.logger.info(f"文档重新解析任务已提交: doc_id={doc_id}, job_id={job_id}")
 
         return jsonify({
             'code': 200,
             'status': 'success',
             'data': {
                 'docId': document.id,
+                'jobId': job_id,
                 'status': 'QUEUED',
                 'message': '已触发重新解析'
             }
@@ -190,16 +190,13 @@ def get_parsing_job_status(job_id):
                 'filename': document.original_filename,
                 'status': document.status,
                 'progress': document.progress,
-                'chunk_count': document.chunk_count
+                'chunk_count': (document.parsing_summary or {}).get('chunks_count')
             }
         }
 
         # 添加结果或错误信息
-        if job.status == 'COMPLETED' and job.result:
-            try:
-                response_data['result'] = json.loads(job.result)
-            except:
-                response_data['result'] = job.result
+        if job.status == 'COMPLETED' and job.result_data:
+            response_data['result'] = job.result_data
 
         if job.status == 'FAILED' and job.error_message:
             response_data['error_message'] = job.error_message
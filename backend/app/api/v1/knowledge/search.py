@@ -8,6 +8,7 @@ from flask import request, jsonify, current_app
 from flask_jwt_extended import jwt_required
 from app.api.v1.knowledge import knowledge_bp as bp
 from app.services.retrieval.hybrid_retrieval import search_knowledge
+from app.api.common.admission import CHEAP_BUDGET, admission_control
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,7 @@ logger = logging.getLogger(__name__)
 
 @bp.route('/search', methods=['POST'])
 @jwt_required()
+@admission_control(CHEAP_BUDGET)
 def search_knowledge_api():
     """
     知识检索API接口
@@ -121,6 +123,7 @@ def search_knowledge_api():
 
 @bp.route('/search/suggest', methods=['POST'])
 @jwt_required()
+@admission_control(CHEAP_BUDGET)
 def suggest_search_terms():
     """
     搜索建议API接口
@@ -10,6 +10,8 @@ from app import db
 from app.api.v1.system import system_bp as bp
 from app.services.storage.cache_service import cache_service
 from app.services.retrieval.vector_service import get_vector_service
+from app.services.ai.llm_service import get_llm_service
+from app.utils.circuit_breaker import OPEN, get_breaker_states
 from app.models.user import User
 import psutil
 from datetime import datetime
@@ -80,6 +82,12 @@ def get_system_health():
             }
         }
 
+        # 外部依赖（大模型、向量化、文档智能、Weaviate）的熔断器状态，熔断中的依赖正在走降级逻辑，
+        # 服务仍可用，只报告为降级，不影响整体健康状态（避免存活检查因熔断器生效而失败）
+        circuit_breakers = get_breaker_states()
+        degraded_dependencies = sorted(name for name, breaker in circuit_breakers.items()
+                                       if breaker['state'] == OPEN)
+
         overall_health = all(service['status'] == 'up' for service in health_checks.values())
 
         return jsonify({
@@ -87,7 +95,10 @@ def get_system_health():
             'status': 'success',
             'data': {
                 'healthy': overall_health,
+                'degraded': bool(degraded_dependencies),
+                'degraded_dependencies': degraded_dependencies,
                 'services': health_checks,
+                'circuit_breakers': circuit_breakers,
                 'timestamp': datetime.utcnow().isoformat() + 'Z'
             }
         })
@@ -235,6 +246,8 @@ def get_system_metrics():
                 },
                 'request_count': 0,  # 可以实际统计
                 'error_rate': 0.0,   # 可以实际统计
+                'cache': cache_service.get_prefix_stats(),
+                'llm_router': get_llm_service().get_router_stats(),
                 'timestamp': datetime.utcnow().isoformat() + 'Z'
             }
         })
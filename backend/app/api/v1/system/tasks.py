@@ -18,10 +18,13 @@ IP智慧解答专家系统 - 任务监控API
 本模块提供异步任务状态监控和管理的API接口。
 """
 
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import hmac
+
+from flask import Blueprint, Response, current_app, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
 from app.api.v1.system import system_bp as bp
 from app.services.infrastructure.task_monitor import TaskMonitor
+from app.services.infrastructure.queue_metrics import render_prometheus
 from app.services.document.document_service import get_parsing_status
 from app.services.ai.agent_service import get_agent_task_status
 from app.services.ai import get_langgraph_task_status
@@ -49,6 +52,24 @@ def get_queue_stats():
         }), 500
 
 
+@bp.route('/queue/metrics', methods=['GET'])
+def get_queue_metrics():
+    """
+    以 Prometheus 文本格式输出任务队列指标
+
+    采集端可使用 METRICS_SCRAPE_TOKEN 配置的固定令牌（Authorization: Bearer <token>），
+    未配置或令牌不匹配时按JWT校验。
+    """
+    scrape_token = current_app.config.get('METRICS_SCRAPE_TOKEN')
+    auth_header = request.headers.get('Authorization', '')
+    if not (scrape_token and hmac.compare_digest(auth_header, f'Bearer {scrape_token}')):
+        verify_jwt_in_request()
+
+    stats = TaskMonitor.get_queue_stats()
+    body = render_prometheus(stats['functions'], stats['lanes'], stats.get('process_lane'))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
 @bp.route('/task/<job_id>/status', methods=['GET'])
 @jwt_required()
 def get_task_status(job_id):
@@ -351,8 +372,12 @@ def get_metrics():
                 },
                 'queue': {
                     'current_length': queue_stats.get('queue_length', 0),
+                    'running_count': queue_stats.get('running_count', 0),
                     'workers_count': queue_stats.get('workers_count', 0),
-                    'failed_jobs_count': queue_stats.get('failed_jobs_count', 0)
+                    'failed_jobs_count': queue_stats.get('failed_jobs_count', 0),
+                    'timed_out_jobs_count': queue_stats.get('timed_out_jobs_count', 0),
+                    'lanes': queue_stats.get('lanes', {}),
+                    'functions': queue_stats.get('functions', [])
                 },
                 'timestamp': datetime.utcnow().isoformat() + 'Z'
             }
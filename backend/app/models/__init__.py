@@ -6,20 +6,20 @@
 
 # 导入所有模型，确保它们被注册到SQLAlchemy
 from app.models.user import User
-from app.models.case import Case, Node, Edge
+from app.models.case import Case, Node, Edge, WorkflowCheckpoint
 from app.models.knowledge import KnowledgeDocument, ParsingJob
 from app.models.feedback import Feedback
-from app.models.files import UserFile
+from app.models.files import UserFile, UploadSession, UploadPart
 from app.models.user_settings import UserSettings
 from app.models.notification import Notification
 from app.models.prompt import PromptTemplate
 
 __all__ = [
     'User',
-    'Case', 'Node', 'Edge',
+    'Case', 'Node', 'Edge', 'WorkflowCheckpoint',
     'KnowledgeDocument', 'ParsingJob',
     'Feedback',
-    'UserFile',
+    'UserFile', 'UploadSession', 'UploadPart',
     'UserSettings',
     'Notification',
     'PromptTemplate'
@@ -28,6 +28,7 @@ class Case(db.Model):
     nodes = db.relationship('Node', backref='case', lazy='dynamic', cascade='all, delete-orphan')
     edges = db.relationship('Edge', backref='case', lazy='dynamic', cascade='all, delete-orphan')
     feedback = db.relationship('Feedback', backref='case', lazy='dynamic', cascade='all, delete-orphan')
+    checkpoints = db.relationship('WorkflowCheckpoint', backref='case', lazy='dynamic', cascade='all, delete-orphan')
 
     def to_dict(self):
         """转换为字典"""
@@ -84,3 +85,28 @@ class Edge(db.Model):
             'source': self.source,
             'target': self.target
         }
+
+
+class WorkflowCheckpoint(db.Model):
+    """工作流步骤检查点：步骤完成后的Agent状态和节点内容，任务重试或恢复时跳过已完成的步骤"""
+
+    __tablename__ = 'workflow_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    case_id = db.Column(db.String(36), db.ForeignKey('cases.id'), nullable=False)
+    node_id = db.Column(db.String(36), nullable=False, index=True)
+    step = db.Column(db.String(50), nullable=False)
+    input_digest = db.Column(db.String(32), nullable=False)  # 步骤输入状态的指纹
+    state = db.Column(db.JSON)
+    node_snapshot = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'nodeId': self.node_id,
+            'step': self.step,
+            'createdAt': self.created_at.isoformat() + 'Z' if self.created_at else None,
+            'expiresAt': self.expires_at.isoformat() + 'Z' if self.expires_at else None
+        }
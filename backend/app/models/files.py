@@ -76,3 +76,73 @@ class UserFile(db.Model):
 
     def __repr__(self):
         return f'<UserFile {self.id}: {self.original_filename}>'
+
+
+class UploadSession(db.Model):
+    """分片上传会话模型"""
+    __tablename__ = 'upload_sessions'
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(36), nullable=False, index=True)
+
+    # 上传目标：attachment 生成 UserFile，knowledge 生成 KnowledgeDocument
+    purpose = Column(String(20), nullable=False, default='attachment')
+    original_filename = Column(String(255), nullable=False)
+    mime_type = Column(String(100), nullable=True)
+    total_size = Column(db.BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    total_parts = Column(Integer, nullable=False)
+    expected_sha256 = Column(String(64), nullable=True)
+
+    # 完成上传后传给创建路径的表单字段（vendor、tags、fileType、description等）
+    form_fields = Column(JSON, default=dict)
+
+    temp_path = Column(String(500), nullable=False)
+    status = Column(String(20), default='active')  # active, completed, aborted
+    result_id = Column(String(36), nullable=True)
+    content_hash = Column(String(64), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    parts = db.relationship('UploadPart', backref='session', lazy='dynamic', cascade='all, delete-orphan')
+
+    def to_dict(self):
+        """转换为字典格式"""
+        parts = self.parts.all()
+        received = sorted(part.part_number for part in parts)
+        received_set = set(received)
+        return {
+            'uploadId': self.id,
+            'purpose': self.purpose,
+            'fileName': self.original_filename,
+            'totalSize': self.total_size,
+            'chunkSize': self.chunk_size,
+            'totalParts': self.total_parts,
+            'receivedParts': received,
+            'missingParts': [n for n in range(1, self.total_parts + 1) if n not in received_set],
+            'receivedBytes': sum(part.size for part in parts),
+            'status': self.status,
+            'resultId': self.result_id,
+            'createdAt': self.created_at.isoformat() + 'Z' if self.created_at else None,
+            'expiresAt': self.expires_at.isoformat() + 'Z' if self.expires_at else None
+        }
+
+    def __repr__(self):
+        return f'<UploadSession {self.id}: {self.original_filename}>'
+
+
+class UploadPart(db.Model):
+    """已接收的上传分片"""
+    __tablename__ = 'upload_parts'
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'part_number', name='uq_upload_part_number'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(36), db.ForeignKey('upload_sessions.id'), nullable=False, index=True)
+    part_number = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -21,6 +21,14 @@ class KnowledgeDocument(db.Model):
     file_size = db.Column(db.Integer)
     mime_type = db.Column(db.String(100))
 
+    # 内容指纹：仅持有解析结果的规范文档保存SHA-256，重复上传的文档通过source_document_id复用其分块和向量
+    content_hash = db.Column(db.String(64), unique=True, index=True)
+    source_document_id = db.Column(db.String(36), db.ForeignKey('knowledge_documents.id'), index=True)
+
+    # 解析产物：完整解析结果压缩存放在产物存储中，行内只保留引用和摘要
+    parsing_result_ref = db.Column(db.String(255))
+    parsing_summary = db.Column(db.JSON)
+
     # 元数据
     vendor = db.Column(db.String(50))
     tags = db.Column(db.JSON)
@@ -9,6 +9,7 @@ from .analysis_prompt import (
     CLARIFICATION_PROMPT,
     SOLUTION_PROMPT,
     CONTINUE_CONVERSATION_PROMPT,
+    CONVERSATION_SUMMARY_PROMPT,
     FEEDBACK_PROCESSING_PROMPT
 )
 from .vendor_prompts import HUAWEI_PROMPT, CISCO_PROMPT, H3C_PROMPT, RUIJIE_PROMPT
@@ -19,6 +20,7 @@ __all__ = [
     'CLARIFICATION_PROMPT',
     'SOLUTION_PROMPT',
     'CONTINUE_CONVERSATION_PROMPT',
+    'CONVERSATION_SUMMARY_PROMPT',
     'FEEDBACK_PROCESSING_PROMPT',
     'HUAWEI_PROMPT',
     'CISCO_PROMPT',
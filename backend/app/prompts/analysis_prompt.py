@@ -126,6 +126,22 @@ CONTINUE_CONVERSATION_PROMPT = """继续提供技术支持。
 • 避免重复已提供的信息
 """
 
+# 对话历史摘要提示词
+CONVERSATION_SUMMARY_PROMPT = """压缩网络故障排查的对话历史。
+
+**已有摘要**
+{previous_summary}
+
+**新增对话**
+{transcript}
+
+【摘要要求】
+• 合并为一段不超过{max_tokens}字的摘要
+• 保留设备厂商、型号、故障现象、已确认的事实、已尝试的操作及结果
+• 保留用户提供的配置、日志和报错中的关键字段
+• 删除寒暄和重复内容，只输出摘要本身
+"""
+
 # 反馈处理提示词
 FEEDBACK_PROCESSING_PROMPT = """快速响应用户反馈。
 
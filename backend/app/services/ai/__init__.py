@@ -3,13 +3,18 @@ AI服务模块
 
 包含所有AI相关的服务：
 - LLM服务：大语言模型交互
+- LLM路由：按耗时和错误率在多个模型接入点之间选择，可选对冲请求
+- 上下文打包：按token预算整理检索结果
 - 嵌入服务：文本向量化
 - Agent服务：AI Agent异步任务处理
 - LangGraph Agent服务：基于langgraph的智能对话Agent
 - 日志解析服务：AI智能日志分析
 """
 
-from .llm_service import LLMService
+from .llm_service import LLMService, get_llm_service
+from .llm_router import LLMRouter, LLMTarget
+from .context_packer import ContextPacker, pack_context
+from .conversation_summary import ConversationWindow, build_conversation_context
 from .embedding_service import QwenEmbedding, get_embedding_service
 from .agent_service import RetrievalService
 from .langgraph_agent_service import (
@@ -21,6 +26,13 @@ from .log_parsing_service import log_parsing_service
 
 __all__ = [
     'LLMService',
+    'get_llm_service',
+    'LLMRouter',
+    'LLMTarget',
+    'ContextPacker',
+    'pack_context',
+    'ConversationWindow',
+    'build_conversation_context',
     'QwenEmbedding',
     'get_embedding_service',
     'RetrievalService',
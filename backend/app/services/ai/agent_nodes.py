@@ -5,15 +5,98 @@ Agent节点实现
 """
 
 import logging
-from typing import Dict, Any
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Optional
+from flask import current_app
 from app.services.ai.agent_state import AgentState
-from app.services.ai.llm_service import LLMService
+from app.services.ai.llm_service import get_llm_service
 from app.services.ai.agent_service import RetrievalService
-from app.models.case import Node
+from app.services.ai.node_stream import create_stream_writer
+from app.services.retrieval.case_index import search_similar_cases
+from app.services.infrastructure.cancellation import (
+    CancellationToken, bind_token, check_cancelled, current_token
+)
+from app.models.case import Case, Node
 from app import db
 
 logger = logging.getLogger(__name__)
 
+# 预检索线程池：每个进程一个（fork 后重新创建）
+_speculation_executor: Optional[ThreadPoolExecutor] = None
+_speculation_pid: Optional[int] = None
+_speculation_lock = threading.Lock()
+# 等待预检索结果时检查取消令牌的间隔（秒）
+_SPECULATION_POLL_SECONDS = 0.2
+
+
+def _get_speculation_executor() -> ThreadPoolExecutor:
+    global _speculation_executor, _speculation_pid
+    with _speculation_lock:
+        if _speculation_executor is None or _speculation_pid != os.getpid():
+            _speculation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='agent-retrieval')
+            _speculation_pid = os.getpid()
+        return _speculation_executor
+
+
+def _similar_case_context(query: str, vendor: Optional[str], case_id: Optional[str]) -> List[Dict[str, Any]]:
+    """案例所属用户的相似已解决案例，转换为检索结果的格式（AGENT_SIMILAR_CASES 为0时不查询）"""
+    limit = current_app.config.get('AGENT_SIMILAR_CASES', 3)
+    case = db.session.get(Case, case_id) if case_id else None
+    if not limit or case is None:
+        return []
+    return [
+        {
+            'content': f"问题: {item['query']}\n解决方案: {item['solution']}",
+            'title': f"历史案例: {item['title']}",
+            'score': item['similarity'],
+            'source_type': 'case',
+            'document_id': item['caseId'],
+            'chunk_id': f"case:{item['caseId']}",
+            'metadata': {'vendor': item['vendor'], 'category': item['category'], 'rating': item['rating']}
+        }
+        for item in search_similar_cases(query, case.user_id, vendor=vendor, limit=limit, exclude_case_id=case_id)
+    ]
+
+
+def _search_context(query: str, vendor: Optional[str], case_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """按用户问题和设备厂商检索知识，并附上相似的已解决案例"""
+    search_filters = {}
+    if vendor:
+        search_filters["vendor"] = vendor
+    context = RetrievalService().search(query=query, filters=search_filters)
+    return _similar_case_context(query, vendor, case_id) + context
+
+
+def _timed_search(app, query: str, vendor: Optional[str], case_id: Optional[str] = None,
+                  token: Optional[CancellationToken] = None):
+    """在独立的应用上下文（独立的数据库会话）中检索，绑定调用方的取消令牌，返回 (结果, 耗时)"""
+    started_at = time.time()
+    with app.app_context(), bind_token(token):
+        check_cancelled()
+        context = _search_context(query, vendor, case_id)
+    return context, time.time() - started_at
+
+
+def _await_speculation(future: Future, timeout: float):
+    """
+    等待预检索结果
+
+    等待期间定期检查当前任务的取消令牌，任务被取消时抛出 TaskCancelled；
+    超过 timeout 秒仍未完成时抛出 TimeoutError。
+    """
+    deadline = time.time() + timeout
+    while True:
+        check_cancelled()
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError(f'预检索超过 {timeout:g} 秒未完成')
+        done, _ = wait([future], timeout=min(remaining, _SPECULATION_POLL_SECONDS))
+        if done:
+            return future.result()
+
 
 def analyze_query(state: AgentState) -> AgentState:
     """
@@ -28,8 +111,8 @@ def analyze_query(state: AgentState) -> AgentState:
     try:
         logger.info(f"开始分析用户查询: {state['user_query']}")
 
-        # 初始化LLM服务
-        llm_service = LLMService()
+        # 获取共享的LLM服务
+        llm_service = get_llm_service()
 
         # 分析用户查询
         analysis_result = llm_service.analyze_query(
@@ -103,8 +186,8 @@ def generate_clarification(state: AgentState) -> AgentState:
     try:
         logger.info("开始生成澄清问题")
 
-        # 初始化LLM服务
-        llm_service = LLMService()
+        # 获取共享的LLM服务
+        llm_service = get_llm_service()
 
         # 生成澄清问题
         clarification = llm_service.generate_clarification(
@@ -172,19 +255,8 @@ def retrieve_knowledge(state: AgentState) -> AgentState:
     try:
         logger.info("开始检索相关知识")
 
-        # 初始化检索服务
-        retrieval_service = RetrievalService()
-
-        # 构建检索过滤器
-        search_filters = {}
-        if state.get("vendor"):
-            search_filters["vendor"] = state["vendor"]
-
         # 执行知识检索
-        context = retrieval_service.search(
-            query=state["user_query"],
-            filters=search_filters
-        )
+        context = _search_context(state["user_query"], state.get("vendor"), state.get("case_id"))
 
         # 更新状态
         state["context"] = context
@@ -201,6 +273,81 @@ def retrieve_knowledge(state: AgentState) -> AgentState:
     return state
 
 
+def analyze_and_retrieve(state: AgentState) -> AgentState:
+    """
+    问题分析与知识检索并行执行节点
+
+    检索只依赖用户问题和设备厂商，在分析（一次大模型调用）进行的同时提前发起；分析结果
+    需要澄清或分析失败时取消并丢弃检索。检索线程绑定当前任务的取消令牌，等待检索结果时
+    同样响应取消，最长等待 AGENT_SPECULATIVE_RETRIEVAL_TIMEOUT 秒。
+    两个步骤的耗时及节省的时间记录在节点元数据 step_timings 中。
+
+    Args:
+        state: Agent状态
+
+    Returns:
+        更新后的Agent状态
+    """
+    started_at = time.time()
+    future = _get_speculation_executor().submit(
+        _timed_search, current_app._get_current_object(), state["user_query"], state.get("vendor"),
+        state.get("case_id"), current_token()
+    )
+
+    try:
+        state = analyze_query(state)
+    except BaseException:
+        future.cancel()
+        raise
+    analysis_seconds = time.time() - started_at
+
+    context, retrieval_seconds = None, None
+    discarded = bool(state.get("error")) or state.get("need_more_info", False)
+    if discarded:
+        future.cancel()
+    else:
+        try:
+            context, retrieval_seconds = _await_speculation(
+                future, current_app.config.get('AGENT_SPECULATIVE_RETRIEVAL_TIMEOUT', 60)
+            )
+        except Exception as e:
+            future.cancel()
+            logger.error(f"预检索失败: {str(e)}")
+        except BaseException:
+            future.cancel()
+            raise
+
+    if not discarded:
+        if context is None:
+            state["error"] = "知识检索失败"
+            state["context"] = []
+            state["step"] = "retrieval_error"
+        else:
+            state["context"] = context
+            state["step"] = "knowledge_retrieved"
+            logger.info(f"预检索完成，找到 {len(context)} 个相关文档")
+
+    elapsed = time.time() - started_at
+    timings = {
+        'analysis_seconds': round(analysis_seconds, 3),
+        'retrieval_seconds': round(retrieval_seconds, 3) if retrieval_seconds is not None else None,
+        'elapsed_seconds': round(elapsed, 3),
+        # 顺序执行需要两者之和，并行后只需较长的一个
+        'saved_seconds': round(max(analysis_seconds + (retrieval_seconds or 0) - elapsed, 0), 3),
+        'retrieval_discarded': discarded
+    }
+    logger.info(f"分析与检索并行完成: {timings}")
+
+    node = db.session.get(Node, state["current_node_id"])
+    if node:
+        metadata = dict(node.node_metadata or {})
+        metadata['step_timings'] = {**metadata.get('step_timings', {}), 'analyze_and_retrieve': timings}
+        node.node_metadata = metadata
+        db.session.commit()
+
+    return state
+
+
 def generate_solution(state: AgentState) -> AgentState:
     """
     生成解决方案节点
@@ -214,15 +361,21 @@ def generate_solution(state: AgentState) -> AgentState:
     try:
         logger.info("开始生成解决方案")
 
-        # 初始化LLM服务
-        llm_service = LLMService()
+        # 获取共享的LLM服务
+        llm_service = get_llm_service()
+
+        # 流式生成时首个片段即推送到节点主题
+        node = db.session.get(Node, state["current_node_id"])
+        stream_writer = create_stream_writer(node) if node else None
 
         # 生成解决方案
         solution = llm_service.generate_solution(
             query=state["user_query"],
             context=state.get("context", []),
             analysis=state.get("analysis_result"),
-            vendor=state.get("vendor", "通用")
+            vendor=state.get("vendor", "通用"),
+            user_context=state.get("conversation") or None,
+            on_token=stream_writer
         )
 
         # 更新状态
@@ -231,27 +384,32 @@ def generate_solution(state: AgentState) -> AgentState:
         state["step"] = "solution_generated"
 
         # 更新数据库节点
-        node = db.session.get(Node, state["current_node_id"])
         if node:
             node.type = "SOLUTION"
             node.title = "解决方案"
             node.status = "COMPLETED"
             node.content = {
-                "answer": solution.get("answer"),
+                "answer": solution.get("solution") or solution.get("answer"),
                 "sources": solution.get("sources", []),
                 "commands": solution.get("commands", []),
                 "category": state.get("category"),
                 "vendor": state.get("vendor", "通用")
             }
 
-            # 更新节点元数据
-            if node.node_metadata is None:
-                node.node_metadata = {}
-            node.node_metadata.update({
+            # 更新节点元数据（JSON列原地修改不会被跟踪，需赋值新的字典）
+            node.node_metadata = {
+                **(node.node_metadata or {}),
                 'solution_step': 'completed',
                 'context_count': len(state.get("context", [])),
-                'solution_ready': True
-            })
+                # 引用的知识库文档，文档变化时据此移除语义缓存中的该方案
+                'source_document_ids': sorted({
+                    item['document_id'] for item in state.get("context", [])
+                    if isinstance(item, dict) and item.get('document_id') and item.get('source_type') != 'case'
+                }),
+                'solution_ready': True,
+                'first_token_seconds': stream_writer.first_token_seconds if stream_writer else None,
+                'context_stats': solution.get('context_stats')
+            }
 
             db.session.commit()
 
@@ -8,11 +8,15 @@ import time
 import logging
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from app import create_app, db
+from app import db
 from app.models.case import Case, Node, Edge
 from app.services.infrastructure.task_monitor import with_monitoring_and_retry
+from app.services.infrastructure.cancellation import TaskCancelled, on_cancel
+from app.services.infrastructure.worker_runtime import worker_app_context
+from app.services.infrastructure.progress_bus import publish_node_update, report_progress
 from app.services.retrieval.hybrid_retrieval import get_hybrid_retrieval, search_knowledge
-from app.services.ai.llm_service import LLMService
+from app.services.ai.llm_service import get_llm_service
+from app.services.ai.node_stream import create_stream_writer
 from app.services.storage.cache_service import get_cache_service, cached_retrieval_call, cached_llm_call
 from app.utils.monitoring import monitor_performance
 
@@ -25,7 +29,7 @@ class RetrievalService:
         self.hybrid_retrieval = get_hybrid_retrieval()
 
     @monitor_performance("retrieval_search", slow_threshold=1.0)
-    @cached_retrieval_call("retrieval_search", expire_time=1800)
+    @cached_retrieval_call("retrieval_search", expire_time=1800, text_args=('query',))
     def search(self, query: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """执行混合检索"""
         try:
@@ -37,6 +41,28 @@ class RetrievalService:
             return []
 
 
+def mark_node_cancelled(reason: TaskCancelled, case_id: str, node_id: str, *args):
+    """
+    Agent任务被取消或超时后，把仍在处理中的节点标记为带错误信息的完成状态
+
+    作为任务的取消处理函数使用，参数与任务函数相同（前面加上取消原因）。
+    """
+    with worker_app_context():
+        node = db.session.get(Node, node_id)
+        if node is None or node.status != 'PROCESSING':
+            return
+        node.status = 'COMPLETED'
+        node.content = {
+            'error': '处理超时，请重试' if reason.status == 'timed_out' else '处理已取消',
+            'error_details': reason.message,
+            'cancel_reason': reason.status
+        }
+        db.session.commit()
+        publish_node_update(node)
+        logger.info(f"任务已停止，节点状态已更新: case_id={case_id}, node_id={node_id}, 原因: {reason.message}")
+
+
+@on_cancel(mark_node_cancelled)
 @with_monitoring_and_retry(max_retries=3, retry_intervals=[10, 30, 60])
 def analyze_user_query(case_id: str, node_id: str, query: str):
     """
@@ -47,17 +73,11 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
         node_id: 节点ID
         query: 用户查询内容
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         try:
             logger.info(f"开始分析用户查询: case_id={case_id}, node_id={node_id}")
 
-            # 线程池队列不支持get_current_job，跳过任务状态更新
-            # job = get_current_job()
-            # if job:
-            #     job.meta['status'] = 'processing'
-            #     job.meta['progress'] = 0
-            #     job.save_meta()
+            report_progress('initializing', 0, case_id=case_id, node_id=node_id)
 
             # 获取节点
             node = db.session.get(Node, node_id)
@@ -69,10 +89,7 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
             if not case:
                 raise Exception(f"案例 {case_id} 不存在")
 
-            # 线程池队列不支持job进度更新
-            # if job:
-            #     job.meta['progress'] = 20
-            #     job.save_meta()
+            report_progress('analyzing_query', 20, case_id=case_id, node_id=node_id)
 
             # 使用AI服务分析查询
             logger.info(f"开始AI分析用户查询: {query}")
@@ -83,7 +100,7 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
             try:
 
                 # 调用LLM服务进行查询分析
-                llm_service = LLMService()
+                llm_service = get_llm_service()
                 analysis_result = llm_service.analyze_query(
                     query=query,
                     context="",
@@ -101,12 +118,10 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
                 analysis_result = _analyze_query_content(query)
                 context = []
 
-            # 线程池队列不支持job进度更新
-            # if job:
-            #     job.meta['progress'] = 60
-            #     job.save_meta()
+            report_progress('generating_answer', 60, case_id=case_id, node_id=node_id)
 
             # 根据分析结果决定下一步
+            stream_writer = None
             if analysis_result.get('need_more_info'):
                 # 需要更多信息，生成追问
                 try:
@@ -130,12 +145,15 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
                     'vendor': vendor
                 }
             else:
-                # 可以直接提供解决方案
+                # 可以直接提供解决方案；流式生成时首个片段即推送给前端
+                stream_writer = create_stream_writer(node)
                 try:
                     solution = llm_service.generate_solution(
                         query=query,
                         context=context,
-                        vendor=vendor or "通用"
+                        vendor=vendor or "通用",
+                        analysis=analysis_result,
+                        on_token=stream_writer
                     )
                     # 检查LLM服务是否返回错误信息
                     if 'solution' in solution and ('错误' in solution['solution'] or 'timed out' in solution['solution']):
@@ -173,6 +191,9 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
                 'context_count': len(context),
                 'processing_time': 0  # 线程池队列不支持job时间跟踪
             })
+            if stream_writer is not None and stream_writer.first_token_seconds is not None:
+                # 重新赋值使JSON列的变更被记录
+                node.node_metadata = {**node.node_metadata, 'first_token_seconds': stream_writer.first_token_seconds}
 
             # 更新案例时间
             case.updated_at = datetime.utcnow()
@@ -180,11 +201,8 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
             # 提交数据库更改
             db.session.commit()
 
-            # 线程池队列不支持job状态更新
-            # if job:
-            #     job.meta['status'] = 'completed'
-            #     job.meta['progress'] = 100
-            #     job.save_meta()
+            publish_node_update(node)
+            report_progress('completed', 100, case_id=case_id, node_id=node_id)
 
             logger.info(f"用户查询分析完成: case_id={case_id}, node_id={node_id}")
 
@@ -202,18 +220,16 @@ def analyze_user_query(case_id: str, node_id: str, query: str):
                         'error_details': str(e)
                     }
                     db.session.commit()
+                    publish_node_update(node)
             except:
                 pass
 
-            # 线程池队列不支持job状态更新
-            # if job:
-            #     job.meta['status'] = 'failed'
-            #     job.meta['error'] = str(e)
-            #     job.save_meta()
+            report_progress('error', case_id=case_id, node_id=node_id, error=str(e))
 
             raise
 
 
+@on_cancel(mark_node_cancelled)
 @with_monitoring_and_retry(max_retries=3, retry_intervals=[10, 30, 60])
 def process_user_response(case_id: str, node_id: str, response_data: Dict[str, Any],
                          retrieval_weight: float = 0.7, filter_tags: Optional[List[str]] = None):
@@ -227,15 +243,9 @@ def process_user_response(case_id: str, node_id: str, response_data: Dict[str, A
         retrieval_weight: 检索权重
         filter_tags: 过滤标签
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context() as app:
         try:
-            # 线程池队列不支持get_current_job
-            # job = get_current_job()
-            # if job:
-            #     job.meta['status'] = 'processing'
-            #     job.meta['progress'] = 0
-            #     job.save_meta()
+            report_progress('initializing', 0, case_id=case_id, node_id=node_id)
 
             # 获取节点
             node = db.session.get(Node, node_id)
@@ -249,18 +259,12 @@ def process_user_response(case_id: str, node_id: str, response_data: Dict[str, A
 
             app.logger.info(f"开始处理用户响应: case_id={case_id}")
 
-            # 线程池队列不支持job进度更新
-            # if job:
-            #     job.meta['progress'] = 30
-            #     job.save_meta()
+            report_progress('processing_response', 30, case_id=case_id, node_id=node_id)
 
             # 处理用户响应（模拟）
             processed_response = _process_response_content(response_data, retrieval_weight, filter_tags)
 
-            # 线程池队列不支持job进度更新
-            # if job:
-            #     job.meta['progress'] = 70
-            #     job.save_meta()
+            report_progress('generating_solution', 70, case_id=case_id, node_id=node_id)
 
             # 生成最终解决方案
             solution = _generate_final_solution(case_id, processed_response)
@@ -292,11 +296,8 @@ def process_user_response(case_id: str, node_id: str, response_data: Dict[str, A
             # 提交数据库更改
             db.session.commit()
 
-            # 线程池队列不支持job状态更新
-            # if job:
-            #     job.meta['status'] = 'completed'
-            #     job.meta['progress'] = 100
-            #     job.save_meta()
+            publish_node_update(node)
+            report_progress('completed', 100, case_id=case_id, node_id=node_id)
 
             app.logger.info(f"用户响应处理完成: case_id={case_id}, node_id={node_id}")
 
@@ -314,14 +315,11 @@ def process_user_response(case_id: str, node_id: str, response_data: Dict[str, A
                         'error_details': str(e)
                     }
                     db.session.commit()
+                    publish_node_update(node)
             except:
                 pass
 
-            # 线程池队列不支持job状态更新
-            # if job:
-            #     job.meta['status'] = 'failed'
-            #     job.meta['error'] = str(e)
-            #     job.save_meta()
+            report_progress('error', case_id=case_id, node_id=node_id, error=str(e))
 
             raise
 
@@ -447,7 +445,9 @@ def submit_query_analysis_task(case_id: str, node_id: str, query: str) -> str:
         case_id,
         node_id,
         query,
-        timeout='10m'  # 10分钟超时
+        timeout='10m',  # 10分钟超时
+        lane='interactive',
+        dedupe_key=(case_id, node_id)
     )
 
     logger.info(f"查询分析任务已提交: {task.id}")
@@ -478,7 +478,9 @@ def submit_response_processing_task(case_id: str, node_id: str, response_data: D
         response_data,
         retrieval_weight,
         filter_tags,
-        timeout='10m'  # 10分钟超时
+        timeout='10m',  # 10分钟超时
+        lane='interactive',
+        dedupe_key=(case_id, node_id)
     )
 
     logger.info(f"响应处理任务已提交: {task.id}")
@@ -25,3 +25,4 @@ class AgentState(TypedDict):
     solution: Optional[Dict]         # 解决方案
     error: Optional[str]             # 错误信息
     step: str                        # 当前处理步骤
+    conversation: Optional[str]      # 整理后的多轮对话历史（最近轮次 + 早期摘要）
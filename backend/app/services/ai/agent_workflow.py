@@ -2,23 +2,67 @@
 Agent工作流编排
 
 使用langgraph构建智能对话Agent的状态机工作流。
+每个步骤开始时向案例主题发布进度事件，结束后推送节点的最新内容（见 progress_bus）。
+步骤完成后保存检查点，任务重试或恢复时跳过输入相同的已完成步骤（见 workflow_checkpoint）。
+
+编译后的工作流不保存运行状态，可在多个任务间并发复用。工作流在注册表中按名称登记
+构建函数和版本，get_workflow 每个进程只编译一次；开发时可通过 reload_workflows 丢弃
+已编译的工作流（可选重新加载节点实现），下次获取时重新编译。
 """
 
+import importlib
 import logging
-from typing import Callable
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from langgraph.graph import StateGraph, END
+from app import db
+from app.models.case import Node
+from app.services.ai import agent_nodes
 from app.services.ai.agent_state import AgentState
-from app.services.ai.agent_nodes import (
-    analyze_query,
-    generate_clarification,
-    retrieve_knowledge,
-    generate_solution,
-    handle_error
-)
+from app.services.ai.workflow_checkpoint import load_checkpoint, restore_checkpoint, save_checkpoint, state_digest
+from app.services.infrastructure.progress_bus import publish_node_update, report_progress
 
 logger = logging.getLogger(__name__)
 
 
+def with_progress(name: str, step: Optional[Callable] = None) -> Callable:
+    """
+    包装工作流步骤，发布步骤进度和节点更新事件，并保存或使用步骤检查点
+
+    Args:
+        name: 步骤名称
+        step: 步骤函数，缺省使用 agent_nodes 中的同名函数（编译时读取，重新加载节点实现后生效）
+
+    Returns:
+        包装后的步骤函数
+    """
+    step = step or getattr(agent_nodes, name)
+
+    @wraps(step)
+    def run(state: AgentState) -> AgentState:
+        case_id = state.get("case_id")
+        node_id = state.get("current_node_id")
+        report_progress(name, case_id=case_id, node_id=node_id)
+
+        # 任务重试或恢复时，输入相同的已完成步骤直接使用检查点
+        input_digest = state_digest(state)
+        checkpoint = load_checkpoint(node_id, name, input_digest)
+        if checkpoint is not None:
+            node = db.session.get(Node, node_id)
+            result = restore_checkpoint(checkpoint, node)
+        else:
+            result = step(state)
+            # 步骤已提交节点内容，推送给订阅方（会话中已加载的节点不会再次查询）
+            node = db.session.get(Node, node_id) if node_id else None
+            save_checkpoint(name, input_digest, result, node)
+
+        if node is not None:
+            publish_node_update(node)
+        return result
+    return run
+
+
 def should_generate_clarification(state: AgentState) -> str:
     """
     判断是否需要生成澄清问题
@@ -38,6 +82,25 @@ def should_generate_clarification(state: AgentState) -> str:
     return "retrieve_knowledge"
 
 
+def route_after_speculative_retrieval(state: AgentState) -> str:
+    """
+    分析与检索并行完成后的路由：需要澄清时生成澄清问题（检索结果已丢弃），否则直接生成解决方案
+
+    Args:
+        state: Agent状态
+
+    Returns:
+        下一个节点的名称
+    """
+    if state.get("error"):
+        return "handle_error"
+
+    if state.get("need_more_info", False):
+        return "generate_clarification"
+
+    return "generate_solution"
+
+
 def should_continue_to_solution(state: AgentState) -> str:
     """
     判断是否继续生成解决方案
@@ -91,11 +154,11 @@ def create_agent_workflow() -> Callable:
         workflow = StateGraph(AgentState)
 
         # 添加节点
-        workflow.add_node("analyze_query", analyze_query)
-        workflow.add_node("generate_clarification", generate_clarification)
-        workflow.add_node("retrieve_knowledge", retrieve_knowledge)
-        workflow.add_node("generate_solution", generate_solution)
-        workflow.add_node("handle_error", handle_error)
+        workflow.add_node("analyze_query", with_progress("analyze_query"))
+        workflow.add_node("generate_clarification", with_progress("generate_clarification"))
+        workflow.add_node("retrieve_knowledge", with_progress("retrieve_knowledge"))
+        workflow.add_node("generate_solution", with_progress("generate_solution"))
+        workflow.add_node("handle_error", with_progress("handle_error"))
 
         # 设置入口点
         workflow.set_entry_point("analyze_query")
@@ -152,6 +215,68 @@ def create_agent_workflow() -> Callable:
         raise
 
 
+def create_speculative_agent_workflow() -> Callable:
+    """
+    创建分析与检索并行的Agent工作流
+
+    与 create_agent_workflow 的流程相同，但知识检索与问题分析同时进行（analyze_and_retrieve），
+    不需要澄清时省去一次检索的等待。
+
+    Returns:
+        编译后的工作流图
+    """
+    try:
+        logger.info("开始创建并行检索Agent工作流")
+
+        workflow = StateGraph(AgentState)
+
+        workflow.add_node("analyze_and_retrieve", with_progress("analyze_and_retrieve"))
+        workflow.add_node("generate_clarification", with_progress("generate_clarification"))
+        workflow.add_node("generate_solution", with_progress("generate_solution"))
+        workflow.add_node("handle_error", with_progress("handle_error"))
+
+        workflow.set_entry_point("analyze_and_retrieve")
+
+        workflow.add_conditional_edges(
+            "analyze_and_retrieve",
+            route_after_speculative_retrieval,
+            {
+                "generate_clarification": "generate_clarification",
+                "generate_solution": "generate_solution",
+                "handle_error": "handle_error"
+            }
+        )
+
+        workflow.add_conditional_edges(
+            "generate_clarification",
+            should_continue_to_solution,
+            {
+                "handle_error": "handle_error",
+                END: END
+            }
+        )
+
+        workflow.add_conditional_edges(
+            "generate_solution",
+            should_end_workflow,
+            {
+                "handle_error": "handle_error",
+                END: END
+            }
+        )
+
+        workflow.add_edge("handle_error", END)
+
+        compiled_workflow = workflow.compile()
+
+        logger.info("并行检索Agent工作流创建成功")
+        return compiled_workflow
+
+    except Exception as e:
+        logger.error(f"创建并行检索Agent工作流失败: {str(e)}")
+        raise
+
+
 def create_response_processing_workflow() -> Callable:
     """
     创建用户响应处理工作流
@@ -168,9 +293,9 @@ def create_response_processing_workflow() -> Callable:
         workflow = StateGraph(AgentState)
 
         # 添加节点（跳过分析，直接检索和生成解决方案）
-        workflow.add_node("retrieve_knowledge", retrieve_knowledge)
-        workflow.add_node("generate_solution", generate_solution)
-        workflow.add_node("handle_error", handle_error)
+        workflow.add_node("retrieve_knowledge", with_progress("retrieve_knowledge"))
+        workflow.add_node("generate_solution", with_progress("generate_solution"))
+        workflow.add_node("handle_error", with_progress("handle_error"))
 
         # 设置入口点
         workflow.set_entry_point("retrieve_knowledge")
@@ -206,3 +331,84 @@ def create_response_processing_workflow() -> Callable:
     except Exception as e:
         logger.error(f"创建响应处理工作流失败: {str(e)}")
         raise
+
+
+AGENT_WORKFLOW = 'agent'
+SPECULATIVE_AGENT_WORKFLOW = 'agent_speculative'
+RESPONSE_PROCESSING_WORKFLOW = 'response_processing'
+
+# 工作流注册表：名称 -> (版本, 构建函数)；编译结果按 (名称, 版本) 缓存
+_workflow_builders: Dict[str, Tuple[int, Callable[[], Any]]] = {}
+_compiled_workflows: Dict[Tuple[str, int], Any] = {}
+_workflow_lock = threading.Lock()
+
+
+def register_workflow(name: str, builder: Callable[[], Any], version: int = 1) -> None:
+    """
+    登记工作流构建函数
+
+    Args:
+        name: 工作流名称
+        builder: 返回编译后工作流的函数
+        version: 版本号，修改图结构时递增，旧版本的编译结果不再使用
+    """
+    with _workflow_lock:
+        _workflow_builders[name] = (version, builder)
+
+
+def get_workflow(name: str) -> Any:
+    """
+    获取编译后的工作流，每个进程只编译一次
+
+    Args:
+        name: 工作流名称，如 AGENT_WORKFLOW、RESPONSE_PROCESSING_WORKFLOW
+
+    Returns:
+        编译后的工作流图
+
+    Raises:
+        ValueError: 工作流未登记
+    """
+    with _workflow_lock:
+        if name not in _workflow_builders:
+            raise ValueError(f"未登记的工作流: {name}")
+        version, builder = _workflow_builders[name]
+        key = (name, version)
+        workflow = _compiled_workflows.get(key)
+        if workflow is None:
+            workflow = _compiled_workflows[key] = builder()
+            logger.info(f"工作流已编译: {name} (版本 {version})")
+        return workflow
+
+
+def reload_workflows(reload_nodes: bool = False) -> List[Dict[str, Any]]:
+    """
+    丢弃已编译的工作流，下次获取时重新编译（开发调试使用）
+
+    Args:
+        reload_nodes: 是否先重新加载 agent_nodes 模块，使修改后的步骤实现生效
+
+    Returns:
+        List[Dict]: 重新加载后的注册表信息
+    """
+    if reload_nodes:
+        importlib.reload(agent_nodes)
+        logger.info("已重新加载Agent节点实现")
+    with _workflow_lock:
+        _compiled_workflows.clear()
+    logger.info("已清除编译后的工作流")
+    return list_workflows()
+
+
+def list_workflows() -> List[Dict[str, Any]]:
+    """注册表中的工作流及其版本和是否已编译"""
+    with _workflow_lock:
+        return [
+            {'name': name, 'version': version, 'compiled': (name, version) in _compiled_workflows}
+            for name, (version, _) in sorted(_workflow_builders.items())
+        ]
+
+
+register_workflow(AGENT_WORKFLOW, create_agent_workflow)
+register_workflow(SPECULATIVE_AGENT_WORKFLOW, create_speculative_agent_workflow)
+register_workflow(RESPONSE_PROCESSING_WORKFLOW, create_response_processing_workflow)
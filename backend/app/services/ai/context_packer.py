@@ -0,0 +1,221 @@
+"""
+检索上下文打包
+
+检索返回的文档片段原样放入解决方案提示词时，提示词长度随片段数量增长，其中不少是
+相互重叠的文本，拖慢生成并增加费用。打包器在调用模型前处理检索结果：
+
+- 去重：同一片段或文本高度重叠（字符三元组相似度达到阈值）的片段只保留得分较高的一个
+- 排序：按检索的融合得分从高到低
+- 裁剪：每个片段只保留与问题相关的句子（按原文顺序），没有相关句子时保留开头部分
+- 限额：按快速估算的token数依次放入，超出预算的片段截断或丢弃
+
+打包结果记录放入和丢弃的token数，便于观察预算设置是否合适。
+"""
+
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+_CJK_CHARS = r'\u3400-\u9fff\uf900-\ufaff'
+_CJK_PATTERN = re.compile(f'[{_CJK_CHARS}]')
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.\-/]*')
+_SENTENCE_PATTERN = re.compile(r'[^。！？!?；;\n]+[。！？!?；;\n]*')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+# 截断后剩余预算少于该值时不再放入片段
+_MIN_PIECE_TOKENS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    快速估算文本的token数
+
+    中文字符按每字一个token，其余非空白字符按每4个字符一个token计算，
+    不调用分词器，误差在提示词预算控制的可接受范围内。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(_SPACE_PATTERN.sub('', text)) - cjk
+    return cjk + math.ceil(max(other, 0) / 4)
+
+
+def _query_terms(query: str) -> Set[str]:
+    """问题中的英文词/数字（转小写）与中文二元组"""
+    terms = {word.lower() for word in _WORD_PATTERN.findall(query or '') if len(word) > 1}
+    for run in re.findall(f'[{_CJK_CHARS}]+', query or ''):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """按估算的token数截断文本"""
+    tokens = estimate_tokens(text)
+    if tokens <= limit:
+        return text
+    cut = int(len(text) * limit / tokens)
+    while cut > 0 and estimate_tokens(text[:cut]) > limit:
+        cut = int(cut * 0.9)
+    return text[:cut]
+
+
+def _shingles(text: str) -> Set[str]:
+    normalized = _SPACE_PATTERN.sub('', text).lower()
+    if len(normalized) < 3:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+def _chunk_score(chunk: Dict[str, Any]) -> float:
+    for key in ('score', 'similarity', 'relevance_score'):
+        value = chunk.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+    return 0.0
+
+
+@dataclass
+class PackedContext:
+    """打包结果"""
+    text: str = ''
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    packed_tokens: int = 0
+    dropped_tokens: int = 0
+    duplicate_chunks: int = 0
+    dropped_chunks: int = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'packed_tokens': self.packed_tokens,
+            'dropped_tokens': self.dropped_tokens,
+            'packed_chunks': len(self.chunks),
+            'duplicate_chunks': self.duplicate_chunks,
+            'dropped_chunks': self.dropped_chunks
+        }
+
+
+class ContextPacker:
+    """按token预算打包检索结果"""
+
+    def __init__(self, budget_tokens: Optional[int] = None, chunk_tokens: Optional[int] = None,
+                 duplicate_threshold: Optional[float] = None):
+        """
+        Args:
+            budget_tokens: 全部片段的token预算，缺省读取 LLM_CONTEXT_TOKEN_BUDGET
+            chunk_tokens: 单个片段裁剪后的token上限，缺省读取 LLM_CONTEXT_CHUNK_TOKENS
+            duplicate_threshold: 判定重复的相似度阈值，缺省读取 LLM_CONTEXT_DUPLICATE_THRESHOLD
+        """
+        config = current_app.config if has_app_context() else {}
+        # 显式传入的0同样有效（例如预算为0时不放入任何片段），只有None才读取配置
+        self.budget_tokens = (budget_tokens if budget_tokens is not None
+                              else config.get('LLM_CONTEXT_TOKEN_BUDGET', 1500))
+        self.chunk_tokens = chunk_tokens if chunk_tokens is not None else config.get('LLM_CONTEXT_CHUNK_TOKENS', 400)
+        self.duplicate_threshold = (duplicate_threshold if duplicate_threshold is not None
+                                    else config.get('LLM_CONTEXT_DUPLICATE_THRESHOLD', 0.8))
+
+    def pack(self, query: str, results: List[Dict[str, Any]]) -> PackedContext:
+        """
+        打包检索结果
+
+        Args:
+            query: 用户问题，用于挑选相关句子
+            results: RetrievalService.search 返回的片段列表
+
+        Returns:
+            PackedContext: 拼接后的文本、放入的片段及token统计
+        """
+        packed = PackedContext()
+        ranked = sorted((chunk for chunk in results or [] if (chunk.get('content') or '').strip()),
+                        key=_chunk_score, reverse=True)
+        unique = self._dedupe(ranked, packed)
+
+        terms = _query_terms(query)
+        remaining = self.budget_tokens
+        pieces = []
+        for chunk in unique:
+            content = chunk['content']
+            original_tokens = estimate_tokens(content)
+            limit = min(self.chunk_tokens, remaining)
+            trimmed = self._trim(content, terms, limit) if limit >= _MIN_PIECE_TOKENS else ''
+            tokens = estimate_tokens(trimmed)
+
+            if not trimmed:
+                packed.dropped_chunks += 1
+                packed.dropped_tokens += original_tokens
+                continue
+
+            remaining -= tokens
+            packed.packed_tokens += tokens
+            packed.dropped_tokens += max(original_tokens - tokens, 0)
+            packed.chunks.append({**chunk, 'content': trimmed})
+            title = chunk.get('title') or '参考资料'
+            pieces.append(f"[{len(pieces) + 1}] {title}\n{trimmed}")
+
+        packed.text = '\n\n'.join(pieces)
+        logger.info(f"检索上下文打包完成: {packed.stats()}")
+        return packed
+
+    def _dedupe(self, ranked: List[Dict[str, Any]], packed: PackedContext) -> List[Dict[str, Any]]:
+        """按得分从高到低保留，与已保留片段同源或高度重叠的片段丢弃"""
+        kept = []
+        kept_ids = set()
+        kept_shingles = []
+        for chunk in ranked:
+            chunk_id = chunk.get('chunk_id')
+            shingles = _shingles(chunk['content'])
+            duplicate = chunk_id is not None and chunk_id in kept_ids
+            if not duplicate:
+                for other in kept_shingles:
+                    overlap = len(shingles & other)
+                    # 包含关系（短片段是长片段的一部分）同样视为重复
+                    if overlap and overlap / min(len(shingles), len(other)) >= self.duplicate_threshold:
+                        duplicate = True
+                        break
+            if duplicate:
+                packed.duplicate_chunks += 1
+                packed.dropped_tokens += estimate_tokens(chunk['content'])
+                continue
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+            if chunk_id is not None:
+                kept_ids.add(chunk_id)
+        return kept
+
+    def _trim(self, content: str, terms: Set[str], limit: int) -> str:
+        """保留与问题相关的句子（按原文顺序），不超过 limit 个token"""
+        sentences = [s.strip() for s in _SENTENCE_PATTERN.findall(content) if s.strip()]
+        if not sentences:
+            return ''
+
+        hits = [sum(1 for term in terms if term in sentence.lower()) for sentence in sentences]
+        if any(hits):
+            # 相关度高的句子优先占用预算，输出时恢复原文顺序
+            order = sorted((i for i, hit in enumerate(hits) if hit), key=lambda i: -hits[i])
+        else:
+            order = range(len(sentences))
+
+        selected = []
+        used = 0
+        for i in order:
+            tokens = estimate_tokens(sentences[i])
+            if used + tokens > limit:
+                continue
+            selected.append(i)
+            used += tokens
+        if not selected:
+            # 最相关的一句本身超出上限时截断该句
+            return truncate_tokens(sentences[next(iter(order))], limit)
+        return ''.join(sentences[i] for i in sorted(selected))
+
+
+def pack_context(query: str, results: List[Dict[str, Any]], budget_tokens: Optional[int] = None) -> PackedContext:
+    """按配置的预算打包检索结果，见 ContextPacker.pack"""
+    return ContextPacker(budget_tokens=budget_tokens).pack(query, results)
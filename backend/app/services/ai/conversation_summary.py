@@ -0,0 +1,276 @@
+"""
+多轮对话历史摘要
+
+案例在分析、澄清和用户补充之间多次往返时，把全部历史原样放入提示词会使后续轮次的提示词
+越来越长、越来越慢。本模块把案例的对话历史整理为有界的上下文：
+
+- 最近 CONVERSATION_RECENT_TURNS 轮原样保留，每轮不超过 CONVERSATION_TURN_TOKEN_BUDGET 个token
+- 更早的轮次压缩为摘要（不超过 CONVERSATION_SUMMARY_TOKEN_BUDGET 个token），保存在案例元数据的
+  conversation_summary 中；之后只把新移出最近窗口的轮次合并进已有摘要，每轮的摘要成本不随案例变长
+- 摘要记录覆盖的节点及其内容指纹，已覆盖的节点被重新生成或删除时摘要失效并重新生成
+- 调用方直接传入的对话历史没有可写回的案例，摘要按已摘要轮次的内容链式指纹缓存在进程内，
+  历史变长时从最长的已缓存前缀增量合并
+
+摘要由LLM服务的 fast 层级模型生成，Mock模式或调用失败时按token预算截取原文。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import current_app, has_app_context
+
+from app.models.case import Case, Node
+from app.services.ai.context_packer import estimate_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_METADATA_KEY = 'conversation_summary'
+
+# 传入历史的摘要缓存：已摘要轮次的链式指纹 -> 摘要，按最近使用淘汰
+_HISTORY_SUMMARY_CACHE_SIZE = 256
+_history_summaries: 'OrderedDict[str, str]' = OrderedDict()
+_history_summaries_lock = threading.Lock()
+
+_ROLE_LABELS = {
+    'USER_QUERY': '用户问题',
+    'USER_RESPONSE': '用户补充',
+    'AI_ANALYSIS': 'AI分析',
+    'AI_CLARIFICATION': 'AI澄清',
+    'SOLUTION': '解决方案'
+}
+
+# 节点内容中依次尝试的文本字段
+_CONTENT_FIELDS = ('text', 'response', 'answer', 'analysis', 'clarification', 'questions')
+
+
+@dataclass
+class ConversationTurn:
+    """一轮对话（一个已完成的节点）"""
+    node_id: str
+    role: str
+    text: str
+    digest: str
+
+
+@dataclass
+class ConversationContext:
+    """整理后的对话上下文"""
+    summary: str = ''
+    recent: List[ConversationTurn] = field(default_factory=list)
+    summarized_turns: int = 0
+    summary_rebuilt: bool = False
+
+    @property
+    def text(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"【早期对话摘要】\n{self.summary}")
+        if self.recent:
+            parts.append("【最近对话】\n" + '\n'.join(f"{turn.role}: {turn.text}" for turn in self.recent))
+        return '\n\n'.join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'summarized_turns': self.summarized_turns,
+            'recent_turns': len(self.recent),
+            'summary_tokens': estimate_tokens(self.summary),
+            'context_tokens': estimate_tokens(self.text),
+            'summary_rebuilt': self.summary_rebuilt
+        }
+
+
+def _node_text(node: Node) -> str:
+    content = node.content
+    if isinstance(content, dict):
+        for key in _CONTENT_FIELDS:
+            value = content.get(key)
+            if value:
+                return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        return ''
+    if content is None:
+        return ''
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+def _digest(node: Node) -> str:
+    """节点内容指纹，节点重新生成后随之变化"""
+    payload = json.dumps(node.content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def _fingerprint(turns: List[ConversationTurn]) -> str:
+    joined = '|'.join(f"{turn.node_id}:{turn.digest}" for turn in turns)
+    return hashlib.md5(joined.encode('utf-8')).hexdigest()
+
+
+def collect_turns(case_id: str, exclude_node_ids: Iterable[str] = ()) -> List[ConversationTurn]:
+    """按创建时间收集案例中已完成且有内容的节点，跳过出错的节点"""
+    excluded = set(exclude_node_ids or ())
+    nodes = (Node.query
+             .filter(Node.case_id == case_id, Node.status != 'PROCESSING')
+             .order_by(Node.created_at, Node.id)
+             .all())
+    turns = []
+    for node in nodes:
+        if node.id in excluded or (isinstance(node.content, dict) and node.content.get('error')):
+            continue
+        text = _node_text(node).strip()
+        if text:
+            turns.append(ConversationTurn(node.id, _ROLE_LABELS.get(node.type, node.type or '节点'),
+                                          text, _digest(node)))
+    return turns
+
+
+class ConversationWindow:
+    """按最近轮次 + 滚动摘要整理对话历史"""
+
+    def __init__(self, recent_turns: Optional[int] = None, turn_tokens: Optional[int] = None,
+                 summary_tokens: Optional[int] = None):
+        """
+        Args:
+            recent_turns: 原样保留的最近轮数，缺省读取 CONVERSATION_RECENT_TURNS
+            turn_tokens: 每轮的token上限，缺省读取 CONVERSATION_TURN_TOKEN_BUDGET
+            summary_tokens: 摘要的token上限，缺省读取 CONVERSATION_SUMMARY_TOKEN_BUDGET
+        """
+        config = current_app.config if has_app_context() else {}
+        self.recent_turns = recent_turns if recent_turns is not None else config.get('CONVERSATION_RECENT_TURNS', 4)
+        self.turn_tokens = turn_tokens or config.get('CONVERSATION_TURN_TOKEN_BUDGET', 300)
+        self.summary_tokens = summary_tokens or config.get('CONVERSATION_SUMMARY_TOKEN_BUDGET', 400)
+
+    def build(self, case: Case, exclude_node_ids: Iterable[str] = ()) -> ConversationContext:
+        """
+        整理案例的对话历史，摘要有变化时写回案例元数据（由调用方提交）
+
+        Args:
+            case: 案例
+            exclude_node_ids: 不计入历史的节点（当前处理中的节点、本轮的用户补充）
+
+        Returns:
+            ConversationContext
+        """
+        turns = [ConversationTurn(t.node_id, t.role, truncate_tokens(t.text, self.turn_tokens), t.digest)
+                 for t in collect_turns(case.id, exclude_node_ids)]
+        split = max(len(turns) - self.recent_turns, 0)
+        older, recent = turns[:split], turns[split:]
+        context = ConversationContext(recent=recent, summarized_turns=len(older))
+        if not older:
+            return context
+
+        cached = (case.case_metadata or {}).get(SUMMARY_METADATA_KEY) or {}
+        covered = cached.get('node_ids') or []
+        reusable = (cached.get('text') and len(covered) <= len(older)
+                    and [t.node_id for t in older[:len(covered)]] == covered
+                    and _fingerprint(older[:len(covered)]) == cached.get('fingerprint'))
+
+        if reusable and len(covered) == len(older):
+            context.summary = cached['text']
+            return context
+
+        if reusable:
+            # 只合并新移出最近窗口的轮次
+            previous, pending = cached['text'], older[len(covered):]
+        else:
+            if cached:
+                logger.info(f"案例 {case.id} 的对话摘要已失效（早期节点已变化），重新生成")
+            previous, pending = '', older
+            context.summary_rebuilt = True
+
+        context.summary = self._summarize(previous, pending)
+        case.case_metadata = {
+            **(case.case_metadata or {}),
+            SUMMARY_METADATA_KEY: {
+                'text': context.summary,
+                'node_ids': [t.node_id for t in older],
+                'fingerprint': _fingerprint(older),
+                'updated_at': datetime.utcnow().isoformat()
+            }
+        }
+        return context
+
+    def build_from_history(self, history: List[Dict[str, Any]]) -> ConversationContext:
+        """
+        整理调用方传入的对话历史
+
+        摘要缓存在进程内而不写回案例；之前已摘要过的轮次不再重复摘要，只合并新移出最近窗口的轮次。
+
+        Args:
+            history: 每项包含 role（user/assistant）和 content
+        """
+        turns = []
+        for i, entry in enumerate(history or []):
+            text = str((entry or {}).get('content') or '').strip()
+            if text:
+                role = '用户' if entry.get('role') == 'user' else 'AI'
+                text = truncate_tokens(text, self.turn_tokens)
+                digest = hashlib.md5(f"{role}:{text}".encode('utf-8')).hexdigest()
+                turns.append(ConversationTurn(str(i), role, text, digest))
+        split = max(len(turns) - self.recent_turns, 0)
+        context = ConversationContext(recent=turns[split:], summarized_turns=split)
+        if not split:
+            return context
+
+        # keys[k] 为前 k+1 轮的链式指纹，包含摘要预算，预算不同的摘要互不复用
+        keys, chain = [], f"{self.summary_tokens}"
+        for turn in turns[:split]:
+            chain = hashlib.md5(f"{chain}|{turn.digest}".encode('utf-8')).hexdigest()
+            keys.append(chain)
+
+        covered, previous = 0, ''
+        with _history_summaries_lock:
+            for count in range(split, 0, -1):
+                cached = _history_summaries.get(keys[count - 1])
+                if cached is not None:
+                    _history_summaries.move_to_end(keys[count - 1])
+                    covered, previous = count, cached
+                    break
+
+        if covered == split:
+            context.summary = previous
+            return context
+
+        context.summary = self._summarize(previous, turns[covered:split])
+        with _history_summaries_lock:
+            _history_summaries[keys[split - 1]] = context.summary
+            while len(_history_summaries) > _HISTORY_SUMMARY_CACHE_SIZE:
+                _history_summaries.popitem(last=False)
+        return context
+
+    def _summarize(self, previous: str, turns: List[ConversationTurn]) -> str:
+        from app.services.ai.llm_service import get_llm_service
+
+        transcript = '\n'.join(f"{turn.role}: {turn.text}" for turn in turns)
+        try:
+            summary = get_llm_service().summarize_conversation(previous, transcript, self.summary_tokens)
+        except Exception as e:
+            logger.warning(f"对话摘要生成失败，截取原文: {str(e)}")
+            summary = '\n'.join(part for part in (previous, transcript) if part)
+        return truncate_tokens(summary.strip(), self.summary_tokens)
+
+
+def build_conversation_context(case: Case, exclude_node_ids: Iterable[str] = ()) -> ConversationContext:
+    """按配置整理案例的对话历史，见 ConversationWindow.build"""
+    return ConversationWindow().build(case, exclude_node_ids)
+
+
+def invalidate_conversation_summary(case: Case, node_id: Optional[str] = None) -> bool:
+    """
+    移除案例的对话摘要（由调用方提交）
+
+    Args:
+        case: 案例
+        node_id: 提供时只在摘要覆盖了该节点时移除
+
+    Returns:
+        bool: 是否移除了摘要
+    """
+    cached = (case.case_metadata or {}).get(SUMMARY_METADATA_KEY)
+    if not cached or (node_id and node_id not in (cached.get('node_ids') or [])):
+        return False
+    case.case_metadata = {k: v for k, v in case.case_metadata.items() if k != SUMMARY_METADATA_KEY}
+    return True
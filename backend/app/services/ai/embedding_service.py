@@ -9,6 +9,9 @@ import logging
 from typing import List, Optional
 from langchain_community.embeddings import DashScopeEmbeddings
 
+from app.services.infrastructure.cancellation import check_cancelled
+from app.utils.circuit_breaker import CircuitOpenError, get_breaker
+
 logger = logging.getLogger(__name__)
 
 
@@ -55,7 +58,9 @@ class QwenEmbedding:
             return [0.0] * 1024  # text-embedding-v4实际维度
 
         try:
-            vector = self.embeddings.embed_query(text)
+            # DashScope 不可用时熔断，直接失败而不是等满超时
+            with get_breaker('embedding:dashscope').protect():
+                vector = self.embeddings.embed_query(text)
             return vector
         except Exception as e:
             logger.error(f"文本向量化失败: {str(e)}")
@@ -76,13 +81,19 @@ class QwenEmbedding:
             return []
 
         try:
-            vectors = self.embeddings.embed_documents(texts)
+            with get_breaker('embedding:dashscope').protect():
+                vectors = self.embeddings.embed_documents(texts)
             return vectors
+        except CircuitOpenError as e:
+            # 已熔断时逐条处理同样会被拒绝，直接使用零向量降级
+            logger.error(f"批量向量化被熔断，使用零向量: {str(e)}")
+            return [[0.0] * 1024 for _ in texts]
         except Exception as e:
             logger.error(f"批量向量化失败，降级到单个处理: {str(e)}")
             # 降级到单个处理
             embeddings = []
             for i, text in enumerate(texts):
+                check_cancelled()
                 try:
                     vector = self.embed_text(text)
                     embeddings.append(vector)
@@ -9,19 +9,70 @@ import logging
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
-from app import create_app, db
+from flask import current_app
+
+from app import db
 from app.models.case import Case, Node, Edge
 # 任务队列依赖已移除
 from app.services.infrastructure.task_monitor import with_monitoring_and_retry
 from app.services.infrastructure.task_queue import get_task_queue
-from app.services.ai.agent_workflow import create_agent_workflow, create_response_processing_workflow
+from app.services.infrastructure.cancellation import on_cancel
+from app.services.infrastructure.worker_runtime import worker_app_context
+from app.services.infrastructure.progress_bus import (
+    PROGRESS_EVENT, get_progress_bus, publish_node_update, report_progress, task_topic
+)
+from app.services.ai.agent_workflow import (
+    AGENT_WORKFLOW, RESPONSE_PROCESSING_WORKFLOW, SPECULATIVE_AGENT_WORKFLOW, get_workflow
+)
 from app.services.ai.agent_state import AgentState
-from app.services.ai.agent_service import RetrievalService
+from app.services.ai.agent_service import RetrievalService, mark_node_cancelled
+from app.services.ai.semantic_cache import get_semantic_cache
+from app.services.ai.conversation_summary import build_conversation_context
+from app.services.ai.workflow_checkpoint import clear_checkpoints
 from app.utils.monitoring import monitor_performance
 
 logger = logging.getLogger(__name__)
 
 
+def _answer_from_semantic_cache(case: Case, node: Node, cached: Dict[str, Any], vendor: Optional[str]):
+    """用语义缓存命中的解决方案完成节点"""
+    node.type = 'SOLUTION'
+    node.title = '解决方案'
+    node.status = 'COMPLETED'
+    node.content = {
+        'answer': cached['answer'],
+        'sources': [],
+        'commands': [],
+        'vendor': vendor or '通用',
+        'cached_from': {'caseId': cached['case_id'], 'similarity': cached['similarity']}
+    }
+    node.node_metadata = {
+        **(node.node_metadata or {}),
+        'solution_ready': True,
+        'semantic_cache_hit': True
+    }
+
+    case.updated_at = datetime.utcnow()
+    case.case_metadata = {
+        **(case.case_metadata or {}),
+        'last_workflow_step': 'semantic_cache_hit',
+        'workflow_executed_at': datetime.utcnow().isoformat(),
+        'need_more_info': False,
+        'solution_ready': True
+    }
+    db.session.commit()
+    publish_node_update(node)
+
+    report_progress('completed', 100, case_id=case.id, node_id=node.id, final_state={
+        'step': 'semantic_cache_hit',
+        'need_more_info': False,
+        'solution_ready': True,
+        'category': None
+    })
+    logger.info(f"语义缓存命中，直接返回解决方案: case_id={case.id}, 来源案例={cached['case_id']}")
+
+
+@on_cancel(mark_node_cancelled)
 @with_monitoring_and_retry(max_retries=3, retry_intervals=[10, 30, 60])
 def analyze_user_query_with_langgraph(case_id: str, node_id: str, query: str):
     """
@@ -32,18 +83,11 @@ def analyze_user_query_with_langgraph(case_id: str, node_id: str, query: str):
         node_id: 节点ID
         query: 用户查询内容
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         try:
             logger.info(f"开始使用langgraph分析用户查询: case_id={case_id}, node_id={node_id}")
 
-            # 获取当前任务
-            # job = get_current_job()  # 线程池队列不支持
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['status'] = 'processing'
-            #     job.meta['progress'] = 0
-            #     job.meta['step'] = 'initializing'
-            #     job.save_meta()
+            report_progress('initializing', 0, case_id=case_id, node_id=node_id)
 
             # 获取节点
             node = db.session.get(Node, node_id)
@@ -55,28 +99,27 @@ def analyze_user_query_with_langgraph(case_id: str, node_id: str, query: str):
             if not case:
                 raise Exception(f"案例 {case_id} 不存在")
 
-            # 线程池队列不支持job进度更新
-            # if job:
-            #     job.meta['progress'] = 10
-            #     job.meta['step'] = 'creating_workflow'
-            #     job.save_meta()
-
-            # 创建Agent工作流
+            # 该用户语义相近的问题已有评价良好的解决方案时直接返回，不再执行工作流
+            vendor = case.case_metadata.get('vendor') if case.case_metadata else None
+            if (case.case_metadata or {}).get('use_semantic_cache', True):
+                cached = get_semantic_cache().lookup(query, case.user_id, vendor)
+                if cached:
+                    _answer_from_semantic_cache(case, node, cached, vendor)
+                    return
+
+            report_progress('creating_workflow', 10, case_id=case_id, node_id=node_id)
+
+            # 获取Agent工作流（每个进程只编译一次），默认分析与检索并行
+            workflow_name = (SPECULATIVE_AGENT_WORKFLOW
+                             if current_app.config.get('AGENT_SPECULATIVE_RETRIEVAL', True)
+                             else AGENT_WORKFLOW)
             try:
-                agent_workflow = create_agent_workflow()
-                logger.info("Agent工作流创建成功")
+                agent_workflow = get_workflow(workflow_name)
             except Exception as e:
                 logger.error(f"创建Agent工作流失败: {str(e)}")
                 raise Exception(f"无法创建Agent工作流: {str(e)}")
 
-            # 线程池队列不支持job进度更新
-            # if job:
-            #     job.meta['progress'] = 20
-            #     job.meta['step'] = 'initializing_state'
-            #     job.save_meta()
-
-            # 获取案例相关信息（设备厂商等）
-            vendor = case.case_metadata.get('vendor') if case.case_metadata else None
+            report_progress('initializing_state', 20, case_id=case_id, node_id=node_id)
 
             # 初始化Agent状态
             initial_state: AgentState = {
@@ -100,11 +143,7 @@ def analyze_user_query_with_langgraph(case_id: str, node_id: str, query: str):
             logger.info("开始执行Agent工作流")
             final_state = agent_workflow.invoke(initial_state)
 
-            # 更新任务进度
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['progress'] = 90
-            #     job.meta['step'] = 'finalizing'
-            #     job.save_meta()
+            report_progress('finalizing', 90, case_id=case_id, node_id=node_id)
 
             # 记录工作流执行结果
             logger.info(f"Agent工作流执行完成，最终步骤: {final_state.get('step')}")
@@ -130,18 +169,15 @@ def analyze_user_query_with_langgraph(case_id: str, node_id: str, query: str):
             # 提交数据库更改
             db.session.commit()
 
-            # 更新任务进度
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['status'] = 'completed'
-            #     job.meta['progress'] = 100
-            #     job.meta['step'] = 'completed'
-            #     job.meta['final_state'] = {
-            #         'step': final_state.get('step'),
-            #         'need_more_info': final_state.get('need_more_info'),
-            #         'solution_ready': final_state.get('solution_ready'),
-            #         'category': final_state.get('category')
-            #     }
-            #     job.save_meta()
+            # 工作流已完成，不再需要步骤检查点
+            clear_checkpoints(node_id)
+
+            report_progress('completed', 100, case_id=case_id, node_id=node_id, final_state={
+                'step': final_state.get('step'),
+                'need_more_info': final_state.get('need_more_info'),
+                'solution_ready': final_state.get('solution_ready'),
+                'category': final_state.get('category')
+            })
 
             logger.info(f"langgraph用户查询分析完成: case_id={case_id}, node_id={node_id}")
 
@@ -160,20 +196,16 @@ def analyze_user_query_with_langgraph(case_id: str, node_id: str, query: str):
                         'workflow_type': 'langgraph'
                     }
                     db.session.commit()
+                    publish_node_update(node)
             except Exception as db_error:
                 logger.error(f"更新数据库失败: {str(db_error)}")
 
-            # 更新任务状态
-            # job = get_current_job()  # 线程池队列不支持
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['status'] = 'failed'
-            #     job.meta['error'] = str(e)
-            #     job.meta['step'] = 'error'
-            #     job.save_meta()
+            report_progress('error', case_id=case_id, node_id=node_id, error=str(e))
 
             raise
 
 
+@on_cancel(mark_node_cancelled)
 @with_monitoring_and_retry(max_retries=3, retry_intervals=[10, 30, 60])
 def process_user_response_with_langgraph(case_id: str, node_id: str, response_data: Dict[str, Any],
                                        retrieval_weight: float = 0.7, filter_tags: Optional[List[str]] = None):
@@ -187,18 +219,11 @@ def process_user_response_with_langgraph(case_id: str, node_id: str, response_da
         retrieval_weight: 检索权重
         filter_tags: 过滤标签
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         try:
             logger.info(f"开始使用langgraph处理用户响应: case_id={case_id}, node_id={node_id}")
 
-            # 获取当前任务
-            # job = get_current_job()  # 线程池队列不支持
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['status'] = 'processing'
-            #     job.meta['progress'] = 0
-            #     job.meta['step'] = 'initializing'
-            #     job.save_meta()
+            report_progress('initializing', 0, case_id=case_id, node_id=node_id)
 
             # 获取节点
             node = db.session.get(Node, node_id)
@@ -210,31 +235,27 @@ def process_user_response_with_langgraph(case_id: str, node_id: str, response_da
             if not case:
                 raise Exception(f"案例 {case_id} 不存在")
 
-            # 更新任务进度
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['progress'] = 10
-            #     job.meta['step'] = 'creating_response_workflow'
-            #     job.save_meta()
+            report_progress('creating_response_workflow', 10, case_id=case_id, node_id=node_id)
 
-            # 创建响应处理工作流
+            # 获取响应处理工作流（每个进程只编译一次）
             try:
-                response_workflow = create_response_processing_workflow()
-                logger.info("响应处理工作流创建成功")
+                response_workflow = get_workflow(RESPONSE_PROCESSING_WORKFLOW)
             except Exception as e:
                 logger.error(f"创建响应处理工作流失败: {str(e)}")
                 raise Exception(f"无法创建响应处理工作流: {str(e)}")
 
-            # 更新任务进度
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['progress'] = 20
-            #     job.meta['step'] = 'preparing_enhanced_query'
-            #     job.save_meta()
+            report_progress('preparing_enhanced_query', 20, case_id=case_id, node_id=node_id)
 
             # 构建增强的查询（结合原始问题和用户补充信息）
-            original_query = case.original_query if hasattr(case, 'original_query') else ""
+            original_query = (case.case_metadata or {}).get('original_query') or case.title or ""
             user_response = response_data.get('response', '')
             enhanced_query = f"原始问题: {original_query}\n\n补充信息: {user_response}"
 
+            # 多轮对话历史：最近轮次原样保留，更早的轮次使用案例上保存的摘要
+            conversation = build_conversation_context(
+                case, exclude_node_ids={node_id, (node.node_metadata or {}).get('parent_response_id')}
+            )
+
             # 获取案例相关信息
             vendor = case.case_metadata.get('vendor') if case.case_metadata else None
 
@@ -253,24 +274,17 @@ def process_user_response_with_langgraph(case_id: str, node_id: str, response_da
                 "clarification": None,
                 "solution": None,
                 "error": None,
-                "step": "user_response_received"
+                "step": "user_response_received",
+                "conversation": conversation.text or None
             }
 
-            # 更新任务进度
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['progress'] = 30
-            #     job.meta['step'] = 'executing_response_workflow'
-            #     job.save_meta()
+            report_progress('executing_response_workflow', 30, case_id=case_id, node_id=node_id)
 
             # 执行响应处理工作流
             logger.info("开始执行响应处理工作流")
             final_state = response_workflow.invoke(initial_state)
 
-            # 更新任务进度
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['progress'] = 90
-            #     job.meta['step'] = 'finalizing'
-            #     job.save_meta()
+            report_progress('finalizing', 90, case_id=case_id, node_id=node_id)
 
             # 记录工作流执行结果
             logger.info(f"响应处理工作流执行完成，最终步骤: {final_state.get('step')}")
@@ -283,31 +297,28 @@ def process_user_response_with_langgraph(case_id: str, node_id: str, response_da
             # 更新案例时间
             case.updated_at = datetime.utcnow()
 
-            # 更新案例元数据
-            if case.case_metadata is None:
-                case.case_metadata = {}
-            case.case_metadata.update({
+            # 更新案例元数据（JSON列原地修改不会被跟踪，需赋值新的字典）
+            case.case_metadata = {
+                **(case.case_metadata or {}),
                 'last_response_processed_at': datetime.utcnow().isoformat(),
                 'response_workflow_step': final_state.get('step'),
                 'solution_ready': final_state.get('solution_ready', False),
                 'retrieval_weight': retrieval_weight,
-                'filter_tags': filter_tags or []
-            })
+                'filter_tags': filter_tags or [],
+                'conversation_context': conversation.stats()
+            }
 
             # 提交数据库更改
             db.session.commit()
 
-            # 更新任务进度
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['status'] = 'completed'
-            #     job.meta['progress'] = 100
-            #     job.meta['step'] = 'completed'
-            #     job.meta['final_state'] = {
-            #         'step': final_state.get('step'),
-            #         'solution_ready': final_state.get('solution_ready'),
-            #         'category': final_state.get('category')
-            #     }
-            #     job.save_meta()
+            # 工作流已完成，不再需要步骤检查点
+            clear_checkpoints(node_id)
+
+            report_progress('completed', 100, case_id=case_id, node_id=node_id, final_state={
+                'step': final_state.get('step'),
+                'solution_ready': final_state.get('solution_ready'),
+                'category': final_state.get('category')
+            })
 
             logger.info(f"langgraph用户响应处理完成: case_id={case_id}, node_id={node_id}")
 
@@ -326,16 +337,11 @@ def process_user_response_with_langgraph(case_id: str, node_id: str, response_da
                         'workflow_type': 'langgraph_response'
                     }
                     db.session.commit()
+                    publish_node_update(node)
             except Exception as db_error:
                 logger.error(f"更新数据库失败: {str(db_error)}")
 
-            # 更新任务状态
-            # job = get_current_job()  # 线程池队列不支持
-            # if job:  # 线程池队列不支持job操作
-            #     job.meta['status'] = 'failed'
-            #     job.meta['error'] = str(e)
-            #     job.meta['step'] = 'error'
-            #     job.save_meta()
+            report_progress('error', case_id=case_id, node_id=node_id, error=str(e))
 
             raise
 
@@ -357,7 +363,9 @@ def submit_langgraph_query_analysis_task(case_id: str, node_id: str, query: str)
         analyze_user_query_with_langgraph,
         case_id, node_id, query,
         timeout='5m',
-        job_timeout='10m'
+        job_timeout='10m',
+        lane='interactive',
+        dedupe_key=(case_id, node_id)
     )
     logger.info(f"已提交langgraph查询分析任务: {job.id}")
     return job.id
@@ -384,7 +392,9 @@ def submit_langgraph_response_processing_task(case_id: str, node_id: str, respon
         process_user_response_with_langgraph,
         case_id, node_id, response_data, retrieval_weight, filter_tags,
         timeout='5m',
-        job_timeout='10m'
+        job_timeout='10m',
+        lane='interactive',
+        dedupe_key=(case_id, node_id)
     )
     logger.info(f"已提交langgraph响应处理任务: {job.id}")
     return job.id
@@ -394,6 +404,8 @@ def get_langgraph_task_status(job_id: str) -> Dict[str, Any]:
     """
     获取langgraph任务状态
 
+    任务状态来自任务队列，进度和步骤来自任务通过 report_progress 上报的最新事件。
+
     Args:
         job_id: 任务ID
 
@@ -402,7 +414,7 @@ def get_langgraph_task_status(job_id: str) -> Dict[str, Any]:
     """
     try:
         queue = get_task_queue()
-        job = queue.fetch_job(job_id)
+        job = queue.get_job(job_id)
 
         if not job:
             return {
@@ -415,28 +427,32 @@ def get_langgraph_task_status(job_id: str) -> Dict[str, Any]:
             'status': job.get_status(),
             'created_at': job.created_at.isoformat() if job.created_at else None,
             'started_at': job.started_at.isoformat() if job.started_at else None,
-            'ended_at': job.ended_at.isoformat() if job.ended_at else None,
+            'ended_at': job.completed_at.isoformat() if job.completed_at else None,
         }
 
-        # 添加任务元数据
-        if hasattr(job, 'meta') and job.meta:
+        # 添加任务上报的进度
+        latest = get_progress_bus().latest(task_topic(job_id), PROGRESS_EVENT)
+        if latest:
+            progress = latest['data']
             status_info.update({
-                'progress': job.meta.get('progress', 0),
-                'step': job.meta.get('step', 'unknown'),
+                'progress': progress.get('progress') or 0,
+                'step': progress.get('step', 'unknown'),
                 'workflow_type': 'langgraph'
             })
 
             # 如果任务完成，添加最终状态
-            if job.meta.get('status') == 'completed':
-                status_info['final_state'] = job.meta.get('final_state', {})
+            if 'final_state' in progress:
+                status_info['final_state'] = progress['final_state']
 
-            # 如果任务失败，添加错误信息
-            if job.meta.get('status') == 'failed':
-                status_info['error'] = job.meta.get('error', '未知错误')
+        # 如果任务失败，添加错误信息
+        error = job.get_error()
+        if error:
+            status_info['error'] = error
 
         # 添加结果信息
-        if job.result:
-            status_info['result'] = job.result
+        result = job.get_result()
+        if result:
+            status_info['result'] = result
 
         return status_info
 
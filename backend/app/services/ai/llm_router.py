@@ -0,0 +1,431 @@
+"""
+大模型路由
+
+LLMService 原先固定使用一个模型和接入点（LLM_MODEL、OPENAI_API_BASE），该接入点变慢时
+所有诊断都随之变慢。路由器管理多个兼容OpenAI接口的目标（接入点 + 模型）：
+
+- 按滚动窗口统计每个目标的耗时和错误率，连续失败的目标暂停一段时间；
+  每个目标的调用经过熔断器（app.utils.circuit_breaker），熔断的目标直接跳过
+- 每次调用选择所在层级（default / fast）中最快的健康目标，失败时依次尝试下一个
+- 可选对冲：首选目标超过其 p95 耗时仍未返回时，向第二快的目标发起同样的请求，
+  采用先完成的结果（同步调用中落后的请求在后台完成，只用于更新统计；异步调用中取消）
+- fast 层级放置快速、低成本的模型，用于问题分析分类等简单任务；未配置或全部不可用时使用 default 层级
+
+目标通过 LLM_TARGETS（JSON 列表）配置，未配置时由 LLM_MODEL、OPENAI_API_BASE 生成单一目标，
+LLM_FAST_MODEL 可在同一接入点上增加一个 fast 层级的目标。路由器提供与 ChatOpenAI 相同的
+invoke / stream / ainvoke 接口。
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.utils.circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError, get_breaker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER = 'default'
+FAST_TIER = 'fast'
+
+# 对冲请求线程池：每个进程一个（fork 后重新创建）
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_pid: Optional[int] = None
+_hedge_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor, _hedge_pid
+    with _hedge_lock:
+        if _hedge_executor is None or _hedge_pid != os.getpid():
+            workers = int(os.environ.get('LLM_HEDGE_WORKERS', '8'))
+            _hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='llm-hedge')
+            _hedge_pid = os.getpid()
+        return _hedge_executor
+
+
+class LLMTarget:
+    """一个路由目标：模型客户端、熔断器及其滚动统计"""
+
+    def __init__(self, name: str, client: Any, tier: str = DEFAULT_TIER, window: int = 50,
+                 cooldown_seconds: float = 30.0, max_error_rate: float = 0.5,
+                 breaker: Optional[CircuitBreaker] = None,
+                 async_client_factory: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        self.client = client
+        self.async_client_factory = async_client_factory
+        self.tier = tier
+        self.breaker = breaker or CircuitBreaker(f"llm:{name}")
+        self.cooldown_seconds = cooldown_seconds
+        self.max_error_rate = max_error_rate
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def client_for(self, http_async_client: Any = None) -> Any:
+        """
+        异步调用使用的模型客户端
+
+        异步连接池依附于事件循环，传入当前事件循环的连接池时用 async_client_factory 创建绑定该连接池的客户端
+        （只创建客户端对象，开销远小于一次模型调用），否则使用 client。
+        """
+        if http_async_client is None or self.async_client_factory is None:
+            return self.client
+        return self.async_client_factory(http_async_client)
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        """记录一次调用结果；流式调用只记录成败，不计入耗时"""
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok:
+                self._consecutive_failures = 0
+                if latency is not None:
+                    self._latencies.append(latency)
+            else:
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= 3:
+                    self._cooldown_until = time.time() + self.cooldown_seconds
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(int(math.ceil(q * len(ordered))) - 1, len(ordered) - 1)]
+
+    def healthy(self) -> bool:
+        if time.time() < self._cooldown_until or self.breaker.state == OPEN:
+            return False
+        with self._lock:
+            # 样本太少时不按错误率判断
+            if len(self._outcomes) < 5:
+                return True
+        return self.error_rate <= self.max_error_rate
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            samples = len(self._outcomes)
+        return {
+            'name': self.name,
+            'tier': self.tier,
+            'healthy': self.healthy(),
+            'circuit': self.breaker.state,
+            'samples': samples,
+            'error_rate': round(self.error_rate, 3),
+            'p50_seconds': round(p50, 3) if p50 is not None else None,
+            'p95_seconds': round(p95, 3) if p95 is not None else None
+        }
+
+
+class LLMRouter:
+    """在多个目标之间路由模型调用"""
+
+    def __init__(self, targets: List[LLMTarget], hedge_enabled: bool = False,
+                 hedge_min_delay: float = 0.5, hedge_max_delay: float = 10.0):
+        if not targets:
+            raise ValueError("至少需要一个LLM路由目标")
+        self.targets = targets
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+
+    # 兼容 ChatOpenAI 的调试属性，取首个目标的配置
+    @property
+    def model_name(self) -> str:
+        return getattr(self.targets[0].client, 'model_name', self.targets[0].name)
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        return getattr(self.targets[0].client, 'max_tokens', None)
+
+    def has_tier(self, tier: str) -> bool:
+        return any(target.tier == tier for target in self.targets)
+
+    def ranked(self, tier: str = DEFAULT_TIER) -> List[LLMTarget]:
+        """
+        按优先顺序排列的目标
+
+        先排该层级的目标，非 default 层级之后再排 default 层级的目标，该层级的目标全部熔断或失败时
+        由 default 层级完成调用（没有可用目标时使用全部目标）。每组内健康的目标在前，
+        其中按 p50 耗时从快到慢，尚无耗时数据的目标按配置顺序排在最前以便获得样本。
+        """
+        candidates = [t for t in self.targets if t.tier == tier]
+        fallback = [t for t in self.targets if t.tier == DEFAULT_TIER] if tier != DEFAULT_TIER else []
+        if not candidates and not fallback:
+            candidates = self.targets
+        return self._by_preference(candidates) + self._by_preference(fallback)
+
+    @staticmethod
+    def _by_preference(targets: List[LLMTarget]) -> List[LLMTarget]:
+        order = {id(t): i for i, t in enumerate(targets)}
+
+        def key(target: LLMTarget):
+            p50 = target.percentile(0.5)
+            return (not target.healthy(), p50 if p50 is not None else -1.0, order[id(target)])
+        return sorted(targets, key=key)
+
+    def hedge_delay(self, target: LLMTarget) -> float:
+        """对冲等待时间：目标的 p95 耗时，限制在 [hedge_min_delay, hedge_max_delay]"""
+        p95 = target.percentile(0.95)
+        if p95 is None:
+            return self.hedge_max_delay
+        return min(max(p95, self.hedge_min_delay), self.hedge_max_delay)
+
+    @staticmethod
+    def _call(target: LLMTarget, messages: Any, kwargs: Dict[str, Any]):
+        started_at = time.time()
+        try:
+            with target.breaker.protect():
+                result = target.client.invoke(messages, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            target.record(False)
+            raise
+        target.record(True, time.time() - started_at)
+        return result
+
+    def invoke(self, messages: Any, tier: str = DEFAULT_TIER, **kwargs):
+        """调用最快的健康目标；开启对冲时首选目标超过 p95 仍未返回则同时请求下一个目标"""
+        targets = self.ranked(tier)
+        if self.hedge_enabled and len(targets) > 1:
+            return self._hedged_invoke(targets, messages, kwargs)
+
+        last_error = None
+        for target in targets:
+            try:
+                return self._call(target, messages, kwargs)
+            except Exception as e:
+                last_error = e
+                logger.warning(f"LLM目标 {target.name} 调用失败，尝试下一个目标: {str(e)}")
+        raise last_error
+
+    def _hedged_invoke(self, targets: List[LLMTarget], messages: Any, kwargs: Dict[str, Any]):
+        executor = _get_hedge_executor()
+        primary, backups = targets[0], list(targets[1:])
+        pending = {executor.submit(self._call, primary, messages, kwargs): primary}
+
+        done, _ = wait(pending, timeout=self.hedge_delay(primary))
+        if not done and backups:
+            backup = backups.pop(0)
+            logger.info(f"LLM目标 {primary.name} 超过对冲等待时间，同时请求 {backup.name}")
+            pending[executor.submit(self._call, backup, messages, kwargs)] = backup
+
+        last_error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                target = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"LLM目标 {target.name} 调用失败: {str(e)}")
+            # 已发起的请求都失败时继续尝试剩余的目标
+            if not pending and backups:
+                backup = backups.pop(0)
+                pending[executor.submit(self._call, backup, messages, kwargs)] = backup
+        raise last_error
+
+    def stream(self, messages: Any, tier: str = DEFAULT_TIER, **kwargs) -> Iterator[Any]:
+        """流式调用最快的健康目标；尚未输出任何片段时失败则改用下一个目标，不做对冲"""
+        last_error = None
+        for target in self.ranked(tier):
+            try:
+                ticket = target.breaker.before_call()
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+            started = False
+            started_at = time.time()
+            try:
+                for chunk in target.client.stream(messages, **kwargs):
+                    if not started:
+                        # 熔断器按首个片段的耗时判断慢调用
+                        started = True
+                        target.breaker.after_call(True, time.time() - started_at, ticket)
+                    yield chunk
+                if not started:
+                    target.breaker.after_call(True, time.time() - started_at, ticket)
+                target.record(True)
+                return
+            except Exception as e:
+                target.record(False)
+                if started:
+                    raise
+                target.breaker.after_call(False, time.time() - started_at, ticket)
+                last_error = e
+                logger.warning(f"LLM目标 {target.name} 流式调用失败，尝试下一个目标: {str(e)}")
+            except BaseException:
+                # 任务取消：尚未输出片段时只释放熔断器名额
+                if not started:
+                    target.breaker.release(ticket)
+                raise
+        raise last_error
+
+    @staticmethod
+    async def _acall(target: LLMTarget, messages: Any, kwargs: Dict[str, Any], http_async_client: Any = None):
+        started_at = time.time()
+        try:
+            with target.breaker.protect():
+                result = await target.client_for(http_async_client).ainvoke(messages, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            target.record(False)
+            raise
+        target.record(True, time.time() - started_at)
+        return result
+
+    async def ainvoke(self, messages: Any, tier: str = DEFAULT_TIER, http_async_client: Any = None, **kwargs):
+        """
+        异步调用，路由、故障转移和对冲规则与 invoke 相同；对冲胜出后取消落后的请求
+
+        http_async_client 为当前事件循环的异步连接池，各目标通过 LLMTarget.client_for 使用该连接池。
+        """
+        targets = self.ranked(tier)
+        if not (self.hedge_enabled and len(targets) > 1):
+            last_error = None
+            for target in targets:
+                try:
+                    return await self._acall(target, messages, kwargs, http_async_client)
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"LLM目标 {target.name} 调用失败，尝试下一个目标: {str(e)}")
+            raise last_error
+
+        primary, backups = targets[0], list(targets[1:])
+        pending = {asyncio.ensure_future(self._acall(primary, messages, kwargs, http_async_client)): primary}
+        done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(primary))
+        if not done:
+            backup = backups.pop(0)
+            logger.info(f"LLM目标 {primary.name} 超过对冲等待时间，同时请求 {backup.name}")
+            pending[asyncio.ensure_future(self._acall(backup, messages, kwargs, http_async_client))] = backup
+
+        last_error = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    target = pending.pop(future)
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"LLM目标 {target.name} 调用失败: {str(e)}")
+                if not pending and backups:
+                    backup = backups.pop(0)
+                    pending[asyncio.ensure_future(self._acall(backup, messages, kwargs, http_async_client))] = backup
+        finally:
+            for future in pending:
+                future.cancel()
+        raise last_error
+
+    def for_tier(self, tier: str) -> 'TierView':
+        return TierView(self, tier)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'hedge_enabled': self.hedge_enabled,
+            'targets': [target.stats() for target in self.targets]
+        }
+
+
+class TierView:
+    """固定层级的路由器视图，接口与 ChatOpenAI 相同"""
+
+    def __init__(self, router: LLMRouter, tier: str):
+        self.router = router
+        self.tier = tier
+
+    def invoke(self, messages: Any, **kwargs):
+        return self.router.invoke(messages, tier=self.tier, **kwargs)
+
+    def stream(self, messages: Any, **kwargs):
+        return self.router.stream(messages, tier=self.tier, **kwargs)
+
+    async def ainvoke(self, messages: Any, **kwargs):
+        return await self.router.ainvoke(messages, tier=self.tier, **kwargs)
+
+
+def load_target_specs() -> List[Dict[str, Any]]:
+    """
+    读取路由目标配置
+
+    LLM_TARGETS 为 JSON 列表，每项包含 name、model，可选 base_url、api_key_env（读取密钥的环境变量，
+    缺省 DASHSCOPE_API_KEY）、tier、max_tokens、timeout。未配置时使用 LLM_MODEL 和 OPENAI_API_BASE，
+    配置了 LLM_FAST_MODEL 时再增加一个 fast 层级的目标。
+    """
+    default_base = os.environ.get('OPENAI_API_BASE', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
+    raw = os.environ.get('LLM_TARGETS')
+    if raw:
+        try:
+            specs = json.loads(raw)
+            if isinstance(specs, list) and specs:
+                return [{'base_url': default_base, 'tier': DEFAULT_TIER, **spec} for spec in specs]
+            logger.warning("LLM_TARGETS 不是非空列表，使用默认目标")
+        except json.JSONDecodeError as e:
+            logger.warning(f"LLM_TARGETS 解析失败，使用默认目标: {str(e)}")
+
+    model = os.environ.get('LLM_MODEL', 'qwen-plus')
+    specs = [{'name': model, 'model': model, 'base_url': default_base, 'tier': DEFAULT_TIER}]
+    fast_model = os.environ.get('LLM_FAST_MODEL')
+    if fast_model:
+        specs.append({'name': fast_model, 'model': fast_model, 'base_url': default_base, 'tier': FAST_TIER})
+    return specs
+
+
+def build_llm_router(client_factory, async_client_factory=None) -> LLMRouter:
+    """
+    按配置创建路由器
+
+    Args:
+        client_factory: 根据目标配置创建模型客户端的函数，配置中的 api_key 已解析
+        async_client_factory: 可选，根据目标配置和事件循环的异步连接池创建模型客户端的函数
+
+    Returns:
+        LLMRouter
+    """
+    window = int(os.environ.get('LLM_ROUTER_WINDOW', '50'))
+    cooldown = float(os.environ.get('LLM_TARGET_COOLDOWN_SECONDS', '30'))
+    max_error_rate = float(os.environ.get('LLM_TARGET_MAX_ERROR_RATE', '0.5'))
+
+    targets = []
+    for spec in load_target_specs():
+        api_key = os.environ.get(spec.get('api_key_env') or 'DASHSCOPE_API_KEY')
+        if not api_key:
+            logger.warning(f"LLM目标 {spec.get('name')} 缺少API Key，已跳过")
+            continue
+        resolved = {**spec, 'api_key': api_key}
+        client = client_factory(resolved)
+        name = spec.get('name') or spec['model']
+        bind_async = partial(async_client_factory, resolved) if async_client_factory is not None else None
+        targets.append(LLMTarget(name, client, tier=spec.get('tier', DEFAULT_TIER), window=window,
+                                 cooldown_seconds=cooldown, max_error_rate=max_error_rate,
+                                 breaker=get_breaker(f"llm:{name}"), async_client_factory=bind_async))
+
+    router = LLMRouter(
+        targets,
+        hedge_enabled=os.environ.get('LLM_HEDGE_ENABLED', 'false').lower() == 'true',
+        hedge_min_delay=float(os.environ.get('LLM_HEDGE_MIN_DELAY', '0.5')),
+        hedge_max_delay=float(os.environ.get('LLM_HEDGE_MAX_DELAY', '10'))
+    )
+    logger.info(f"LLM路由器已创建: {[t.name + '/' + t.tier for t in targets]}, 对冲: {router.hedge_enabled}")
+    return router
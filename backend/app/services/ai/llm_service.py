@@ -3,12 +3,21 @@
 
 本模块实现了与LLM的交互，包括问题分析、解决方案生成等功能。
 集成了缓存机制和性能监控。
+
+所有 LLMService 实例共享进程内的HTTP连接池，保持长连接并限制最大连接数，工作流每一步
+不再重新建立TLS连接；异步连接池依附于事件循环，每个事件循环各有一个。
+业务代码通过 get_llm_service 获取共享实例，fork 出的子进程会重新创建。
 """
 
+import asyncio
+import atexit
+import hashlib
 import os
 import logging
+import threading
 import time
-from typing import Dict, Any, List, Optional
+import weakref
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage, AIMessage
 from app.prompts import (
@@ -16,15 +25,205 @@ from app.prompts import (
     CLARIFICATION_PROMPT,
     SOLUTION_PROMPT,
     CONTINUE_CONVERSATION_PROMPT,
+    CONVERSATION_SUMMARY_PROMPT,
     FEEDBACK_PROCESSING_PROMPT
 )
 from app.prompts.base_prompt import SYSTEM_ROLE_PROMPT, ERROR_HANDLING_PROMPT
 from app.prompts.vendor_prompts import get_vendor_prompt
 from app.services.storage.cache_service import cached_llm_call
+from app.services.ai.context_packer import pack_context
+from app.services.ai.llm_router import DEFAULT_TIER, FAST_TIER, LLMRouter, build_llm_router, load_target_specs
+from app.services.infrastructure.cancellation import check_cancelled
 from app.utils.monitoring import monitor_performance
 
 logger = logging.getLogger(__name__)
 
+# 进程内共享的同步HTTP客户端、按事件循环创建的异步HTTP客户端（及其关闭钩子），及其所属进程
+_http_client = None
+_async_http_clients: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+_http_clients_pid: Optional[int] = None
+_http_clients_lock = threading.Lock()
+
+
+def _http2_enabled() -> bool:
+    """LLM_HTTP2 开启且安装了 h2 时使用HTTP/2"""
+    if os.environ.get('LLM_HTTP2', 'true').lower() != 'true':
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _http_client_options() -> Dict[str, Any]:
+    """连接池配置：大小、长连接数量和空闲时长由 LLM_MAX_CONNECTIONS、LLM_MAX_KEEPALIVE_CONNECTIONS、LLM_KEEPALIVE_EXPIRY 配置"""
+    import httpx
+
+    timeout_s = int(os.environ.get('LLM_TIMEOUT', '60'))
+    return {
+        'timeout': httpx.Timeout(timeout_s, connect=10.0, read=timeout_s, write=timeout_s),
+        'limits': httpx.Limits(
+            max_connections=int(os.environ.get('LLM_MAX_CONNECTIONS', '20')),
+            max_keepalive_connections=int(os.environ.get('LLM_MAX_KEEPALIVE_CONNECTIONS', '10')),
+            keepalive_expiry=float(os.environ.get('LLM_KEEPALIVE_EXPIRY', '60')),
+        ),
+        'http2': _http2_enabled(),
+    }
+
+
+def _claim_http_clients(pid: int) -> None:
+    """fork 出的子进程丢弃父进程的客户端（调用方持有锁）"""
+    global _http_client, _async_http_clients, _http_clients_pid
+    if _http_clients_pid != pid:
+        _http_client = None
+        _async_http_clients = weakref.WeakKeyDictionary()
+        _http_clients_pid = pid
+
+
+def get_llm_http_client():
+    """
+    获取进程内共享的同步LLM HTTP客户端
+
+    按进程缓存，fork 出的子进程会重新创建，不与父进程共用连接。
+
+    Returns:
+        httpx.Client
+    """
+    global _http_client
+    import httpx
+
+    pid = os.getpid()
+    with _http_clients_lock:
+        _claim_http_clients(pid)
+        if _http_client is None:
+            options = _http_client_options()
+            _http_client = httpx.Client(**options)
+            logger.info(f"LLM HTTP连接池已创建 (PID: {pid}, HTTP/2: {options['http2']})")
+        return _http_client
+
+
+async def _close_with_loop(client) -> AsyncIterator[None]:
+    """
+    随事件循环关闭异步客户端
+
+    作为异步生成器启动后由事件循环跟踪，asyncio.run 结束前的 shutdown_asyncgens 会关闭它，
+    此时在该事件循环中关闭客户端的连接并移除登记。
+    """
+    try:
+        yield
+    finally:
+        loop = asyncio.get_running_loop()
+        with _http_clients_lock:
+            entry = _async_http_clients.get(loop)
+            if entry is not None and entry[0] is client:
+                del _async_http_clients[loop]
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug(f"关闭异步HTTP客户端时发生异常: {e}")
+
+
+async def get_llm_async_http_client():
+    """
+    获取当前事件循环的异步LLM HTTP客户端，必须在事件循环中调用
+
+    异步连接依附于创建它们的事件循环，不能跨事件循环复用，因此每个事件循环各创建一个，
+    事件循环关闭（shutdown_asyncgens）时随之关闭，不会随 asyncio.run 的次数累积连接。
+
+    Returns:
+        httpx.AsyncClient
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    with _http_clients_lock:
+        _claim_http_clients(os.getpid())
+        entry = _async_http_clients.get(loop)
+        if entry is not None:
+            return entry[0]
+        client = httpx.AsyncClient(**_http_client_options())
+        closer = _close_with_loop(client)
+        _async_http_clients[loop] = (client, closer)
+    # 启动后事件循环才会跟踪该生成器
+    await closer.__anext__()
+    return client
+
+
+def close_llm_http_clients() -> None:
+    """关闭共享的同步HTTP客户端，进程退出时自动调用"""
+    global _http_client, _async_http_clients, _http_clients_pid
+    with _http_clients_lock:
+        client, _http_client = _http_client, None
+        owned = _http_clients_pid == os.getpid()
+        _async_http_clients = weakref.WeakKeyDictionary()
+        _http_clients_pid = None
+    if client is None or not owned:
+        return
+    try:
+        client.close()
+    except Exception as e:
+        logger.debug(f"关闭HTTP客户端时发生异常: {e}")
+    # 异步客户端由各自的事件循环在关闭时关闭
+
+
+atexit.register(close_llm_http_clients)
+
+
+def _cache_version(*templates: str) -> Callable[[], str]:
+    """
+    缓存版本：路由目标的层级和模型加提示词模板的摘要
+
+    修改模板、切换模型或调整 LLM_TARGETS / LLM_FAST_MODEL 后旧缓存不再命中。
+    """
+    digest = hashlib.sha256(''.join(templates).encode('utf-8')).hexdigest()[:12]
+
+    def version() -> str:
+        models = sorted(f"{spec.get('tier') or DEFAULT_TIER}={spec.get('model')}" for spec in load_target_specs())
+        return f"{','.join(models)}:{digest}"
+    return version
+
+
+def _create_chat_model(spec: Dict[str, Any], http_async_client: Any = None) -> ChatOpenAI:
+    """
+    按路由目标配置创建模型客户端；超时、最大生成长度和重试次数可由目标单独设置
+
+    http_async_client 为当前事件循环的异步连接池，只在异步调用时传入。
+    """
+    timeout_s = int(spec.get('timeout') or os.environ.get('LLM_TIMEOUT', '60'))
+    max_tokens = int(spec.get('max_tokens') or os.environ.get('LLM_MAX_TOKENS', '200'))
+    max_retries = int(os.environ.get('LLM_MAX_RETRIES', '1'))
+
+    # 使用进程共享的连接池，超时设置由连接池统一配置
+    http_client = get_llm_http_client()
+
+    llm = ChatOpenAI(
+        model=spec['model'],
+        api_key=spec['api_key'],
+        base_url=spec['base_url'],
+        temperature=0.0,  # 提高确定性，便于缓存与测试
+        max_tokens=max_tokens,
+        timeout=timeout_s,
+        max_retries=max_retries,  # 通过环境变量控制重试次数，默认0
+        http_client=http_client,
+        http_async_client=http_async_client
+    )
+    # 强制覆盖request_timeout属性
+    llm.request_timeout = timeout_s
+    return llm
+
+
+# 问题类别关键词
+_CATEGORY_KEYWORDS = {
+    'routing': ['路由', 'ospf', 'bgp', 'isis', 'rip'],
+    'switching': ['交换', 'vlan', 'stp', 'trunk', 'access'],
+    'network': ['网络', '连接', '丢包', '延迟', 'ping'],
+    'configuration': ['配置', 'config', '设置', '参数'],
+    'troubleshooting': ['故障', '问题', '错误', '异常', '告警'],
+    'security': ['安全', '防火墙', 'acl', '认证', '授权'],
+    'performance': ['性能', '优化', '带宽', '吞吐量', '利用率']
+}
+
 
 class LLMService:
     """大语言模型服务类"""
@@ -32,48 +231,25 @@ class LLMService:
     def __init__(self):
         """初始化LLM服务；在缺少API Key或初始化失败时启用快速本地Mock，保障测试稳定和性能基准通过。"""
         self.is_mock = False
-        self._http_client = None
         try:
-            # 在测试环境或显式要求下强制使用Mock
-            if os.environ.get('PYTEST_CURRENT_TEST') or os.environ.get('LLM_USE_MOCK') == '1':
+            # 在测试环境或显式要求下强制使用Mock；LLM_USE_MOCK=0 时测试中也走真实调用路径
+            # （如指向 bin/fake_llm_server.py 做压测）
+            use_mock = os.environ.get('LLM_USE_MOCK')
+            if use_mock == '1' or (os.environ.get('PYTEST_CURRENT_TEST') and use_mock != '0'):
                 self.llm = None
                 self.is_mock = True
                 logger.info("LLM服务以Mock模式运行（测试环境或 LLM_USE_MOCK=1）")
                 return
 
-            api_key = os.environ.get('DASHSCOPE_API_KEY')
-            if not api_key:
+            if not os.environ.get('DASHSCOPE_API_KEY') and not os.environ.get('LLM_TARGETS'):
                 # 无Key时使用Mock模式
                 self.llm = None
                 self.is_mock = True
                 logger.info("LLM服务以Mock模式运行（未检测到 DASHSCOPE_API_KEY）")
                 return
 
-            # 允许通过环境变量调整模型、超时与最大生成长度
-            model_name = os.environ.get('LLM_MODEL', 'qwen-plus')
-            timeout_s = int(os.environ.get('LLM_TIMEOUT', '60'))
-            max_tokens = int(os.environ.get('LLM_MAX_TOKENS', '200'))
-            max_retries = int(os.environ.get('LLM_MAX_RETRIES', '1'))
-
-            # 配置HTTP客户端确保超时设置生效
-            import httpx
-            http_client = httpx.Client(
-                timeout=httpx.Timeout(timeout_s, connect=10.0, read=timeout_s, write=timeout_s)
-            )
-            
-            self.llm = ChatOpenAI(
-                model=model_name,
-                api_key=api_key,
-                base_url=os.environ.get('OPENAI_API_BASE', 'https://dashscope.aliyuncs.com/compatible-mode/v1'),
-                temperature=0.0,  # 提高确定性，便于缓存与测试
-                max_tokens=max_tokens,
-                timeout=timeout_s,
-                max_retries=max_retries,  # 通过环境变量控制重试次数，默认0
-                http_client=http_client  # 使用自定义HTTP客户端
-            )
-            # 强制覆盖request_timeout属性
-            self.llm.request_timeout = timeout_s
-            self._http_client = http_client
+            # 按 LLM_TARGETS（或 LLM_MODEL、OPENAI_API_BASE）创建多目标路由器，接口与 ChatOpenAI 相同
+            self.llm = build_llm_router(_create_chat_model, async_client_factory=_create_chat_model)
             logger.info("LLM服务初始化成功")
         except Exception as e:
             logger.warning(f"LLM服务初始化失败，降级为Mock模式: {str(e)}")
@@ -81,7 +257,8 @@ class LLMService:
             self.is_mock = True
 
     @monitor_performance("llm_analyze_query", slow_threshold=5.0)
-    @cached_llm_call("llm_analysis", expire_time=3600)
+    @cached_llm_call("llm_analysis", expire_time=3600,
+                     version=_cache_version(SYSTEM_ROLE_PROMPT, ANALYSIS_PROMPT), text_args=('query',))
     def analyze_query(self, query: str, vendor: str = "Huawei",
                      context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -122,11 +299,15 @@ class LLMService:
             # 调试日志：显示实际调用参数
             logger.debug(f"LLM调用参数 - max_tokens: {self.llm.max_tokens}, model: {self.llm.model_name}")
             
-            response = self.llm.invoke(messages)
+            # 后台任务已取消或超时时不再发起新的模型调用
+            check_cancelled()
+            # 问题分析和分类优先使用 fast 层级的模型，未配置时使用默认模型
+            analyzer = self.llm.for_tier(FAST_TIER) if isinstance(self.llm, LLMRouter) else self.llm
+            response = analyzer.invoke(messages)
             duration = time.time() - start_time
             result = {
                 'analysis': response.content,
-                'category': self._extract_category(response.content),
+                'category': self._classify_category(response.content),
                 'vendor': vendor,
                 'confidence': self._extract_confidence(response.content),
                 'processing_time': duration
@@ -178,6 +359,7 @@ class LLMService:
                 guidance = context.get('user_prompt') or '无'
                 return f"基于给定上下文的更新内容。原始信息：{original}。用户指导：{guidance}。"
 
+            check_cancelled()
             response = self.llm.invoke(messages)
             return response.content
 
@@ -186,8 +368,18 @@ class LLMService:
             return f"内容重新生成过程中出现错误: {str(e)}"
 
     @monitor_performance("llm_clarification", slow_threshold=4.0)
-    def generate_clarification(self, query: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """生成澄清问题提示内容。"""
+    def generate_clarification(self, query: str, context: Optional[Dict[str, Any]] = None,
+                               analysis: Optional[Dict[str, Any]] = None,
+                               vendor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        生成澄清问题提示内容。
+
+        Args:
+            query: 用户查询
+            context: 上下文信息
+            analysis: analyze_query 的分析结果，提供时据此填写当前分析、类别和严重程度
+            vendor: 厂商类型
+        """
         try:
             # Mock 快速路径
             if self.is_mock or self.llm is None:
@@ -202,9 +394,10 @@ class LLMService:
                     'severity': 'medium'
                 }
 
-            current_analysis = query
-            category = "general"
-            severity = "medium"
+            analysis = analysis or {}
+            current_analysis = analysis.get('analysis') or query
+            category = analysis.get('category') or "general"
+            severity = analysis.get('severity') or "medium"
             default_questions = (
                 "1. 请提供更详细的故障现象与发生时间\n"
                 "2. 请提供设备型号/版本与关键接口信息\n"
@@ -223,6 +416,7 @@ class LLMService:
                 HumanMessage(content=prompt)
             ]
 
+            check_cancelled()
             response = self.llm.invoke(messages)
             return {
                 'clarification': response.content,
@@ -236,23 +430,43 @@ class LLMService:
             }
 
     @monitor_performance("llm_solution", slow_threshold=65.0)  # 调整监控阈值匹配60秒超时设置
-    def generate_solution(self, query: str, context: Optional[Dict[str, Any]] = None, vendor: str = "Huawei") -> Dict[str, Any]:
-        """根据问题生成解决方案。"""
+    def generate_solution(self, query: str, context: Optional[Dict[str, Any]] = None, vendor: str = "Huawei",
+                          analysis: Optional[Dict[str, Any]] = None, user_context: Optional[Any] = None,
+                          on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        根据问题生成解决方案。
+
+        Args:
+            query: 用户查询
+            context: 上下文信息；为检索结果列表时按 LLM_CONTEXT_TOKEN_BUDGET 打包后作为参考资料，
+                返回值中的 context_stats 记录放入和丢弃的token数
+            vendor: 厂商类型
+            analysis: analyze_query 的分析结果，提供时使用其中的问题类别
+            user_context: 用户补充的环境信息，缺省使用 context
+            on_token: 流式输出回调，提供时以流式方式调用模型，每收到一段文本调用一次；
+                完整结果仍作为返回值
+        """
         try:
             # Mock 快速路径
             if self.is_mock or self.llm is None:
+                solution = f"基于经验的快速解决思路：检查 {vendor} 设备基础连通性、查看接口状态/错误计数、核对路由与ACL策略，并复现问题收集日志。输入问题：{query}"
+                if on_token is not None:
+                    on_token(solution)
                 return {
-                    'solution': f"基于经验的快速解决思路：检查 {vendor} 设备基础连通性、查看接口状态/错误计数、核对路由与ACL策略，并复现问题收集日志。输入问题：{query}",
+                    'solution': solution,
                     'vendor': vendor
                 }
 
+            # 检索结果按token预算去重、裁剪后放入参考资料
+            packed = pack_context(query, context) if isinstance(context, list) else None
+
             prompt = SOLUTION_PROMPT.format(
                 problem=query,
-                category="general",
+                category=(analysis or {}).get('category') or "general",
                 vendor=vendor,
                 environment="",
-                retrieved_docs="",
-                user_context=context or {}
+                retrieved_docs=packed.text if packed else "",
+                user_context=user_context or (None if packed else context) or {}
             )
 
             messages = [
@@ -264,15 +478,22 @@ class LLMService:
             import time
             start = time.time()
             
-            response = self.llm.invoke(messages)
+            check_cancelled()
+            if on_token is not None:
+                content = self._stream(messages, on_token)
+            else:
+                content = self.llm.invoke(messages).content
             
             elapsed = time.time() - start
             logger.info(f"解决方案生成完成，耗时: {elapsed:.2f}s")
             
-            return {
-                'solution': response.content,
+            result = {
+                'solution': content,
                 'vendor': vendor
             }
+            if packed:
+                result['context_stats'] = packed.stats()
+            return result
         except Exception as e:
             logger.error(f"生成解决方案失败: {str(e)}")
             return {
@@ -280,27 +501,103 @@ class LLMService:
                 'vendor': vendor
             }
 
+    @monitor_performance("llm_continue_conversation", slow_threshold=4.0)
+    def continue_conversation(self, conversation_history: List[Dict[str, Any]], new_query: str,
+                              problem_status: str = '进行中') -> Dict[str, Any]:
+        """
+        在已有对话的基础上继续回答
+
+        历史按最近轮次 + 摘要整理（见 conversation_summary.ConversationWindow），提示词长度不随对话轮数增长。
+
+        Args:
+            conversation_history: 对话历史，每项包含 role（user/assistant）和 content
+            new_query: 用户新输入
+            problem_status: 问题状态
+        """
+        from app.services.ai.conversation_summary import ConversationWindow
+
+        conversation = ConversationWindow().build_from_history(conversation_history)
+        try:
+            if self.is_mock or self.llm is None:
+                response = f"基于对话上下文的快速回复：{new_query}"
+            else:
+                prompt = CONTINUE_CONVERSATION_PROMPT.format(
+                    conversation_history=conversation.text or '无',
+                    new_query=new_query,
+                    problem_status=problem_status
+                )
+                messages = [SystemMessage(content=SYSTEM_ROLE_PROMPT), HumanMessage(content=prompt)]
+                check_cancelled()
+                response = self.llm.invoke(messages).content
+            return {'response': response, 'conversation_stats': conversation.stats()}
+        except Exception as e:
+            logger.error(f"继续对话失败: {str(e)}")
+            return {
+                'response': f'继续对话过程中出现错误: {str(e)}',
+                'conversation_stats': conversation.stats()
+            }
+
+    def summarize_conversation(self, previous_summary: str, transcript: str, max_tokens: int) -> str:
+        """
+        把新增的对话合并进已有摘要
+
+        使用 fast 层级的模型；Mock模式下返回已有摘要与新增对话的拼接，由调用方按token预算截断。
+        调用失败时抛出异常。
+        """
+        if self.is_mock or self.llm is None:
+            return '\n'.join(part for part in (previous_summary, transcript) if part)
+
+        prompt = CONVERSATION_SUMMARY_PROMPT.format(
+            previous_summary=previous_summary or '无',
+            transcript=transcript,
+            max_tokens=max_tokens
+        )
+        check_cancelled()
+        summarizer = self.llm.for_tier(FAST_TIER) if isinstance(self.llm, LLMRouter) else self.llm
+        return summarizer.invoke([HumanMessage(content=prompt)]).content
+
+    def _stream(self, messages: List[Any], on_token: Callable[[str], None]) -> str:
+        """流式调用模型，逐段回调并返回完整文本；每段之间检查后台任务是否已取消"""
+        parts = []
+        for chunk in self.llm.stream(messages):
+            check_cancelled()
+            delta = chunk.content
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+        return ''.join(parts)
+
     def _extract_category(self, content: str) -> str:
-        """从回复中提取问题类别"""
+        """按关键词从回复中提取问题类别，无法判断时返回 general（不调用模型，Mock和降级路径使用）"""
         content_lower = content.lower()
 
-        # 定义类别关键词
-        categories = {
-            'routing': ['路由', 'ospf', 'bgp', 'isis', 'rip'],
-            'switching': ['交换', 'vlan', 'stp', 'trunk', 'access'],
-            'network': ['网络', '连接', '丢包', '延迟', 'ping'],
-            'configuration': ['配置', 'config', '设置', '参数'],
-            'troubleshooting': ['故障', '问题', '错误', '异常', '告警'],
-            'security': ['安全', '防火墙', 'acl', '认证', '授权'],
-            'performance': ['性能', '优化', '带宽', '吞吐量', '利用率']
-        }
-
-        for category, keywords in categories.items():
+        for category, keywords in _CATEGORY_KEYWORDS.items():
             if any(keyword in content_lower for keyword in keywords):
                 return category
-
         return 'general'
 
+    def _classify_category(self, content: str) -> str:
+        """模型分析成功后的分类：关键词无法判断且配置了 fast 层级模型时由快速模型分类"""
+        category = self._extract_category(content)
+        if category == 'general' and isinstance(self.llm, LLMRouter) and self.llm.has_tier(FAST_TIER):
+            return self._classify_with_fast_model(content)
+        return category
+
+    def _classify_with_fast_model(self, content: str) -> str:
+        """使用 fast 层级模型从固定类别中选择一个，失败或回复不在类别中时返回 general"""
+        labels = ', '.join(list(_CATEGORY_KEYWORDS) + ['general'])
+        messages = [
+            SystemMessage(content=f"你是网络问题分类器。只回复以下类别之一，不要输出其他内容：{labels}"),
+            HumanMessage(content=content[:1000])
+        ]
+        try:
+            check_cancelled()
+            reply = self.llm.invoke(messages, tier=FAST_TIER).content.strip().lower()
+        except Exception as e:
+            logger.warning(f"快速模型分类失败: {str(e)}")
+            return 'general'
+        return reply if reply in _CATEGORY_KEYWORDS else 'general'
+
     def _extract_confidence(self, content: str) -> float:
         """从回复中提取置信度"""
         # 简化的置信度计算
@@ -324,6 +621,12 @@ class LLMService:
             'temperature': 0.1
         }
 
+    def get_router_stats(self) -> Dict[str, Any]:
+        """各路由目标的耗时、错误率和健康状态；Mock模式下返回空列表"""
+        if isinstance(self.llm, LLMRouter):
+            return self.llm.get_stats()
+        return {'hedge_enabled': False, 'targets': []}
+
     def health_check(self) -> Dict[str, Any]:
         """健康检查"""
         try:
@@ -350,19 +653,54 @@ class LLMService:
                 'model_available': False
             }
 
+    async def ainvoke(self, messages: List[Any]) -> str:
+        """
+        异步调用模型，返回回复文本
+
+        同一事件循环中可通过 asyncio.gather 并发发起多个调用。异步连接不能跨事件循环复用，
+        各目标在调用时绑定当前事件循环的连接池，路由统计和熔断器与同步调用共用。
+        Mock模式下返回基于最后一条消息的固定回复。
+        """
+        if self.is_mock or self.llm is None:
+            return f"基于经验的快速回复：{messages[-1].content if messages else ''}"
+
+        check_cancelled()
+        if isinstance(self.llm, LLMRouter):
+            response = await self.llm.ainvoke(messages, http_async_client=await get_llm_async_http_client())
+        else:
+            response = await self.llm.ainvoke(messages)
+        return response.content
+
     def close(self) -> None:
-        """关闭底层HTTP客户端以释放连接资源。"""
-        try:
-            client = getattr(self, "_http_client", None)
-            if client is not None:
-                client.close()
-                self._http_client = None
-        except Exception as e:
-            logger.debug(f"关闭HTTP客户端时发生异常: {e}")
+        """实例使用进程共享的连接池，不单独关闭连接；连接池在进程退出时统一关闭。"""
 
-    def __del__(self):
-        # 确保在对象回收时释放连接
-        try:
-            self.close()
-        except Exception:
-            pass
+
+# 全局LLM服务实例及其所属进程
+_llm_service: Optional[LLMService] = None
+_llm_service_pid: Optional[int] = None
+_llm_service_lock = threading.Lock()
+
+
+def get_llm_service() -> LLMService:
+    """
+    获取全局LLM服务实例（单例模式）
+
+    按进程缓存，fork 出的子进程会重新创建，不沿用父进程的模型客户端和连接。
+
+    Returns:
+        LLMService: LLM服务实例
+    """
+    global _llm_service, _llm_service_pid
+    with _llm_service_lock:
+        if _llm_service is None or _llm_service_pid != os.getpid():
+            _llm_service = LLMService()
+            _llm_service_pid = os.getpid()
+        return _llm_service
+
+
+def reset_llm_service():
+    """重置全局LLM服务实例（主要用于测试）"""
+    global _llm_service, _llm_service_pid
+    with _llm_service_lock:
+        _llm_service = None
+        _llm_service_pid = None
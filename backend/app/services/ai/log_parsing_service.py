@@ -473,3 +473,17 @@ class LogParsingService:
 
 # 全局服务实例
 log_parsing_service = LogParsingService()
+
+
+def parse_log_content(
+    log_type: str,
+    vendor: str,
+    log_content: str,
+    context_info: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    解析技术日志（模块级入口）
+
+    供进程车道在工作进程中调用：工作进程导入本模块时已加载解析规则。
+    """
+    return log_parsing_service.parse_log(log_type, vendor, log_content, context_info)
@@ -0,0 +1,90 @@
+"""
+节点内容流式写入
+
+解决方案生成以流式方式调用大模型时，每收到一段文本就推送到节点主题（token 事件），
+前端在首个片段到达时即可开始展示，不必等待完整回复。已生成的内容按间隔写入
+Node.content，刷新页面或重新连接时先从节点取得已生成部分，再继续接收后续片段。
+"""
+
+import logging
+import time
+from typing import Optional
+
+from flask import current_app, has_app_context
+
+from app import db
+from app.services.infrastructure.progress_bus import TOKEN_EVENT, node_topic, publish_progress
+
+logger = logging.getLogger(__name__)
+
+
+class NodeStreamWriter:
+    """
+    把模型输出的文本片段推送到节点主题，并定期写入节点内容
+
+    作为 LLMService.generate_solution 的 on_token 回调使用。token 事件带有片段在全文中的
+    起始位置 offset，客户端据此拼接，从快照中的部分内容续接时也不会重复或遗漏。
+    """
+
+    def __init__(self, node, field: str = 'answer', checkpoint_seconds: Optional[float] = None):
+        """
+        Args:
+            node: 正在生成内容的节点
+            field: 写入 Node.content 的字段
+            checkpoint_seconds: 写入已生成内容的间隔，缺省读取 LLM_STREAM_CHECKPOINT_SECONDS
+        """
+        if checkpoint_seconds is None:
+            config = current_app.config if has_app_context() else {}
+            checkpoint_seconds = config.get('LLM_STREAM_CHECKPOINT_SECONDS', 2.0)
+
+        self.node = node
+        self.node_id = node.id
+        self.field = field
+        self.checkpoint_seconds = checkpoint_seconds
+        self.started_at = time.time()
+        self.first_token_seconds: Optional[float] = None
+        self._parts = []
+        self._length = 0
+        self._checkpointed_at: Optional[float] = None
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._parts)
+
+    def __call__(self, delta: str):
+        if not delta:
+            return
+
+        now = time.time()
+        if self.first_token_seconds is None:
+            self.first_token_seconds = round(now - self.started_at, 3)
+
+        publish_progress(node_topic(self.node_id), TOKEN_EVENT,
+                         nodeId=self.node_id, offset=self._length, delta=delta)
+        self._parts.append(delta)
+        self._length += len(delta)
+
+        # 首个片段立即写入，之后按间隔写入
+        if self._checkpointed_at is None or now - self._checkpointed_at >= self.checkpoint_seconds:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """把已生成的内容写入节点，节点仍处于处理中；写入失败只记录日志"""
+        self._checkpointed_at = time.time()
+        try:
+            content = dict(self.node.content or {})
+            content[self.field] = self.text
+            content['streaming'] = True
+            self.node.content = content
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"写入节点 {self.node_id} 的流式内容失败: {str(e)}")
+
+
+def create_stream_writer(node, field: str = 'answer') -> Optional[NodeStreamWriter]:
+    """按 LLM_STREAMING_ENABLED 配置创建流式写入器，关闭流式生成时返回None"""
+    config = current_app.config if has_app_context() else {}
+    if not config.get('LLM_STREAMING_ENABLED', True):
+        return None
+    return NodeStreamWriter(node, field=field)
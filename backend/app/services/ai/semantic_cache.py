@@ -0,0 +1,297 @@
+"""
+语义答案缓存
+
+许多诊断请求只是措辞不同（如“OSPF邻居卡在ExStart”的各种说法），精确匹配的缓存键无法命中，
+每次都要完整执行 分析 → 检索 → 生成 的流程。语义缓存位于Agent工作流之前：
+
+- 写入：用户反馈问题已解决且评分达到 SEMANTIC_CACHE_MIN_RATING 时，把案例的原始问题
+  （连同设备厂商，规范化后）向量化，与解决方案、案例所属用户和生成方案时引用的知识库文档
+  一起存入本地向量索引；反馈改为未解决时移除
+- 查询：新问题向量化后查找最相近的条目，同一用户、同一厂商、未过期且相似度达到
+  SEMANTIC_CACHE_THRESHOLD 时直接返回已有的解决方案（与其他案例接口一致，不跨用户复用）
+- 失效：条目超过 SEMANTIC_CACHE_TTL_SECONDS 不再使用；知识库文档重新入库或删除时，
+  只移除引用了该文档的条目，新文档入库不影响已有条目；案例删除时移除该案例的条目
+
+索引保存在 SEMANTIC_CACHE_PATH 下（LocalFileVectorDB），多个进程共享同一组文件，
+写入在文件锁下进行，文件变化时重新加载。向量化失败时查询视为未命中，不影响正常流程。
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from flask import current_app, has_app_context
+
+from app.services.storage.local_vector_db import LocalFileVectorDB
+
+logger = logging.getLogger(__name__)
+
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_query(query: str, vendor: Optional[str]) -> str:
+    """规范化问题文本（合并空白、转小写）并带上设备厂商，作为向量化的输入"""
+    text = _SPACE_PATTERN.sub(' ', query or '').strip().lower()
+    return f"{(vendor or '通用').strip().lower()}: {text}"
+
+
+class SemanticAnswerCache:
+    """按问题语义相似度复用已解决案例的解决方案"""
+
+    def __init__(self, storage_path: Optional[str] = None):
+        config = current_app.config if has_app_context() else {}
+        self.storage_path = storage_path or config.get('SEMANTIC_CACHE_PATH', 'instance/semantic_cache')
+        self._db: Optional[LocalFileVectorDB] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _config(key: str, default: Any) -> Any:
+        config = current_app.config if has_app_context() else {}
+        return config.get(key, default)
+
+    def enabled(self) -> bool:
+        return bool(self._config('SEMANTIC_CACHE_ENABLED', True))
+
+    def _has_index(self) -> bool:
+        return self._db is not None or os.path.exists(os.path.join(self.storage_path, 'index.json'))
+
+    def _get_db(self) -> LocalFileVectorDB:
+        """获取向量索引，其他进程修改过索引文件时重新加载"""
+        if self._db is None:
+            self._db = LocalFileVectorDB(self.storage_path)
+        else:
+            self._db.refresh()
+        return self._db
+
+    def _embed(self, query: str, vendor: Optional[str]):
+        from app.services.ai.embedding_service import get_embedding_service
+        return get_embedding_service().embed_text(normalize_query(query, vendor))
+
+    def lookup(self, query: str, user_id: Any, vendor: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        查找用户语义相近的已解决问题
+
+        Args:
+            query: 用户问题
+            user_id: 提问的用户，只复用该用户的案例
+            vendor: 设备厂商
+
+        Returns:
+            命中时返回 {'answer', 'case_id', 'node_id', 'query', 'similarity'}，否则返回None
+        """
+        if not self.enabled() or not self._has_index():
+            return None
+
+        try:
+            vector = self._embed(query, vendor)
+        except Exception as e:
+            logger.warning(f"语义缓存查询向量化失败，跳过缓存: {str(e)}")
+            return None
+
+        threshold = self._config('SEMANTIC_CACHE_THRESHOLD', 0.92)
+        ttl = self._config('SEMANTIC_CACHE_TTL_SECONDS', 7 * 24 * 3600)
+        normalized_vendor = (vendor or '通用').lower()
+        now = time.time()
+
+        def usable(info: Dict[str, Any]) -> bool:
+            # 在排序截取之前过滤，其他用户或过期的条目不会挤掉该用户自己的相似问题
+            metadata = info.get('metadata') or {}
+            return (metadata.get('user_id') == str(user_id) and metadata.get('vendor') == normalized_vendor
+                    and now - metadata.get('stored_at', 0) <= ttl)
+
+        with self._lock:
+            candidates = self._get_db().search_similar(vector, top_k=1, predicate=usable)
+
+        for candidate in candidates:
+            if candidate['similarity'] < threshold:
+                break
+            metadata = candidate.get('metadata') or {}
+            logger.info(f"语义缓存命中: case_id={candidate['document_id']}, 相似度={candidate['similarity']:.3f}")
+            return {
+                'answer': candidate['content'],
+                'case_id': candidate['document_id'],
+                'node_id': metadata.get('node_id'),
+                'query': metadata.get('query'),
+                'similarity': round(float(candidate['similarity']), 4)
+            }
+        return None
+
+    def store(self, case_id: str, node_id: str, query: str, answer: str, user_id: Any,
+              vendor: Optional[str] = None, rating: Optional[int] = None,
+              document_ids: Optional[List[str]] = None) -> bool:
+        """
+        存入已解决案例的解决方案，同一案例只保留最新的一条
+
+        Args:
+            user_id: 案例所属用户
+            document_ids: 生成解决方案时引用的知识库文档，文档变化时移除该条目
+
+        Returns:
+            bool: 是否已存入
+        """
+        if not self.enabled() or not answer or not query:
+            return False
+
+        try:
+            vector = self._embed(query, vendor)
+        except Exception as e:
+            logger.warning(f"语义缓存写入向量化失败: {str(e)}")
+            return False
+
+        with self._lock, self._get_db().transaction() as db:
+            if any(info.get('document_id') == case_id for info in db.index.values()):
+                db.delete_document(case_id)
+            self._evict(db)
+            db.add_document(case_id, [{
+                'content': answer,
+                'metadata': {
+                    'query': query,
+                    'user_id': str(user_id),
+                    'vendor': (vendor or '通用').lower(),
+                    'document_ids': list(document_ids or []),
+                    'node_id': node_id,
+                    'rating': rating,
+                    'stored_at': time.time()
+                }
+            }], [vector])
+        logger.info(f"已写入语义缓存: case_id={case_id}")
+        return True
+
+    def _evict(self, db: LocalFileVectorDB):
+        """条目数达到 SEMANTIC_CACHE_MAX_ENTRIES 时移除最早写入的条目"""
+        max_entries = self._config('SEMANTIC_CACHE_MAX_ENTRIES', 2000)
+        overflow = len(db.index) - max_entries + 1
+        if overflow <= 0:
+            return
+        oldest = sorted(db.index.values(), key=lambda info: info.get('metadata', {}).get('stored_at', 0))
+        for info in oldest[:overflow]:
+            db.delete_document(info['document_id'])
+
+    def remove(self, case_id: str) -> bool:
+        """移除案例的缓存条目（反馈改为未解决时）"""
+        if not self._has_index():
+            return False
+        with self._lock, self._get_db().transaction() as db:
+            if not any(info.get('document_id') == case_id for info in db.index.values()):
+                return False
+            removed = db.delete_document(case_id)
+        return removed
+
+    def invalidate_document(self, document_id: str, reason: str = '') -> int:
+        """
+        移除引用了知识库文档的条目（文档重新入库或删除后，基于旧内容的解决方案可能过时）
+
+        Returns:
+            int: 移除的条目数
+        """
+        if not self._has_index():
+            return 0
+        with self._lock, self._get_db().transaction() as db:
+            stale = [info['document_id'] for info in db.index.values()
+                     if document_id in (info.get('metadata') or {}).get('document_ids', [])]
+            for case_id in stale:
+                db.delete_document(case_id)
+        if stale:
+            logger.info(f"语义缓存已移除 {len(stale)} 个条目: {reason}")
+        return len(stale)
+
+    def invalidate(self, reason: str = ''):
+        """清空缓存（知识库变化后已有的解决方案可能过时）"""
+        if not self._has_index():
+            return
+        with self._lock:
+            db = self._get_db()
+            if not db.index:
+                return
+            db.clear_all()
+        logger.info(f"语义缓存已清空: {reason}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            db = self._get_db()
+            return {'enabled': self.enabled(), 'entries': len(db.index), 'storage_path': str(db.storage_path)}
+
+
+# 全局语义缓存实例
+_semantic_cache: Optional[SemanticAnswerCache] = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    """获取进程内共享的语义缓存实例"""
+    global _semantic_cache
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticAnswerCache()
+        return _semantic_cache
+
+
+def reset_semantic_cache():
+    """重置全局语义缓存实例（主要用于测试）"""
+    global _semantic_cache
+    with _semantic_cache_lock:
+        _semantic_cache = None
+
+
+def invalidate_semantic_cache(reason: str = ''):
+    """清空语义缓存，失败只记录日志"""
+    try:
+        get_semantic_cache().invalidate(reason)
+    except Exception as e:
+        logger.warning(f"清空语义缓存失败: {str(e)}")
+
+
+def invalidate_semantic_cache_for_document(document_id: str, reason: str = '') -> int:
+    """知识库文档重新入库或删除时移除引用了它的缓存条目，失败只记录日志"""
+    try:
+        return get_semantic_cache().invalidate_document(document_id, reason)
+    except Exception as e:
+        logger.warning(f"移除语义缓存条目失败: document_id={document_id}, {str(e)}")
+        return 0
+
+
+def remove_case_from_semantic_cache(case_id: str) -> bool:
+    """案例删除后移除其缓存条目，失败只记录日志"""
+    try:
+        return get_semantic_cache().remove(case_id)
+    except Exception as e:
+        logger.warning(f"移除语义缓存条目失败: case_id={case_id}, {str(e)}")
+        return False
+
+
+def update_from_feedback(case, feedback) -> bool:
+    """
+    根据案例反馈更新语义缓存
+
+    问题已解决且评分达到 SEMANTIC_CACHE_MIN_RATING 时存入案例最新的解决方案，
+    否则移除该案例已有的条目。失败只记录日志。
+
+    Returns:
+        bool: 是否存入了缓存
+    """
+    from app.models.case import Node
+
+    try:
+        cache = get_semantic_cache()
+        min_rating = cache._config('SEMANTIC_CACHE_MIN_RATING', 4)
+        if feedback.outcome != 'solved' or (feedback.rating or 0) < min_rating:
+            cache.remove(case.id)
+            return False
+
+        solution_node = (Node.query
+                         .filter_by(case_id=case.id, type='SOLUTION', status='COMPLETED')
+                         .order_by(Node.created_at.desc())
+                         .first())
+        answer = (solution_node.content or {}).get('answer') if solution_node else None
+        metadata = case.case_metadata or {}
+        if not answer:
+            return False
+        return cache.store(case.id, solution_node.id, metadata.get('original_query') or case.title,
+                           answer, case.user_id, vendor=metadata.get('vendor'), rating=feedback.rating,
+                           document_ids=(solution_node.node_metadata or {}).get('source_document_ids'))
+    except Exception as e:
+        logger.warning(f"根据反馈更新语义缓存失败: case_id={case.id}, {str(e)}")
+        return False
@@ -0,0 +1,184 @@
+"""
+工作流步骤检查点
+
+工作进程退出或某次LLM调用失败时，任务重试（retry_on_failure）或由其他进程接管（任务存储的租约恢复）
+后会从头执行整个工作流，重复已完成的分析、检索和生成调用。每个步骤完成后保存检查点：
+
+- 检查点记录步骤完成后的Agent状态和节点内容，按 (节点, 步骤, 输入状态指纹) 查找
+- 重新执行时，输入状态与检查点一致的步骤直接使用保存的结果（恢复节点内容），从第一个未完成的步骤继续；
+  输入变化（如问题内容不同）的步骤照常执行
+- 出错的步骤和错误处理步骤不保存，重试时重新执行
+- 工作流成功结束后删除该节点的检查点；未结束的检查点保留 WORKFLOW_CHECKPOINT_TTL_SECONDS 秒，
+  过期后在保存检查点时定期清理，也可通过 flask purge-checkpoints 命令清理
+
+检查点读写失败只记录日志，不影响工作流执行。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import current_app, has_app_context
+
+from app import db
+from app.models.case import Node, WorkflowCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# 不保存检查点的步骤
+_UNCHECKPOINTED_STEPS = {'handle_error'}
+
+# 检查点中保存的节点字段
+_NODE_FIELDS = ('type', 'title', 'status', 'content', 'node_metadata')
+
+# 过期检查点的清理间隔（秒）
+_PURGE_INTERVAL_SECONDS = 600
+
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+def _config() -> Dict[str, Any]:
+    return current_app.config if has_app_context() else {}
+
+
+def checkpoints_enabled() -> bool:
+    return bool(_config().get('WORKFLOW_CHECKPOINT_ENABLED', True))
+
+
+def _to_json(value: Any) -> Any:
+    """转换为可保存到JSON列的结构"""
+    return json.loads(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def state_digest(state: Dict[str, Any]) -> str:
+    """Agent状态的指纹"""
+    payload = json.dumps(state, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def load_checkpoint(node_id: str, step: str, input_digest: str) -> Optional[WorkflowCheckpoint]:
+    """
+    查找步骤在相同输入下的未过期检查点
+
+    Args:
+        node_id: 工作流处理的节点ID
+        step: 步骤名称
+        input_digest: 步骤输入状态的指纹
+
+    Returns:
+        WorkflowCheckpoint，不存在时返回None
+    """
+    if not node_id or not checkpoints_enabled():
+        return None
+    try:
+        return (WorkflowCheckpoint.query
+                .filter(WorkflowCheckpoint.node_id == node_id,
+                        WorkflowCheckpoint.step == step,
+                        WorkflowCheckpoint.input_digest == input_digest,
+                        WorkflowCheckpoint.expires_at > datetime.utcnow())
+                .order_by(WorkflowCheckpoint.id.desc())
+                .first())
+    except Exception as e:
+        logger.warning(f"读取工作流检查点失败: {str(e)}")
+        return None
+
+
+def save_checkpoint(step: str, input_digest: str, result: Dict[str, Any], node: Optional[Node]) -> bool:
+    """
+    保存步骤完成后的状态和节点内容
+
+    Args:
+        step: 步骤名称
+        input_digest: 步骤输入状态的指纹
+        result: 步骤返回的Agent状态
+        node: 工作流处理的节点
+
+    Returns:
+        bool: 是否已保存
+    """
+    if (node is None or step in _UNCHECKPOINTED_STEPS or (result or {}).get('error')
+            or not checkpoints_enabled()):
+        return False
+
+    ttl = _config().get('WORKFLOW_CHECKPOINT_TTL_SECONDS', 86400)
+    try:
+        db.session.add(WorkflowCheckpoint(
+            case_id=node.case_id,
+            node_id=node.id,
+            step=step,
+            input_digest=input_digest,
+            state=_to_json(result),
+            node_snapshot=_to_json({name: getattr(node, name) for name in _NODE_FIELDS}),
+            expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"保存工作流检查点失败: step={step}, node_id={node.id}, {str(e)}")
+        return False
+
+    _maybe_purge_expired()
+    return True
+
+
+def restore_checkpoint(checkpoint: WorkflowCheckpoint, node: Optional[Node]) -> Dict[str, Any]:
+    """
+    使用检查点作为步骤结果：恢复节点内容（期间可能已被错误信息覆盖），返回保存的Agent状态
+    """
+    if node is not None and checkpoint.node_snapshot:
+        for name in _NODE_FIELDS:
+            setattr(node, name, checkpoint.node_snapshot.get(name))
+        db.session.commit()
+    logger.info(f"步骤 {checkpoint.step} 已完成，使用检查点结果: node_id={checkpoint.node_id}")
+    return dict(checkpoint.state or {})
+
+
+def clear_checkpoints(node_id: str) -> int:
+    """
+    删除节点的全部检查点（工作流成功结束后调用）
+
+    Returns:
+        int: 删除的检查点数量
+    """
+    try:
+        removed = WorkflowCheckpoint.query.filter(WorkflowCheckpoint.node_id == node_id).delete()
+        db.session.commit()
+        return removed
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"删除工作流检查点失败: node_id={node_id}, {str(e)}")
+        return 0
+
+
+def purge_expired_checkpoints() -> int:
+    """
+    删除已过期的检查点
+
+    Returns:
+        int: 删除的检查点数量
+    """
+    removed = WorkflowCheckpoint.query.filter(WorkflowCheckpoint.expires_at <= datetime.utcnow()).delete()
+    db.session.commit()
+    if removed:
+        logger.info(f"已清理 {removed} 个过期的工作流检查点")
+    return removed
+
+
+def _maybe_purge_expired():
+    """距上次清理超过 _PURGE_INTERVAL_SECONDS 时清理过期检查点"""
+    global _last_purge
+
+    with _purge_lock:
+        if time.time() - _last_purge < _PURGE_INTERVAL_SECONDS:
+            return
+        _last_purge = time.time()
+    try:
+        purge_expired_checkpoints()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"清理过期工作流检查点失败: {str(e)}")
@@ -9,35 +9,61 @@ import logging
 from datetime import datetime
 from typing import Dict, Any, List
 
-from flask import has_app_context, current_app
-from app import create_app, db
+from flask import current_app
+from app import db
 from app.models.knowledge import KnowledgeDocument, ParsingJob
 from app.services.document.idp_service import IDPService
-from app.services.document.semantic_splitter import SemanticSplitter
+from app.services.document.semantic_splitter import SemanticSplitter, split_with_metadata
 from app.services.retrieval.vector_service import VectorService
 from app.services.infrastructure.task_monitor import with_monitoring_and_retry
+from app.services.infrastructure.cancellation import TaskCancelled, check_cancelled, on_cancel
+from app.services.infrastructure.worker_runtime import worker_app_context
+from app.services.infrastructure.process_lane import run_cpu_bound
+from app.services.infrastructure.progress_bus import (
+    STATUS_EVENT, document_topic, publish_progress, report_progress
+)
 from app.services.storage.cache_service import cached_retrieval_call
+from app.services.storage.artifact_store import get_artifact_store, build_parsing_summary
 from app.utils.monitoring import monitor_performance
 
 logger = logging.getLogger(__name__)
 
 
+def _mark_parsing_cancelled(reason: TaskCancelled, job_id: str):
+    """解析任务被取消或超时后，将解析任务和文档标记为失败"""
+    with worker_app_context():
+        job = db.session.get(ParsingJob, job_id)
+        if job is None or job.status in ('COMPLETED', 'FAILED'):
+            return
+        job.status = 'FAILED'
+        job.error_message = reason.message
+        job.completed_at = datetime.utcnow()
+
+        document = db.session.get(KnowledgeDocument, job.document_id)
+        if document is not None and document.status in ('QUEUED', 'PARSING'):
+            document.status = 'FAILED'
+            document.error_message = reason.message
+            _sync_linked_documents(document)
+
+        db.session.commit()
+        if document is not None:
+            _publish_document_status(document)
+        logger.info(f"解析任务已停止: {job_id}, 原因: {reason.message}")
+
+
+@on_cancel(_mark_parsing_cancelled)
 @with_monitoring_and_retry(max_retries=3, retry_intervals=[10, 30, 60])
 def parse_document(job_id: str):
     """
     解析文档的异步任务 - 专注于IDP服务
 
-    优先复用现有的 Flask 应用上下文，避免在测试环境中重新 create_app()
-    造成使用不同数据库配置（如指向不存在的 SQLite 文件）。
+    优先复用现有的 Flask 应用上下文（如测试环境），避免使用不同的数据库配置；
+    在工作线程中则使用工作进程共享的应用实例，不再为每个任务 create_app()。
 
     Args:
         job_id: 解析任务ID
     """
-    if has_app_context():
-        return _parse_document_impl(job_id)
-    # 无应用上下文时再创建应用
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         return _parse_document_impl(job_id)
 
 
@@ -61,7 +87,9 @@ def _parse_document_impl(job_id: str):
         job.started_at = datetime.utcnow()
         document.status = 'PARSING'
         document.progress = 10
+        _sync_linked_documents(document)
         db.session.commit()
+        report_progress('parsing', document.progress, document_id=document.id, status=document.status)
 
         # 优先使用阿里云IDP服务
         try:
@@ -73,8 +101,10 @@ def _parse_document_impl(job_id: str):
                 raise Exception(f"不支持的文件格式: {document.file_path}")
 
             parsed_result = idp_service.parse_document(document.file_path)
+            check_cancelled()
             document.progress = 50
             db.session.commit()
+            report_progress('parsed', document.progress, document_id=document.id, status=document.status)
 
             logger.info("IDP服务解析完成")
 
@@ -87,6 +117,7 @@ def _parse_document_impl(job_id: str):
                 parsed_result = _simple_text_extraction(document.file_path)
                 document.progress = 50
                 db.session.commit()
+                report_progress('parsed', document.progress, document_id=document.id, status=document.status)
                 logger.info("使用简单文本提取作为备用方案")
             else:
                 # 对于复杂文档，直接失败并提示用户
@@ -95,15 +126,16 @@ def _parse_document_impl(job_id: str):
         # 语义切分
         try:
             logger.info("开始语义切分...")
-            splitter = SemanticSplitter(max_chunk_size=1000, overlap=100)
-            chunks = splitter.split_document(parsed_result, document)
-
-            # 为每个chunk添加元数据
-            for chunk in chunks:
-                chunk.update(splitter.extract_metadata(chunk, document))
+            # 切分是纯CPU计算，交给进程车道，避免长时间持有GIL拖慢同进程的请求
+            chunks = []
+            for chunk, metadata in run_cpu_bound(split_with_metadata, parsed_result, document.original_filename):
+                # 为每个chunk添加元数据
+                chunk.update(metadata)
+                chunks.append(chunk)
 
             document.progress = 70
             db.session.commit()
+            report_progress('split', document.progress, document_id=document.id, status=document.status)
 
             logger.info(f"语义切分完成，生成 {len(chunks)} 个文档块")
 
@@ -112,12 +144,14 @@ def _parse_document_impl(job_id: str):
             raise
 
         # 向量化并存储
+        check_cancelled()
         try:
             logger.info("开始向量化和存储...")
             vector_service = VectorService()
             vector_service.index_chunks(chunks, document.id)
             document.progress = 90
             db.session.commit()
+            report_progress('indexed', document.progress, document_id=document.id, status=document.status)
 
             logger.info("向量化和存储完成")
 
@@ -135,11 +169,21 @@ def _parse_document_impl(job_id: str):
             'categories': list(set(chunk.get('category', '其他') for chunk in chunks if chunk.get('category'))),
             'processed_with_idp': 'IDP服务' if 'layouts' in parsed_result else '简单文本提取'
         }
+        document.parsing_summary = build_parsing_summary(
+            parsed_result, len(chunks), text_length=job.result_data['text_length']
+        )
+        try:
+            # 完整解析结果压缩写入产物存储，行内只保留引用
+            document.parsing_result_ref = get_artifact_store().save(document.id, parsed_result)
+        except Exception as e:
+            logger.warning(f"保存解析产物失败，但文档解析已完成: {str(e)}")
         document.status = 'INDEXED'
         document.progress = 100
         document.processed_at = datetime.utcnow()
+        _sync_linked_documents(document)
 
         db.session.commit()
+        _publish_document_status(document)
         logger.info(f"文档解析任务完成: {document.original_filename}")
 
     except Exception as e:
@@ -150,11 +194,34 @@ def _parse_document_impl(job_id: str):
         job.completed_at = datetime.utcnow()
         document.status = 'FAILED'
         document.error_message = str(e)
+        _sync_linked_documents(document)
 
         db.session.commit()
+        _publish_document_status(document)
         raise
 
 
+def _sync_linked_documents(document: KnowledgeDocument) -> None:
+    """将规范文档的解析状态同步给复用其内容的重复文档"""
+    KnowledgeDocument.query.filter_by(source_document_id=document.id).update({
+        'status': document.status,
+        'progress': document.progress,
+        'error_message': document.error_message,
+        'processed_at': document.processed_at,
+        'parsing_summary': document.parsing_summary
+    }, synchronize_session=False)
+
+
+def _publish_document_status(document: KnowledgeDocument) -> None:
+    """推送文档解析的最终状态，复用其内容的重复文档的订阅方同样收到"""
+    linked_ids = [row.id for row in KnowledgeDocument.query.with_entities(KnowledgeDocument.id)
+                  .filter_by(source_document_id=document.id)]
+    for document_id in [document.id] + linked_ids:
+        publish_progress(document_topic(document_id), STATUS_EVENT,
+                         status=document.status, progress=document.progress,
+                         error=document.error_message if document.status == 'FAILED' else None)
+
+
 def _simple_text_extraction(file_path: str) -> Dict[str, Any]:
     """
     简化的文本提取（仅支持纯文本文件）
@@ -243,15 +310,25 @@ def _simple_text_split(parsed_result: Dict[str, Any], document, chunk_size: int
     return chunks
 
 
+class ParsingQueueUnavailable(RuntimeError):
+    """解析任务无法提交到任务队列"""
+
+
 def submit_parsing_job(document_id: str) -> str:
     """
     提交文档解析任务
 
+    同一文档已有排队中或执行中的解析任务时（如重复点击重新解析）不再重复解析，
+    撤销本次创建的解析任务记录并返回已有任务的ID。
+
     Args:
         document_id: 知识文档ID
 
     Returns:
         str: 任务ID
+
+    Raises:
+        ParsingQueueUnavailable: 任务队列提交失败；解析任务记录标记为失败，不在请求线程中解析
     """
     from app.services import get_task_queue
     from uuid import uuid4
@@ -275,13 +352,23 @@ def submit_parsing_job(document_id: str) -> str:
             parse_document,
             job_id,
             job_id=job_id,
-            job_timeout='30m'  # 30分钟超时
+            job_timeout='30m',  # 30分钟超时
+            lane='ingestion',
+            dedupe_key=document_id
         )
+        if task_job.id != job_id:
+            db.session.delete(parsing_job)
+            db.session.commit()
+            logger.info(f"文档已有未完成的解析任务，不再重复提交: {document_id} (任务: {task_job.id})")
+            return task_job.id
         logger.info(f"文档解析任务已提交到线程池: {job_id}")
     except Exception as queue_error:
         logger.error(f"任务队列提交失败: {str(queue_error)}")
-        # 如果队列提交失败，直接同步执行
-        parse_document_sync(job_id)
+        parsing_job.status = 'FAILED'
+        parsing_job.error_message = f"任务队列提交失败: {str(queue_error)}"
+        parsing_job.completed_at = datetime.utcnow()
+        db.session.commit()
+        raise ParsingQueueUnavailable(str(queue_error)) from queue_error
 
     return job_id
 
@@ -6,7 +6,6 @@ IP智慧解答专家系统 - 阿里云文档智能服务
 """
 
 import os
-import time
 import logging
 import json
 import threading
@@ -18,6 +17,9 @@ from alibabacloud_tea_util import models as util_models
 from alibabacloud_credentials.client import Client as CredClient
 from flask import current_app
 
+from app.services.infrastructure.cancellation import cancellable_sleep, check_cancelled
+from app.utils.circuit_breaker import get_breaker
+
 logger = logging.getLogger(__name__)
 
 # 全局IDP客户端实例（在主线程中初始化）
@@ -83,6 +85,8 @@ class IDPService:
         # 使用全局客户端实例
         self.client = _global_idp_client
         self.credentials_available = _client_credentials_available
+        # DocMind 不可用时熔断，提交和查询直接失败，不再逐次等满超时
+        self.breaker = get_breaker('docmind')
 
     def parse_document(self, file_path: str, enable_llm: bool = True, enable_formula: bool = True) -> Dict[str, Any]:
         """
@@ -112,7 +116,8 @@ class IDPService:
                 )
                 runtime = util_models.RuntimeOptions()
 
-                response = self.client.submit_doc_parser_job_advance(request, runtime)
+                with self.breaker.protect():
+                    response = self.client.submit_doc_parser_job_advance(request, runtime)
             job_id = response.body.data.id
 
             logger.info(f"文档解析任务提交成功，任务ID: {job_id}")
@@ -127,7 +132,8 @@ class IDPService:
                     status_request = docmind_api20220711_models.QueryDocParserStatusRequest(
                         id=job_id
                     )
-                    status_response = self.client.query_doc_parser_status(status_request)
+                    with self.breaker.protect():
+                        status_response = self.client.query_doc_parser_status(status_request)
 
                     status = status_response.body.data.status
                     logger.info(f"任务状态: {status}")
@@ -141,7 +147,7 @@ class IDPService:
                         raise Exception(error_msg)
 
                     # 状态为 Init 或 Processing，继续等待
-                    time.sleep(10)
+                    cancellable_sleep(10)
                     attempt += 1
 
                     if attempt % 6 == 0:  # 每分钟记录一次进度
@@ -150,7 +156,7 @@ class IDPService:
 
                 except Exception as e:
                     logger.warning(f"查询解析状态时出现临时错误: {str(e)}")
-                    time.sleep(10)
+                    cancellable_sleep(10)
                     attempt += 1
                     continue
 
@@ -185,6 +191,7 @@ class IDPService:
         layout_step_size = 100  # 每次获取100个layout
 
         while True:
+            check_cancelled()
             try:
                 result_request = docmind_api20220711_models.GetDocParserResultRequest(
                     id=job_id,
@@ -192,7 +199,8 @@ class IDPService:
                     layout_step_size=layout_step_size
                 )
 
-                result_response = self.client.get_doc_parser_result(result_request)
+                with self.breaker.protect():
+                    result_response = self.client.get_doc_parser_result(result_request)
                 batch_data = result_response.body.data
 
                 # 解析返回的JSON数据
@@ -250,7 +258,8 @@ class IDPService:
                 formula_enhancement=enable_formula
             )
 
-            response = self.client.submit_doc_parser_job(request)
+            with self.breaker.protect():
+                response = self.client.submit_doc_parser_job(request)
             job_id = response.body.data.id
 
             logger.info(f"文档解析任务提交成功，任务ID: {job_id}")
@@ -264,7 +273,8 @@ class IDPService:
                     status_request = docmind_api20220711_models.QueryDocParserStatusRequest(
                         id=job_id
                     )
-                    status_response = self.client.query_doc_parser_status(status_request)
+                    with self.breaker.protect():
+                        status_response = self.client.query_doc_parser_status(status_request)
 
                     status = status_response.body.data.status
 
@@ -275,7 +285,7 @@ class IDPService:
                         logger.error(error_msg)
                         raise Exception(error_msg)
 
-                    time.sleep(10)
+                    cancellable_sleep(10)
                     attempt += 1
 
                     if attempt % 6 == 0:
@@ -284,7 +294,7 @@ class IDPService:
 
                 except Exception as e:
                     logger.warning(f"查询解析状态时出现临时错误: {str(e)}")
-                    time.sleep(10)
+                    cancellable_sleep(10)
                     attempt += 1
                     continue
 
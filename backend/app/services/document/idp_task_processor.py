@@ -9,11 +9,14 @@ import json
 import logging
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from app import create_app, db
+from app import db
 from app.models.knowledge import KnowledgeDocument, ParsingJob, DocumentChunk
 from app.services.document.idp_service import IDPService
-from app.services.document.semantic_splitter import SemanticSplitter
+from app.services.document.semantic_splitter import split_with_metadata
 from app.services.retrieval.vector_service import VectorService
+from app.services.storage.artifact_store import get_artifact_store, build_parsing_summary
+from app.services.infrastructure.worker_runtime import worker_app_context
+from app.services.infrastructure.process_lane import run_cpu_bound
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +31,7 @@ def parse_document_with_idp(job_id: str) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 解析结果
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context() as app:
         try:
             # 获取任务和文档信息
             job = ParsingJob.query.get(job_id)
@@ -51,7 +53,6 @@ def parse_document_with_idp(job_id: str) -> Dict[str, Any]:
 
             # 初始化服务
             idp_service = IDPService()
-            splitter = SemanticSplitter(max_chunk_size=1000, overlap=100)
             vector_service = VectorService()
 
             # 步骤1: IDP文档解析
@@ -80,23 +81,21 @@ def parse_document_with_idp(job_id: str) -> Dict[str, Any]:
 
             # 步骤2: 语义切分
             logger.info("步骤2: 执行语义切分")
-            chunks = splitter.split_document(idp_result, document)
+            # 切分是纯CPU计算，交给进程车道，避免长时间持有GIL拖慢同进程的请求
+            split_results = run_cpu_bound(split_with_metadata, idp_result, document.original_filename)
 
             document.progress = 70
             db.session.commit()
 
             # 步骤3: 保存文档块到数据库
-            logger.info(f"步骤3: 保存 {len(chunks)} 个文档块到数据库")
+            logger.info(f"步骤3: 保存 {len(split_results)} 个文档块到数据库")
 
             # 删除旧的文档块
             DocumentChunk.query.filter_by(document_id=document.id).delete()
 
             saved_chunks = []
-            for i, chunk_data in enumerate(chunks):
+            for i, (chunk_data, metadata) in enumerate(split_results):
                 try:
-                    # 提取元数据
-                    metadata = splitter.extract_metadata(chunk_data, document)
-
                     # 创建文档块记录
                     chunk = DocumentChunk(
                         document_id=document.id,
@@ -148,23 +147,26 @@ def parse_document_with_idp(job_id: str) -> Dict[str, Any]:
             # 步骤5: 更新文档状态
             document.status = 'COMPLETED'
             document.progress = 100
-            document.chunk_count = len(saved_chunks)
             document.parsed_at = datetime.utcnow()
 
-            # 保存IDP原始结果
-            document.parsing_result = json.dumps({
+            # IDP原始结果压缩写入产物存储，行内只保留引用和摘要
+            statistics = idp_service.get_document_statistics(idp_result)
+            document.parsing_result_ref = get_artifact_store().save(document.id, {
                 'idp_result': idp_result,
-                'statistics': idp_service.get_document_statistics(idp_result),
+                'statistics': statistics,
                 'chunks_count': len(saved_chunks)
-            }, ensure_ascii=False)
+            })
+            document.parsing_summary = build_parsing_summary(
+                idp_result, len(saved_chunks), statistics=statistics
+            )
 
             job.status = 'COMPLETED'
             job.completed_at = datetime.utcnow()
-            job.result = json.dumps({
+            job.result_data = {
                 'success': True,
                 'chunks_count': len(saved_chunks),
-                'statistics': idp_service.get_document_statistics(idp_result)
-            }, ensure_ascii=False)
+                'statistics': statistics
+            }
 
             db.session.commit()
 
@@ -174,7 +176,7 @@ def parse_document_with_idp(job_id: str) -> Dict[str, Any]:
                 'success': True,
                 'document_id': document.id,
                 'chunks_count': len(saved_chunks),
-                'statistics': idp_service.get_document_statistics(idp_result)
+                'statistics': statistics
             }
 
         except Exception as e:
@@ -209,8 +211,7 @@ def reprocess_document(document_id: str, use_enhanced_llm: bool = True) -> Dict[
     Returns:
         Dict[str, Any]: 处理结果
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         try:
             document = KnowledgeDocument.query.get(document_id)
             if not document:
@@ -253,8 +254,7 @@ def batch_process_documents(document_ids: List[str]) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 批量处理结果
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         results = {
             'success_count': 0,
             'failed_count': 0,
@@ -289,8 +289,7 @@ def cleanup_failed_documents() -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 清理结果
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         try:
             # 查找解析失败的文档
             failed_documents = KnowledgeDocument.query.filter_by(
@@ -336,8 +335,7 @@ def get_processing_statistics() -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 统计信息
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         try:
             # 文档状态统计
             document_stats = db.session.query(
@@ -387,8 +385,7 @@ def parse_document_from_url_task(job_id: str, file_url: str, file_name: str,
     Returns:
         Dict[str, Any]: 解析结果
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context():
         try:
             # 获取任务和文档信息
             job = ParsingJob.query.get(job_id)
@@ -410,7 +407,6 @@ def parse_document_from_url_task(job_id: str, file_url: str, file_name: str,
 
             # 初始化服务
             idp_service = IDPService()
-            splitter = SemanticSplitter(max_chunk_size=1000, overlap=100)
             vector_service = VectorService()
 
             # 步骤1: IDP文档解析（通过URL）
@@ -431,23 +427,21 @@ def parse_document_from_url_task(job_id: str, file_url: str, file_name: str,
 
             # 步骤2: 语义切分
             logger.info("步骤2: 执行语义切分")
-            chunks = splitter.split_document(idp_result, document)
+            # 切分是纯CPU计算，交给进程车道，避免长时间持有GIL拖慢同进程的请求
+            split_results = run_cpu_bound(split_with_metadata, idp_result, document.original_filename)
 
             document.progress = 70
             db.session.commit()
 
             # 步骤3: 保存文档块到数据库
-            logger.info(f"步骤3: 保存 {len(chunks)} 个文档块到数据库")
+            logger.info(f"步骤3: 保存 {len(split_results)} 个文档块到数据库")
 
             # 删除旧的文档块
             DocumentChunk.query.filter_by(document_id=document.id).delete()
 
             saved_chunks = []
-            for i, chunk_data in enumerate(chunks):
+            for i, (chunk_data, metadata) in enumerate(split_results):
                 try:
-                    # 提取元数据
-                    metadata = splitter.extract_metadata(chunk_data, document)
-
                     # 创建文档块记录
                     chunk = DocumentChunk(
                         document_id=document.id,
@@ -499,26 +493,29 @@ def parse_document_from_url_task(job_id: str, file_url: str, file_name: str,
             # 步骤5: 更新文档状态
             document.status = 'COMPLETED'
             document.progress = 100
-            document.chunk_count = len(saved_chunks)
             document.parsed_at = datetime.utcnow()
 
-            # 保存IDP原始结果
-            document.parsing_result = json.dumps({
+            # IDP原始结果压缩写入产物存储，行内只保留引用和摘要
+            statistics = idp_service.get_document_statistics(idp_result)
+            document.parsing_result_ref = get_artifact_store().save(document.id, {
                 'idp_result': idp_result,
-                'statistics': idp_service.get_document_statistics(idp_result),
+                'statistics': statistics,
                 'chunks_count': len(saved_chunks),
                 'source_type': 'url',
                 'source_url': file_url
-            }, ensure_ascii=False)
+            })
+            document.parsing_summary = build_parsing_summary(
+                idp_result, len(saved_chunks), statistics=statistics, source_type='url'
+            )
 
             job.status = 'COMPLETED'
             job.completed_at = datetime.utcnow()
-            job.result = json.dumps({
+            job.result_data = {
                 'success': True,
                 'chunks_count': len(saved_chunks),
-                'statistics': idp_service.get_document_statistics(idp_result),
+                'statistics': statistics,
                 'source_type': 'url'
-            }, ensure_ascii=False)
+            }
 
             db.session.commit()
 
@@ -528,7 +525,7 @@ def parse_document_from_url_task(job_id: str, file_url: str, file_name: str,
                 'success': True,
                 'document_id': document.id,
                 'chunks_count': len(saved_chunks),
-                'statistics': idp_service.get_document_statistics(idp_result),
+                'statistics': statistics,
                 'source_type': 'url'
             }
 
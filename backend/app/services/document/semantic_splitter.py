@@ -6,7 +6,8 @@ IP智慧解答专家系统 - 语义切分器
 
 import re
 import logging
-from typing import List, Dict, Any, Optional
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional, Tuple
 from app.models.knowledge import KnowledgeDocument
 
 logger = logging.getLogger(__name__)
@@ -429,3 +430,25 @@ class SemanticSplitter:
             return '配置管理'
 
         return '其他'
+
+
+def split_with_metadata(idp_result: Dict[str, Any], source_filename: str,
+                        max_chunk_size: int = 1000, overlap: int = 100) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    切分文档并提取每个块的元数据
+
+    只依赖可pickle的参数，供进程车道在工作进程中执行（见 run_cpu_bound）。
+
+    Args:
+        idp_result: IDP解析结果
+        source_filename: 文档原始文件名
+        max_chunk_size: 最大块大小
+        overlap: 重叠字符数
+
+    Returns:
+        List[Tuple[Dict, Dict]]: (文档块, 元数据) 列表
+    """
+    splitter = SemanticSplitter(max_chunk_size=max_chunk_size, overlap=overlap)
+    source = SimpleNamespace(original_filename=source_filename)
+    chunks = splitter.split_document(idp_result, source)
+    return [(chunk, splitter.extract_metadata(chunk, source)) for chunk in chunks]
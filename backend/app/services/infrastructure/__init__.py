@@ -4,16 +4,48 @@
 包含所有基础设施相关的服务：
 - 任务监控：异步任务监控和重试机制
 - 任务队列：异步任务队列服务
+- 任务存储：任务队列的可插拔持久化后端
+- 任务取消：后台任务的超时和协作式取消
+- 任务运行时：工作进程共享的应用实例和任务应用上下文
+- 进程车道：CPU密集型计算的预热进程池
+- 进度事件：任务进度的发布订阅总线，供SSE接口推送
+- 队列指标：任务队列的排队深度、等待和执行时长直方图
 """
 
 from .task_monitor import TaskMonitor, with_monitoring_and_retry
-from .task_queue import get_task_queue, get_task_status, is_queue_available, cleanup_old_tasks
+from .task_queue import get_task_queue, get_task_status, cancel_task, is_queue_available, cleanup_old_tasks
+from .job_store import MemoryJobStore, SQLiteJobStore, create_job_store
+from .cancellation import TaskCancelled, TaskTimeout, check_cancelled, cancellable_sleep
+from .worker_runtime import get_worker_app, set_worker_app, worker_app_context
+from .process_lane import ProcessLane, get_process_lane, get_process_lane_stats, run_cpu_bound
+from .progress_bus import get_progress_bus, publish_progress, report_progress
+from .queue_metrics import QueueMetrics, render_prometheus
 
 __all__ = [
     'TaskMonitor',
     'with_monitoring_and_retry',
     'get_task_queue',
     'get_task_status', 
+    'cancel_task',
     'is_queue_available',
-    'cleanup_old_tasks'
+    'cleanup_old_tasks',
+    'MemoryJobStore',
+    'SQLiteJobStore',
+    'create_job_store',
+    'TaskCancelled',
+    'TaskTimeout',
+    'check_cancelled',
+    'cancellable_sleep',
+    'get_worker_app',
+    'set_worker_app',
+    'worker_app_context',
+    'ProcessLane',
+    'get_process_lane',
+    'get_process_lane_stats',
+    'run_cpu_bound',
+    'get_progress_bus',
+    'publish_progress',
+    'report_progress',
+    'QueueMetrics',
+    'render_prometheus'
 ]
@@ -0,0 +1,180 @@
+"""
+IP智慧解答专家系统 - 任务取消令牌
+
+Python线程无法被强制终止，后台任务的超时和取消采用协作方式：
+任务队列为每个任务创建 CancellationToken 并绑定到执行线程，
+IDP轮询、LLM调用、向量化循环等长耗时步骤通过 check_cancelled()
+或 cancellable_sleep() 检查令牌，收到取消后抛出 TaskCancelled 退出。
+
+TaskCancelled 继承自 BaseException（与 asyncio.CancelledError 相同），
+不会被业务代码中大量存在的 ``except Exception`` 吞掉，也不会触发失败重试。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, Union
+
+CANCELLED = 'cancelled'
+TIMED_OUT = 'timed_out'
+
+
+class TaskCancelled(BaseException):
+    """任务被取消"""
+
+    status = CANCELLED
+
+    def __init__(self, message: str = '任务已取消'):
+        super().__init__(message)
+        self.message = message
+
+
+class TaskTimeout(TaskCancelled):
+    """任务执行超时"""
+
+    status = TIMED_OUT
+
+    def __init__(self, message: str = '任务执行超时'):
+        super().__init__(message)
+
+
+class CancellationToken:
+    """任务取消令牌"""
+
+    def __init__(self, timeout: Optional[float] = None, job_id: Optional[str] = None):
+        """
+        Args:
+            timeout: 执行超时秒数，从 start() 开始计时；None 表示不限时
+            job_id: 所属任务ID，任务上报进度时使用
+        """
+        self.timeout = timeout
+        self.job_id = job_id
+        self.deadline: Optional[float] = None
+        self.cancelled_at: Optional[float] = None
+        self._event = threading.Event()
+        self._reason: Optional[TaskCancelled] = None
+
+    def start(self):
+        """任务开始执行，开始计算超时"""
+        if self.timeout:
+            self.deadline = time.time() + self.timeout
+
+    def cancel(self, reason: Optional[TaskCancelled] = None) -> bool:
+        """
+        请求取消任务
+
+        Returns:
+            bool: 是否为首次取消
+        """
+        if self._event.is_set():
+            return False
+        self._reason = reason or TaskCancelled()
+        self.cancelled_at = time.time()
+        self._event.set()
+        return True
+
+    def expire_if_overdue(self) -> bool:
+        """超过截止时间时以超时原因取消，返回是否本次触发"""
+        if self.deadline is not None and time.time() >= self.deadline:
+            return self.cancel(TaskTimeout(f'任务执行超过 {self.timeout:g} 秒'))
+        return False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def reason(self) -> Optional[TaskCancelled]:
+        return self._reason
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的剩余秒数，未限时返回None"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0.0)
+
+    def raise_if_cancelled(self):
+        """已取消或已超时时抛出 TaskCancelled / TaskTimeout"""
+        self.expire_if_overdue()
+        if self._event.is_set():
+            raise self._reason
+
+    def sleep(self, seconds: float):
+        """可被取消打断的等待"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._event.wait(seconds)
+        self.raise_if_cancelled()
+
+
+_local = threading.local()
+
+
+def current_token() -> Optional[CancellationToken]:
+    """当前线程正在执行的任务的取消令牌，不在后台任务中时返回None"""
+    return getattr(_local, 'token', None)
+
+
+@contextmanager
+def bind_token(token: CancellationToken):
+    """在当前线程上绑定任务取消令牌"""
+    previous = current_token()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def check_cancelled():
+    """检查当前任务是否已取消或超时，不在后台任务中时什么也不做"""
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def cancellable_sleep(seconds: float):
+    """替代 time.sleep：后台任务中被取消时立即抛出 TaskCancelled"""
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+def on_cancel(handler: Callable):
+    """
+    为任务函数注册取消处理函数
+
+    任务被取消、超时或因无响应被放弃时，任务队列以 ``handler(reason, *args)`` 调用，
+    用于把关联的业务状态（解析任务、对话节点等）改为失败。处理函数可能在请求线程
+    或看门狗线程中执行，需要自行确保应用上下文。
+    """
+    def decorator(func: Callable) -> Callable:
+        func.on_cancel = handler
+        return func
+    return decorator
+
+
+def parse_timeout(value: Union[None, int, float, str]) -> Optional[float]:
+    """
+    解析超时设置
+
+    支持秒数或带单位的字符串（与RQ相同）：'90'、'30s'、'10m'、'1h'。
+
+    Returns:
+        Optional[float]: 秒数，未设置或不大于0时返回None
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = str(value).strip().lower()
+        units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+        if text[-1] in units:
+            seconds = float(text[:-1]) * units[text[-1]]
+        else:
+            seconds = float(text)
+    return seconds if seconds > 0 else None
@@ -0,0 +1,430 @@
+"""
+IP智慧解答专家系统 - 任务持久化存储
+
+ThreadPoolQueue 的可插拔任务存储后端：
+- MemoryJobStore：进程内存储，测试和不需要持久化的场景使用
+- SQLiteJobStore：独立SQLite文件存储，进程重启或崩溃后任务不丢失
+
+任务以“函数路径 + JSON参数”的形式持久化。每个任务由持有租约的工作进程执行，
+工作进程定期续租；租约过期（进程退出、崩溃）的任务会被其他进程或重启后的进程
+重新入队，实现至少一次（at-least-once）投递。
+
+带去重键的任务通过 add_unique 登记：同一去重键已有未结束的任务时不再新建，
+返回已有任务，多个进程同时提交时由存储保证只登记一个。
+"""
+
+import importlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 尚未结束的任务状态
+ACTIVE_STATUSES = ('queued', 'started')
+
+
+@dataclass
+class JobRecord:
+    """持久化的任务记录"""
+    id: str
+    func_path: str
+    args: List[Any]
+    status: str = 'queued'
+    owner: Optional[str] = None
+    lease_expires_at: Optional[float] = None
+    attempts: int = 0
+    max_attempts: int = 3
+    options: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    completed_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    dedupe_key: Optional[str] = None
+
+
+def func_path(func: Callable) -> Optional[str]:
+    """返回可在其他进程中重新导入的函数路径，闭包和lambda返回None"""
+    qualname = getattr(func, '__qualname__', '')
+    module = getattr(func, '__module__', None)
+    if not module or not qualname or '<' in qualname:
+        return None
+    return f'{module}:{qualname}'
+
+
+def resolve_func(path: str) -> Callable:
+    """根据函数路径导入函数"""
+    module_name, qualname = path.split(':', 1)
+    target = importlib.import_module(module_name)
+    for attr in qualname.split('.'):
+        target = getattr(target, attr)
+    return target
+
+
+def serialize_args(args: Tuple[Any, ...]) -> Optional[List[Any]]:
+    """参数可JSON序列化时返回列表，否则返回None（任务只在内存中执行）"""
+    try:
+        return json.loads(json.dumps(list(args), ensure_ascii=False))
+    except (TypeError, ValueError):
+        return None
+
+
+def new_worker_id() -> str:
+    """生成工作进程标识：主机名:进程号:随机串"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def owner_is_dead(owner: Optional[str], worker_id: str) -> bool:
+    """
+    判断租约持有者所在进程是否已确定退出
+
+    同一主机上可以直接检查进程；容器重启后进程号可能与上一次相同，
+    此时依靠随机串区分前后两次启动。其他主机上的进程只能依靠租约过期判断。
+    """
+    if not owner:
+        return True
+    try:
+        host, pid, token = owner.split(':')
+        my_host, my_pid, my_token = worker_id.split(':')
+        pid = int(pid)
+    except ValueError:
+        return False
+
+    if host != my_host:
+        return False
+    if pid == int(my_pid):
+        return token != my_token
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, OSError):
+        return False
+    return False
+
+
+class MemoryJobStore:
+    """进程内任务存储（测试用本地替身，不跨进程持久化）"""
+
+    durable = False
+
+    def __init__(self):
+        self._records: Dict[str, JobRecord] = {}
+        self._lock = threading.Lock()
+
+    def add(self, record: JobRecord) -> None:
+        with self._lock:
+            self._records[record.id] = record
+
+    def add_unique(self, record: JobRecord) -> JobRecord:
+        """登记带去重键的任务，同一去重键已有未结束的任务时返回该任务而不登记"""
+        with self._lock:
+            for existing in self._records.values():
+                if existing.dedupe_key == record.dedupe_key and existing.status in ACTIVE_STATUSES:
+                    return existing
+            self._records[record.id] = record
+            return record
+
+    def release_dedupe_key(self, job_id: str) -> None:
+        """解除任务的去重键（任务已被取消、正在退出），之后可以提交相同的任务"""
+        with self._lock:
+            record = self._records.get(job_id)
+            if record is not None:
+                record.dedupe_key = None
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            return self._records.get(job_id)
+
+    def mark_started(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """领取任务开始执行，任务已被其他进程接管时返回False"""
+        with self._lock:
+            record = self._records.get(job_id)
+            if record is None or record.owner != owner or record.status not in ACTIVE_STATUSES:
+                return False
+            record.status = 'started'
+            record.started_at = time.time()
+            record.attempts += 1
+            record.lease_expires_at = time.time() + lease_seconds
+            return True
+
+    def mark_finished(self, job_id: str, owner: str, status: str,
+                      result: Any = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            record = self._records.get(job_id)
+            if record is None or record.owner != owner:
+                return
+            record.status = status
+            record.result = result
+            record.error = error
+            record.completed_at = time.time()
+            record.lease_expires_at = None
+
+    def heartbeat(self, owner: str, job_ids: List[str], lease_seconds: float) -> None:
+        expires = time.time() + lease_seconds
+        with self._lock:
+            for job_id in job_ids:
+                record = self._records.get(job_id)
+                if record is not None and record.owner == owner and record.status in ACTIVE_STATUSES:
+                    record.lease_expires_at = expires
+
+    def claim_orphans(self, owner: str, lease_seconds: float,
+                      is_dead: Callable[[Optional[str]], bool]) -> List[JobRecord]:
+        """接管租约过期或持有进程已退出的未完成任务"""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            for record in self._records.values():
+                if record.status not in ACTIVE_STATUSES or record.owner == owner:
+                    continue
+                if (record.lease_expires_at or 0) < now or is_dead(record.owner):
+                    record.owner = owner
+                    record.status = 'queued'
+                    record.lease_expires_at = now + lease_seconds
+                    claimed.append(record)
+        return claimed
+
+    def cleanup(self, before: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, record in self._records.items()
+                       if record.completed_at and record.completed_at < before]
+            for job_id in expired:
+                del self._records[job_id]
+            return len(expired)
+
+    def count_by_status(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for record in self._records.values():
+                counts[record.status] = counts.get(record.status, 0) + 1
+        return counts
+
+
+class SQLiteJobStore:
+    """基于独立SQLite文件的持久化任务存储，支持同一主机上的多个工作进程共享"""
+
+    durable = True
+
+    _COLUMNS = ('id', 'func_path', 'args', 'status', 'owner', 'lease_expires_at', 'attempts',
+                'max_attempts', 'options', 'created_at', 'started_at', 'completed_at', 'result', 'error',
+                'dedupe_key')
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        # WAL模式下读写互不阻塞，且必须在事务外设置
+        self._conn().execute('PRAGMA journal_mode=WAL')
+        with self._transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS task_jobs (
+                    id TEXT PRIMARY KEY,
+                    func_path TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    owner TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 3,
+                    options TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    completed_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    dedupe_key TEXT
+                )
+            ''')
+            # 早期版本创建的任务表没有去重键列
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(task_jobs)')}
+            if 'dedupe_key' not in columns:
+                conn.execute('ALTER TABLE task_jobs ADD COLUMN dedupe_key TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_task_jobs_status_lease '
+                         'ON task_jobs (status, lease_expires_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_task_jobs_dedupe_key '
+                         'ON task_jobs (dedupe_key, status)')
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self) -> '_Transaction':
+        return _Transaction(self._conn())
+
+    def _to_record(self, row: sqlite3.Row) -> JobRecord:
+        return JobRecord(
+            id=row['id'],
+            func_path=row['func_path'],
+            args=json.loads(row['args']),
+            status=row['status'],
+            owner=row['owner'],
+            lease_expires_at=row['lease_expires_at'],
+            attempts=row['attempts'],
+            max_attempts=row['max_attempts'],
+            options=json.loads(row['options']) if row['options'] else {},
+            created_at=row['created_at'],
+            started_at=row['started_at'],
+            completed_at=row['completed_at'],
+            result=json.loads(row['result']) if row['result'] else None,
+            error=row['error'],
+            dedupe_key=row['dedupe_key']
+        )
+
+    def _insert(self, conn: sqlite3.Connection, record: JobRecord) -> None:
+        conn.execute(
+            f'INSERT OR REPLACE INTO task_jobs ({", ".join(self._COLUMNS)}) '
+            f'VALUES ({", ".join("?" * len(self._COLUMNS))})',
+            (record.id, record.func_path, json.dumps(record.args, ensure_ascii=False), record.status,
+             record.owner, record.lease_expires_at, record.attempts, record.max_attempts,
+             json.dumps(record.options, ensure_ascii=False), record.created_at, record.started_at,
+             record.completed_at, None, record.error, record.dedupe_key)
+        )
+
+    def add(self, record: JobRecord) -> None:
+        with self._transaction() as conn:
+            self._insert(conn, record)
+
+    def add_unique(self, record: JobRecord) -> JobRecord:
+        """登记带去重键的任务，同一去重键已有未结束的任务时返回该任务而不登记"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM task_jobs WHERE dedupe_key = ? AND status IN ('queued', 'started') "
+                "ORDER BY created_at LIMIT 1",
+                (record.dedupe_key,)
+            ).fetchone()
+            if row is not None:
+                return self._to_record(row)
+            self._insert(conn, record)
+            return record
+
+    def release_dedupe_key(self, job_id: str) -> None:
+        """解除任务的去重键（任务已被取消、正在退出），之后可以提交相同的任务"""
+        with self._transaction() as conn:
+            conn.execute('UPDATE task_jobs SET dedupe_key = NULL WHERE id = ?', (job_id,))
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        row = self._conn().execute('SELECT * FROM task_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_record(row) if row else None
+
+    def mark_started(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE task_jobs SET status = 'started', started_at = ?, attempts = attempts + 1, "
+                "lease_expires_at = ? WHERE id = ? AND owner = ? AND status IN ('queued', 'started')",
+                (now, now + lease_seconds, job_id, owner)
+            )
+            return cursor.rowcount == 1
+
+    def mark_finished(self, job_id: str, owner: str, status: str,
+                      result: Any = None, error: Optional[str] = None) -> None:
+        try:
+            result_json = json.dumps(result, ensure_ascii=False) if result is not None else None
+        except (TypeError, ValueError):
+            result_json = None
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE task_jobs SET status = ?, result = ?, error = ?, completed_at = ?, '
+                'lease_expires_at = NULL WHERE id = ? AND owner = ?',
+                (status, result_json, error, time.time(), job_id, owner)
+            )
+
+    def heartbeat(self, owner: str, job_ids: List[str], lease_seconds: float) -> None:
+        if not job_ids:
+            return
+        expires = time.time() + lease_seconds
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE task_jobs SET lease_expires_at = ? WHERE id = ? AND owner = ? "
+                "AND status IN ('queued', 'started')",
+                [(expires, job_id, owner) for job_id in job_ids]
+            )
+
+    def claim_orphans(self, owner: str, lease_seconds: float,
+                      is_dead: Callable[[Optional[str]], bool]) -> List[JobRecord]:
+        now = time.time()
+        claimed = []
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM task_jobs WHERE status IN ('queued', 'started') AND owner IS NOT ?",
+                (owner,)
+            ).fetchall()
+            for row in rows:
+                if (row['lease_expires_at'] or 0) >= now and not is_dead(row['owner']):
+                    continue
+                # 以原持有者为条件更新，多个进程同时恢复时只有一个能接管
+                cursor = conn.execute(
+                    "UPDATE task_jobs SET owner = ?, status = 'queued', lease_expires_at = ? "
+                    "WHERE id = ? AND owner IS ? AND status IN ('queued', 'started')",
+                    (owner, now + lease_seconds, row['id'], row['owner'])
+                )
+                if cursor.rowcount == 1:
+                    record = self._to_record(row)
+                    record.owner = owner
+                    record.status = 'queued'
+                    claimed.append(record)
+        return claimed
+
+    def cleanup(self, before: float) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'DELETE FROM task_jobs WHERE completed_at IS NOT NULL AND completed_at < ?', (before,)
+            )
+            return cursor.rowcount
+
+    def count_by_status(self) -> Dict[str, int]:
+        rows = self._conn().execute(
+            'SELECT status, COUNT(*) AS total FROM task_jobs GROUP BY status'
+        ).fetchall()
+        return {row['status']: row['total'] for row in rows}
+
+
+class _Transaction:
+    """以 BEGIN IMMEDIATE 包裹的写事务，避免多进程并发领取同一任务"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+
+def create_job_store(backend: str, path: Optional[str] = None):
+    """
+    根据配置创建任务存储
+
+    Args:
+        backend: memory 或 sqlite
+        path: SQLite文件路径
+
+    Returns:
+        任务存储实例
+    """
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError('使用sqlite任务存储时必须配置 TASK_QUEUE_DB_PATH')
+        return SQLiteJobStore(path)
+    if backend != 'memory':
+        logger.warning(f"未知的任务存储后端 {backend}，使用内存存储")
+    return MemoryJobStore()
@@ -0,0 +1,223 @@
+"""
+IP智慧解答专家系统 - 任务车道调度
+
+后台任务按负载类型划分车道，每条车道拥有独立的工作线程和优先级队列：
+- interactive：交互式Agent分析，用户在页面上等待结果
+- ingestion：文档解析入库，单个任务可能持续二十分钟
+- maintenance：清理、统计、索引重建等维护任务
+
+车道内按优先级（数值越大越先执行）和提交顺序调度。车道空闲时可按借用规则
+处理其他车道的任务；交互车道的线程不外借，因此大批量文档入库不会占满交互容量。
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE_LANE = 'interactive'
+INGESTION_LANE = 'ingestion'
+MAINTENANCE_LANE = 'maintenance'
+
+# 未指定车道的任务进入入库车道，与原先共享线程池的行为最接近
+DEFAULT_LANE = INGESTION_LANE
+
+# 各车道空闲时可以帮助处理的其他车道（按顺序尝试）
+DEFAULT_BORROWING = {
+    INTERACTIVE_LANE: (),
+    INGESTION_LANE: (INTERACTIVE_LANE,),
+    MAINTENANCE_LANE: (INTERACTIVE_LANE, INGESTION_LANE),
+}
+
+
+class _WorkItem:
+    """车道队列中的待执行任务"""
+
+    __slots__ = ('future', 'fn', 'lane', 'priority', 'enqueued_at')
+
+    def __init__(self, future: Future, fn: Callable, lane: str, priority: int):
+        self.future = future
+        self.fn = fn
+        self.lane = lane
+        self.priority = priority
+        self.enqueued_at = time.time()
+
+
+class LaneScheduler:
+    """按车道隔离并发的任务调度器"""
+
+    def __init__(self, lanes: Dict[str, int], borrowing: Optional[Dict[str, Sequence[str]]] = None):
+        """
+        Args:
+            lanes: 车道名称到工作线程数的映射
+            borrowing: 车道名称到可借用其空闲线程的车道列表，缺省使用 DEFAULT_BORROWING
+        """
+        if not lanes:
+            raise ValueError('至少需要配置一条任务车道')
+
+        self.lanes = dict(lanes)
+        borrowing = DEFAULT_BORROWING if borrowing is None else borrowing
+        self.borrowing = {
+            lane: tuple(other for other in borrowing.get(lane, ()) if other in self.lanes and other != lane)
+            for lane in self.lanes
+        }
+
+        self._cond = threading.Condition()
+        self._queues: Dict[str, List] = {lane: [] for lane in self.lanes}
+        self._sequence = itertools.count()
+        self._running: Dict[str, int] = {lane: 0 for lane in self.lanes}
+        self._borrowed: Dict[str, int] = {lane: 0 for lane in self.lanes}
+        self._shutdown = False
+        self._threads: Dict[threading.Thread, str] = {}
+        self._busy: Dict[threading.Thread, str] = {}
+        self._retired = set()
+        self._thread_index = itertools.count()
+
+        for lane, workers in self.lanes.items():
+            for _ in range(workers):
+                self._start_worker(lane)
+
+    def _start_worker(self, lane: str):
+        # 守护线程：进程退出时不等待长任务，持久化后端会在重启后接管未完成的任务
+        thread = threading.Thread(
+            target=self._worker_loop, args=(lane,),
+            name=f'TaskWorker-{lane}-{next(self._thread_index)}', daemon=True
+        )
+        self._threads[thread] = lane
+        thread.start()
+
+    def retire_worker(self, thread: threading.Thread) -> bool:
+        """
+        让卡在无响应任务上的工作线程退役，并为其车道补充一个新线程
+
+        线程无法被强制终止，退役线程在当前任务返回后直接退出，不再领取任务。
+
+        Returns:
+            bool: 是否补充了新线程
+        """
+        with self._cond:
+            lane = self._threads.get(thread)
+            if lane is None or thread in self._retired or self._shutdown:
+                return False
+            self._retired.add(thread)
+            self._start_worker(lane)
+        logger.warning(f"工作线程 {thread.name} 已退役，车道 {lane} 补充了新的工作线程")
+        return True
+
+    def submit(self, lane: str, fn: Callable, priority: int = 0) -> Future:
+        """
+        提交任务到指定车道
+
+        Args:
+            lane: 车道名称
+            fn: 无参可调用对象
+            priority: 优先级，数值越大越先执行
+
+        Returns:
+            Future: 任务结果
+        """
+        if lane not in self.lanes:
+            raise ValueError(f'未知的任务车道: {lane}')
+
+        future = Future()
+        item = _WorkItem(future, fn, lane, priority)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('任务调度器已关闭')
+            heapq.heappush(self._queues[lane], (-priority, next(self._sequence), item))
+            self._cond.notify_all()
+        return future
+
+    def _take(self, worker_lane: str) -> Optional[_WorkItem]:
+        """取出工作线程可执行的下一个任务（调用方持有锁）"""
+        for lane in (worker_lane,) + self.borrowing[worker_lane]:
+            queue = self._queues[lane]
+            if queue:
+                return heapq.heappop(queue)[2]
+        return None
+
+    def _worker_loop(self, worker_lane: str):
+        current = threading.current_thread()
+        while True:
+            with self._cond:
+                if current in self._retired:
+                    self._retired.discard(current)
+                    self._threads.pop(current, None)
+                    return
+                item = self._take(worker_lane)
+                while item is None and not self._shutdown:
+                    self._cond.wait()
+                    item = self._take(worker_lane)
+                if item is None:
+                    return
+                self._running[item.lane] += 1
+                self._busy[current] = item.lane
+                if item.lane != worker_lane:
+                    self._borrowed[worker_lane] += 1
+
+            try:
+                if item.future.set_running_or_notify_cancel():
+                    try:
+                        item.future.set_result(item.fn())
+                    except BaseException as e:
+                        item.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[item.lane] -= 1
+                    self._busy.pop(current, None)
+                    if item.lane != worker_lane:
+                        self._borrowed[worker_lane] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各车道的线程数、排队数和执行中任务数"""
+        with self._cond:
+            return {
+                lane: {
+                    'workers': workers,
+                    'queued': len(self._queues[lane]),
+                    'running': self._running[lane],
+                    'lent': self._borrowed[lane],
+                }
+                for lane, workers in self.lanes.items()
+            }
+
+    def workers(self) -> List[Dict[str, Optional[str]]]:
+        """各工作线程的所属车道和状态（busy/idle/retired），busy 时附带正在处理的任务车道"""
+        with self._cond:
+            result = []
+            for thread, lane in self._threads.items():
+                busy_lane = self._busy.get(thread)
+                if thread in self._retired:
+                    state = 'retired'
+                else:
+                    state = 'busy' if busy_lane is not None else 'idle'
+                result.append({'name': thread.name, 'lane': lane, 'state': state, 'task_lane': busy_lane})
+            return result
+
+    def queued_count(self, lane: Optional[str] = None) -> int:
+        """排队中的任务数"""
+        with self._cond:
+            if lane is not None:
+                return len(self._queues.get(lane, []))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def shutdown(self, wait: bool = False):
+        """停止接收新任务，取消排队中的任务"""
+        with self._cond:
+            self._shutdown = True
+            for queue in self._queues.values():
+                for _, _, item in queue:
+                    item.future.cancel()
+                queue.clear()
+            self._cond.notify_all()
+
+        if wait:
+            with self._cond:
+                threads = list(self._threads)
+            for thread in threads:
+                thread.join()
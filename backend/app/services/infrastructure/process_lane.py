@@ -0,0 +1,282 @@
+"""
+IP智慧解答专家系统 - CPU密集型任务进程车道
+
+日志解析、语义切分、jieba分词都是纯Python的CPU计算，放在请求线程或任务线程池中执行时
+会长时间持有GIL，拖慢同一进程内的所有请求。进程车道把这类计算交给常驻的工作进程：
+
+- 工作进程启动时预热（加载jieba词典、日志解析规则和切分器），之后的任务不再重复加载
+- 参数中超过阈值的字符串（如整份日志）原样写入临时文件，不经 pickle，工作进程按路径读回；
+  其余参数很小，由进程池正常传递
+- 输入很小时直接在调用线程中执行，省去进程间往返
+- 工作进程异常退出时重建进程池（并发失败只重建一次）并重新提交一次，仍失败则抛出异常
+- 统计提交、完成、失败、内联执行、落盘传参次数和平均耗时
+
+未配置工作进程（PROCESS_LANE_WORKERS=0，测试环境默认）时所有调用都在调用线程中执行。
+"""
+
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CPU_LANE = 'cpu'
+
+
+def _init_worker():
+    """工作进程初始化：预先加载CPU任务依赖的词典、规则和正则表达式"""
+    try:
+        import jieba
+        jieba.setLogLevel(logging.WARNING)
+        jieba.initialize()
+    except Exception as e:  # pragma: no cover - jieba为可选依赖
+        logger.warning(f"进程车道预热jieba失败: {str(e)}")
+
+    # 导入即完成规则加载和正则编译
+    import app.services.ai.log_parsing_service  # noqa: F401
+    import app.services.document.semantic_splitter  # noqa: F401
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class _SpilledText:
+    """落盘参数的占位：工作进程按路径读回原始字符串或字节串"""
+
+    __slots__ = ('path', 'is_bytes')
+
+    def __init__(self, path: str, is_bytes: bool):
+        self.path = path
+        self.is_bytes = is_bytes
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        return data if self.is_bytes else data.decode('utf-8', errors='surrogatepass')
+
+
+def _payload_size(value: Any, depth: int = 0) -> int:
+    """估算参数大小：累计其中字符串和字节串的长度，不做序列化"""
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if depth >= 4:
+        return 0
+    if isinstance(value, dict):
+        return sum(_payload_size(k, depth + 1) + _payload_size(v, depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_payload_size(item, depth + 1) for item in value)
+    return 0
+
+
+def _restore(value: Any) -> Any:
+    if isinstance(value, _SpilledText):
+        return value.load()
+    if isinstance(value, dict):
+        return {k: _restore(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_restore(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_restore(item) for item in value)
+    return value
+
+
+def _run_task(func: Callable, args: tuple, kwargs: dict) -> Any:
+    return func(*_restore(args), **_restore(kwargs))
+
+
+class ProcessLane:
+    """CPU密集型任务的进程池车道"""
+
+    def __init__(self, workers: int = 2, inline_bytes: int = 64 * 1024,
+                 spill_bytes: int = 1024 * 1024, spill_dir: Optional[str] = None):
+        """
+        Args:
+            workers: 工作进程数，0表示不启用进程池，所有调用在调用线程中执行
+            inline_bytes: 参数中字符串总长度小于该值时在调用线程中直接执行
+            spill_bytes: 超过该长度的字符串参数经由临时文件传递
+            spill_dir: 临时文件目录，缺省使用系统临时目录
+        """
+        self.workers = workers
+        self.inline_bytes = inline_bytes
+        self.spill_bytes = spill_bytes
+        self.spill_dir = spill_dir or tempfile.gettempdir()
+
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._metrics = {
+            'submitted': 0,
+            'running': 0,
+            'completed': 0,
+            'failed': 0,
+            'inline': 0,
+            'spilled': 0,
+            'restarts': 0,
+            'total_seconds': 0.0,
+        }
+
+        if workers > 0:
+            self._executor = self._create_executor()
+            self.warm_up()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn：Web进程内有大量线程和数据库连接，fork出的子进程可能继承被持有的锁
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._executor is not None
+
+    def warm_up(self):
+        """提前启动全部工作进程，首个请求不承担进程启动和预热开销"""
+        if self._executor is None:
+            return
+        for _ in range(self.workers):
+            self._executor.submit(_ping)
+
+    def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        执行CPU密集型函数并等待结果
+
+        工作进程异常退出（如内存不足被杀）时重建进程池并重新提交一次，再次失败则抛出 BrokenProcessPool。
+
+        Args:
+            func: 模块级函数（工作进程按模块路径导入）
+            *args, **kwargs: 函数参数，需可pickle
+            timeout: 等待结果的超时秒数
+
+        Returns:
+            Any: 函数返回值
+        """
+        if self._executor is None or _payload_size((args, kwargs)) < self.inline_bytes:
+            return self._run_inline(func, args, kwargs)
+
+        spill_paths = []
+        started = time.time()
+        self._record(submitted=1, running=1)
+        try:
+            args, kwargs = self._spill((args, kwargs), spill_paths)
+            for attempt in range(2):
+                executor = self._executor
+                if executor is None:
+                    raise BrokenProcessPool("进程车道已关闭")
+                try:
+                    result = executor.submit(_run_task, func, args, kwargs).result(timeout=timeout)
+                    break
+                except BrokenProcessPool:
+                    logger.error(f"进程车道工作进程异常退出，重建进程池: {getattr(func, '__name__', func)}")
+                    self._restart(executor)
+                    if attempt:
+                        raise
+            self._record(completed=1, total_seconds=time.time() - started)
+            return result
+        except Exception:
+            self._record(failed=1)
+            raise
+        finally:
+            self._record(running=-1)
+            for path in spill_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _spill(self, value: Any, paths: list) -> Any:
+        """把超过 spill_bytes 的字符串和字节串原样写入临时文件，替换为占位"""
+        if isinstance(value, (str, bytes, bytearray)):
+            if len(value) <= self.spill_bytes:
+                return value
+            fd, path = tempfile.mkstemp(prefix='cpu_lane_', suffix='.arg', dir=self.spill_dir)
+            paths.append(path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value.encode('utf-8', errors='surrogatepass') if isinstance(value, str) else value)
+            self._record(spilled=1)
+            return _SpilledText(path, not isinstance(value, str))
+        if isinstance(value, dict):
+            return {k: self._spill(v, paths) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._spill(item, paths) for item in value]
+        if isinstance(value, tuple):
+            return tuple(self._spill(item, paths) for item in value)
+        return value
+
+    def _run_inline(self, func: Callable, args: tuple, kwargs: dict) -> Any:
+        self._record(inline=1)
+        return func(*args, **kwargs)
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """重建进程池；并发失败的调用只有第一个重建，其余沿用新进程池"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._create_executor()
+            self._metrics['restarts'] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.warm_up()
+
+    def _record(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._metrics[key] += value
+
+    def stats(self) -> Dict[str, Any]:
+        """进程车道的工作进程数和执行统计"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        finished = metrics['completed'] + metrics['failed']
+        metrics['avg_seconds'] = round(metrics.pop('total_seconds') / finished, 4) if finished else 0.0
+        metrics['workers'] = self.workers if self.enabled else 0
+        return metrics
+
+    def shutdown(self, wait: bool = False):
+        """关闭工作进程"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# 全局进程车道实例
+_process_lane = None
+_process_lane_lock = threading.Lock()
+
+
+def get_process_lane() -> ProcessLane:
+    """
+    获取进程车道实例
+
+    工作进程数由 PROCESS_LANE_WORKERS 配置（缺省0，即在调用线程中执行），
+    内联与落盘阈值由 PROCESS_LANE_INLINE_BYTES、PROCESS_LANE_SPILL_BYTES 配置。
+    """
+    global _process_lane
+
+    with _process_lane_lock:
+        if _process_lane is None:
+            from flask import current_app, has_app_context
+            config = current_app.config if has_app_context() else {}
+            _process_lane = ProcessLane(
+                workers=config.get('PROCESS_LANE_WORKERS', 0),
+                inline_bytes=config.get('PROCESS_LANE_INLINE_BYTES', 64 * 1024),
+                spill_bytes=config.get('PROCESS_LANE_SPILL_BYTES', 1024 * 1024)
+            )
+        return _process_lane
+
+
+def get_process_lane_stats() -> Dict[str, Any]:
+    """进程车道统计；车道尚未创建时返回空统计，不为统计启动工作进程"""
+    with _process_lane_lock:
+        lane = _process_lane
+    return (lane or ProcessLane(workers=0)).stats()
+
+
+def run_cpu_bound(func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """在进程车道中执行CPU密集型函数并返回结果（便捷函数）"""
+    return get_process_lane().run(func, *args, timeout=timeout, **kwargs)
@@ -0,0 +1,320 @@
+"""
+IP智慧解答专家系统 - 任务进度事件总线
+
+后台任务在每个工作流步骤、文档解析阶段和任务状态变化时发布进度事件，
+SSE接口订阅案例或文档的主题并推送给前端，取代对状态接口的轮询。
+
+主题命名：
+- case:<case_id>：Agent工作流步骤（progress）和节点状态变化（node）
+- document:<document_id>：文档解析进度（progress）和最终状态（status）
+- task:<job_id>：任务队列中任务的生命周期（status）和任务上报的进度（progress）
+- node:<node_id>：节点流式生成的文本片段（token）和节点状态变化（node）
+
+总线保存每个主题每类事件的最新一条，订阅方连接时可先取得当前进度。
+后端由 PROGRESS_BUS_BACKEND 配置：redis 通过 pub/sub 在多个Web进程间广播，
+memory 仅在进程内分发（任务队列与Web请求同进程运行时已足够）；
+Redis不可用时自动回退到 memory。发布进度不会影响任务本身，失败时只记录日志。
+"""
+
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EVENT = 'progress'
+STATUS_EVENT = 'status'
+NODE_EVENT = 'node'
+TOKEN_EVENT = 'token'
+
+
+def case_topic(case_id: str) -> str:
+    return f'case:{case_id}'
+
+
+def document_topic(document_id: str) -> str:
+    return f'document:{document_id}'
+
+
+def task_topic(job_id: str) -> str:
+    return f'task:{job_id}'
+
+
+def node_topic(node_id: str) -> str:
+    return f'node:{node_id}'
+
+
+class _MemorySubscription:
+    """进程内订阅"""
+
+    def __init__(self, bus: 'MemoryProgressBus', topics: List[str], max_pending: int):
+        self._bus = bus
+        self.topics = topics
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+
+    def _deliver(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # 消费方过慢时丢弃最旧的事件，进度事件只关心最新状态
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(event)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """等待下一条事件，超时返回None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._bus._unsubscribe(self)
+
+
+class MemoryProgressBus:
+    """进程内进度事件总线"""
+
+    def __init__(self, max_pending: int = 256, max_topics: int = 10000):
+        """
+        Args:
+            max_pending: 每个订阅最多缓存的未读事件数
+            max_topics: 最多保留最新事件的主题数，超过后淘汰最久未更新的主题
+        """
+        self.max_pending = max_pending
+        self.max_topics = max_topics
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, set] = {}
+        self._latest: 'OrderedDict[str, Dict[str, Dict[str, Any]]]' = OrderedDict()
+        self._sequence = itertools.count(1)
+
+    def publish(self, topic: str, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """发布事件，返回带有ID和时间戳的事件"""
+        with self._lock:
+            message = _build_event(f'{int(time.time() * 1000)}-{next(self._sequence)}', topic, event, data)
+            self._latest.setdefault(topic, {})[event] = message
+            self._latest.move_to_end(topic)
+            while len(self._latest) > self.max_topics:
+                self._latest.popitem(last=False)
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription._deliver(message)
+        return message
+
+    def subscribe(self, topics: Iterable[str]) -> _MemorySubscription:
+        """订阅一个或多个主题"""
+        subscription = _MemorySubscription(self, list(topics), self.max_pending)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: _MemorySubscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def latest(self, topic: str, event: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """主题上最新的一条事件；指定 event 时只看该类事件"""
+        with self._lock:
+            events = self._latest.get(topic)
+            if not events:
+                return None
+            if event is not None:
+                return events.get(event)
+            return max(events.values(), key=lambda message: message['timestamp'])
+
+
+class _RedisSubscription:
+    """Redis pub/sub 订阅"""
+
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """等待下一条事件，超时返回None"""
+        deadline = time.time() + (timeout or 0)
+        while True:
+            remaining = max(deadline - time.time(), 0)
+            message = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None and message.get('type') == 'message':
+                try:
+                    return json.loads(message['data'])
+                except (TypeError, ValueError):
+                    logger.warning(f"忽略无法解析的进度事件: {message.get('channel')}")
+            if time.time() >= deadline:
+                return None
+
+    def close(self):
+        try:
+            self._pubsub.close()
+        except Exception:
+            pass
+
+
+class RedisProgressBus:
+    """基于Redis pub/sub的进度事件总线，多个Web进程共享"""
+
+    def __init__(self, client, prefix: str = 'progress', latest_ttl: int = 3600):
+        """
+        Args:
+            client: redis 客户端（decode_responses=True）
+            prefix: 频道和键名前缀
+            latest_ttl: 最新事件的保留秒数
+        """
+        self.client = client
+        self.prefix = prefix
+        self.latest_ttl = latest_ttl
+
+    def _channel(self, topic: str) -> str:
+        return f'{self.prefix}:{topic}'
+
+    def _latest_key(self, topic: str) -> str:
+        return f'{self.prefix}:latest:{topic}'
+
+    def publish(self, topic: str, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """发布事件，返回带有ID和时间戳的事件"""
+        sequence = self.client.incr(f'{self.prefix}:sequence')
+        message = _build_event(f'{int(time.time() * 1000)}-{sequence}', topic, event, data)
+        payload = json.dumps(message, ensure_ascii=False, default=str)
+
+        pipe = self.client.pipeline()
+        pipe.hset(self._latest_key(topic), event, payload)
+        pipe.expire(self._latest_key(topic), self.latest_ttl)
+        pipe.publish(self._channel(topic), payload)
+        pipe.execute()
+        return message
+
+    def subscribe(self, topics: Iterable[str]) -> _RedisSubscription:
+        """订阅一个或多个主题"""
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*[self._channel(topic) for topic in topics])
+        return _RedisSubscription(pubsub)
+
+    def latest(self, topic: str, event: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """主题上最新的一条事件；指定 event 时只看该类事件"""
+        if event is not None:
+            payload = self.client.hget(self._latest_key(topic), event)
+            return json.loads(payload) if payload else None
+
+        events = [json.loads(payload) for payload in self.client.hvals(self._latest_key(topic))]
+        return max(events, key=lambda message: message['timestamp']) if events else None
+
+
+def _build_event(event_id: str, topic: str, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': event_id,
+        'topic': topic,
+        'event': event,
+        'data': data,
+        'timestamp': time.time(),
+    }
+
+
+# 全局进度总线实例
+_progress_bus = None
+_progress_bus_lock = threading.Lock()
+
+
+def get_progress_bus():
+    """
+    获取进度事件总线实例
+
+    后端由 PROGRESS_BUS_BACKEND 配置：memory（缺省）或 redis，redis 使用 REDIS_URL 连接，
+    连接失败时回退到 memory。
+    """
+    global _progress_bus
+
+    with _progress_bus_lock:
+        if _progress_bus is None:
+            from flask import current_app, has_app_context
+            config = current_app.config if has_app_context() else {}
+            backend = (config.get('PROGRESS_BUS_BACKEND') or 'memory').lower()
+
+            if backend == 'redis':
+                try:
+                    import redis
+                    client = redis.from_url(config.get('REDIS_URL') or 'redis://localhost:6379/0',
+                                            decode_responses=True)
+                    client.ping()
+                    _progress_bus = RedisProgressBus(client, latest_ttl=config.get('PROGRESS_BUS_LATEST_TTL', 3600))
+                    logger.info("进度事件总线使用Redis")
+                except Exception as e:
+                    logger.warning(f"Redis不可用，进度事件总线回退到进程内实现: {str(e)}")
+
+            if _progress_bus is None:
+                _progress_bus = MemoryProgressBus()
+        return _progress_bus
+
+
+def reset_progress_bus():
+    """清除全局进度总线实例（测试使用）"""
+    global _progress_bus
+    with _progress_bus_lock:
+        _progress_bus = None
+
+
+def publish_progress(topic: str, event: str, **data) -> Optional[Dict[str, Any]]:
+    """
+    发布进度事件（便捷函数）
+
+    发布失败只记录日志，不影响调用方。
+
+    Returns:
+        Optional[Dict]: 发布的事件，失败时返回None
+    """
+    try:
+        return get_progress_bus().publish(topic, event, data)
+    except Exception as e:
+        logger.warning(f"发布进度事件失败: {topic} {event}, 错误: {str(e)}")
+        return None
+
+
+def report_progress(step: str, progress: Optional[int] = None, case_id: Optional[str] = None,
+                    node_id: Optional[str] = None, document_id: Optional[str] = None, **data):
+    """
+    上报任务进度
+
+    同时发布到案例或文档主题，以及当前后台任务的任务主题（不在后台任务中时跳过）。
+
+    Args:
+        step: 当前步骤
+        progress: 进度百分比
+        case_id: 案例ID
+        node_id: 案例中正在处理的节点ID
+        document_id: 文档ID
+        **data: 附加信息
+    """
+    from app.services.infrastructure.cancellation import current_token
+
+    payload = {'step': step, 'progress': progress}
+    if node_id is not None:
+        payload['nodeId'] = node_id
+    payload.update(data)
+
+    if case_id is not None:
+        publish_progress(case_topic(case_id), PROGRESS_EVENT, **payload)
+    if document_id is not None:
+        publish_progress(document_topic(document_id), PROGRESS_EVENT, **payload)
+
+    token = current_token()
+    if token is not None and token.job_id:
+        publish_progress(task_topic(token.job_id), PROGRESS_EVENT, **payload)
+
+
+def publish_node_update(node) -> Optional[Dict[str, Any]]:
+    """节点状态或内容变化后推送到案例主题和节点主题，事件中带有完整的节点数据"""
+    data = {'nodeId': node.id, 'status': node.status, 'node': node.to_dict()}
+    publish_progress(node_topic(node.id), NODE_EVENT, **data)
+    return publish_progress(case_topic(node.case_id), NODE_EVENT, **data)
@@ -0,0 +1,240 @@
+"""
+IP智慧解答专家系统 - 任务队列指标
+
+按任务函数和车道统计排队深度、执行中数量、等待时长和执行时长直方图，以及完成、失败、
+取消和超时次数，用于根据实际负载调整各车道的工作线程数。
+
+指标只保存在进程内，随进程重启清零；QueueMetrics.snapshot 供统计接口返回JSON，
+render_prometheus 输出 Prometheus 文本格式供采集。
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 直方图桶上界（秒）：覆盖交互任务的亚秒级等待到文档入库的半小时执行
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# 任务结束状态
+OUTCOMES = ('finished', 'failed', 'cancelled', 'timed_out', 'skipped')
+
+
+class Histogram:
+    """固定桶直方图"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        value = max(value, 0.0)
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶上界估计分位数，落在最后一个桶之外时返回最大桶上界"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(桶上界, 累计次数) 列表，最后一项上界为 +Inf"""
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'avg': round(self.sum / self.count, 4) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {_format_bound(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class _Series:
+    """单个任务函数在单条车道上的指标"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.queued = 0
+        self.running = 0
+        self.enqueued = 0
+        self.deduplicated = 0
+        self.outcomes = {outcome: 0 for outcome in OUTCOMES}
+        self.wait = Histogram(buckets)
+        self.run = Histogram(buckets)
+
+
+class QueueMetrics:
+    """任务队列指标，按 (任务函数, 车道) 聚合"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], _Series] = {}
+
+    def _get(self, func_name: str, lane: str) -> _Series:
+        series = self._series.get((func_name, lane))
+        if series is None:
+            series = self._series[(func_name, lane)] = _Series(self.buckets)
+        return series
+
+    def enqueued(self, func_name: str, lane: str):
+        """任务进入车道队列"""
+        with self._lock:
+            series = self._get(func_name, lane)
+            series.enqueued += 1
+            series.queued += 1
+
+    def deduplicated(self, func_name: str, lane: str):
+        """重复提交被去重，返回了已有任务"""
+        with self._lock:
+            self._get(func_name, lane).deduplicated += 1
+
+    def started(self, func_name: str, lane: str, wait_seconds: float):
+        """任务开始执行，记录排队等待时长"""
+        with self._lock:
+            series = self._get(func_name, lane)
+            series.queued = max(series.queued - 1, 0)
+            series.running += 1
+            series.wait.observe(wait_seconds)
+
+    def completed(self, func_name: str, lane: str, outcome: str, run_seconds: Optional[float] = None):
+        """
+        任务结束
+
+        Args:
+            outcome: 结束状态，见 OUTCOMES
+            run_seconds: 执行时长；None 表示任务未开始执行（排队中被取消或被其他进程接管）
+        """
+        with self._lock:
+            series = self._get(func_name, lane)
+            if run_seconds is None:
+                series.queued = max(series.queued - 1, 0)
+            else:
+                series.running = max(series.running - 1, 0)
+                series.run.observe(run_seconds)
+            series.outcomes[outcome] += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """各任务函数、车道的指标"""
+        with self._lock:
+            items = sorted(self._series.items())
+            result = []
+            for (func_name, lane), series in items:
+                done = sum(series.outcomes[outcome] for outcome in ('finished', 'failed', 'cancelled', 'timed_out'))
+                result.append({
+                    'function': func_name,
+                    'lane': lane,
+                    'queued': series.queued,
+                    'running': series.running,
+                    'enqueued': series.enqueued,
+                    'deduplicated': series.deduplicated,
+                    **series.outcomes,
+                    'failure_rate': round(series.outcomes['failed'] / done, 4) if done else 0.0,
+                    'timeout_rate': round(series.outcomes['timed_out'] / done, 4) if done else 0.0,
+                    'wait_seconds': series.wait.to_dict(),
+                    'run_seconds': series.run.to_dict(),
+                })
+            return result
+
+    def totals(self) -> Dict[str, int]:
+        """所有任务函数的累计次数"""
+        with self._lock:
+            totals = {'queued': 0, 'running': 0, 'enqueued': 0, **{outcome: 0 for outcome in OUTCOMES}}
+            for series in self._series.values():
+                totals['queued'] += series.queued
+                totals['running'] += series.running
+                totals['enqueued'] += series.enqueued
+                for outcome, count in series.outcomes.items():
+                    totals[outcome] += count
+            return totals
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else f'{bound:g}'
+
+
+def _labels(**labels) -> str:
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus(functions: Iterable[Dict[str, Any]], lanes: Dict[str, Dict[str, int]],
+                      process_lane: Optional[Dict[str, Any]] = None) -> str:
+    """
+    以 Prometheus 文本格式输出任务队列指标
+
+    Args:
+        functions: QueueMetrics.snapshot() 的结果
+        lanes: 车道统计（LaneScheduler.stats()）
+        process_lane: 进程车道统计（ProcessLane.stats()）
+
+    Returns:
+        str: text/plain; version=0.0.4 格式的指标文本
+    """
+    functions = list(functions)
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples: Iterable[Tuple[str, Any]]):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix_labels, value in samples:
+            lines.append(f'{name}{suffix_labels} {value}')
+
+    metric('task_queue_lane_workers', 'gauge', '车道工作线程数',
+           [(_labels(lane=lane), stats['workers']) for lane, stats in lanes.items()])
+    metric('task_queue_lane_queued', 'gauge', '车道排队中的任务数',
+           [(_labels(lane=lane), stats['queued']) for lane, stats in lanes.items()])
+    metric('task_queue_lane_running', 'gauge', '车道执行中的任务数',
+           [(_labels(lane=lane), stats['running']) for lane, stats in lanes.items()])
+
+    metric('task_queue_jobs_queued', 'gauge', '按任务函数统计的排队中任务数',
+           [(_labels(function=f['function'], lane=f['lane']), f['queued']) for f in functions])
+    metric('task_queue_jobs_running', 'gauge', '按任务函数统计的执行中任务数',
+           [(_labels(function=f['function'], lane=f['lane']), f['running']) for f in functions])
+    metric('task_queue_jobs_enqueued_total', 'counter', '提交的任务总数',
+           [(_labels(function=f['function'], lane=f['lane']), f['enqueued']) for f in functions])
+    metric('task_queue_jobs_deduplicated_total', 'counter', '因去重未重复提交的任务总数',
+           [(_labels(function=f['function'], lane=f['lane']), f['deduplicated']) for f in functions])
+    metric('task_queue_jobs_completed_total', 'counter', '按结束状态统计的任务总数',
+           [(_labels(function=f['function'], lane=f['lane'], outcome=outcome), f[outcome])
+            for f in functions for outcome in OUTCOMES])
+
+    for key, name, help_text in (
+        ('wait_seconds', 'task_queue_wait_seconds', '任务从提交到开始执行的等待时长'),
+        ('run_seconds', 'task_queue_run_seconds', '任务执行时长'),
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for f in functions:
+            histogram = f[key]
+            labels = dict(function=f['function'], lane=f['lane'])
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {count}')
+            lines.append(f'{name}_sum{_labels(**labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{_labels(**labels)} {histogram["count"]}')
+
+    if process_lane:
+        metric('process_lane_workers', 'gauge', '进程车道工作进程数', [('', process_lane.get('workers', 0))])
+        metric('process_lane_running', 'gauge', '进程车道执行中的调用数', [('', process_lane.get('running', 0))])
+        metric('process_lane_calls_total', 'counter', '进程车道调用总数',
+               [(_labels(mode=mode), process_lane.get(mode, 0))
+                for mode in ('submitted', 'completed', 'failed', 'inline', 'spilled')])
+
+    return '\n'.join(lines) + '\n'
@@ -6,17 +6,66 @@ IP智慧解答专家系统 - 任务监控器
 
 import logging
 import traceback
-import time
 from functools import wraps
 from typing import Any, Callable, Dict, Optional
 from flask import current_app
 
+from app.services.infrastructure.cancellation import cancellable_sleep
+
 logger = logging.getLogger(__name__)
 
 
 class TaskMonitor:
     """任务监控器"""
 
+    @staticmethod
+    def get_task_status(job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务状态
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务状态信息，任务不存在时返回None
+        """
+        from app.services.infrastructure.task_queue import get_task_status
+        status = get_task_status(job_id)
+        return None if status.get('status') == 'not_found' else status
+
+    @staticmethod
+    def cancel_task(job_id: str) -> bool:
+        """
+        取消排队中或执行中的任务
+
+        执行中的任务在下一个取消检查点退出，关联的业务状态由任务的取消处理函数清理。
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            bool: 是否已发出取消请求
+        """
+        from app.services.infrastructure.task_queue import cancel_task
+        return cancel_task(job_id)
+
+    @staticmethod
+    def get_queue_stats() -> Dict[str, Any]:
+        """
+        获取任务队列统计
+
+        包括排队深度、执行中任务数、工作线程状态、各车道统计，按任务函数和车道的等待时长、
+        执行时长直方图和失败率、超时率，以及CPU进程车道的执行统计。
+
+        Returns:
+            Dict[str, Any]: 队列统计信息
+        """
+        from app.services.infrastructure.task_queue import get_task_queue
+        from app.services.infrastructure.process_lane import get_process_lane_stats
+        stats = get_task_queue().stats()
+        stats['process_lane'] = get_process_lane_stats()
+        return stats
+
     @staticmethod
     def monitor_task_progress(func: Callable) -> Callable:
         """
@@ -79,7 +128,8 @@ class TaskMonitor:
                                 f"任务执行失败，将在 {retry_interval} 秒后重试 "
                                 f"(第 {attempt + 1}/{max_retries} 次重试): {str(e)}"
                             )
-                            time.sleep(retry_interval)
+                            # 重试等待期间收到取消时立即退出
+                            cancellable_sleep(retry_interval)
                         else:
                             logger.error(f"任务最终失败，已达到最大重试次数: {str(e)}")
                             raise last_exception
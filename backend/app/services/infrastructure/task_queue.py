@@ -2,37 +2,73 @@
 IP智慧解答专家系统 - 任务队列服务
 
 本模块提供基于线程池的异步任务处理功能，无需外部依赖。
-使用ThreadPoolExecutor实现真正的异步执行，避免阻塞Web请求。
+工作线程按车道划分（见 lanes），交互式分析与文档入库互不抢占，避免阻塞Web请求。
+任务记录保存在可插拔的任务存储中（见 job_store），持久化后端下重启不丢任务。
+任务超时和取消通过取消令牌协作完成（见 cancellation），看门狗线程负责检查超时
+并替换无响应任务占用的工作线程。任务状态变化发布到进度事件总线的 task:<job_id> 主题
+（见 progress_bus）。按任务函数和车道统计排队深度、等待和执行时长（见 queue_metrics）。
+提交时可指定去重键，重复提交（双击、前端重试）返回已有任务而不重复执行。
 """
 
 import logging
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, Future
-from typing import Optional, Any, Callable, Dict
+import uuid
+from concurrent.futures import Future
+from typing import Optional, Any, Callable, Dict, Hashable
 from datetime import datetime
 from flask import current_app
 
+from app.services.infrastructure.job_store import (
+    JobRecord, MemoryJobStore, create_job_store, func_path, new_worker_id,
+    owner_is_dead, resolve_func, serialize_args
+)
+from app.services.infrastructure.lanes import (
+    LaneScheduler, DEFAULT_LANE, INTERACTIVE_LANE, INGESTION_LANE, MAINTENANCE_LANE
+)
+from app.services.infrastructure.cancellation import (
+    CancellationToken, TaskCancelled, bind_token, parse_timeout
+)
+from app.services.infrastructure.progress_bus import (
+    PROGRESS_EVENT, STATUS_EVENT, get_progress_bus, publish_progress, task_topic
+)
+from app.services.infrastructure.queue_metrics import QueueMetrics
+
 logger = logging.getLogger(__name__)
 
 
 class TaskJob:
     """任务对象，跟踪任务状态和结果"""
     
-    def __init__(self, job_id: str, future: Future, func_name: str):
+    def __init__(self, job_id: str, future: Future, func_name: str, lane: str = DEFAULT_LANE,
+                 token: Optional[CancellationToken] = None, func: Optional[Callable] = None,
+                 args: tuple = (), persistent: bool = False):
         self.id = job_id
         self.future = future
         self.func_name = func_name
+        self.lane = lane
+        self.token = token or CancellationToken()
+        # 取消时调用取消处理函数需要原始函数和参数
+        self.func = func
+        self.args = args
+        self.persistent = persistent
         self.created_at = datetime.now()
         self.started_at = None
         self.completed_at = None
+        # 取消后未响应、已被看门狗放弃的任务
+        self.abandoned = False
         
     def get_status(self) -> str:
         """获取任务状态"""
         if self.future.cancelled():
             return 'cancelled'
+        elif self.abandoned:
+            return self.token.reason.status
         elif self.future.done():
-            if self.future.exception():
+            error = self.future.exception()
+            if isinstance(error, TaskCancelled):
+                return error.status
+            elif error:
                 return 'failed'
             else:
                 return 'finished'
@@ -43,71 +79,520 @@ class TaskJob:
     
     def get_result(self) -> Any:
         """获取任务结果"""
-        if self.future.done() and not self.future.exception():
+        if self.future.done() and not self.future.cancelled() and not self.future.exception():
             return self.future.result()
         return None
     
     def get_error(self) -> str:
         """获取错误信息"""
+        if self.future.cancelled() or self.abandoned:
+            return str(self.token.reason or TaskCancelled())
         if self.future.done() and self.future.exception():
             return str(self.future.exception())
         return None
 
 
+class StoredTaskJob:
+    """从任务存储读取的任务（如重启前提交、或由其他工作进程执行的任务）"""
+
+    def __init__(self, record: JobRecord):
+        self.id = record.id
+        self.record = record
+        self.func_name = record.func_path.rsplit(':', 1)[-1].rsplit('.', 1)[-1]
+        self.lane = record.options.get('lane', DEFAULT_LANE)
+        self.created_at = _to_datetime(record.created_at)
+        self.started_at = _to_datetime(record.started_at)
+        self.completed_at = _to_datetime(record.completed_at)
+
+    def get_status(self) -> str:
+        """获取任务状态"""
+        return self.record.status
+
+    def get_result(self) -> Any:
+        """获取任务结果"""
+        return self.record.result if self.record.status == 'finished' else None
+
+    def get_error(self) -> str:
+        """获取错误信息"""
+        return self.record.error if self.record.status in ('failed', 'cancelled', 'timed_out') else None
+
+
+def _to_datetime(timestamp: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(timestamp) if timestamp else None
+
+
+def _dedupe_key(func: Callable, key: Hashable) -> str:
+    """以任务函数为命名空间规范化去重键，元组按元素拼接"""
+    parts = key if isinstance(key, (tuple, list)) else (key,)
+    return ':'.join([func_path(func) or func.__name__] + [str(part) for part in parts])
+
+
+def _new_job_id() -> str:
+    # 毫秒时间戳在并发提交时可能重复，追加随机后缀
+    return f'task_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}'
+
+
 class ThreadPoolQueue:
     """基于线程池的任务队列"""
     
-    def __init__(self, max_workers: int = 4):
-        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='TaskWorker')
+    def __init__(self, max_workers: int = 4, store=None,
+                 lease_seconds: float = 60, max_attempts: int = 3,
+                 lanes: Optional[Dict[str, int]] = None, borrowing=None,
+                 default_timeout: Optional[float] = None, cancel_grace: float = 30,
+                 watchdog_interval: float = 1.0):
+        """
+        Args:
+            max_workers: 未配置车道时交互和入库车道各自的工作线程数
+            store: 任务存储，缺省使用内存存储
+            lease_seconds: 任务租约时长
+            max_attempts: 孤儿任务最多执行次数
+            lanes: 车道名称到工作线程数的映射
+            borrowing: 车道借用规则，缺省交互车道不外借
+            default_timeout: 未指定 job_timeout 的任务的执行超时秒数，None 表示不限时
+            cancel_grace: 取消或超时后等待任务自行退出的秒数，超过后放弃该任务并补充工作线程
+            watchdog_interval: 看门狗检查间隔秒数
+        """
+        if lanes is None:
+            lanes = {INTERACTIVE_LANE: max_workers, INGESTION_LANE: max_workers, MAINTENANCE_LANE: 1}
+        self.scheduler = LaneScheduler(lanes, borrowing)
         self.jobs: Dict[str, TaskJob] = {}
         self.lock = threading.Lock()
-        logger.info(f"线程池任务队列初始化完成，最大工作线程数: {max_workers}")
+        self.metrics = QueueMetrics()
+
+        # 任务存储：持久化后端下任务以函数路径和参数落盘，进程退出后可由其他进程接管
+        self.store = store if store is not None else MemoryJobStore()
+        self.worker_id = new_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._persistent_ids = set()
+        # 去重键 -> 本进程内最近一次以该键提交的任务ID；提交去重任务时串行检查和登记
+        self._dedupe_ids: Dict[str, str] = {}
+        self._dedupe_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._maintenance_thread = None
+
+        # 超时与取消：执行中的任务 -> (工作线程, 取消令牌)，由看门狗线程检查
+        self.default_timeout = default_timeout
+        self.cancel_grace = cancel_grace
+        self._running: Dict[str, tuple] = {}
+        self._stopped_ids = set()
+        self._watchdog_interval = watchdog_interval
+        self._watchdog_thread = threading.Thread(
+            target=self._watchdog_loop, name='TaskQueueWatchdog', daemon=True
+        )
+        self._watchdog_thread.start()
+
+        logger.info(f"线程池任务队列初始化完成，车道线程数: {lanes}, "
+                    f"任务存储: {type(self.store).__name__}")
+
+        if self.store.durable:
+            self.recover_orphaned_jobs()
+            self._start_maintenance()
     
     def enqueue(self, func: Callable, *args, **kwargs) -> TaskJob:
-        """提交任务到线程池"""
-        job_id = kwargs.pop('job_id', f'task_{int(time.time() * 1000)}')
-        job_timeout = kwargs.pop('job_timeout', None)  # 暂时忽略超时设置
+        """
+        提交任务到线程池
+
+        关键字参数:
+            job_id: 任务ID，缺省自动生成
+            lane: 任务车道（interactive / ingestion / maintenance），缺省为 ingestion
+            priority: 车道内优先级，数值越大越先执行，缺省为0
+            job_timeout: 执行超时，秒数或 '30s' / '10m' / '1h'，缺省使用队列的默认超时；
+                兼容RQ的 timeout 参数
+            dedupe_key: 去重键，如 (case_id, node_id) 或 document_id，以任务函数为命名空间；
+                同一去重键已有排队中或执行中的任务时不再提交，直接返回该任务
+                （可能是其他工作进程提交的任务）。任务结束或被取消后可以再次提交
+        """
+        dedupe_key = kwargs.pop('dedupe_key', None)
+        if dedupe_key is not None:
+            with self._dedupe_lock:
+                return self._enqueue(func, args, kwargs, _dedupe_key(func, dedupe_key))
+        return self._enqueue(func, args, kwargs)
+
+    def _enqueue(self, func: Callable, args: tuple, kwargs: dict, dedupe_key: Optional[str] = None):
+        job_id = kwargs.pop('job_id', None) or _new_job_id()
+        legacy_timeout = kwargs.pop('timeout', None)
+        job_timeout = kwargs.pop('job_timeout', None) or legacy_timeout
+        timeout = parse_timeout(job_timeout) if job_timeout is not None else self.default_timeout
+        lane = kwargs.pop('lane', None) or DEFAULT_LANE
+        priority = kwargs.pop('priority', 0)
+        if lane not in self.scheduler.lanes:
+            logger.warning(f"未知的任务车道 {lane}，使用默认车道 {DEFAULT_LANE}: {func.__name__} (ID: {job_id})")
+            lane = DEFAULT_LANE
+
+        if dedupe_key is not None:
+            existing = self._active_duplicate(dedupe_key)
+            if existing is not None:
+                return self._deduplicated(existing, func, lane)
+
+        path = func_path(func)
+        stored_args = serialize_args(args)
+        persistent = path is not None and stored_args is not None
+        if persistent:
+            record = JobRecord(
+                id=job_id,
+                func_path=path,
+                args=stored_args,
+                owner=self.worker_id,
+                lease_expires_at=time.time() + self.lease_seconds,
+                max_attempts=self.max_attempts,
+                options={'lane': lane, 'priority': priority, 'timeout': timeout},
+                dedupe_key=dedupe_key
+            )
+            if dedupe_key is None:
+                self.store.add(record)
+            else:
+                # 持久化后端中其他工作进程可能已提交了相同的任务
+                stored = self.store.add_unique(record)
+                if stored.id != job_id:
+                    return self._deduplicated(self.get_job(stored.id) or StoredTaskJob(stored), func, lane)
+        elif self.store.durable:
+            logger.warning(f"任务函数或参数无法序列化，仅在内存中执行: {func.__name__} (ID: {job_id})")
+
+        if dedupe_key is not None:
+            with self.lock:
+                self._dedupe_ids[dedupe_key] = job_id
+        return self._submit(job_id, func, args, persistent, lane, priority, timeout)
+
+    def _active_duplicate(self, dedupe_key: str) -> Optional[TaskJob]:
+        """本进程内以该去重键提交、尚未结束且未被取消的任务"""
+        with self.lock:
+            job = self.jobs.get(self._dedupe_ids.get(dedupe_key))
+        if job is None or job.future.done() or job.token.cancelled:
+            return None
+        return job
+
+    def _release_dedupe_key(self, job: TaskJob):
+        """被取消或超时的任务不再占用去重键，正在退出期间即可重新提交"""
+        if job.persistent:
+            try:
+                self.store.release_dedupe_key(job.id)
+            except Exception as e:
+                logger.error(f"解除任务去重键失败 (ID: {job.id}): {str(e)}")
+
+    def _deduplicated(self, job, func: Callable, lane: str):
+        logger.info(f"相同的任务尚未结束，返回已有任务: {func.__name__} (ID: {job.id})")
+        self.metrics.deduplicated(func.__name__, lane)
+        return job
+
+    def _submit(self, job_id: str, func: Callable, args: tuple, persistent: bool,
+                lane: str = DEFAULT_LANE, priority: int = 0,
+                timeout: Optional[float] = None) -> TaskJob:
+        token = CancellationToken(timeout, job_id)
+        func_name = func.__name__
+        enqueued_at = time.time()
         
         def wrapped_func():
             """包装函数，用于记录执行时间和处理异常"""
+            if persistent and not self.store.mark_started(job_id, self.worker_id, self.lease_seconds):
+                # 租约已过期并被其他进程接管，由接管方执行
+                logger.warning(f"任务已被其他工作进程接管，跳过执行: {func.__name__} (ID: {job_id})")
+                self.metrics.completed(func_name, lane, 'skipped')
+                return None
+
+            started_at = time.time()
+            self.metrics.started(func_name, lane, started_at - enqueued_at)
             try:
                 with self.lock:
                     if job_id in self.jobs:
                         self.jobs[job_id].started_at = datetime.now()
+                    self._running[job_id] = (threading.current_thread(), token)
                 
                 logger.info(f"开始执行任务: {func.__name__} (ID: {job_id})")
-                result = func(*args)
+                self._publish_status(job_id, 'started', lane)
+                token.start()
+                with bind_token(token):
+                    token.raise_if_cancelled()
+                    result = func(*args)
                 
                 with self.lock:
                     if job_id in self.jobs:
                         self.jobs[job_id].completed_at = datetime.now()
+                    self._persistent_ids.discard(job_id)
+                    # 被看门狗放弃的任务已记录为取消或超时，迟到的结果不再覆盖
+                    stopped = job_id in self._stopped_ids
+                if persistent and not stopped:
+                    self.store.mark_finished(job_id, self.worker_id, 'finished', result=result)
+                if not stopped:
+                    self.metrics.completed(func_name, lane, 'finished', time.time() - started_at)
+                    self._publish_status(job_id, 'finished', lane)
                 
                 logger.info(f"任务执行完成: {func.__name__} (ID: {job_id})")
                 return result
+
+            except TaskCancelled as e:
+                logger.warning(f"任务已停止: {func.__name__} (ID: {job_id}), 原因: {e.message}")
+                if self._finish_cancelled(job_id, func, args, persistent, e, time.time() - started_at):
+                    with self.lock:
+                        if job_id in self.jobs:
+                            self.jobs[job_id].completed_at = datetime.now()
+                raise
                 
             except Exception as e:
                 logger.error(f"任务执行失败: {func.__name__} (ID: {job_id}), 错误: {str(e)}")
                 with self.lock:
                     if job_id in self.jobs:
                         self.jobs[job_id].completed_at = datetime.now()
+                    self._persistent_ids.discard(job_id)
+                    stopped = job_id in self._stopped_ids
+                if persistent and not stopped:
+                    self.store.mark_finished(job_id, self.worker_id, 'failed', error=str(e))
+                if not stopped:
+                    self.metrics.completed(func_name, lane, 'failed', time.time() - started_at)
+                    self._publish_status(job_id, 'failed', lane, error=str(e))
                 raise
+
+            finally:
+                with self.lock:
+                    self._running.pop(job_id, None)
         
-        # 提交到线程池
-        future = self.executor.submit(wrapped_func)
+        if persistent:
+            with self.lock:
+                self._persistent_ids.add(job_id)
+
+        # 提交到车道
+        self.metrics.enqueued(func_name, lane)
+        future = self.scheduler.submit(lane, wrapped_func, priority)
         
         # 创建任务对象
-        job = TaskJob(job_id, future, func.__name__)
+        job = TaskJob(job_id, future, func_name, lane, token, func, args, persistent)
         
         with self.lock:
             self.jobs[job_id] = job
+        self._publish_status(job_id, 'queued', lane)
         
-        logger.info(f"任务已提交到线程池: {func.__name__} (ID: {job_id})")
+        logger.info(f"任务已提交到线程池: {func.__name__} (ID: {job_id}, 车道: {lane}, 优先级: {priority})")
         return job
     
-    def get_job(self, job_id: str) -> Optional[TaskJob]:
-        """获取任务对象"""
+    def get_job(self, job_id: str):
+        """获取任务对象，本进程内没有时从任务存储中读取"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+
+        record = self.store.get(job_id)
+        return StoredTaskJob(record) if record is not None else None
+
+    def recover_orphaned_jobs(self) -> int:
+        """
+        接管并重新执行孤儿任务
+
+        孤儿任务指租约已过期、或持有进程已确定退出的排队/执行中任务。
+        执行次数达到上限的任务直接标记为失败，避免反复触发崩溃。
+
+        Returns:
+            int: 重新入队的任务数量
+        """
+        records = self.store.claim_orphans(
+            self.worker_id, self.lease_seconds,
+            lambda owner: owner_is_dead(owner, self.worker_id)
+        )
+
+        recovered = 0
+        for record in records:
+            if record.attempts >= record.max_attempts:
+                self.store.mark_finished(
+                    record.id, self.worker_id, 'failed',
+                    error=f'工作进程退出，任务已执行 {record.attempts} 次，达到最大尝试次数'
+                )
+                logger.error(f"孤儿任务达到最大尝试次数，标记为失败: {record.func_path} (ID: {record.id})")
+                continue
+
+            try:
+                func = resolve_func(record.func_path)
+            except Exception as e:
+                self.store.mark_finished(record.id, self.worker_id, 'failed',
+                                         error=f'无法加载任务函数: {str(e)}')
+                logger.error(f"孤儿任务函数无法加载: {record.func_path} (ID: {record.id}), 错误: {str(e)}")
+                continue
+
+            lane = record.options.get('lane', DEFAULT_LANE)
+            if lane not in self.scheduler.lanes:
+                lane = DEFAULT_LANE
+            self._submit(record.id, func, tuple(record.args), True, lane,
+                         record.options.get('priority', 0), record.options.get('timeout'))
+            recovered += 1
+
+        if recovered:
+            logger.info(f"已重新入队 {recovered} 个孤儿任务")
+        return recovered
+
+    def _start_maintenance(self):
+        """启动续租和孤儿任务恢复的后台线程"""
+        self._maintenance_thread = threading.Thread(
+            target=self._maintenance_loop, name='TaskQueueMaintenance', daemon=True
+        )
+        self._maintenance_thread.start()
+
+    def _maintenance_loop(self):
+        interval = max(self.lease_seconds / 3, 1)
+        last_recovery = time.time()
+        while not self._stop_event.wait(interval):
+            try:
+                with self.lock:
+                    active_ids = list(self._persistent_ids)
+                self.store.heartbeat(self.worker_id, active_ids, self.lease_seconds)
+
+                if time.time() - last_recovery >= self.lease_seconds:
+                    last_recovery = time.time()
+                    self.recover_orphaned_jobs()
+            except Exception as e:
+                logger.error(f"任务队列维护失败: {str(e)}")
+
+    def cancel(self, job_id: str, reason: Optional[TaskCancelled] = None) -> bool:
+        """
+        取消任务
+
+        排队中的任务直接出队；执行中的任务通过取消令牌通知，任务在下一个检查点退出，
+        超过 cancel_grace 仍未退出时由看门狗放弃。两种情况都会调用任务函数的取消处理函数
+        （见 cancellation.on_cancel）清理关联的业务状态。
+
+        Returns:
+            bool: 是否已发出取消请求，任务不存在或已结束时返回False
+        """
+        reason = reason or TaskCancelled('任务已被用户取消')
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None or job.future.done() or job.token.cancelled:
+            return False
+
+        job.token.cancel(reason)
+        self._release_dedupe_key(job)
+        if job.future.cancel():
+            logger.info(f"已取消排队中的任务: {job.func_name} (ID: {job_id})")
+            if self._finish_cancelled(job_id, job.func, job.args, job.persistent, reason):
+                job.completed_at = datetime.now()
+        else:
+            logger.info(f"已通知执行中的任务停止: {job.func_name} (ID: {job_id})")
+        return True
+
+    def _finish_cancelled(self, job_id: str, func: Callable, args: tuple,
+                          persistent: bool, reason: TaskCancelled,
+                          run_seconds: Optional[float] = None) -> bool:
+        """
+        记录任务取消或超时，并调用任务函数的取消处理函数
+
+        任务自行退出与看门狗放弃可能先后发生，只有第一次调用生效。
+
+        Args:
+            run_seconds: 任务已执行的秒数，None 表示任务在排队中被取消
+
+        Returns:
+            bool: 本次调用是否生效
+        """
+        with self.lock:
+            if job_id in self._stopped_ids:
+                return False
+            self._stopped_ids.add(job_id)
+            self._persistent_ids.discard(job_id)
+            job = self.jobs.get(job_id)
+
+        lane = job.lane if job is not None else DEFAULT_LANE
+        self.metrics.completed(func.__name__, lane, reason.status, run_seconds)
+
+        if persistent:
+            self.store.mark_finished(job_id, self.worker_id, reason.status, error=reason.message)
+        self._publish_status(job_id, reason.status, error=reason.message)
+
+        handler = getattr(func, 'on_cancel', None)
+        if handler is not None:
+            try:
+                handler(reason, *args)
+            except Exception as e:
+                logger.error(f"任务取消处理失败: {func.__name__} (ID: {job_id}), 错误: {str(e)}")
+        return True
+
+    def _publish_status(self, job_id: str, status: str, lane: Optional[str] = None,
+                        error: Optional[str] = None):
+        """发布任务状态变化事件"""
+        data = {'jobId': job_id, 'status': status}
+        if lane is not None:
+            data['lane'] = lane
+        if error is not None:
+            data['error'] = error
+        publish_progress(task_topic(job_id), STATUS_EVENT, **data)
+
+    def _watchdog_loop(self):
+        while not self._stop_event.wait(self._watchdog_interval):
+            try:
+                self.check_timeouts()
+            except Exception as e:
+                logger.error(f"任务看门狗检查失败: {str(e)}")
+
+    def check_timeouts(self) -> int:
+        """
+        检查执行中任务的超时和取消状态
+
+        超时的任务通过取消令牌通知停止；取消后超过 cancel_grace 仍未退出的任务
+        被放弃：立即记录为 cancelled / timed_out 并清理业务状态，其工作线程退役，
+        车道补充一个新线程，避免卡死的外部调用永久占用并发容量。
+
+        Returns:
+            int: 本次放弃的任务数量
+        """
         with self.lock:
-            return self.jobs.get(job_id)
+            running = list(self._running.items())
+
+        abandoned = 0
+        now = time.time()
+        for job_id, (thread, token) in running:
+            if token.expire_if_overdue():
+                logger.warning(f"任务执行超时，已通知停止 (ID: {job_id}, 超时: {token.timeout:g} 秒)")
+                with self.lock:
+                    expired = self.jobs.get(job_id)
+                if expired is not None:
+                    self._release_dedupe_key(expired)
+            if not token.cancelled or now - token.cancelled_at < self.cancel_grace:
+                continue
+
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if self._running.get(job_id, (None,))[0] is not thread:
+                    continue
+                self._running.pop(job_id, None)
+            if job is None:
+                continue
+
+            logger.error(f"任务取消后 {self.cancel_grace:g} 秒仍未退出，放弃该任务并替换工作线程: "
+                         f"{job.func_name} (ID: {job_id}, 线程: {thread.name})")
+            job.abandoned = True
+            job.completed_at = datetime.now()
+            self.scheduler.retire_worker(thread)
+            run_seconds = (job.completed_at - job.started_at).total_seconds() if job.started_at else 0.0
+            self._finish_cancelled(job_id, job.func, job.args, job.persistent, token.reason, run_seconds)
+            abandoned += 1
+        return abandoned
+
+    def lane_stats(self) -> Dict[str, Dict[str, int]]:
+        """各车道的线程数、排队数和执行中任务数"""
+        return self.scheduler.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        队列统计：排队深度、执行中任务数、工作线程状态，以及按任务函数和车道的
+        等待时长、执行时长直方图和失败率、超时率
+        """
+        lanes = self.scheduler.stats()
+        workers = self.scheduler.workers()
+        totals = self.metrics.totals()
+        return {
+            'queue_length': sum(lane['queued'] for lane in lanes.values()),
+            'running_count': sum(lane['running'] for lane in lanes.values()),
+            'workers_count': sum(1 for worker in workers if worker['state'] != 'retired'),
+            'workers': workers,
+            'finished_jobs_count': totals['finished'],
+            'failed_jobs_count': totals['failed'],
+            'cancelled_jobs_count': totals['cancelled'],
+            'timed_out_jobs_count': totals['timed_out'],
+            'lanes': lanes,
+            'functions': self.metrics.snapshot(),
+        }
+
+    def shutdown(self, wait: bool = False):
+        """停止后台维护线程和各车道工作线程"""
+        self._stop_event.set()
+        self.scheduler.shutdown(wait=wait)
     
     def cleanup_completed_jobs(self, max_age_hours: int = 24):
         """清理已完成的旧任务"""
@@ -122,10 +607,18 @@ class ThreadPoolQueue:
             
             for job_id in to_remove:
                 del self.jobs[job_id]
+                self._stopped_ids.discard(job_id)
+            removed_ids = set(to_remove)
+            for key in [key for key, job_id in self._dedupe_ids.items() if job_id in removed_ids]:
+                del self._dedupe_ids[key]
             
             if to_remove:
                 logger.info(f"清理了 {len(to_remove)} 个已完成的旧任务")
 
+        removed = self.store.cleanup(cutoff_time)
+        if removed:
+            logger.info(f"从任务存储中清理了 {removed} 条已完成的任务记录")
+
 
 # 全局线程池队列实例
 _thread_pool_queue = None
@@ -135,6 +628,12 @@ _queue_lock = threading.Lock()
 def get_task_queue():
     """
     获取任务队列实例（线程池实现）
+
+    任务存储由 TASK_QUEUE_BACKEND 配置：memory（默认）或 sqlite。
+    使用sqlite时首次获取队列即会接管上次未完成的任务。
+    各车道线程数由 TASK_QUEUE_INTERACTIVE_WORKERS、TASK_QUEUE_INGESTION_WORKERS、
+    TASK_QUEUE_MAINTENANCE_WORKERS 配置；任务默认超时和取消宽限期由
+    TASK_QUEUE_DEFAULT_TIMEOUT、TASK_QUEUE_CANCEL_GRACE 配置。
     
     Returns:
         ThreadPoolQueue: 线程池队列实例
@@ -143,8 +642,24 @@ def get_task_queue():
     
     with _queue_lock:
         if _thread_pool_queue is None:
-            max_workers = current_app.config.get('TASK_QUEUE_MAX_WORKERS', 4)
-            _thread_pool_queue = ThreadPoolQueue(max_workers=max_workers)
+            config = current_app.config
+            lanes = {
+                INTERACTIVE_LANE: config.get('TASK_QUEUE_INTERACTIVE_WORKERS', 4),
+                INGESTION_LANE: config.get('TASK_QUEUE_INGESTION_WORKERS', config.get('TASK_QUEUE_MAX_WORKERS', 4)),
+                MAINTENANCE_LANE: config.get('TASK_QUEUE_MAINTENANCE_WORKERS', 1),
+            }
+            store = create_job_store(
+                config.get('TASK_QUEUE_BACKEND', 'memory'),
+                config.get('TASK_QUEUE_DB_PATH')
+            )
+            _thread_pool_queue = ThreadPoolQueue(
+                lanes=lanes,
+                store=store,
+                lease_seconds=config.get('TASK_QUEUE_LEASE_SECONDS', 60),
+                max_attempts=config.get('TASK_QUEUE_MAX_ATTEMPTS', 3),
+                default_timeout=parse_timeout(config.get('TASK_QUEUE_DEFAULT_TIMEOUT')),
+                cancel_grace=config.get('TASK_QUEUE_CANCEL_GRACE', 30)
+            )
         
         return _thread_pool_queue
 
@@ -171,11 +686,16 @@ def get_task_status(job_id: str) -> dict:
                 'error': 'Job not found'
             }
         
+        # 任务通过 report_progress 上报的最新进度
+        progress = get_progress_bus().latest(task_topic(job_id), PROGRESS_EVENT)
+
         return {
             'id': job.id,
+            'lane': job.lane,
             'status': job.get_status(),
             'result': job.get_result(),
             'error': job.get_error(),
+            'progress': progress['data'] if progress else None,
             'created_at': job.created_at.isoformat() if job.created_at else None,
             'started_at': job.started_at.isoformat() if job.started_at else None,
             'completed_at': job.completed_at.isoformat() if job.completed_at else None
@@ -191,6 +711,23 @@ def get_task_status(job_id: str) -> dict:
         }
 
 
+def cancel_task(job_id: str) -> bool:
+    """
+    取消任务
+
+    Args:
+        job_id: 任务ID
+
+    Returns:
+        bool: 是否已发出取消请求
+    """
+    try:
+        return get_task_queue().cancel(job_id)
+    except Exception as e:
+        logger.error(f"取消任务失败: {str(e)}")
+        return False
+
+
 def is_queue_available() -> bool:
     """
     检查任务队列是否可用
@@ -0,0 +1,83 @@
+"""
+IP智慧解答专家系统 - 后台任务运行时
+
+后台任务需要应用上下文访问数据库和配置。每个任务调用 create_app() 会重新注册全部蓝图、
+重连Redis、重新初始化jieba和日志，单次开销达数百毫秒。工作进程改为只创建一个应用，
+任务在该应用上推入独立的应用上下文执行：Flask-SQLAlchemy 的会话按应用上下文隔离，
+上下文弹出时自动回滚未提交的事务并归还连接，任务之间互不影响。
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import Flask, current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+_worker_app: Optional[Flask] = None
+_worker_pid: Optional[int] = None
+_worker_lock = threading.Lock()
+
+
+def set_worker_app(app: Flask) -> None:
+    """
+    指定后台任务使用的应用实例
+
+    Web进程内运行任务队列时传入已创建的应用，避免再创建一个。
+    """
+    global _worker_app, _worker_pid
+    with _worker_lock:
+        _worker_app = app
+        _worker_pid = os.getpid()
+
+
+def get_worker_app() -> Flask:
+    """
+    获取当前工作进程的应用实例，首次调用时创建
+
+    按进程号缓存：fork出的子进程不复用父进程的应用（数据库连接池不能跨进程共享）。
+    """
+    global _worker_app, _worker_pid
+    pid = os.getpid()
+    if _worker_app is not None and _worker_pid == pid:
+        return _worker_app
+
+    with _worker_lock:
+        if _worker_app is None or _worker_pid != pid:
+            from app import create_app
+            _worker_app = create_app()
+            _worker_pid = pid
+            logger.info(f"后台任务应用已创建 (PID: {pid})")
+        return _worker_app
+
+
+def reset_worker_app() -> None:
+    """清除缓存的应用实例（测试使用）"""
+    global _worker_app, _worker_pid
+    with _worker_lock:
+        _worker_app = None
+        _worker_pid = None
+
+
+@contextmanager
+def worker_app_context():
+    """
+    后台任务的应用上下文
+
+    已处于应用上下文中（同步执行、测试）时直接复用；否则在工作进程的应用上推入新的上下文，
+    退出时由 Flask-SQLAlchemy 清理本任务的数据库会话。
+
+    用法:
+        with worker_app_context():
+            ...
+    """
+    if has_app_context():
+        yield current_app._get_current_object()
+        return
+
+    app = get_worker_app()
+    with app.app_context():
+        yield app
@@ -5,11 +5,13 @@
 - 向量服务：向量数据库操作
 - 混合检索：结合多种检索策略
 - 知识检索服务：统一的知识检索接口
+- 已解决案例索引：相似历史案例查询
 """
 
 from .vector_service import VectorService, get_vector_service, delete_document_vectors
 from .hybrid_retrieval import get_hybrid_retrieval, search_knowledge
 from .knowledge_service import knowledge_service
+from .case_index import get_case_index, search_similar_cases, submit_case_indexing
 
 __all__ = [
     'VectorService',
@@ -17,5 +19,8 @@ __all__ = [
     'delete_document_vectors',
     'get_hybrid_retrieval',
     'search_knowledge',
-    'knowledge_service'
+    'knowledge_service',
+    'get_case_index',
+    'search_similar_cases',
+    'submit_case_indexing'
 ]
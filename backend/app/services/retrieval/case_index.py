@@ -0,0 +1,277 @@
+"""
+已解决案例索引
+
+已解决的案例（问题、最终解决方案、厂商、问题类别及用户反馈）是最有价值的经验，
+此前每个新案例都从头分析。本模块把已解决案例向量化存入独立的本地索引：
+
+- 案例被标记为已解决（状态修改或反馈为已解决）时，在维护车道提交索引任务；
+  状态改回未解决或案例删除时移除
+- search_similar_cases 对新问题做一次向量化和本地相似度计算，毫秒级返回相似的历史案例，
+  供 GET /cases/similar 接口和Agent检索步骤使用；与其他案例接口一致，只返回同一用户的案例
+- flask index-cases 命令重建全部已解决案例的索引
+
+索引保存在 RESOLVED_CASE_INDEX_PATH 下（LocalFileVectorDB），多个进程共享同一组文件，
+写入在文件锁下进行。
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+
+from app import db
+from app.models.case import Case, Node
+from app.models.feedback import Feedback
+from app.services.infrastructure.lanes import MAINTENANCE_LANE
+from app.services.infrastructure.worker_runtime import worker_app_context
+from app.services.storage.local_vector_db import LocalFileVectorDB
+
+logger = logging.getLogger(__name__)
+
+RESOLVED_STATUSES = ('solved', 'resolved')
+
+# 索引文本中解决方案的最大长度（字符），避免长方案稀释问题本身的语义
+_SOLUTION_EMBED_CHARS = 800
+
+
+def is_resolved(case: Case) -> bool:
+    """案例状态为已解决，或用户反馈问题已解决"""
+    if case.status in RESOLVED_STATUSES:
+        return True
+    return Feedback.query.filter_by(case_id=case.id, outcome='solved').first() is not None
+
+
+def build_case_document(case: Case) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    生成案例的索引文本和元数据
+
+    Returns:
+        (用于向量化的文本, 索引条目)，案例没有已完成的解决方案时返回None
+    """
+    solution_node = (Node.query
+                     .filter_by(case_id=case.id, type='SOLUTION', status='COMPLETED')
+                     .order_by(Node.created_at.desc())
+                     .first())
+    solution = (solution_node.content or {}).get('answer') if solution_node else None
+    if not solution:
+        return None
+
+    case_metadata = case.case_metadata or {}
+    query = case_metadata.get('original_query') or case.title
+    vendor = case_metadata.get('vendor') or (solution_node.content or {}).get('vendor') or '通用'
+    category = (solution_node.content or {}).get('category') or case_metadata.get('category')
+    feedback = Feedback.query.filter_by(case_id=case.id).first()
+
+    text = f"厂商: {vendor}\n类别: {category or '未分类'}\n问题: {query}\n解决方案: {solution[:_SOLUTION_EMBED_CHARS]}"
+    metadata = {
+        'user_id': str(case.user_id),
+        'title': case.title,
+        'query': query,
+        'vendor': vendor,
+        'category': category,
+        'solution_node_id': solution_node.id,
+        'outcome': feedback.outcome if feedback else None,
+        'rating': feedback.rating if feedback else None,
+        'resolved_at': (case.updated_at or datetime.utcnow()).isoformat() + 'Z'
+    }
+    return text, {'content': solution, 'metadata': metadata}
+
+
+class ResolvedCaseIndex:
+    """已解决案例的向量索引"""
+
+    def __init__(self, storage_path: Optional[str] = None):
+        config = current_app.config if has_app_context() else {}
+        self.storage_path = storage_path or config.get('RESOLVED_CASE_INDEX_PATH', 'instance/resolved_cases')
+        self._db: Optional[LocalFileVectorDB] = None
+        self._lock = threading.Lock()
+
+    def _has_index(self) -> bool:
+        return self._db is not None or os.path.exists(os.path.join(self.storage_path, 'index.json'))
+
+    def _get_db(self) -> LocalFileVectorDB:
+        if self._db is None:
+            self._db = LocalFileVectorDB(self.storage_path)
+        else:
+            self._db.refresh()
+        return self._db
+
+    def _embed(self, text: str) -> List[float]:
+        from app.services.ai.embedding_service import get_embedding_service
+        return get_embedding_service().embed_text(text)
+
+    def index_case(self, case: Case) -> bool:
+        """
+        索引（或更新）一个已解决案例
+
+        Returns:
+            bool: 是否已写入索引
+        """
+        document = build_case_document(case)
+        if document is None:
+            logger.info(f"案例 {case.id} 没有已完成的解决方案，跳过索引")
+            return False
+
+        text, entry = document
+        vector = self._embed(text)
+        with self._lock, self._get_db().transaction() as index:
+            if any(info.get('document_id') == case.id for info in index.index.values()):
+                index.delete_document(case.id)
+            index.add_document(case.id, [entry], [vector])
+        logger.info(f"已索引已解决案例: {case.id}")
+        return True
+
+    def remove_case(self, case_id: str) -> bool:
+        """从索引中移除案例"""
+        if not self._has_index():
+            return False
+        with self._lock, self._get_db().transaction() as index:
+            if not any(info.get('document_id') == case_id for info in index.index.values()):
+                return False
+            return index.delete_document(case_id)
+
+    def search(self, query: str, user_id: Any, vendor: Optional[str] = None, limit: int = 5,
+               min_similarity: Optional[float] = None,
+               exclude_case_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查找与问题相似的已解决案例
+
+        Args:
+            query: 问题描述
+            user_id: 发起查询的用户，只返回该用户的案例
+            vendor: 设备厂商，提供时只返回该厂商或通用的案例
+            limit: 返回数量
+            min_similarity: 最低相似度，缺省读取 RESOLVED_CASE_MIN_SIMILARITY
+            exclude_case_id: 排除的案例（当前案例）
+
+        Returns:
+            List[Dict]: 按相似度从高到低排列的案例摘要
+        """
+        if not self._has_index() or not (query or '').strip():
+            return []
+        if min_similarity is None:
+            config = current_app.config if has_app_context() else {}
+            min_similarity = config.get('RESOLVED_CASE_MIN_SIMILARITY', 0.75)
+
+        vendors = {vendor.lower(), '通用'} if vendor else None
+
+        def visible(info: Dict[str, Any]) -> bool:
+            # 在排序截取之前过滤，共享索引中其他用户的案例不会挤掉该用户自己的案例
+            metadata = info.get('metadata') or {}
+            if info.get('document_id') == exclude_case_id or metadata.get('user_id') != str(user_id):
+                return False
+            return not vendors or (metadata.get('vendor') or '通用').lower() in vendors
+
+        vector = self._embed(query)
+        with self._lock:
+            candidates = self._get_db().search_similar(vector, top_k=limit, predicate=visible)
+
+        results = []
+        for candidate in candidates:
+            if candidate['similarity'] < min_similarity:
+                break
+            metadata = candidate.get('metadata') or {}
+            results.append({
+                'caseId': candidate['document_id'],
+                'title': metadata.get('title'),
+                'query': metadata.get('query'),
+                'solution': candidate['content'],
+                'vendor': metadata.get('vendor'),
+                'category': metadata.get('category'),
+                'outcome': metadata.get('outcome'),
+                'rating': metadata.get('rating'),
+                'resolvedAt': metadata.get('resolved_at'),
+                'similarity': round(float(candidate['similarity']), 4)
+            })
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        if not self._has_index():
+            return {'cases': 0, 'storage_path': self.storage_path}
+        with self._lock:
+            index = self._get_db()
+            return {'cases': len(index.index), 'storage_path': str(index.storage_path)}
+
+
+# 全局已解决案例索引实例
+_case_index: Optional[ResolvedCaseIndex] = None
+_case_index_lock = threading.Lock()
+
+
+def get_case_index() -> ResolvedCaseIndex:
+    """获取进程内共享的已解决案例索引"""
+    global _case_index
+    with _case_index_lock:
+        if _case_index is None:
+            _case_index = ResolvedCaseIndex()
+        return _case_index
+
+
+def reset_case_index():
+    """重置全局已解决案例索引（主要用于测试）"""
+    global _case_index
+    with _case_index_lock:
+        _case_index = None
+
+
+def search_similar_cases(query: str, user_id: Any, vendor: Optional[str] = None, limit: int = 5,
+                         exclude_case_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """查找用户的相似已解决案例，失败时返回空列表"""
+    try:
+        return get_case_index().search(query, user_id, vendor=vendor, limit=limit,
+                                       exclude_case_id=exclude_case_id)
+    except Exception as e:
+        logger.warning(f"相似案例查询失败: {str(e)}")
+        return []
+
+
+def index_resolved_case(case_id: str):
+    """
+    更新单个案例在索引中的条目（后台任务）
+
+    案例已解决时写入索引，否则（状态改回、案例已删除）从索引中移除。
+    """
+    with worker_app_context():
+        case = db.session.get(Case, case_id)
+        index = get_case_index()
+        if case is None or not is_resolved(case):
+            index.remove_case(case_id)
+            return
+        index.index_case(case)
+
+
+def submit_case_indexing(case_id: str) -> Optional[str]:
+    """在维护车道提交案例索引任务，提交失败只记录日志"""
+    from app.services.infrastructure.task_queue import get_task_queue
+
+    try:
+        job = get_task_queue().enqueue(index_resolved_case, case_id, lane=MAINTENANCE_LANE,
+                                       dedupe_key=case_id)
+        return job.id
+    except Exception as e:
+        logger.warning(f"提交案例索引任务失败: case_id={case_id}, {str(e)}")
+        return None
+
+
+def rebuild_case_index() -> int:
+    """
+    重建全部已解决案例的索引
+
+    Returns:
+        int: 写入索引的案例数
+    """
+    index = get_case_index()
+    indexed = 0
+    solved_case_ids = db.session.query(Feedback.case_id).filter(Feedback.outcome == 'solved')
+    resolved_cases = Case.query.filter(db.or_(Case.status.in_(RESOLVED_STATUSES), Case.id.in_(solved_case_ids)))
+    for case in resolved_cases.yield_per(100):
+        try:
+            if index.index_case(case):
+                indexed += 1
+        except Exception as e:
+            logger.error(f"索引案例失败: case_id={case.id}, {str(e)}")
+    logger.info(f"已解决案例索引重建完成，共 {indexed} 个案例")
+    return indexed
@@ -6,8 +6,9 @@ IP智慧解答专家系统 - 向量服务
 
 import logging
 from typing import List, Dict, Any, Optional
-from app import create_app
 from app.services.ai.embedding_service import get_embedding_service
+from app.services.infrastructure.cancellation import check_cancelled
+from app.services.infrastructure.worker_runtime import worker_app_context
 from app.services.storage.vector_db_config import vector_db_config, VectorDBType
 from app.services.storage.weaviate_vector_db import WeaviateVectorDB
 
@@ -21,8 +22,7 @@ def delete_document_vectors(document_id):
     Args:
         document_id: 文档ID
     """
-    app = create_app()
-    with app.app_context():
+    with worker_app_context() as app:
         vector_service = get_vector_service()
         success = vector_service.delete_document(document_id)
         if success:
@@ -31,6 +31,12 @@ def delete_document_vectors(document_id):
             app.logger.warning(f"Failed to delete vectors for document {document_id}")
 
 
+def _invalidate_answer_cache(document_id: str, reason: str):
+    """文档内容变化后，引用了该文档的缓存解决方案可能过时，从语义缓存中移除"""
+    from app.services.ai.semantic_cache import invalidate_semantic_cache_for_document
+    invalidate_semantic_cache_for_document(document_id, reason)
+
+
 class VectorService:
     """向量服务类 - 支持多种向量数据库后端"""
 
@@ -68,6 +74,8 @@ class VectorService:
             all_vectors = []
             
             for i in range(0, len(texts), batch_size):
+                # 大文档需要数百次向量化调用，每批之前检查后台任务是否已取消
+                check_cancelled()
                 batch_texts = texts[i:i + batch_size]
                 batch_vectors = self.embedding_service.embed_batch(batch_texts)
                 all_vectors.extend(batch_vectors)
@@ -114,6 +122,7 @@ class VectorService:
 
             vector_ids = self.vector_db.add_document(document_id, formatted_chunks, vectors)
             logger.info(f"成功存储 {len(chunks)} 个向量到向量数据库")
+            _invalidate_answer_cache(document_id, f"文档 {document_id} 已重新入库")
             return vector_ids
 
         except Exception as e:
@@ -201,6 +210,7 @@ class VectorService:
             success = self.vector_db.delete_document(document_id)
             if success:
                 logger.info(f"成功删除文档 {document_id} 的向量数据")
+                _invalidate_answer_cache(document_id, f"文档 {document_id} 已删除")
             else:
                 logger.warning(f"删除文档 {document_id} 的向量数据失败")
             return success
@@ -5,6 +5,8 @@
 - 缓存服务：Redis缓存管理
 - 向量数据库：Weaviate和本地向量数据库
 - 数据库配置：向量数据库配置管理
+- 分片上传：大文件断点续传会话管理
+- 解析产物：压缩存储的文档解析结果
 """
 
 from .cache_service import (
@@ -12,11 +14,14 @@ from .cache_service import (
     cache_service,
     get_cache_service,
     cached_llm_call,
-    cached_retrieval_call
+    cached_retrieval_call,
+    build_cache_key
 )
 from .weaviate_vector_db import WeaviateVectorDB
 from .local_vector_db import LocalFileVectorDB
 from .vector_db_config import vector_db_config, VectorDBType
+from .artifact_store import ParseArtifactStore, get_artifact_store, build_parsing_summary
+from .chunked_upload import ChunkedUploadService, ChunkedUploadError, get_chunked_upload_service
 
 __all__ = [
     'CacheService',
@@ -24,8 +29,15 @@ __all__ = [
     'get_cache_service',
     'cached_llm_call',
     'cached_retrieval_call',
+    'build_cache_key',
     'WeaviateVectorDB',
     'LocalFileVectorDB',
     'vector_db_config',
-    'VectorDBType'
+    'VectorDBType',
+    'ChunkedUploadService',
+    'ChunkedUploadError',
+    'get_chunked_upload_service',
+    'ParseArtifactStore',
+    'get_artifact_store',
+    'build_parsing_summary'
 ]
@@ -0,0 +1,153 @@
+"""
+解析产物存储
+
+IDP解析结果（版面、表格、图片等）动辄数MB，不再以JSON存入知识文档行，
+而是压缩后按文档ID写入实例目录下的独立文件。数据库行只保留引用和摘要，
+详情接口需要时再按引用加载。
+
+安装了 zstandard 时使用zstd压缩，否则回退到标准库gzip；读取时根据文件扩展名选择解码方式，
+因此切换压缩方式不影响已有产物。
+"""
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+
+class ParseArtifactStore:
+    """按文档ID存取压缩后的解析产物"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @property
+    def codec(self) -> str:
+        return 'zstd' if zstandard is not None else 'gzip'
+
+    def _extension(self, codec: str) -> str:
+        return '.json.zst' if codec == 'zstd' else '.json.gz'
+
+    def _path(self, ref: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, ref))
+        # 引用来自数据库，仍需防止越出存储目录
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f'无效的解析产物引用: {ref}')
+        return path
+
+    def save(self, document_id: str, payload: Dict[str, Any]) -> str:
+        """
+        压缩并保存解析产物
+
+        Args:
+            document_id: 文档ID
+            payload: 可JSON序列化的解析结果
+
+        Returns:
+            str: 相对于存储目录的引用，写入 KnowledgeDocument.parsing_result_ref
+        """
+        codec = self.codec
+        ref = os.path.join(document_id[:2], f'{document_id}{self._extension(codec)}')
+        path = self._path(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        raw = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        if codec == 'zstd':
+            data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        else:
+            data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+
+        # 先写临时文件再原子替换，重新解析时读者不会看到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # 切换压缩方式后重新解析，清理旧扩展名的产物
+        for other in ('zstd', 'gzip'):
+            if other != codec:
+                stale = os.path.join(os.path.dirname(path), f'{document_id}{self._extension(other)}')
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+        logger.info(f"解析产物已保存: {ref}, 原始 {len(raw)} 字节, 压缩后 {len(data)} 字节")
+        return ref
+
+    def load(self, ref: str) -> Optional[Dict[str, Any]]:
+        """按引用加载解析产物，文件不存在时返回None"""
+        path = self._path(ref)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        if ref.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError('读取zstd压缩的解析产物需要安装 zstandard')
+            raw = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            raw = gzip.decompress(data)
+        return json.loads(raw.decode('utf-8'))
+
+    def delete(self, ref: str) -> bool:
+        """删除解析产物，返回是否删除了文件"""
+        path = self._path(ref)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+
+def get_artifact_store() -> ParseArtifactStore:
+    """获取当前应用配置的解析产物存储"""
+    from flask import current_app
+
+    root = current_app.config.get('PARSE_ARTIFACT_FOLDER') or \
+        os.path.join(current_app.instance_path, 'artifacts')
+    return ParseArtifactStore(root)
+
+
+def build_parsing_summary(parsed_result: Dict[str, Any], chunks_count: int, **extra) -> Dict[str, Any]:
+    """
+    从解析结果提取保存在数据库行中的小体积摘要
+
+    Args:
+        parsed_result: IDP或简单文本提取的解析结果
+        chunks_count: 生成的文档块数量
+        **extra: 其他摘要字段（如来源类型）
+
+    Returns:
+        Dict[str, Any]: 摘要
+    """
+    layouts = parsed_result.get('layouts', []) or []
+    type_counts: Dict[str, int] = {}
+    for layout in layouts:
+        layout_type = layout.get('type', 'unknown')
+        type_counts[layout_type] = type_counts.get(layout_type, 0) + 1
+
+    summary = {
+        'chunks_count': chunks_count,
+        'layouts_count': len(layouts),
+        'layout_types': type_counts,
+        'source': parsed_result.get('source', 'idp')
+    }
+    summary.update(extra)
+    return summary
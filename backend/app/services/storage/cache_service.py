@@ -2,14 +2,23 @@
 缓存服务
 
 提供Redis缓存功能，用于缓存AI模型调用结果，提高系统性能。
+
+cached_llm_call / cached_retrieval_call 的缓存键由 build_cache_key 生成：按函数签名绑定参数，
+忽略 self/cls，对装饰器 text_args 标记的查询文本归一化空白和大小写（其余字符串原样保留）、
+对字典按键排序，并带上调用方给出的版本（提示词模板和路由模型的摘要），
+不同服务实例之间、措辞空白不同的相同查询可以共享缓存。
+各缓存前缀的命中和未命中次数保存在进程内，通过 get_prefix_stats 查看。
 """
 
 import redis
 import hashlib
+import inspect
 import json
 import logging
 import os
-from typing import Any, Optional, Dict
+import threading
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional, Dict, Union
 from datetime import datetime
 from flask import current_app
 
@@ -28,6 +37,8 @@ class CacheService:
         """
         # 优先使用传入的redis_url；否则回退环境变量，缺省到db=0
         self.redis_url = redis_url or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        self._prefix_stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
         try:
             self.redis_client = redis.from_url(self.redis_url, decode_responses=True)
             # 测试连接
@@ -142,6 +153,36 @@ class CacheService:
             self._fallback_store[key] = ({'data': result, 'cached_at': datetime.now().isoformat(), 'expires_at': expire_time}, expires_at)
             return True
 
+    def add_if_absent(self, key: str, result: Dict[str, Any], expire_time: int = 3600) -> bool:
+        """
+        键不存在时写入缓存（原子操作），用于在多个Web进程间占用一个键
+
+        Args:
+            key: 缓存键
+            result: 要缓存的结果
+            expire_time: 过期时间（秒）
+
+        Returns:
+            是否由本次调用写入
+        """
+        cache_data = {'data': result, 'cached_at': datetime.now().isoformat(), 'expires_at': expire_time}
+        try:
+            if not self.redis_client:
+                raise RuntimeError("Redis 未连接，使用降级缓存")
+            return bool(self.redis_client.set(key, json.dumps(cache_data, ensure_ascii=False),
+                                              ex=expire_time, nx=True))
+        except Exception as e:
+            logger.warning(f"Redis写入失败，使用进程内降级缓存: {e}")
+            with self._stats_lock:
+                if not hasattr(self, '_fallback_store'):
+                    self._fallback_store = {}
+                existing = self._fallback_store.get(key)
+                now = datetime.now().timestamp()
+                if existing and now <= existing[1]:
+                    return False
+                self._fallback_store[key] = (cache_data, now + expire_time)
+                return True
+
     def delete_cache(self, key: str) -> bool:
         """
         删除缓存
@@ -192,6 +233,28 @@ class CacheService:
             # 如果生成失败，返回基于时间戳的键
             return f"{prefix}:{int(datetime.now().timestamp())}"
 
+    def record_lookup(self, prefix: str, hit: bool):
+        """记录一次按前缀的缓存查找结果"""
+        with self._stats_lock:
+            stats = self._prefix_stats.setdefault(prefix, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+
+    def get_prefix_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各缓存前缀的命中统计（进程内，随进程重启清零）
+
+        Returns:
+            Dict: {前缀: {'hits', 'misses', 'hit_rate'}}，hit_rate 为百分比
+        """
+        with self._stats_lock:
+            return {
+                prefix: {
+                    **stats,
+                    'hit_rate': round(stats['hits'] / max(stats['hits'] + stats['misses'], 1) * 100, 2)
+                }
+                for prefix, stats in sorted(self._prefix_stats.items())
+            }
+
     def clear_cache_by_pattern(self, pattern: str) -> int:
         """
         根据模式清除缓存
@@ -271,7 +334,8 @@ class CacheService:
                     info.get('keyspace_hits', 0) /
                     max(info.get('keyspace_hits', 0) + info.get('keyspace_misses', 0), 1) * 100,
                     2
-                )
+                ),
+                'prefixes': self.get_prefix_stats()
             }
         except Exception as e:
             logger.error(f"获取缓存统计失败: {e}")
@@ -309,26 +373,90 @@ class CacheService:
 # 全局缓存服务实例
 cache_service = CacheService()
 
+CacheVersion = Union[str, Callable[[], str], None]
+
+
+def _canonicalize(value: Any, fold_text: bool = False) -> Any:
+    """
+    把参数转换为稳定的可序列化形式
+
+    字典按键排序，空字符串和空容器视为None，其他对象使用 str()；
+    fold_text 为True时（标记为查询文本的参数）字符串再合并连续空白并转为小写。
+    其他字符串（ID、路径、命令、配置片段等）保持原样，避免不同输入共用缓存键。
+    """
+    if isinstance(value, str):
+        if fold_text:
+            value = ' '.join(value.split()).lower()
+        return value or None
+    if isinstance(value, dict):
+        if not value:
+            return None
+        return {str(key): _canonicalize(item, fold_text)
+                for key, item in sorted(value.items(), key=lambda pair: str(pair[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(item, fold_text) for item in value] or None
+    if isinstance(value, (set, frozenset)):
+        return sorted((_canonicalize(item, fold_text) for item in value),
+                      key=lambda item: json.dumps(item, sort_keys=True, default=str)) or None
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+
+def build_cache_key(prefix: str, func: Callable, args: tuple, kwargs: dict, version: CacheVersion = None,
+                    text_args: Iterable[str] = ()) -> str:
+    """
+    生成与调用实例无关的缓存键
 
-def cached_llm_call(cache_key_prefix: str, expire_time: int = 3600):
+    Args:
+        prefix: 缓存键前缀
+        func: 被缓存的函数，用于按签名绑定参数（位置参数和关键字参数传法不同时键相同）
+        args: 位置参数，实例方法的 self/cls 不参与缓存键
+        kwargs: 关键字参数
+        version: 缓存版本，字符串或返回字符串的函数；版本变化后旧缓存不再命中
+        text_args: 作为查询文本的参数名，这些参数忽略空白和大小写差异
+
+    Returns:
+        str: 缓存键
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+    except TypeError:
+        arguments = {'args': list(args), 'kwargs': dict(kwargs)}
+    arguments.pop('self', None)
+    arguments.pop('cls', None)
+
+    payload = {
+        'version': version() if callable(version) else version,
+        'arguments': {name: _canonicalize(value, fold_text=name in text_args)
+                      for name, value in sorted(arguments.items())},
+    }
+    content = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{prefix}:{hashlib.sha256(content.encode('utf-8')).hexdigest()}"
+
+
+def cached_llm_call(cache_key_prefix: str, expire_time: int = 3600, version: CacheVersion = None,
+                    text_args: Iterable[str] = ()):
     """
     LLM调用缓存装饰器
 
     Args:
         cache_key_prefix: 缓存键前缀
         expire_time: 过期时间（秒）
+        version: 缓存版本，通常为提示词模板和模型名称的摘要
+        text_args: 作为查询文本、忽略空白和大小写差异的参数名
     """
     def decorator(func):
+        @wraps(func)
         def wrapper(*args, **kwargs):
             # 生成缓存键
-            cache_key = cache_service.generate_cache_key(
-                cache_key_prefix,
-                *args,
-                *[f"{k}={v}" for k, v in sorted(kwargs.items())]
-            )
+            cache_key = build_cache_key(cache_key_prefix, func, args, kwargs, version, text_args)
 
             # 尝试从缓存获取结果
             cached_result = cache_service.get_cached_result(cache_key)
+            cache_service.record_lookup(cache_key_prefix, bool(cached_result and 'data' in cached_result))
             if cached_result and 'data' in cached_result:
                 logger.debug(f"使用缓存结果: {cache_key_prefix}")
                 return cached_result['data']
@@ -336,10 +464,10 @@ def cached_llm_call(cache_key_prefix: str, expire_time: int = 3600):
             # 缓存未命中，调用原函数
             try:
                 result = func(*args, **kwargs)
-                # 仅缓存成功结果：跳过包含错误字段或错误类别的结果
+                # 仅缓存成功结果：跳过包含错误字段、错误类别或降级生成的结果
                 should_cache = True
                 if isinstance(result, dict):
-                    if result.get('error') or result.get('category') == 'error':
+                    if result.get('error') or result.get('category') == 'error' or result.get('fallback'):
                         should_cache = False
                 if should_cache:
                     cache_service.cache_result(cache_key, result, expire_time)
@@ -354,25 +482,26 @@ def cached_llm_call(cache_key_prefix: str, expire_time: int = 3600):
     return decorator
 
 
-def cached_retrieval_call(cache_key_prefix: str, expire_time: int = 1800):
+def cached_retrieval_call(cache_key_prefix: str, expire_time: int = 1800, version: CacheVersion = None,
+                          text_args: Iterable[str] = ()):
     """
     检索调用缓存装饰器
 
     Args:
         cache_key_prefix: 缓存键前缀
         expire_time: 过期时间（秒），默认30分钟
+        version: 缓存版本
+        text_args: 作为查询文本、忽略空白和大小写差异的参数名
     """
     def decorator(func):
+        @wraps(func)
         def wrapper(*args, **kwargs):
             # 生成缓存键
-            cache_key = cache_service.generate_cache_key(
-                cache_key_prefix,
-                *args,
-                *[f"{k}={v}" for k, v in sorted(kwargs.items())]
-            )
+            cache_key = build_cache_key(cache_key_prefix, func, args, kwargs, version, text_args)
 
             # 尝试从缓存获取结果
             cached_result = cache_service.get_cached_result(cache_key)
+            cache_service.record_lookup(cache_key_prefix, bool(cached_result and 'data' in cached_result))
             if cached_result and 'data' in cached_result:
                 logger.debug(f"使用缓存检索结果: {cache_key_prefix}")
                 return cached_result['data']
@@ -0,0 +1,437 @@
+"""
+分片上传服务
+
+大文件（厂商手册、日志压缩包）按固定大小分片上传：创建会话后客户端可并发、乱序地
+PUT各个分片，断线后查询会话状态只重传缺失的分片，全部到齐后完成上传。
+
+每个分片先写入私有的临时文件，再以硬链接原子地占用该分片的文件名：同一分片并发上传时
+只有一个请求占用成功，其余请求只与已占用的分片比较内容，不会改写已写入的数据。
+整体SHA-256随分片到达沿连续前缀滚动计算；分片乱序到达或服务重启导致滚动状态丢失时，
+完成上传时只需从分片文件补算剩余部分，随后按顺序拼接为最终文件。
+"""
+
+import hashlib
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.files import UploadSession, UploadPart
+from app.utils.file_hash import STREAM_CHUNK_SIZE, hash_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+MAX_CHUNK_SIZE = 32 * 1024 * 1024  # 32MB
+MAX_PARTS = 10000
+DEFAULT_MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+DEFAULT_SESSION_TTL = 24 * 3600  # 24小时
+
+
+class ChunkedUploadError(ValueError):
+    """分片上传请求无效，error_type和status_code直接映射为API错误响应"""
+
+    def __init__(self, message: str, error_type: str = 'INVALID_REQUEST',
+                 status_code: int = 400, details: Optional[dict] = None):
+        super().__init__(message)
+        self.message = message
+        self.error_type = error_type
+        self.status_code = status_code
+        self.details = details
+
+
+class _RunningHash:
+    """沿已接收分片的连续前缀滚动计算的SHA-256"""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.next_part = 1
+        self.lock = threading.Lock()
+
+
+class ChunkedUploadService:
+    """分片上传会话管理"""
+
+    def __init__(self):
+        self._running_hashes: Dict[str, _RunningHash] = {}
+        self._registry_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 配置
+    # ------------------------------------------------------------------
+
+    def _max_chunk_size(self) -> int:
+        limit = current_app.config.get('CHUNKED_UPLOAD_MAX_CHUNK_SIZE', MAX_CHUNK_SIZE)
+        # 单个分片必须能通过请求体大小限制
+        max_content_length = current_app.config.get('MAX_CONTENT_LENGTH')
+        if max_content_length:
+            limit = min(limit, max_content_length)
+        return limit
+
+    def _partial_folder(self) -> str:
+        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+        folder = os.path.join(upload_folder, '.partial')
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    # ------------------------------------------------------------------
+    # 会话生命周期
+    # ------------------------------------------------------------------
+
+    def create_session(self, user_id: str, filename: str, total_size: int,
+                       purpose: str = 'attachment', chunk_size: Optional[int] = None,
+                       mime_type: Optional[str] = None, expected_sha256: Optional[str] = None,
+                       form_fields: Optional[dict] = None) -> UploadSession:
+        """
+        创建上传会话及存放分片的临时目录
+
+        Args:
+            user_id: 用户ID
+            filename: 经过secure_filename处理的原始文件名
+            total_size: 文件总字节数
+            purpose: attachment 或 knowledge
+            chunk_size: 分片大小，缺省使用配置值
+            mime_type: 文件MIME类型
+            expected_sha256: 客户端声明的整体SHA-256，完成上传时校验
+            form_fields: 完成上传时传给创建路径的表单字段
+
+        Returns:
+            UploadSession: 新建的会话
+        """
+        self.cleanup_expired_sessions()
+
+        max_size = current_app.config.get('CHUNKED_UPLOAD_MAX_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+        if total_size <= 0:
+            raise ChunkedUploadError('文件大小必须大于0')
+        if total_size > max_size:
+            raise ChunkedUploadError(
+                f'文件大小超过限制，最大允许 {max_size // 1024 // 1024}MB',
+                error_type='UNPROCESSABLE_ENTITY', status_code=422
+            )
+
+        chunk_size = chunk_size or current_app.config.get('CHUNKED_UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        max_chunk_size = self._max_chunk_size()
+        if chunk_size <= 0 or chunk_size > max_chunk_size:
+            raise ChunkedUploadError(f'分片大小必须在 1 到 {max_chunk_size} 字节之间')
+
+        total_parts = math.ceil(total_size / chunk_size)
+        if total_parts > MAX_PARTS:
+            raise ChunkedUploadError(f'分片数量超过限制（{MAX_PARTS}），请增大分片大小')
+
+        if expected_sha256 is not None:
+            expected_sha256 = expected_sha256.lower()
+            if len(expected_sha256) != 64 or any(c not in '0123456789abcdef' for c in expected_sha256):
+                raise ChunkedUploadError('sha256格式无效')
+
+        ttl = current_app.config.get('CHUNKED_UPLOAD_SESSION_TTL', DEFAULT_SESSION_TTL)
+        session = UploadSession(
+            user_id=user_id,
+            purpose=purpose,
+            original_filename=filename,
+            mime_type=mime_type,
+            total_size=total_size,
+            chunk_size=chunk_size,
+            total_parts=total_parts,
+            expected_sha256=expected_sha256,
+            form_fields=form_fields or {},
+            temp_path='',
+            expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+        )
+        db.session.add(session)
+        db.session.flush()
+
+        # 未完成的会话 temp_path 为分片目录，每个分片一个文件
+        session.temp_path = os.path.join(self._partial_folder(), session.id)
+        os.makedirs(session.temp_path, exist_ok=True)
+
+        db.session.commit()
+        logger.info(f"创建分片上传会话: upload_id={session.id}, size={total_size}, parts={total_parts}")
+        return session
+
+    def get_session(self, upload_id: str, user_id: str) -> UploadSession:
+        """获取当前用户的上传会话"""
+        session = db.session.get(UploadSession, upload_id)
+        if session is None or session.user_id != user_id:
+            raise ChunkedUploadError('上传会话不存在', error_type='NOT_FOUND', status_code=404)
+        return session
+
+    def _require_active(self, session: UploadSession):
+        if session.status != 'active':
+            raise ChunkedUploadError(f'上传会话已{session.status}', error_type='CONFLICT', status_code=409)
+        if session.expires_at < datetime.utcnow():
+            raise ChunkedUploadError('上传会话已过期', error_type='GONE', status_code=410)
+
+    def part_range(self, session: UploadSession, part_number: int) -> Tuple[int, int]:
+        """分片的起始偏移和期望大小"""
+        offset = (part_number - 1) * session.chunk_size
+        return offset, min(session.chunk_size, session.total_size - offset)
+
+    def part_path(self, session: UploadSession, part_number: int) -> str:
+        """分片文件路径"""
+        return os.path.join(session.temp_path, f'{part_number:05d}.part')
+
+    # ------------------------------------------------------------------
+    # 分片写入
+    # ------------------------------------------------------------------
+
+    def write_part(self, session: UploadSession, part_number: int, stream: BinaryIO,
+                   part_sha256: Optional[str] = None) -> UploadPart:
+        """
+        写入一个分片
+
+        分片先写入私有临时文件并校验，再以硬链接原子地占用分片文件名。同一分片可重复上传
+        （断线重传、并发重试），内容与已接收的分片一致时视为成功；内容不一致时拒绝，
+        已接收的分片不会被改写。
+
+        Args:
+            session: 上传会话
+            part_number: 分片序号，从1开始
+            stream: 分片数据流
+            part_sha256: 客户端提供的分片SHA-256，用于校验传输完整性
+
+        Returns:
+            UploadPart: 分片记录
+        """
+        self._require_active(session)
+        if part_number < 1 or part_number > session.total_parts:
+            raise ChunkedUploadError(f'分片序号必须在 1 到 {session.total_parts} 之间')
+
+        _, expected_size = self.part_range(session, part_number)
+        existing = UploadPart.query.filter_by(session_id=session.id, part_number=part_number).first()
+
+        # 当前分片正好接在滚动哈希之后时，边写边把数据喂给整体哈希的副本
+        state = self._get_running_hash(session.id)
+        with state.lock:
+            candidate = state.sha256.copy() if state.next_part == part_number and existing is None else None
+
+        part_hash = hashlib.sha256()
+        staging_path = None
+        try:
+            if existing is None:
+                fd, staging_path = tempfile.mkstemp(dir=session.temp_path, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    size = self._copy_part(stream, expected_size, part_hash, candidate, f)
+            else:
+                size = self._copy_part(stream, expected_size, part_hash, None, None)
+
+            if size != expected_size:
+                raise ChunkedUploadError(f'分片大小不正确，期望 {expected_size} 字节，实际 {size} 字节')
+
+            digest = part_hash.hexdigest()
+            if part_sha256 and part_sha256.lower() != digest:
+                raise ChunkedUploadError('分片校验失败，请重新上传', error_type='CHECKSUM_MISMATCH')
+
+            if existing is not None:
+                if existing.sha256 != digest:
+                    raise ChunkedUploadError('分片已上传且内容不一致', error_type='CONFLICT', status_code=409)
+                return existing
+
+            claimed = self._claim_part_file(session, part_number, staging_path, digest)
+        finally:
+            if staging_path and os.path.exists(staging_path):
+                os.remove(staging_path)
+
+        part = UploadPart(session_id=session.id, part_number=part_number, size=size, sha256=digest)
+        db.session.add(part)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 并发重传同一分片，另一个请求已记录（分片文件内容已确认一致）
+            db.session.rollback()
+            part = UploadPart.query.filter_by(session_id=session.id, part_number=part_number).first()
+            if part is None or part.sha256 != digest:
+                raise ChunkedUploadError('分片已上传且内容不一致', error_type='CONFLICT', status_code=409)
+            return part
+
+        if claimed:
+            self._advance_running_hash(session, state, part_number, candidate)
+        return part
+
+    def _claim_part_file(self, session: UploadSession, part_number: int, staging_path: str, digest: str) -> bool:
+        """
+        以硬链接原子地占用分片文件名
+
+        Returns:
+            bool: 是否由本次请求占用；分片文件已存在且内容一致时返回False
+
+        Raises:
+            ChunkedUploadError: 分片文件已存在且内容不一致
+        """
+        try:
+            os.link(staging_path, self.part_path(session, part_number))
+            return True
+        except FileExistsError:
+            if hash_file(self.part_path(session, part_number)) != digest:
+                raise ChunkedUploadError('分片已上传且内容不一致', error_type='CONFLICT', status_code=409)
+            return False
+
+    def _copy_part(self, stream: BinaryIO, expected_size: int, part_hash, candidate, target) -> int:
+        """读取分片数据流，超过期望大小即停止"""
+        size = 0
+        while True:
+            chunk = stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > expected_size:
+                return size
+            part_hash.update(chunk)
+            if candidate is not None:
+                candidate.update(chunk)
+            if target is not None:
+                target.write(chunk)
+        return size
+
+    # ------------------------------------------------------------------
+    # 滚动哈希
+    # ------------------------------------------------------------------
+
+    def _get_running_hash(self, upload_id: str) -> _RunningHash:
+        with self._registry_lock:
+            state = self._running_hashes.get(upload_id)
+            if state is None:
+                state = _RunningHash()
+                self._running_hashes[upload_id] = state
+            return state
+
+    def _discard_running_hash(self, upload_id: str):
+        with self._registry_lock:
+            self._running_hashes.pop(upload_id, None)
+
+    def _advance_running_hash(self, session: UploadSession, state: _RunningHash,
+                              part_number: int, candidate):
+        """提交刚写入分片的哈希副本，并吸收其后已乱序到达的连续分片"""
+        with state.lock:
+            if candidate is None or state.next_part != part_number:
+                return
+            state.sha256 = candidate
+            state.next_part += 1
+
+            received = {
+                row.part_number for row in UploadPart.query.with_entities(UploadPart.part_number)
+                .filter(UploadPart.session_id == session.id, UploadPart.part_number >= state.next_part)
+            }
+            self._hash_parts_from_disk(session, state, received)
+
+    def _hash_parts_from_disk(self, session: UploadSession, state: _RunningHash, received: set):
+        """从分片文件读取连续的已接收分片，推进滚动哈希（调用方持有state.lock）"""
+        while state.next_part in received:
+            with open(self.part_path(session, state.next_part), 'rb') as f:
+                while True:
+                    chunk = f.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    state.sha256.update(chunk)
+            state.next_part += 1
+
+    # ------------------------------------------------------------------
+    # 完成与取消
+    # ------------------------------------------------------------------
+
+    def complete_session(self, session: UploadSession, final_path: str) -> str:
+        """
+        校验分片完整性，计算整体SHA-256并将分片按顺序拼接到最终位置
+
+        Args:
+            session: 上传会话
+            final_path: 组装后文件的目标路径
+
+        Returns:
+            str: 十六进制SHA-256
+        """
+        self._require_active(session)
+
+        received = {part.part_number for part in session.parts}
+        if len(received) != session.total_parts:
+            missing = [n for n in range(1, session.total_parts + 1) if n not in received]
+            raise ChunkedUploadError(
+                '仍有分片未上传', error_type='CONFLICT', status_code=409,
+                details={'missingParts': missing}
+            )
+
+        state = self._get_running_hash(session.id)
+        with state.lock:
+            # 滚动状态落后（乱序到达、多进程或重启）时只补算剩余分片
+            self._hash_parts_from_disk(session, state, received)
+            content_hash = state.sha256.hexdigest()
+
+        if session.expected_sha256 and session.expected_sha256 != content_hash:
+            raise ChunkedUploadError(
+                '文件校验失败，整体SHA-256不一致', error_type='CHECKSUM_MISMATCH',
+                details={'expected': session.expected_sha256, 'actual': content_hash}
+            )
+
+        self._assemble(session, final_path)
+        self._discard_running_hash(session.id)
+
+        session.status = 'completed'
+        session.content_hash = content_hash
+        session.temp_path = final_path
+        db.session.flush()
+        logger.info(f"分片上传完成: upload_id={session.id}, sha256={content_hash}")
+        return content_hash
+
+    def _assemble(self, session: UploadSession, final_path: str):
+        """按顺序拼接分片文件，写完后原子替换到最终位置并删除分片目录"""
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                for part_number in range(1, session.total_parts + 1):
+                    with open(self.part_path(session, part_number), 'rb') as source:
+                        shutil.copyfileobj(source, target, STREAM_CHUNK_SIZE)
+            os.replace(tmp_path, final_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        shutil.rmtree(session.temp_path, ignore_errors=True)
+
+    def abort_session(self, session: UploadSession):
+        """取消上传会话并删除临时文件"""
+        if session.status == 'completed':
+            raise ChunkedUploadError('上传会话已完成，无法取消', error_type='CONFLICT', status_code=409)
+        self._discard_session_data(session)
+        session.status = 'aborted'
+        db.session.commit()
+
+    def _discard_session_data(self, session: UploadSession):
+        self._discard_running_hash(session.id)
+        try:
+            if session.temp_path and os.path.isdir(session.temp_path):
+                shutil.rmtree(session.temp_path)
+            elif session.temp_path and os.path.exists(session.temp_path):
+                os.remove(session.temp_path)
+        except OSError as e:
+            logger.warning(f"删除分片临时文件失败: {session.temp_path}, {str(e)}")
+        UploadPart.query.filter_by(session_id=session.id).delete()
+
+    def cleanup_expired_sessions(self) -> int:
+        """清理过期未完成的会话，返回清理数量"""
+        expired = UploadSession.query.filter(
+            UploadSession.status == 'active',
+            UploadSession.expires_at < datetime.utcnow()
+        ).all()
+        for session in expired:
+            self._discard_session_data(session)
+            session.status = 'aborted'
+        if expired:
+            db.session.commit()
+            logger.info(f"清理过期分片上传会话: {len(expired)} 个")
+        return len(expired)
+
+
+chunked_upload_service = ChunkedUploadService()
+
+
+def get_chunked_upload_service() -> ChunkedUploadService:
+    """获取分片上传服务实例"""
+    return chunked_upload_service
@@ -1,16 +1,27 @@
 """
 本地文件向量数据库实现
 使用JSON文件存储向量数据，支持基本的CRUD和相似度搜索
+
+多个进程可以共享同一个存储目录：增删在目录锁文件的排他锁下进行，先加载其他进程的最新修改
+再写入，每个文件先写临时文件再原子替换；重新加载时持有共享锁，不会读到写了一半的数据。
 """
 import os
 import json
 import pickle
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import numpy as np
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只保证进程内的互斥
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,13 +42,86 @@ class LocalFileVectorDB:
         self.metadata_file = self.storage_path / "metadata.json"
         self.vectors_file = self.storage_path / "vectors.pkl"
         self.index_file = self.storage_path / "index.json"
+        self.lock_file = self.storage_path / ".lock"
+
+        # 进程内的线程互斥及当前线程持有的排他文件锁（可重入）
+        self._mutex = threading.RLock()
+        self._lock_handle = None
+        self._lock_depth = 0
 
         # 内存中的数据
+        self._loaded_version = None
+        with self._file_lock(exclusive=False):
+            self._reload()
+
+        logger.info(f"LocalFileVectorDB initialized at {self.storage_path}")
+
+    def _index_version(self) -> Optional[Tuple[int, int, int]]:
+        """索引文件的版本（修改时间、inode、大小），原子替换后 inode 必然变化"""
+        try:
+            stat = self.index_file.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino, stat.st_size
+
+    def _reload(self):
         self.metadata = self._load_metadata()
         self.vectors = self._load_vectors()
         self.index = self._load_index()
+        self._loaded_version = self._index_version()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """持有存储目录的文件锁；当前线程已持有排他锁时直接复用"""
+        with self._mutex:
+            if self._lock_depth:
+                yield
+                return
+            handle = open(self.lock_file, 'a+')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield
+            finally:
+                handle.close()  # 关闭文件即释放锁
+
+    @contextmanager
+    def transaction(self):
+        """
+        跨进程写事务
 
-        logger.info(f"LocalFileVectorDB initialized at {self.storage_path}")
+        持有排他锁并先加载其他进程的最新修改，事务内的查询和多次增删基于同一份数据，
+        不会覆盖其他进程在此期间写入的条目。add_document / delete_document / clear_all
+        自动在事务中执行，需要先查询再修改时由调用方显式开启。
+        """
+        with self._mutex:
+            if self._lock_depth == 0:
+                self._lock_handle = open(self.lock_file, 'a+')
+                if fcntl is not None:
+                    fcntl.flock(self._lock_handle, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1 and self._index_version() != self._loaded_version:
+                    self._reload()
+                yield self
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._lock_handle.close()
+                    self._lock_handle = None
+
+    def refresh(self) -> bool:
+        """
+        索引文件被其他进程修改（或删除）后重新加载
+
+        Returns:
+            是否重新加载
+        """
+        if self._index_version() == self._loaded_version:
+            return False
+        with self._file_lock(exclusive=False):
+            self._reload()
+        return True
 
     def _load_metadata(self) -> Dict[str, Any]:
         """加载元数据"""
@@ -75,21 +159,32 @@ class LocalFileVectorDB:
                 logger.error(f"Error loading index: {e}")
         return {}
 
+    def _write_atomic(self, path: Path, data: bytes):
+        """先写临时文件再原子替换，读者不会看到半个文件"""
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.storage_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     def _save_metadata(self):
         """保存元数据"""
         self.metadata["last_updated"] = datetime.now().isoformat()
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        self._write_atomic(self.metadata_file,
+                           json.dumps(self.metadata, ensure_ascii=False, indent=2).encode('utf-8'))
 
     def _save_vectors(self):
         """保存向量数据"""
-        with open(self.vectors_file, 'wb') as f:
-            pickle.dump(self.vectors, f)
+        self._write_atomic(self.vectors_file, pickle.dumps(self.vectors))
 
     def _save_index(self):
-        """保存索引数据"""
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        """保存索引数据（最后写入，其他进程据此判断是否需要重新加载）"""
+        self._write_atomic(self.index_file, json.dumps(self.index, ensure_ascii=False, indent=2).encode('utf-8'))
+        self._loaded_version = self._index_version()
 
     def add_document(self, document_id: str, chunks: List[Dict[str, Any]],
                     vectors: List[List[float]]) -> List[str]:
@@ -107,6 +202,11 @@ class LocalFileVectorDB:
         if len(chunks) != len(vectors):
             raise ValueError("Chunks and vectors must have the same length")
 
+        with self.transaction():
+            return self._add_document(document_id, chunks, vectors)
+
+    def _add_document(self, document_id: str, chunks: List[Dict[str, Any]],
+                      vectors: List[List[float]]) -> List[str]:
         vector_ids = []
 
         for i, (chunk, vector) in enumerate(zip(chunks, vectors)):
@@ -148,6 +248,10 @@ class LocalFileVectorDB:
         Returns:
             删除是否成功
         """
+        with self.transaction():
+            return self._delete_document(document_id)
+
+    def _delete_document(self, document_id: str) -> bool:
         try:
             # 找到所有相关的向量ID
             vector_ids_to_delete = [
@@ -181,7 +285,8 @@ class LocalFileVectorDB:
             return False
 
     def search_similar(self, query_vector: List[float], top_k: int = 5,
-                      document_id: Optional[str] = None) -> List[Dict[str, Any]]:
+                      document_id: Optional[str] = None,
+                      predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
         """
         搜索相似向量
 
@@ -189,6 +294,7 @@ class LocalFileVectorDB:
             query_vector: 查询向量
             top_k: 返回的结果数量
             document_id: 可选，限制在特定文档内搜索
+            predicate: 可选，按索引条目（document_id、content、metadata）过滤，在截取 top_k 之前执行
 
         Returns:
             相似结果列表，每个结果包含向量ID、相似度分数和元数据
@@ -203,6 +309,8 @@ class LocalFileVectorDB:
             # 如果指定了文档ID，只搜索该文档的向量
             if document_id and self.index[vector_id].get("document_id") != document_id:
                 continue
+            if predicate is not None and not predicate(self.index[vector_id]):
+                continue
 
             # 计算余弦相似度
             doc_vec = np.array(vector)
@@ -245,6 +353,10 @@ class LocalFileVectorDB:
 
     def clear_all(self):
         """清空所有数据"""
+        with self.transaction():
+            self._clear_all()
+
+    def _clear_all(self):
         self.vectors = {}
         self.index = {}
         self.metadata = {
@@ -259,5 +371,6 @@ class LocalFileVectorDB:
         for file_path in [self.metadata_file, self.vectors_file, self.index_file]:
             if file_path.exists():
                 file_path.unlink()
+        self._loaded_version = None
 
         logger.info("Cleared all vector data")
@@ -6,6 +6,8 @@ from typing import List, Dict, Any, Optional
 import weaviate
 import uuid
 
+from app.utils.circuit_breaker import get_breaker
+
 logger = logging.getLogger(__name__)
 
 
@@ -116,6 +118,7 @@ class WeaviateVectorDB:
         self.config = config
         self.class_name = config.get('class_name', 'Document')
         self.client = None
+        self.breaker = get_breaker('weaviate')
         self._initialize_client()
 
     def _initialize_client(self):
@@ -485,51 +488,29 @@ class WeaviateVectorDB:
             List[str]: 向量ID列表
         """
         try:
-            # 验证向量维度
-            if vectors:
-                vector_dim = len(vectors[0])
-                # 检查现有集合的向量维度
-                existing_dim = self._get_collection_vector_dimension()
-                if existing_dim and existing_dim != vector_dim:
-                    logger.warning(f"⚠️ 向量维度不匹配：现有{existing_dim}维 vs 新增{vector_dim}维")
-                    logger.warning(f"⚠️ 将重新创建集合以适应新维度，现有数据将被清除！")
-                    # 重新创建集合以适应新维度
-                    self._recreate_collection_with_new_dimension(vector_dim)
-                    logger.info(f"✅ 已重新创建集合以支持{vector_dim}维向量")
+            # Weaviate 不可用时熔断，直接走失败分支而不是等满超时
+            with self.breaker.protect():
+                # 验证向量维度
+                if vectors:
+                    vector_dim = len(vectors[0])
+                    # 检查现有集合的向量维度
+                    existing_dim = self._get_collection_vector_dimension()
+                    if existing_dim and existing_dim != vector_dim:
+                        logger.warning(f"⚠️ 向量维度不匹配：现有{existing_dim}维 vs 新增{vector_dim}维")
+                        logger.warning(f"⚠️ 将重新创建集合以适应新维度，现有数据将被清除！")
+                        # 重新创建集合以适应新维度
+                        self._recreate_collection_with_new_dimension(vector_dim)
+                        logger.info(f"✅ 已重新创建集合以支持{vector_dim}维向量")
                     
-            vector_ids = []
+                vector_ids = []
 
-            # 检查使用的客户端版本
-            if hasattr(self.client, 'collections'):
-                # v4 客户端
-                collection = self.client.collections.get(self.class_name)
-
-                for i, (chunk, vector) in enumerate(zip(chunks, vectors)):
-                    # 生成UUID
-                    vector_id = str(uuid.uuid4())
-                    properties = {
-                        "content": chunk.get("content", ""),
-                        "title": chunk.get("title", ""),
-                        "source": chunk.get("source", ""),
-                        "doc_type": chunk.get("doc_type", ""),
-                        "chunk_index": chunk.get("chunk_index", i),
-                        "document_id": document_id
-                    }
-
-                    # 插入数据
-                    collection.data.insert(
-                        uuid=vector_id,
-                        properties=properties,
-                        vector=vector
-                    )
-                    vector_ids.append(vector_id)
-            else:
-                # v3 客户端
-                with self.client.batch as batch:
-                    batch.batch_size = 100
+                # 检查使用的客户端版本
+                if hasattr(self.client, 'collections'):
+                    # v4 客户端
+                    collection = self.client.collections.get(self.class_name)
 
                     for i, (chunk, vector) in enumerate(zip(chunks, vectors)):
-                        # 生成有效的UUID
+                        # 生成UUID
                         vector_id = str(uuid.uuid4())
                         properties = {
                             "content": chunk.get("content", ""),
@@ -540,16 +521,40 @@ class WeaviateVectorDB:
                             "document_id": document_id
                         }
 
-                        batch.add_data_object(
-                            data_object=properties,
-                            class_name=self.class_name,
-                            vector=vector,
-                            uuid=vector_id
+                        # 插入数据
+                        collection.data.insert(
+                            uuid=vector_id,
+                            properties=properties,
+                            vector=vector
                         )
                         vector_ids.append(vector_id)
+                else:
+                    # v3 客户端
+                    with self.client.batch as batch:
+                        batch.batch_size = 100
+
+                        for i, (chunk, vector) in enumerate(zip(chunks, vectors)):
+                            # 生成有效的UUID
+                            vector_id = str(uuid.uuid4())
+                            properties = {
+                                "content": chunk.get("content", ""),
+                                "title": chunk.get("title", ""),
+                                "source": chunk.get("source", ""),
+                                "doc_type": chunk.get("doc_type", ""),
+                                "chunk_index": chunk.get("chunk_index", i),
+                                "document_id": document_id
+                            }
+
+                            batch.add_data_object(
+                                data_object=properties,
+                                class_name=self.class_name,
+                                vector=vector,
+                                uuid=vector_id
+                            )
+                            vector_ids.append(vector_id)
 
-            logger.info(f"成功添加文档 {document_id} 的 {len(chunks)} 个分块")
-            return vector_ids
+                logger.info(f"成功添加文档 {document_id} 的 {len(chunks)} 个分块")
+                return vector_ids
 
         except Exception as e:
             logger.error(f"添加文档失败: {e}")
@@ -570,82 +575,84 @@ class WeaviateVectorDB:
             List[Dict]: 搜索结果
         """
         try:
-            results = []
-
-            # 检查使用的客户端版本
-            if hasattr(self.client, 'collections'):
-                # v4 客户端
-                collection = self.client.collections.get(self.class_name)
+            # Weaviate 不可用时熔断，直接走失败分支而不是等满超时
+            with self.breaker.protect():
+                results = []
 
-                # 构建查询
-                query_builder = collection.query.near_vector(
-                    near_vector=query_vector,
-                    limit=top_k,
-                    return_metadata=["score", "distance"]
-                )
+                # 检查使用的客户端版本
+                if hasattr(self.client, 'collections'):
+                    # v4 客户端
+                    collection = self.client.collections.get(self.class_name)
 
-                # 应用文档ID过滤
-                if document_id:
-                    from weaviate.classes.query import Filter
+                    # 构建查询
                     query_builder = collection.query.near_vector(
                         near_vector=query_vector,
                         limit=top_k,
-                        where=Filter.by_property("document_id").equal(document_id),
                         return_metadata=["score", "distance"]
                     )
 
-                response = query_builder
-
-                # 处理结果
-                for obj in response.objects:
-                    result = {
-                        "content": obj.properties.get("content", ""),
-                        "title": obj.properties.get("title", ""),
-                        "source": obj.properties.get("source", ""),
-                        "doc_type": obj.properties.get("doc_type", ""),
-                        "chunk_index": obj.properties.get("chunk_index", 0),
-                        "document_id": obj.properties.get("document_id", ""),
-                        "score": getattr(obj.metadata, 'score', 0) if obj.metadata else 0,
-                        "distance": getattr(obj.metadata, 'distance', 0) if obj.metadata else 0
-                    }
-                    results.append(result)
-
-            else:
-                # v3 客户端
-                query_builder = (
-                    self.client.query
-                    .get(self.class_name, ["content", "title", "source", "doc_type", "chunk_index", "document_id"])
-                    .with_near_vector({"vector": query_vector})
-                    .with_limit(top_k)
-                    .with_additional(["score", "distance"])
-                )
-
-                # 应用文档ID过滤
-                if document_id:
-                    query_builder = query_builder.with_where({
-                        "path": ["document_id"],
-                        "operator": "Equal",
-                        "valueText": document_id
-                    })
+                    # 应用文档ID过滤
+                    if document_id:
+                        from weaviate.classes.query import Filter
+                        query_builder = collection.query.near_vector(
+                            near_vector=query_vector,
+                            limit=top_k,
+                            where=Filter.by_property("document_id").equal(document_id),
+                            return_metadata=["score", "distance"]
+                        )
 
-                response = query_builder.do()
+                    response = query_builder
 
-                if 'data' in response and 'Get' in response['data'] and self.class_name in response['data']['Get']:
-                    for obj in response['data']['Get'][self.class_name]:
+                    # 处理结果
+                    for obj in response.objects:
                         result = {
-                            "content": obj.get("content", ""),
-                            "title": obj.get("title", ""),
-                            "source": obj.get("source", ""),
-                            "doc_type": obj.get("doc_type", ""),
-                            "chunk_index": obj.get("chunk_index", 0),
-                            "document_id": obj.get("document_id", ""),
-                            "score": obj.get("_additional", {}).get("score", 0),
-                            "distance": obj.get("_additional", {}).get("distance", 0)
+                            "content": obj.properties.get("content", ""),
+                            "title": obj.properties.get("title", ""),
+                            "source": obj.properties.get("source", ""),
+                            "doc_type": obj.properties.get("doc_type", ""),
+                            "chunk_index": obj.properties.get("chunk_index", 0),
+                            "document_id": obj.properties.get("document_id", ""),
+                            "score": getattr(obj.metadata, 'score', 0) if obj.metadata else 0,
+                            "distance": getattr(obj.metadata, 'distance', 0) if obj.metadata else 0
                         }
                         results.append(result)
 
-            logger.info(f"搜索返回 {len(results)} 个结果")
-            return results
+                else:
+                    # v3 客户端
+                    query_builder = (
+                        self.client.query
+                        .get(self.class_name, ["content", "title", "source", "doc_type", "chunk_index", "document_id"])
+                        .with_near_vector({"vector": query_vector})
+                        .with_limit(top_k)
+                        .with_additional(["score", "distance"])
+                    )
+
+                    # 应用文档ID过滤
+                    if document_id:
+                        query_builder = query_builder.with_where({
+                            "path": ["document_id"],
+                            "operator": "Equal",
+                            "valueText": document_id
+                        })
+
+                    response = query_builder.do()
+
+                    if 'data' in response and 'Get' in response['data'] and self.class_name in response['data']['Get']:
+                        for obj in response['data']['Get'][self.class_name]:
+                            result = {
+                                "content": obj.get("content", ""),
+                                "title": obj.get("title", ""),
+                                "source": obj.get("source", ""),
+                                "doc_type": obj.get("doc_type", ""),
+                                "chunk_index": obj.get("chunk_index", 0),
+                                "document_id": obj.get("document_id", ""),
+                                "score": obj.get("_additional", {}).get("score", 0),
+                                "distance": obj.get("_additional", {}).get("distance", 0)
+                            }
+                            results.append(result)
+
+                logger.info(f"搜索返回 {len(results)} 个结果")
+                return results
 
         except Exception as e:
             logger.error(f"搜索失败: {e}")
@@ -662,51 +669,53 @@ class WeaviateVectorDB:
             bool: 是否成功
         """
         try:
-            # 检查使用的客户端版本
-            if hasattr(self.client, 'collections'):
-                # v4 客户端
-                collection = self.client.collections.get(self.class_name)
-
-                # 删除所有匹配的对象
-                from weaviate.classes.query import Filter
-                result = collection.data.delete_many(
-                    where=Filter.by_property("document_id").equal(document_id)
-                )
-
-                deleted_count = result.matches if hasattr(result, 'matches') else 0
-                logger.info(f"成功删除文档 {document_id} 的 {deleted_count} 个分块")
-                return True
-
-            else:
-                # v3 客户端
-                query_result = (
-                    self.client.query
-                    .get(self.class_name, ["document_id"])
-                    .with_where({
-                        "path": ["document_id"],
-                        "operator": "Equal",
-                        "valueText": document_id
-                    })
-                    .with_additional(["id"])
-                    .do()
-                )
+            # Weaviate 不可用时熔断，直接走失败分支而不是等满超时
+            with self.breaker.protect():
+                # 检查使用的客户端版本
+                if hasattr(self.client, 'collections'):
+                    # v4 客户端
+                    collection = self.client.collections.get(self.class_name)
 
-                # 删除找到的所有对象
-                if 'data' in query_result and 'Get' in query_result['data'] and self.class_name in query_result['data']['Get']:
-                    objects = query_result['data']['Get'][self.class_name]
-                    for obj in objects:
-                        obj_id = obj.get('_additional', {}).get('id')
-                        if obj_id:
-                            self.client.data_object.delete(
-                                uuid=obj_id,
-                                class_name=self.class_name
-                            )
+                    # 删除所有匹配的对象
+                    from weaviate.classes.query import Filter
+                    result = collection.data.delete_many(
+                        where=Filter.by_property("document_id").equal(document_id)
+                    )
 
-                    logger.info(f"成功删除文档 {document_id} 的 {len(objects)} 个分块")
+                    deleted_count = result.matches if hasattr(result, 'matches') else 0
+                    logger.info(f"成功删除文档 {document_id} 的 {deleted_count} 个分块")
                     return True
+
                 else:
-                    logger.warning(f"未找到文档 {document_id} 的分块")
-                    return True
+                    # v3 客户端
+                    query_result = (
+                        self.client.query
+                        .get(self.class_name, ["document_id"])
+                        .with_where({
+                            "path": ["document_id"],
+                            "operator": "Equal",
+                            "valueText": document_id
+                        })
+                        .with_additional(["id"])
+                        .do()
+                    )
+
+                    # 删除找到的所有对象
+                    if 'data' in query_result and 'Get' in query_result['data'] and self.class_name in query_result['data']['Get']:
+                        objects = query_result['data']['Get'][self.class_name]
+                        for obj in objects:
+                            obj_id = obj.get('_additional', {}).get('id')
+                            if obj_id:
+                                self.client.data_object.delete(
+                                    uuid=obj_id,
+                                    class_name=self.class_name
+                                )
+
+                        logger.info(f"成功删除文档 {document_id} 的 {len(objects)} 个分块")
+                        return True
+                    else:
+                        logger.warning(f"未找到文档 {document_id} 的分块")
+                        return True
 
         except Exception as e:
             logger.error(f"删除文档失败: {e}")
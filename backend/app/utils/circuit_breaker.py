@@ -0,0 +1,284 @@
+"""
+外部依赖熔断器
+
+DashScope（大模型、向量化）、阿里云文档智能（DocMind）和 Weaviate 变慢或不可用时，
+每次调用都要等满超时（大模型60秒），等待中的调用占满请求线程和任务线程池，整个系统随之停滞。
+熔断器包裹每个外部依赖的调用：
+
+- 按滚动窗口统计最近的调用：失败率或慢调用比例超过阈值时熔断（open），之后的调用立即抛出
+  CircuitOpenError，由调用方走已有的降级逻辑（Mock回复、零向量、空检索结果等）
+- 熔断持续 open_seconds 后进入半开（half_open），放行少量探测调用：探测成功则恢复（closed），
+  失败则重新熔断
+- 每个依赖限制同时进行的调用数（舱壁），超出时立即拒绝，一个慢依赖不会占满全部线程
+- 只有 Exception 计为失败；任务取消（TaskCancelled 等 BaseException）只释放名额，不计入统计
+- 每次调用在放行时记录所处的状态阶段，熔断前发起、之后才结束的调用不影响新阶段的判断，
+  半开状态只由放行的探测调用决定恢复或重新熔断
+
+参数通过环境变量配置（调用可能发生在应用上下文之外）：CIRCUIT_BREAKER_WINDOW、CIRCUIT_BREAKER_MIN_CALLS、
+CIRCUIT_BREAKER_FAILURE_RATE、CIRCUIT_BREAKER_SLOW_RATE、CIRCUIT_BREAKER_OPEN_SECONDS 对所有依赖生效；
+CIRCUIT_BREAKER_<依赖>_SLOW_SECONDS、CIRCUIT_BREAKER_<依赖>_MAX_CONCURRENT 按依赖类别设置
+（类别为熔断器名称中冒号之前的部分，如 llm:qwen-plus 的类别为 llm）。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 各依赖类别的慢调用阈值（秒）和最大并发调用数
+# 大模型生成解决方案正常需要 10~30 秒，非流式调用的计时覆盖整个生成过程，
+# 慢调用阈值缺省取 LLM_TIMEOUT（None），只有接近超时的调用才计为慢调用
+_DEPENDENCY_DEFAULTS = {
+    'llm': {'slow_seconds': None, 'max_concurrent': 16},
+    'embedding': {'slow_seconds': 5.0, 'max_concurrent': 16},
+    'docmind': {'slow_seconds': 30.0, 'max_concurrent': 8},
+    'weaviate': {'slow_seconds': 5.0, 'max_concurrent': 16}
+}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态或并发已满，调用被立即拒绝"""
+
+    def __init__(self, name: str, reason: str = 'open'):
+        self.name = name
+        self.reason = reason
+        message = f"依赖 {name} 已熔断" if reason == 'open' else f"依赖 {name} 并发调用已满"
+        super().__init__(message)
+
+
+class CircuitBreaker:
+    """单个外部依赖的熔断器"""
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_seconds: float = 20.0, slow_rate: float = 0.8, open_seconds: float = 30.0,
+                 half_open_calls: int = 1, max_concurrent: Optional[int] = None):
+        """
+        Args:
+            name: 依赖名称
+            window: 统计的最近调用数
+            min_calls: 窗口内调用数达到该值才判断是否熔断
+            failure_rate: 触发熔断的失败率
+            slow_seconds: 耗时超过该值的调用计为慢调用
+            slow_rate: 触发熔断的慢调用比例
+            open_seconds: 熔断持续时间，之后进入半开状态
+            half_open_calls: 半开状态下放行的探测调用数
+            max_concurrent: 最大并发调用数，None 表示不限制
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.max_concurrent = max_concurrent
+
+        self._calls = deque(maxlen=window)  # (是否成功, 是否慢调用)
+        self._state = CLOSED
+        self._generation = 0  # 状态变化时递增，用于识别调用放行时所处的阶段
+        self._opened_at = 0.0
+        self._probes = 0
+        self._active = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.time() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._generation += 1
+            self._probes = 0
+            logger.info(f"熔断器 {self.name} 进入半开状态，开始探测")
+        return self._state
+
+    def before_call(self) -> Tuple[int, bool]:
+        """
+        调用前检查：熔断或并发已满时抛出 CircuitOpenError，否则占用一个并发名额
+
+        Returns:
+            放行凭证 (状态阶段, 是否为半开探测)，调用结束时传给 after_call 或 release
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._probes >= self.half_open_calls):
+                self._rejected += 1
+                raise CircuitOpenError(self.name)
+            if self.max_concurrent is not None and self._active >= self.max_concurrent:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, reason='saturated')
+            probe = state == HALF_OPEN
+            if probe:
+                self._probes += 1
+            self._active += 1
+            return self._generation, probe
+
+    def after_call(self, ok: bool, duration: float = 0.0, ticket: Optional[Tuple[int, bool]] = None):
+        """
+        调用结束后释放并发名额并记录结果，必要时熔断或恢复
+
+        Args:
+            ok: 调用是否成功
+            duration: 调用耗时（秒）
+            ticket: before_call 返回的放行凭证；放行后状态已变化的调用只释放名额，不记录结果
+        """
+        slow = duration >= self.slow_seconds
+        with self._lock:
+            self._active -= 1
+            generation, probe = ticket if ticket is not None else (self._generation, False)
+            if generation != self._generation:
+                return
+            if self._state == HALF_OPEN:
+                if not probe:
+                    return
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._generation += 1
+                    self._calls.clear()
+                    logger.info(f"熔断器 {self.name} 探测成功，已恢复")
+                else:
+                    self._trip('探测失败')
+                return
+
+            self._calls.append((ok, slow))
+            if self._state != CLOSED or len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for success, _ in self._calls if not success) / len(self._calls)
+            slow_calls = sum(1 for _, is_slow in self._calls if is_slow) / len(self._calls)
+            if failures >= self.failure_rate:
+                self._trip(f"失败率 {failures:.0%}")
+            elif slow_calls >= self.slow_rate:
+                self._trip(f"慢调用比例 {slow_calls:.0%}")
+
+    def release(self, ticket: Optional[Tuple[int, bool]] = None):
+        """释放并发名额但不记录结果（调用被取消），半开探测的名额交还给下一个探测调用"""
+        with self._lock:
+            self._active -= 1
+            if ticket is not None and ticket[1] and ticket[0] == self._generation and self._state == HALF_OPEN:
+                self._probes -= 1
+
+    def _trip(self, reason: str):
+        self._state = OPEN
+        self._generation += 1
+        self._opened_at = time.time()
+        logger.warning(f"熔断器 {self.name} 已打开（{reason}），{self.open_seconds:.0f} 秒内直接拒绝调用")
+
+    @contextmanager
+    def protect(self):
+        """
+        保护一段调用外部依赖的代码
+
+        熔断或并发已满时抛出 CircuitOpenError；代码块中的 Exception 计为失败后原样抛出，
+        任务取消等 BaseException 只释放名额后原样抛出。
+        """
+        ticket = self.before_call()
+        started_at = time.time()
+        try:
+            yield
+        except CircuitOpenError:
+            # 代码块内嵌套的其他熔断器拒绝了调用，不代表本依赖失败
+            self.release(ticket)
+            raise
+        except Exception:
+            self.after_call(False, time.time() - started_at, ticket)
+            raise
+        except BaseException:
+            self.release(ticket)
+            raise
+        self.after_call(True, time.time() - started_at, ticket)
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """在熔断器保护下调用函数"""
+        with self.protect():
+            return func(*args, **kwargs)
+
+    def reset(self):
+        """恢复为关闭状态并清空统计"""
+        with self._lock:
+            self._state = CLOSED
+            self._generation += 1
+            self._calls.clear()
+            self._probes = 0
+            self._rejected = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._calls)
+            failures = sum(1 for success, _ in self._calls if not success)
+            slow_calls = sum(1 for _, is_slow in self._calls if is_slow)
+            return {
+                'state': state,
+                'calls': calls,
+                'failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'slow_rate': round(slow_calls / calls, 3) if calls else 0.0,
+                'active_calls': self._active,
+                'max_concurrent': self.max_concurrent,
+                'rejected_calls': self._rejected,
+                'retry_in_seconds': round(max(self.open_seconds - (time.time() - self._opened_at), 0), 1)
+                if state == OPEN else 0
+            }
+
+
+def _breaker_settings(name: str) -> Dict[str, Any]:
+    """按环境变量和依赖类别生成熔断器参数"""
+    kind = name.split(':', 1)[0]
+    defaults = _DEPENDENCY_DEFAULTS.get(kind, {'slow_seconds': 20.0, 'max_concurrent': None})
+    prefix = f"CIRCUIT_BREAKER_{kind.upper()}"
+    max_concurrent = os.environ.get(f"{prefix}_MAX_CONCURRENT")
+    if max_concurrent is not None:
+        max_concurrent = int(max_concurrent) or None
+    else:
+        max_concurrent = defaults['max_concurrent']
+    slow_seconds = defaults['slow_seconds']
+    if slow_seconds is None:
+        slow_seconds = float(os.environ.get('LLM_TIMEOUT', '60'))
+    return {
+        'window': int(os.environ.get('CIRCUIT_BREAKER_WINDOW', '20')),
+        'min_calls': int(os.environ.get('CIRCUIT_BREAKER_MIN_CALLS', '5')),
+        'failure_rate': float(os.environ.get('CIRCUIT_BREAKER_FAILURE_RATE', '0.5')),
+        'slow_rate': float(os.environ.get('CIRCUIT_BREAKER_SLOW_RATE', '0.8')),
+        'open_seconds': float(os.environ.get('CIRCUIT_BREAKER_OPEN_SECONDS', '30')),
+        'slow_seconds': float(os.environ.get(f"{prefix}_SLOW_SECONDS", slow_seconds)),
+        'max_concurrent': max_concurrent
+    }
+
+
+# 进程内共享的熔断器，按依赖名称区分
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取依赖的熔断器，首次使用时按配置创建"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, **_breaker_settings(name))
+            _breakers[name] = breaker
+        return breaker
+
+
+def get_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """全部熔断器的状态，供健康检查接口使用"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.get_stats() for name, breaker in sorted(breakers.items())}
+
+
+def reset_breakers():
+    """移除全部熔断器（主要用于测试）"""
+    with _breakers_lock:
+        _breakers.clear()
@@ -0,0 +1,75 @@
+"""
+文件内容指纹工具
+
+在上传文件流式落盘的同时计算SHA-256指纹，避免为求哈希再次读取整个文件。
+"""
+
+import hashlib
+import os
+from typing import BinaryIO, Optional, Tuple
+
+# 每次从上传流读取的块大小
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class FileTooLargeError(ValueError):
+    """写入的数据超过了允许的最大文件大小"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f'文件大小超过限制: {max_size} 字节')
+        self.max_size = max_size
+
+
+def save_stream_with_hash(stream: BinaryIO, file_path: str,
+                          max_size: Optional[int] = None,
+                          chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[int, str]:
+    """
+    将上传流写入磁盘并同时计算SHA-256
+
+    Args:
+        stream: 可读的二进制流（如 FileStorage.stream）
+        file_path: 目标文件路径
+        max_size: 允许的最大字节数，超过时删除已写入的部分并抛出 FileTooLargeError
+        chunk_size: 每次读取的块大小
+
+    Returns:
+        Tuple[int, str]: (写入的字节数, 十六进制SHA-256)
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(file_path, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise FileTooLargeError(max_size)
+                sha256.update(chunk)
+                f.write(chunk)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return size, sha256.hexdigest()
+
+
+def hash_file(file_path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> str:
+    """
+    计算已落盘文件的SHA-256
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的块大小
+
+    Returns:
+        str: 十六进制SHA-256
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
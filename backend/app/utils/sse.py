@@ -0,0 +1,195 @@
+"""
+Server-Sent Events 推送助手
+
+把进度事件总线上的事件转换为 text/event-stream 响应：连接建立时先推送一条 snapshot 事件
+（当前状态），之后推送订阅主题上的事件；空闲时发送注释行保持连接，到达最长时长或收到
+终止事件时发送 end 事件并结束，客户端收到 end 后自行决定是否重新连接。
+
+EventSource 无法设置请求头。访问令牌放在查询参数中会进入访问日志、代理和浏览器历史，
+因此SSE接口除 Authorization 头外只接受一次性推送票据（?ticket=）：客户端先用访问令牌
+换取票据，票据有效期很短（SSE_TICKET_SECONDS）且只能使用一次。
+每个进程同时打开的推送连接数不超过 SSE_MAX_OPEN_STREAMS，超出时返回503。
+"""
+
+import json
+import secrets
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from flask import Response, current_app, g, request, stream_with_context
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from app import db
+from app.services.infrastructure.progress_bus import get_progress_bus
+from app.utils.response_helper import service_unavailable_error, unauthorized_error
+
+STREAM_TICKET_PREFIX = 'sse_ticket'
+
+# 当前进程打开的推送连接数
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+
+def issue_stream_ticket(user_id: str) -> Dict[str, Any]:
+    """
+    为用户签发一次性推送票据
+
+    Returns:
+        Dict[str, Any]: ticket 和有效秒数 expiresIn
+    """
+    from app.services.storage.cache_service import get_cache_service
+
+    ttl = current_app.config.get('SSE_TICKET_SECONDS', 30)
+    ticket = secrets.token_urlsafe(32)
+    get_cache_service().cache_result(f'{STREAM_TICKET_PREFIX}:{ticket}', {'user_id': str(user_id)}, expire_time=ttl)
+    return {'ticket': ticket, 'expiresIn': ttl}
+
+
+def redeem_stream_ticket(ticket: str) -> Optional[str]:
+    """兑换推送票据，返回用户ID；票据不存在、已过期或已被使用时返回None"""
+    from app.services.storage.cache_service import get_cache_service
+
+    cache = get_cache_service()
+    key = f'{STREAM_TICKET_PREFIX}:{ticket}'
+    cached = cache.get_cached_result(key)
+    # 删除成功的一方才算兑换了票据，并发使用同一票据只有一个连接通过
+    if not cached or not cache.delete_cache(key):
+        return None
+    return cached['data']['user_id']
+
+
+def stream_auth_required(view: Callable) -> Callable:
+    """SSE接口认证：Authorization 头中的访问令牌，或查询参数 ticket 中的一次性推送票据"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        ticket = request.args.get('ticket')
+        if ticket:
+            user_id = redeem_stream_ticket(ticket)
+            if user_id is None:
+                return unauthorized_error('推送票据无效、已过期或已被使用')
+        else:
+            verify_jwt_in_request(locations=['headers'])
+            user_id = get_jwt_identity()
+        g.stream_user_id = user_id
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def get_stream_identity() -> str:
+    """stream_auth_required 认证得到的用户ID"""
+    return g.stream_user_id
+
+
+def _acquire_stream_slot() -> bool:
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= current_app.config.get('SSE_MAX_OPEN_STREAMS', 50):
+            return False
+        _open_streams += 1
+        return True
+
+
+def _release_stream_slot():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams = max(_open_streams - 1, 0)
+
+
+def open_stream_count() -> int:
+    """当前进程打开的推送连接数"""
+    with _open_streams_lock:
+        return _open_streams
+
+
+def format_sse(event: str, data: Any, event_id: Optional[str] = None, retry: Optional[int] = None) -> str:
+    """
+    格式化一条SSE消息
+
+    Args:
+        event: 事件名称
+        data: 事件数据，序列化为JSON
+        event_id: 事件ID，客户端重连时通过 Last-Event-ID 带回
+        retry: 客户端断线重连间隔（毫秒）
+
+    Returns:
+        str: SSE消息文本
+    """
+    lines = []
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    lines.extend(f'data: {line}' for line in payload.splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_progress(topics: Iterable[str], snapshot: Callable[[], Dict[str, Any]],
+                    is_terminal: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                    is_finished: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Response:
+    """
+    订阅进度主题并以SSE响应推送
+
+    先订阅再生成快照，快照与第一条事件之间的变化不会丢失。快照生成后立即释放数据库会话，
+    长连接期间不占用连接池。打开的连接数已达 SSE_MAX_OPEN_STREAMS 时返回503。
+
+    Args:
+        topics: 订阅的主题
+        snapshot: 生成当前状态的函数（在请求上下文中执行）
+        is_terminal: 判断事件是否意味着处理已结束的函数，返回True时推送后结束连接
+        is_finished: 判断快照是否已是最终状态的函数，返回True时只推送快照
+
+    Returns:
+        Response: text/event-stream 响应，连接数超限时为503错误响应
+    """
+    topics = list(topics)
+    config = current_app.config
+    max_seconds = config.get('SSE_MAX_STREAM_SECONDS', 300)
+    keepalive = config.get('SSE_KEEPALIVE_SECONDS', 15)
+    retry = config.get('SSE_RETRY_MILLISECONDS', 3000)
+
+    if not _acquire_stream_slot():
+        current_app.logger.warning(f"推送连接数已达上限 {config.get('SSE_MAX_OPEN_STREAMS', 50)}，拒绝新的连接")
+        response, code = service_unavailable_error('当前推送连接较多，请稍后重试')
+        response.headers['Retry-After'] = str(max(retry // 1000, 1))
+        return response, code
+
+    def generate() -> Iterator[str]:
+        subscription = get_progress_bus().subscribe(topics)
+        try:
+            state = snapshot()
+            db.session.close()
+            yield format_sse('snapshot', state, retry=retry)
+            if is_finished is not None and is_finished(state):
+                yield format_sse('end', {'reason': 'completed'})
+                return
+
+            deadline = time.time() + max_seconds
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    yield format_sse('end', {'reason': 'max_duration'})
+                    return
+
+                message = subscription.get(timeout=min(keepalive, remaining))
+                if message is None:
+                    yield ': keepalive\n\n'
+                    continue
+
+                yield format_sse(message['event'], message['data'], event_id=message['id'])
+                if is_terminal is not None and is_terminal(message):
+                    yield format_sse('end', {'reason': 'completed'})
+                    return
+        finally:
+            subscription.close()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # 连接关闭时释放名额；生成器未开始迭代就断开时也会调用
+    response.call_on_close(_release_stream_slot)
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭Nginx等反向代理的响应缓冲，事件到达后立即下发
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+本地模拟大模型/向量化服务器，用于压测和离线开发
+
+LLMService 的内置Mock直接返回结果，性能基准测试无法反映真实调用的耗时、流式输出和限流。
+本服务器实现兼容OpenAI的对话和向量化接口（/v1 与 /compatible-mode/v1），以及 DashScope
+原生的文本向量化接口，可配置：
+
+- 耗时分布：fixed / uniform / lognormal，首个token前的等待时间按分布抽样
+- 生成速度：每秒输出的token数，流式接口按该速度逐段推送
+- 故障注入：按比例返回错误状态码，或挂起直到客户端超时
+- 限流：令牌桶，超出时返回429和Retry-After
+- 向量：按字符二元组哈希生成的归一化向量，文本越相似向量越接近
+
+服务指向本服务器（LLM_USE_MOCK=0 时测试中也使用真实调用路径）：
+
+    python bin/fake_llm_server.py --port 8090 --latency-ms 800 --tokens-per-second 40
+    export DASHSCOPE_API_KEY=fake-key LLM_USE_MOCK=0
+    export OPENAI_API_BASE=http://localhost:8090/compatible-mode/v1
+    export DASHSCOPE_HTTP_BASE_URL=http://localhost:8090/api/v1
+
+所有参数也可通过 FAKE_LLM_* 环境变量设置，运行中可通过 POST /admin/config 调整（模拟服务降级），
+GET /stats 查看请求统计。
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields
+
+from flask import Flask, Response, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+_REPLY_TEMPLATE = (
+    "根据问题描述“{question}”，初步判断如下：\n"
+    "1. 检查相关接口状态和物理链路，确认没有错误计数持续增长；\n"
+    "2. 核对两端的协议参数（区域、认证、定时器、MTU）是否一致；\n"
+    "3. 查看设备日志和告警，定位首次出现异常的时间点；\n"
+    "4. 必要时开启调试信息抓取报文，对比正常与异常时的交互过程；\n"
+    "5. 修改配置后观察邻居状态和路由表，确认问题已恢复并做好记录。"
+)
+
+
+@dataclass
+class FakeServerSettings:
+    """模拟服务器参数，字段名对应 FAKE_LLM_<字段名大写> 环境变量和 --<字段名> 命令行参数"""
+    latency_ms: float = 500.0            # 首个token前的等待时间（分布的中位数）
+    latency_jitter: float = 0.3          # uniform 为上下浮动比例，lognormal 为对数标准差
+    latency_dist: str = 'lognormal'      # fixed / uniform / lognormal
+    tokens_per_second: float = 50.0      # 生成速度，0表示立即返回全部内容
+    reply_tokens: int = 200              # 回复长度（token数），不超过请求的 max_tokens
+    embedding_latency_ms: float = 50.0   # 向量化接口的耗时
+    embedding_dim: int = 1024
+    error_rate: float = 0.0              # 返回错误的请求比例
+    error_status: int = 503
+    hang_rate: float = 0.0               # 挂起不返回的请求比例
+    hang_seconds: float = 120.0
+    rate_limit_rps: float = 0.0          # 每秒允许的请求数，0表示不限流
+    rate_limit_burst: int = 10
+
+    @classmethod
+    def from_env(cls) -> 'FakeServerSettings':
+        settings = cls()
+        for item in fields(cls):
+            value = os.environ.get(f"FAKE_LLM_{item.name.upper()}")
+            if value is not None:
+                setattr(settings, item.name, item.type(value))
+        return settings
+
+    def update(self, values: dict):
+        """按字段类型更新参数，忽略未知字段"""
+        types = {item.name: item.type for item in fields(self)}
+        for name, value in values.items():
+            if name in types:
+                setattr(self, name, types[name](value))
+
+
+class TokenBucket:
+    """令牌桶限流"""
+
+    def __init__(self):
+        self._tokens = None  # 首次取令牌时装满
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, rate: float, burst: int) -> float:
+        """
+        取一个令牌
+
+        Returns:
+            float: 0表示放行，否则为建议的重试等待秒数
+        """
+        if rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            if self._tokens is None:
+                self._tokens = float(burst)
+            self._tokens = min(burst, self._tokens + (now - self._updated_at) * rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / rate
+
+
+def sample_latency(settings: FakeServerSettings, median_ms: float) -> float:
+    """按配置的分布抽样耗时（秒）"""
+    if settings.latency_dist == 'uniform':
+        jitter = median_ms * settings.latency_jitter
+        value = random.uniform(median_ms - jitter, median_ms + jitter)
+    elif settings.latency_dist == 'lognormal':
+        value = median_ms * math.exp(random.gauss(0, settings.latency_jitter))
+    else:
+        value = median_ms
+    return max(value, 0.0) / 1000
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """按字符二元组哈希生成归一化向量，相同文本得到相同向量，相似文本向量相近"""
+    vector = [0.0] * dim
+    normalized = ''.join((text or '').lower().split())
+    grams = [normalized[i:i + 2] for i in range(max(len(normalized) - 1, 1))]
+    for gram in grams:
+        digest = hashlib.md5(gram.encode('utf-8')).digest()
+        index = int.from_bytes(digest[:4], 'little') % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _split_tokens(text: str) -> list:
+    """按约每token两个字符切分回复，用于控制长度和流式推送"""
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+
+def _build_reply(messages: list, limit: int) -> list:
+    question = ''
+    for message in reversed(messages or []):
+        if message.get('role') == 'user':
+            content = message.get('content')
+            question = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+            break
+    question = ' '.join(question.split())[:60]
+    text = _REPLY_TEMPLATE.format(question=question)
+    tokens = _split_tokens(text)
+    while len(tokens) < limit:
+        tokens += _split_tokens(text)
+    return tokens[:limit]
+
+
+def create_app(settings: FakeServerSettings = None) -> Flask:
+    """创建模拟服务器应用"""
+    app = Flask(__name__)
+    settings = settings or FakeServerSettings.from_env()
+    bucket = TokenBucket()
+    stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'hung': 0, 'streams': 0, 'embeddings': 0}
+    stats_lock = threading.Lock()
+    app.config['FAKE_LLM_SETTINGS'] = settings
+    app.config['FAKE_LLM_STATS'] = stats
+
+    def count(key: str):
+        with stats_lock:
+            stats[key] += 1
+
+    def openai_error(status: int, message: str, error_type: str, headers: dict = None):
+        response = jsonify({'error': {'message': message, 'type': error_type, 'code': str(status)}})
+        response.status_code = status
+        for name, value in (headers or {}).items():
+            response.headers[name] = value
+        return response
+
+    def dashscope_error(status: int, message: str, code: str, headers: dict = None):
+        response = jsonify({'code': code, 'message': message, 'request_id': str(uuid.uuid4())})
+        response.status_code = status
+        for name, value in (headers or {}).items():
+            response.headers[name] = value
+        return response
+
+    def inject_faults(error_factory):
+        """限流、错误和挂起注入，返回错误响应或None"""
+        count('requests')
+        retry_after = bucket.acquire(settings.rate_limit_rps, settings.rate_limit_burst)
+        if retry_after:
+            count('rate_limited')
+            return error_factory(429, '请求过于频繁（模拟限流）', 'rate_limit_exceeded',
+                                 {'Retry-After': str(max(1, math.ceil(retry_after)))})
+        if settings.hang_rate and random.random() < settings.hang_rate:
+            count('hung')
+            time.sleep(settings.hang_seconds)
+        if settings.error_rate and random.random() < settings.error_rate:
+            count('errors')
+            return error_factory(settings.error_status, '服务暂时不可用（模拟故障）', 'server_error')
+        return None
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({'status': 'ok'})
+
+    @app.route('/stats', methods=['GET'])
+    def get_stats():
+        with stats_lock:
+            return jsonify({'settings': asdict(settings), 'stats': dict(stats)})
+
+    @app.route('/admin/config', methods=['POST'])
+    def update_config():
+        try:
+            settings.update(request.get_json(silent=True) or {})
+        except (TypeError, ValueError) as e:
+            return openai_error(400, f'参数无效: {e}', 'invalid_request_error')
+        logger.info(f"模拟服务器参数已更新: {asdict(settings)}")
+        return jsonify(asdict(settings))
+
+    @app.route('/v1/models', methods=['GET'])
+    @app.route('/compatible-mode/v1/models', methods=['GET'])
+    def list_models():
+        return jsonify({'object': 'list', 'data': [
+            {'id': name, 'object': 'model', 'owned_by': 'fake-llm-server'}
+            for name in ('qwen-plus', 'qwen-turbo', 'text-embedding-v4')
+        ]})
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    @app.route('/compatible-mode/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        fault = inject_faults(openai_error)
+        if fault is not None:
+            return fault
+
+        body = request.get_json(silent=True) or {}
+        model = body.get('model') or 'qwen-plus'
+        limit = min(int(body.get('max_tokens') or settings.reply_tokens), settings.reply_tokens)
+        tokens = _build_reply(body.get('messages'), limit)
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in body.get('messages') or []) // 2
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        interval = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+        # 请求的 max_tokens 小于回复长度时按截断处理
+        finish_reason = 'length' if limit < settings.reply_tokens else 'stop'
+        first_token_delay = sample_latency(settings, settings.latency_ms)
+
+        if body.get('stream'):
+            count('streams')
+
+            def chunk(delta: dict, finish_reason=None) -> str:
+                payload = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+                }
+                return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+            def generate():
+                time.sleep(first_token_delay)
+                yield chunk({'role': 'assistant', 'content': ''})
+                for token in tokens:
+                    yield chunk({'content': token})
+                    if interval:
+                        time.sleep(interval)
+                yield chunk({}, finish_reason=finish_reason)
+                yield 'data: [DONE]\n\n'
+
+            return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+        time.sleep(first_token_delay + interval * len(tokens))
+        return jsonify({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                'finish_reason': finish_reason
+            }],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens),
+                      'total_tokens': prompt_tokens + len(tokens)}
+        })
+
+    @app.route('/v1/embeddings', methods=['POST'])
+    @app.route('/compatible-mode/v1/embeddings', methods=['POST'])
+    def openai_embeddings():
+        fault = inject_faults(openai_error)
+        if fault is not None:
+            return fault
+
+        count('embeddings')
+        body = request.get_json(silent=True) or {}
+        texts = body.get('input')
+        texts = [texts] if isinstance(texts, str) else list(texts or [])
+        dim = int(body.get('dimensions') or settings.embedding_dim)
+        time.sleep(sample_latency(settings, settings.embedding_latency_ms))
+        return jsonify({
+            'object': 'list',
+            'model': body.get('model') or 'text-embedding-v4',
+            'data': [{'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, dim)}
+                     for i, text in enumerate(texts)],
+            'usage': {'prompt_tokens': sum(len(t) for t in texts), 'total_tokens': sum(len(t) for t in texts)}
+        })
+
+    @app.route('/api/v1/services/embeddings/text-embedding/text-embedding', methods=['POST'])
+    def dashscope_embeddings():
+        """DashScope 原生向量化接口（DashScopeEmbeddings 使用）"""
+        fault = inject_faults(lambda status, message, code, headers=None: dashscope_error(
+            status, message, 'Throttling' if status == 429 else 'InternalError', headers))
+        if fault is not None:
+            return fault
+
+        count('embeddings')
+        body = request.get_json(silent=True) or {}
+        texts = (body.get('input') or {}).get('texts') or []
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        dim = int((body.get('parameters') or {}).get('dimension') or settings.embedding_dim)
+        time.sleep(sample_latency(settings, settings.embedding_latency_ms))
+        return jsonify({
+            'request_id': str(uuid.uuid4()),
+            'output': {'embeddings': [{'text_index': i, 'embedding': fake_embedding(text, dim)}
+                                      for i, text in enumerate(texts)]},
+            'usage': {'total_tokens': sum(len(t) for t in texts)}
+        })
+
+    return app
+
+
+def main():
+    defaults = FakeServerSettings.from_env()
+    parser = argparse.ArgumentParser(description='本地模拟大模型/向量化服务器')
+    parser.add_argument('--host', default=os.environ.get('FAKE_LLM_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FAKE_LLM_PORT', '8090')))
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，便于复现压测结果')
+    for item in fields(FakeServerSettings):
+        option = '--' + item.name.replace('_', '-')
+        kwargs = {'default': getattr(defaults, item.name), 'type': item.type}
+        if item.name == 'latency_dist':
+            kwargs['choices'] = ['fixed', 'uniform', 'lognormal']
+        parser.add_argument(option, **kwargs)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    settings = FakeServerSettings(**{item.name: getattr(args, item.name) for item in fields(FakeServerSettings)})
+    logging.basicConfig(level=logging.INFO)
+    print(f"🚀 启动模拟大模型服务器: http://{args.host}:{args.port}")
+    print(f"   OPENAI_API_BASE=http://{args.host}:{args.port}/compatible-mode/v1")
+    print(f"   DASHSCOPE_HTTP_BASE_URL=http://{args.host}:{args.port}/api/v1")
+    print(f"⚙️  参数: {asdict(settings)}")
+    create_app(settings).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
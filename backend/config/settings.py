@@ -35,12 +35,99 @@ class Config:
     # Redis配置
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379'
 
+    # 准入控制（Flask-Limiter）：限流计数保存在Redis中，多个Web进程共享；
+    # Redis不可用时回退到进程内计数，不因限流存储故障拒绝请求
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or REDIS_URL
+    RATELIMIT_KEY_PREFIX = 'admission'
+    # 调用大模型的接口（创建案例、多轮交互、日志分析）与普通检索接口分别计算每用户和全局限额
+    ADMISSION_LLM_USER_LIMIT = os.environ.get('ADMISSION_LLM_USER_LIMIT') or '10 per minute;60 per hour'
+    ADMISSION_LLM_GLOBAL_LIMIT = os.environ.get('ADMISSION_LLM_GLOBAL_LIMIT') or '120 per minute'
+    ADMISSION_CHEAP_USER_LIMIT = os.environ.get('ADMISSION_CHEAP_USER_LIMIT') or '60 per minute'
+    ADMISSION_CHEAP_GLOBAL_LIMIT = os.environ.get('ADMISSION_CHEAP_GLOBAL_LIMIT') or '600 per minute'
+    # 交互车道排队任务数达到该值时拒绝新的分析请求（429），Retry-After 按排队时长估算，
+    # 没有执行时长统计时使用缺省秒数
+    ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', 20))
+    ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', 30))
+    # 新建案例和多轮交互的幂等：带 Idempotency-Key 的请求保留的秒数，未带时按请求体识别重复提交的时间窗（0为关闭）
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400))
+    IDEMPOTENCY_WINDOW_SECONDS = int(os.environ.get('IDEMPOTENCY_WINDOW_SECONDS', 30))
+
     # 文件上传配置
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(basedir, 'uploads')
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
 
+    # 解析产物存储目录（压缩后的IDP解析结果）
+    PARSE_ARTIFACT_FOLDER = os.environ.get('PARSE_ARTIFACT_FOLDER') or os.path.join(basedir, 'instance', 'artifacts')
+
+    # 分片上传配置（大文件断点续传）
+    CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+    CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # 8MB
+    CHUNKED_UPLOAD_SESSION_TTL = int(os.environ.get('CHUNKED_UPLOAD_SESSION_TTL', 86400))  # 24小时
+
+    # 后台任务队列配置：sqlite 后端在进程重启后接管未完成的任务，memory 仅保存在进程内
+    # 各车道独立的工作线程数：交互式Agent分析 / 文档解析入库 / 维护任务
+    TASK_QUEUE_INTERACTIVE_WORKERS = int(os.environ.get('TASK_QUEUE_INTERACTIVE_WORKERS', 4))
+    TASK_QUEUE_INGESTION_WORKERS = int(os.environ.get('TASK_QUEUE_INGESTION_WORKERS',
+                                                      os.environ.get('TASK_QUEUE_MAX_WORKERS', 2)))
+    TASK_QUEUE_MAINTENANCE_WORKERS = int(os.environ.get('TASK_QUEUE_MAINTENANCE_WORKERS', 1))
+    TASK_QUEUE_BACKEND = os.environ.get('TASK_QUEUE_BACKEND') or 'sqlite'
+    TASK_QUEUE_DB_PATH = os.environ.get('TASK_QUEUE_DB_PATH') or os.path.join(basedir, 'instance', 'task_queue.db')
+    TASK_QUEUE_LEASE_SECONDS = int(os.environ.get('TASK_QUEUE_LEASE_SECONDS', 60))
+    TASK_QUEUE_MAX_ATTEMPTS = int(os.environ.get('TASK_QUEUE_MAX_ATTEMPTS', 3))
+    # 未指定 job_timeout 的任务的执行超时（秒，0表示不限时），以及取消后等待任务自行退出的秒数
+    TASK_QUEUE_DEFAULT_TIMEOUT = int(os.environ.get('TASK_QUEUE_DEFAULT_TIMEOUT', 1800))
+    TASK_QUEUE_CANCEL_GRACE = int(os.environ.get('TASK_QUEUE_CANCEL_GRACE', 30))
+    # Prometheus 采集任务队列指标（GET /api/v1/system/queue/metrics）使用的固定令牌，
+    # 未配置时只接受JWT
+    METRICS_SCRAPE_TOKEN = os.environ.get('METRICS_SCRAPE_TOKEN')
+
+    # CPU密集型任务进程车道（日志解析、语义切分）：工作进程数（0表示在调用线程中执行），
+    # 参数小于内联阈值时不跨进程，超过落盘阈值时经由临时文件传递
+    PROCESS_LANE_WORKERS = int(os.environ.get('PROCESS_LANE_WORKERS', 2))
+    PROCESS_LANE_INLINE_BYTES = int(os.environ.get('PROCESS_LANE_INLINE_BYTES', 64 * 1024))
+    PROCESS_LANE_SPILL_BYTES = int(os.environ.get('PROCESS_LANE_SPILL_BYTES', 1024 * 1024))
+
+    # 任务进度事件总线：redis 在多个Web进程间广播（不可用时回退到进程内），memory 仅进程内
+    PROGRESS_BUS_BACKEND = os.environ.get('PROGRESS_BUS_BACKEND') or 'redis'
+    PROGRESS_BUS_LATEST_TTL = int(os.environ.get('PROGRESS_BUS_LATEST_TTL', 3600))
+    # 进度推送（SSE）连接的最长时长、空闲保活间隔（秒）和客户端重连间隔（毫秒）
+    SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))
+    SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+    SSE_RETRY_MILLISECONDS = int(os.environ.get('SSE_RETRY_MILLISECONDS', 3000))
+    # 推送接口的一次性票据有效期（秒），每个进程同时打开的推送连接上限
+    SSE_TICKET_SECONDS = int(os.environ.get('SSE_TICKET_SECONDS', 30))
+    SSE_MAX_OPEN_STREAMS = int(os.environ.get('SSE_MAX_OPEN_STREAMS', 50))
+
     # AI服务相关配置 - Langchain统一集成
     DASHSCOPE_API_KEY = os.environ.get('DASHSCOPE_API_KEY')
+    # 解决方案流式生成：文本片段推送到节点主题，已生成的内容按间隔（秒）写入节点
+    LLM_STREAMING_ENABLED = os.environ.get('LLM_STREAMING_ENABLED', 'true').lower() == 'true'
+    LLM_STREAM_CHECKPOINT_SECONDS = float(os.environ.get('LLM_STREAM_CHECKPOINT_SECONDS', 2))
+    # 解决方案提示词中检索资料的token预算、单个片段的token上限和判定重复片段的相似度
+    LLM_CONTEXT_TOKEN_BUDGET = int(os.environ.get('LLM_CONTEXT_TOKEN_BUDGET', 1500))
+    LLM_CONTEXT_CHUNK_TOKENS = int(os.environ.get('LLM_CONTEXT_CHUNK_TOKENS', 400))
+    LLM_CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get('LLM_CONTEXT_DUPLICATE_THRESHOLD', 0.8))
+    # 多轮对话历史：原样保留的最近轮数、每轮的token上限，更早轮次压缩为摘要的token上限
+    CONVERSATION_RECENT_TURNS = int(os.environ.get('CONVERSATION_RECENT_TURNS', 4))
+    CONVERSATION_TURN_TOKEN_BUDGET = int(os.environ.get('CONVERSATION_TURN_TOKEN_BUDGET', 300))
+    CONVERSATION_SUMMARY_TOKEN_BUDGET = int(os.environ.get('CONVERSATION_SUMMARY_TOKEN_BUDGET', 400))
+    # 工作流步骤检查点：任务重试或恢复时跳过已完成的步骤，未完成工作流的检查点保留时间（秒）
+    WORKFLOW_CHECKPOINT_ENABLED = os.environ.get('WORKFLOW_CHECKPOINT_ENABLED', 'true').lower() == 'true'
+    WORKFLOW_CHECKPOINT_TTL_SECONDS = int(os.environ.get('WORKFLOW_CHECKPOINT_TTL_SECONDS', 86400))
+    # 语义答案缓存：已解决且评分达到下限的解决方案供同一用户的相似问题直接复用，引用的知识库文档变化时移除
+    SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+    SEMANTIC_CACHE_PATH = os.environ.get('SEMANTIC_CACHE_PATH') or 'instance/semantic_cache'
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.92))
+    SEMANTIC_CACHE_MIN_RATING = int(os.environ.get('SEMANTIC_CACHE_MIN_RATING', 4))
+    SEMANTIC_CACHE_TTL_SECONDS = int(os.environ.get('SEMANTIC_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', 2000))
+    # 已解决案例索引：存储路径、相似案例的最低相似度，Agent检索时附带的相似案例数（0表示不附带）
+    RESOLVED_CASE_INDEX_PATH = os.environ.get('RESOLVED_CASE_INDEX_PATH') or 'instance/resolved_cases'
+    RESOLVED_CASE_MIN_SIMILARITY = float(os.environ.get('RESOLVED_CASE_MIN_SIMILARITY', 0.75))
+    AGENT_SIMILAR_CASES = int(os.environ.get('AGENT_SIMILAR_CASES', 3))
+    # Agent工作流在分析问题的同时提前检索知识，需要澄清时丢弃检索结果；分析完成后等待检索结果的最长时间（秒）
+    AGENT_SPECULATIVE_RETRIEVAL = os.environ.get('AGENT_SPECULATIVE_RETRIEVAL', 'true').lower() == 'true'
+    AGENT_SPECULATIVE_RETRIEVAL_TIMEOUT = float(os.environ.get('AGENT_SPECULATIVE_RETRIEVAL_TIMEOUT', 60))
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY') or os.environ.get('DASHSCOPE_API_KEY')
     OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE') or 'https://dashscope.aliyuncs.com/compatible-mode/v1'
 
@@ -80,6 +167,12 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         f'sqlite:///{os.path.join(basedir, "instance", "test.db")}'
+    TASK_QUEUE_BACKEND = 'memory'
+    PROCESS_LANE_WORKERS = 0
+    PROGRESS_BUS_BACKEND = 'memory'
+    RATELIMIT_STORAGE_URI = 'memory://'
+    # 测试用例之间会提交相同的请求体，只按 Idempotency-Key 识别重复请求
+    IDEMPOTENCY_WINDOW_SECONDS = 0
     WTF_CSRF_ENABLED = False
 
 
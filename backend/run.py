@@ -299,6 +299,17 @@ if __name__ == '__main__':
         from app.services.document.idp_service import init_idp_service
         init_idp_service()
 
+        # 启动任务队列并接管上次未完成的后台任务；debug模式的重载器父进程不处理请求，跳过
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            from app.services.infrastructure.task_queue import get_task_queue
+            from app.services.infrastructure.worker_runtime import set_worker_app
+            from app.services.infrastructure.process_lane import get_process_lane
+            # 后台任务复用Web应用实例，不再另建一个
+            set_worker_app(app)
+            get_task_queue()
+            # 提前启动并预热CPU任务工作进程
+            get_process_lane()
+
     # 5) 检查数据库初始化状态（可选）
     if not check_database_initialized():
         print("\n是否现在运行数据库初始化脚本 (python scripts/manage.py init)？(Y/n): ", end="")
@@ -7,6 +7,7 @@ API v1 案例模块响应测试
 import pytest
 import json
 import time
+import uuid
 from unittest.mock import patch, MagicMock
 from app import db
 from app.models.case import Case, Node, Edge
@@ -43,6 +44,35 @@ class TestCasesAPIResponses:
         # 后端会根据query生成一个title
         assert '网络连接' in case_data['title']
 
+    def test_create_case_retry_with_idempotency_key(self, client, auth_headers):
+        """测试带相同 Idempotency-Key 重试时返回首次的响应，不重复创建案例"""
+        headers = {**auth_headers, 'Idempotency-Key': uuid.uuid4().hex}
+        first = client.post('/api/v1/cases/', json={'query': '我的网络连接有问题'}, headers=headers)
+        retry = client.post('/api/v1/cases/', json={'query': '我的网络连接有问题'}, headers=headers)
+
+        assert first.status_code == retry.status_code == 200
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        case_id = first.get_json()['data']['caseId']
+        assert retry.get_json()['data']['caseId'] == case_id
+        user = User.query.filter_by(username='testuser').first()
+        assert Case.query.filter_by(user_id=user.id).count() == 1
+
+    def test_interaction_resubmit_within_window_not_duplicated(self, app, client, auth_headers, test_case):
+        """测试未带 Idempotency-Key 时，时间窗内重复提交相同的交互只创建一次节点"""
+        app.config.update(IDEMPOTENCY_WINDOW_SECONDS=30)
+        parent = Node(case_id=test_case.id, type='AI_CLARIFICATION', title='需要补充信息', status='AWAITING_USER_INPUT')
+        db.session.add(parent)
+        db.session.commit()
+        payload = {'parentNodeId': parent.id, 'response': {'text': f'补充信息 {uuid.uuid4().hex}'}}
+
+        first = client.post(f'/api/v1/cases/{test_case.id}/interactions', json=payload, headers=auth_headers)
+        second = client.post(f'/api/v1/cases/{test_case.id}/interactions', json=payload, headers=auth_headers)
+
+        assert first.status_code == second.status_code == 200
+        assert second.get_json() == first.get_json()
+        # 父节点、用户补充信息节点和AI处理节点
+        assert Node.query.filter_by(case_id=test_case.id).count() == 3
+
     def test_get_cases_list_response(self, client, auth_headers, test_case):
         """测试获取案例列表响应格式"""
         response = client.get('/api/v1/cases/', headers=auth_headers)
@@ -123,6 +153,15 @@ class TestCasesAPIResponses:
             assert data['status'] == 'success'
             assert data['message'] == '案例删除成功'
 
+    def test_delete_case_removes_semantic_cache_entry(self, client, auth_headers, test_case):
+        """测试删除案例后移除其语义缓存条目"""
+        case_id = test_case.id
+        with patch('app.api.v1.cases.routes.remove_case_from_semantic_cache') as remove:
+            response = client.delete(f'/api/v1/cases/{case_id}', headers=auth_headers)
+
+        assert response.status_code == 204
+        remove.assert_called_once_with(case_id)
+
     def test_unauthorized_access_response(self, client):
         """测试未授权访问响应格式"""
         response = client.get('/api/v1/cases/')
@@ -476,3 +515,233 @@ class TestCasesAPIResponses:
         assert 'data' in data
         assert 'caseStatus' in data['data']
         assert data['data']['caseStatus'] in ['PROCESSING', 'DONE', 'ERROR', 'open']
+
+    def test_case_events_stream(self, app, client, auth_headers):
+        """测试案例进度推送：先推送快照，再推送总线上的事件，到达最长时长后发送end"""
+        from app.services.infrastructure.progress_bus import case_topic, publish_progress
+
+        user = User.query.filter_by(username='testuser').first()
+        case = Case(title='进度推送', user_id=user.id)
+        db.session.add(case)
+        db.session.flush()
+        db.session.add(Node(case_id=case.id, type='AI_ANALYSIS', title='分析中', status='PROCESSING'))
+        db.session.commit()
+        case_id = case.id
+
+        app.config.update(SSE_MAX_STREAM_SECONDS=1, SSE_KEEPALIVE_SECONDS=0.2)
+        # EventSource 无法设置请求头，先换取一次性推送票据，通过查询参数传递
+        ticket = client.post('/api/v1/auth/stream-ticket', headers=auth_headers).get_json()['data']['ticket']
+        response = client.get(f'/api/v1/cases/{case_id}/events?ticket={ticket}', buffered=False)
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        assert response.headers['Cache-Control'] == 'no-cache'
+
+        chunks = iter(response.response)
+        snapshot = next(chunks).decode('utf-8')
+        assert 'event: snapshot' in snapshot
+        snapshot_data = json.loads(snapshot.split('data: ', 1)[1])
+        assert snapshot_data['caseId'] == case_id
+        assert snapshot_data['hasProcessingNodes'] is True
+
+        publish_progress(case_topic(case_id), 'progress', step='analyze_query', progress=None)
+        rest = b''.join(chunks).decode('utf-8')
+        response.close()
+
+        assert 'event: progress' in rest
+        assert '"step": "analyze_query"' in rest
+        assert 'event: end' in rest
+        assert '"reason": "max_duration"' in rest
+
+    def test_case_events_not_found_response(self, client, auth_headers):
+        """测试订阅不存在案例的进度返回404"""
+        response = client.get('/api/v1/cases/nonexistent/events', headers=auth_headers)
+
+        assert response.status_code == 404
+        data = response.get_json()
+        assert data['status'] == 'error'
+        assert data['error']['type'] == 'NOT_FOUND'
+
+    def test_stream_ticket_single_use(self, client, auth_headers, test_case):
+        """测试推送票据只能使用一次，查询参数中的访问令牌不再被接受"""
+        token = auth_headers['Authorization'].split(' ', 1)[1]
+        response = client.get(f'/api/v1/cases/{test_case.id}/events?jwt={token}')
+        assert response.status_code == 401
+
+        ticket = client.post('/api/v1/auth/stream-ticket', headers=auth_headers).get_json()['data']['ticket']
+        first = client.get(f'/api/v1/cases/{test_case.id}/events?ticket={ticket}', buffered=False)
+        assert first.status_code == 200
+        first.close()
+
+        second = client.get(f'/api/v1/cases/{test_case.id}/events?ticket={ticket}')
+        assert second.status_code == 401
+        assert second.get_json()['status'] == 'error'
+
+    def test_open_streams_capped(self, app, client, auth_headers, test_case):
+        """测试打开的推送连接数达到上限时返回503，连接关闭后释放名额"""
+        from app.utils.sse import open_stream_count
+
+        app.config.update(SSE_MAX_OPEN_STREAMS=1)
+        first = client.get(f'/api/v1/cases/{test_case.id}/events', headers=auth_headers, buffered=False)
+        assert first.status_code == 200
+
+        rejected = client.get(f'/api/v1/cases/{test_case.id}/events', headers=auth_headers)
+        assert rejected.status_code == 503
+        assert 'Retry-After' in rejected.headers
+
+        first.close()
+        assert open_stream_count() == 0
+        second = client.get(f'/api/v1/cases/{test_case.id}/events', headers=auth_headers, buffered=False)
+        assert second.status_code == 200
+        second.close()
+
+    def test_create_case_shed_when_lane_backlogged(self, app, client, auth_headers):
+        """测试交互车道积压达到上限时直接拒绝新建案例，并返回Retry-After"""
+        app.config.update(ADMISSION_MAX_QUEUED=0, ADMISSION_RETRY_AFTER_SECONDS=45)
+
+        response = client.post('/api/v1/cases/', json={'query': '我的网络连接有问题'},
+                               headers=auth_headers)
+
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '45'
+        data = response.get_json()
+        assert data['status'] == 'error'
+        assert data['error']['type'] == 'RATE_LIMITED'
+        assert Case.query.count() == 0
+
+    def test_similar_cases_response(self, app, client, auth_headers, tmp_path):
+        """测试相似案例查询：已解决案例写入索引后按问题语义返回"""
+        from unittest.mock import patch
+        from app.services.retrieval.case_index import ResolvedCaseIndex, index_resolved_case, reset_case_index
+
+        app.config['RESOLVED_CASE_INDEX_PATH'] = str(tmp_path / 'resolved_cases')
+        reset_case_index()
+
+        user = User.query.filter_by(username='testuser').first()
+        case = Case(title='OSPF邻居卡在ExStart', user_id=user.id, status='resolved',
+                    case_metadata={'original_query': 'OSPF邻居卡在ExStart', 'vendor': 'Huawei'})
+        db.session.add(case)
+        db.session.flush()
+        db.session.add(Node(case_id=case.id, type='SOLUTION', title='解决方案', status='COMPLETED',
+                            content={'answer': '检查两端MTU是否一致', 'category': 'routing'}))
+        db.session.commit()
+
+        def fake_embed(self, text):
+            return [1.0, 0.0] if 'OSPF' in text or 'ospf' in text else [0.0, 1.0]
+
+        try:
+            with patch.object(ResolvedCaseIndex, '_embed', fake_embed):
+                index_resolved_case(case.id)
+
+                response = client.get('/api/v1/cases/similar?query=ospf邻居停在exstart&vendor=Huawei',
+                                      headers=auth_headers)
+                assert response.status_code == 200
+                data = response.get_json()
+                assert data['status'] == 'success'
+                assert [item['caseId'] for item in data['data']['cases']] == [case.id]
+                assert data['data']['cases'][0]['solution'] == '检查两端MTU是否一致'
+                assert 'tookMs' in data['data']
+
+                response = client.get('/api/v1/cases/similar?query=BGP会话断开', headers=auth_headers)
+                assert response.get_json()['data']['cases'] == []
+
+                # 状态改回未解决后从索引中移除
+                case.status = 'open'
+                db.session.commit()
+                index_resolved_case(case.id)
+                response = client.get('/api/v1/cases/similar?query=ospf邻居停在exstart', headers=auth_headers)
+                assert response.get_json()['data']['cases'] == []
+
+            response = client.get('/api/v1/cases/similar', headers=auth_headers)
+            assert response.status_code == 400
+        finally:
+            reset_case_index()
+
+    def test_similar_cases_scoped_to_user(self, app, client, auth_headers, tmp_path):
+        """测试相似案例查询只返回当前用户的案例，其他用户的已解决案例不可见"""
+        from unittest.mock import patch
+        from flask_jwt_extended import create_access_token
+        from app.services.retrieval.case_index import ResolvedCaseIndex, index_resolved_case, reset_case_index
+
+        app.config['RESOLVED_CASE_INDEX_PATH'] = str(tmp_path / 'resolved_cases')
+        reset_case_index()
+
+        owner = User.query.filter_by(username='testuser').first()
+        other = User(username='other_user', email='other@example.com')
+        other.set_password('otherpass')
+        db.session.add(other)
+        case = Case(title='OSPF邻居卡在ExStart', user_id=owner.id, status='resolved',
+                    case_metadata={'original_query': 'OSPF邻居卡在ExStart', 'vendor': 'Huawei'})
+        db.session.add(case)
+        db.session.flush()
+        db.session.add(Node(case_id=case.id, type='SOLUTION', title='解决方案', status='COMPLETED',
+                            content={'answer': '检查两端MTU是否一致'}))
+        db.session.commit()
+        other_headers = {'Authorization': f'Bearer {create_access_token(identity=str(other.id))}'}
+
+        try:
+            with patch.object(ResolvedCaseIndex, '_embed', lambda self, text: [1.0, 0.0]):
+                index_resolved_case(case.id)
+
+                response = client.get('/api/v1/cases/similar?query=OSPF邻居卡在ExStart', headers=other_headers)
+                assert response.status_code == 200
+                assert response.get_json()['data']['cases'] == []
+
+                response = client.get('/api/v1/cases/similar?query=OSPF邻居卡在ExStart', headers=auth_headers)
+                assert [item['caseId'] for item in response.get_json()['data']['cases']] == [case.id]
+        finally:
+            reset_case_index()
+
+    def test_node_events_stream_tokens(self, app, client, auth_headers):
+        """测试节点流式推送：快照带已生成部分，之后推送片段，节点完成时结束"""
+        from app.services.infrastructure.progress_bus import (
+            TOKEN_EVENT, node_topic, publish_node_update, publish_progress
+        )
+
+        user = User.query.filter_by(username='testuser').first()
+        case = Case(title='流式生成', user_id=user.id)
+        db.session.add(case)
+        db.session.flush()
+        node = Node(case_id=case.id, type='SOLUTION', title='解决方案', status='PROCESSING',
+                    content={'answer': '检查', 'streaming': True})
+        db.session.add(node)
+        db.session.commit()
+        case_id, node_id = case.id, node.id
+
+        ticket = client.post('/api/v1/auth/stream-ticket', headers=auth_headers).get_json()['data']['ticket']
+        response = client.get(f'/api/v1/cases/{case_id}/nodes/{node_id}/events?ticket={ticket}', buffered=False)
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+
+        chunks = iter(response.response)
+        snapshot = next(chunks).decode('utf-8')
+        assert 'event: snapshot' in snapshot
+        assert json.loads(snapshot.split('data: ', 1)[1])['content']['answer'] == '检查'
+
+        publish_progress(node_topic(node_id), TOKEN_EVENT, nodeId=node_id, offset=2, delta='接口状态')
+        node.status = 'COMPLETED'
+        node.content = {'answer': '检查接口状态'}
+        db.session.commit()
+        publish_node_update(node)
+        rest = b''.join(chunks).decode('utf-8')
+        response.close()
+
+        assert 'event: token' in rest
+        assert '"delta": "接口状态"' in rest
+        assert 'event: node' in rest
+        assert '"reason": "completed"' in rest
+
+    def test_node_events_for_completed_node(self, client, auth_headers, test_case):
+        """测试已完成节点只推送快照"""
+        node = Node(case_id=test_case.id, type='SOLUTION', title='解决方案', status='COMPLETED',
+                    content={'answer': '检查接口状态'})
+        db.session.add(node)
+        db.session.commit()
+
+        response = client.get(f'/api/v1/cases/{test_case.id}/nodes/{node.id}/events', headers=auth_headers)
+
+        body = response.get_data(as_text=True)
+        assert 'event: snapshot' in body
+        assert 'event: end' in body
+        assert 'event: token' not in body
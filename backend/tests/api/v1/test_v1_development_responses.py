@@ -317,6 +317,20 @@ class TestDevelopmentAPIResponses:
         assert data['status'] == 'error'
         assert data['error']['type'] == 'FORBIDDEN'
 
+    def test_reload_workflows_response(self, client, admin_headers, auth_headers):
+        """测试重新加载Agent工作流响应格式"""
+        response = client.post('/api/v1/dev/workflows/reload', json={}, headers=auth_headers)
+        assert response.status_code == 403
+
+        response = client.post('/api/v1/dev/workflows/reload', json={}, headers=admin_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+
+        assert data['status'] == 'success'
+        names = [item['name'] for item in data['data']['workflows']]
+        assert 'agent' in names
+        assert all(not item['compiled'] for item in data['data']['workflows'])
+
     def test_dev_tools_disabled_response(self, client, admin_headers):
         """测试开发工具禁用时的响应格式"""
         # 如果在生产环境禁用开发工具
@@ -8,9 +8,12 @@ import pytest
 import io
 import json
 import os
+import hashlib
+from unittest.mock import patch
 
 from app import db
 from app.models.files import UserFile
+from app.models.knowledge import KnowledgeDocument
 
 class TestFilesAPIResponses:
     """文件 API 响应测试类"""
@@ -139,3 +142,146 @@ class TestFilesAPIResponses:
             if user_file:
                 db.session.delete(user_file)
         db.session.commit()
+
+
+class TestChunkedUploadAPI:
+    """分片上传 API 测试类"""
+
+    def _create(self, client, auth_headers, content, **extra):
+        payload = {
+            'fileName': 'switch_logs.log',
+            'fileSize': len(content),
+            'chunkSize': 4,
+            'sha256': hashlib.sha256(content).hexdigest()
+        }
+        payload.update(extra)
+        return client.post('/api/v1/files/uploads', json=payload, headers=auth_headers)
+
+    def _put_part(self, client, auth_headers, upload_id, number, data):
+        return client.put(f'/api/v1/files/uploads/{upload_id}/parts/{number}',
+                          data=data, headers=auth_headers)
+
+    def test_out_of_order_parts_resume_and_complete(self, client, auth_headers):
+        """测试乱序上传、断点续传后完成上传生成附件"""
+        content = b'interface GE0/0/1 down\n'
+        parts = [content[i:i + 4] for i in range(0, len(content), 4)]
+
+        response = self._create(client, auth_headers, content, description='core switch logs')
+        assert response.status_code == 201
+        session = response.get_json()['data']
+        upload_id = session['uploadId']
+        assert session['totalParts'] == len(parts)
+
+        # 先上传除第1片外的所有分片（乱序），模拟断线
+        for number in range(len(parts), 1, -1):
+            assert self._put_part(client, auth_headers, upload_id, number, parts[number - 1]).status_code == 200
+
+        status = client.get(f'/api/v1/files/uploads/{upload_id}', headers=auth_headers).get_json()['data']
+        assert status['missingParts'] == [1]
+
+        # 未齐全时不能完成
+        response = client.post(f'/api/v1/files/uploads/{upload_id}/complete', headers=auth_headers)
+        assert response.status_code == 409
+        assert response.get_json()['error']['details']['missingParts'] == [1]
+
+        # 续传缺失分片，重复上传已接收分片是幂等的
+        assert self._put_part(client, auth_headers, upload_id, 1, parts[0]).status_code == 200
+        assert self._put_part(client, auth_headers, upload_id, 2, parts[1]).status_code == 200
+
+        response = client.post(f'/api/v1/files/uploads/{upload_id}/complete', headers=auth_headers)
+        assert response.status_code == 201
+        file_info = response.get_json()['data']['file_info']
+        assert file_info['size'] == len(content)
+        assert file_info['description'] == 'core switch logs'
+
+        user_file = db.session.get(UserFile, file_info['id'])
+        with open(user_file.file_path, 'rb') as f:
+            assert f.read() == content
+        os.remove(user_file.file_path)
+
+    def test_part_validation(self, client, auth_headers):
+        """测试分片大小、校验和与冲突内容被拒绝"""
+        content = b'display bgp peer'
+        upload_id = self._create(client, auth_headers, content).get_json()['data']['uploadId']
+
+        # 分片大小不正确
+        assert self._put_part(client, auth_headers, upload_id, 1, b'dis').status_code == 400
+        # 分片序号越界
+        assert self._put_part(client, auth_headers, upload_id, 9, b'disp').status_code == 400
+        # 分片校验和不一致
+        response = client.put(f'/api/v1/files/uploads/{upload_id}/parts/1', data=b'disp',
+                              headers={**auth_headers, 'X-Part-SHA256': '0' * 64})
+        assert response.get_json()['error']['type'] == 'CHECKSUM_MISMATCH'
+
+        assert self._put_part(client, auth_headers, upload_id, 1, b'disp').status_code == 200
+        # 已接收分片不能被不同内容覆盖
+        assert self._put_part(client, auth_headers, upload_id, 1, b'DISP').status_code == 409
+
+    def test_concurrent_part_upload_cannot_overwrite_winner(self, client, auth_headers):
+        """测试同一分片并发上传时，后到的不同内容不会改写已占用的分片"""
+        from app.models.files import UploadSession
+        from app.services.storage.chunked_upload import get_chunked_upload_service
+
+        content = b'display bgp peer'
+        upload_id = self._create(client, auth_headers, content).get_json()['data']['uploadId']
+        session = db.session.get(UploadSession, upload_id)
+        # 模拟另一个请求已占用分片1的文件、尚未提交分片记录
+        part_path = get_chunked_upload_service().part_path(session, 1)
+        with open(part_path, 'wb') as f:
+            f.write(b'disp')
+
+        assert self._put_part(client, auth_headers, upload_id, 1, b'DISP').status_code == 409
+        with open(part_path, 'rb') as f:
+            assert f.read() == b'disp'
+        # 内容一致的并发重传视为成功
+        assert self._put_part(client, auth_headers, upload_id, 1, b'disp').status_code == 200
+        for number in range(2, 5):
+            assert self._put_part(client, auth_headers, upload_id, number,
+                                  content[(number - 1) * 4:number * 4]).status_code == 200
+        response = client.post(f'/api/v1/files/uploads/{upload_id}/complete', headers=auth_headers)
+        assert response.status_code == 201
+        os.remove(db.session.get(UserFile, response.get_json()['data']['file_info']['id']).file_path)
+
+    def test_checksum_mismatch_on_complete(self, client, auth_headers):
+        """测试整体SHA-256不一致时拒绝完成上传"""
+        content = b'ospf lsa'
+        upload_id = self._create(client, auth_headers, content, sha256='a' * 64).get_json()['data']['uploadId']
+        for number, offset in enumerate(range(0, len(content), 4), start=1):
+            self._put_part(client, auth_headers, upload_id, number, content[offset:offset + 4])
+
+        response = client.post(f'/api/v1/files/uploads/{upload_id}/complete', headers=auth_headers)
+        assert response.status_code == 400
+        assert response.get_json()['error']['type'] == 'CHECKSUM_MISMATCH'
+
+    @patch('app.services.get_task_queue')
+    def test_knowledge_upload_creates_document(self, mock_get_task_queue, client, auth_headers):
+        """测试知识文档分片上传完成后进入解析队列"""
+        content = b'Huawei VRP configuration guide'
+        response = self._create(client, auth_headers, content, fileName='guide.txt',
+                                purpose='knowledge', vendor='Huawei')
+        upload_id = response.get_json()['data']['uploadId']
+        for number, offset in enumerate(range(0, len(content), 4), start=1):
+            self._put_part(client, auth_headers, upload_id, number, content[offset:offset + 4])
+
+        response = client.post(f'/api/v1/files/uploads/{upload_id}/complete', headers=auth_headers)
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['status'] == 'QUEUED'
+
+        document = db.session.get(KnowledgeDocument, data['docId'])
+        assert document.vendor == 'Huawei'
+        assert document.content_hash == hashlib.sha256(content).hexdigest()
+        assert mock_get_task_queue.return_value.enqueue.call_count == 1
+
+    def test_abort_upload_removes_temp_file(self, client, auth_headers):
+        """测试取消上传会删除临时文件"""
+        from app.models.files import UploadSession
+
+        upload_id = self._create(client, auth_headers, b'abcdefgh').get_json()['data']['uploadId']
+        temp_path = db.session.get(UploadSession, upload_id).temp_path
+        assert os.path.exists(temp_path)
+
+        response = client.delete(f'/api/v1/files/uploads/{upload_id}', headers=auth_headers)
+        assert response.status_code == 204
+        assert not os.path.exists(temp_path)
+        assert self._put_part(client, auth_headers, upload_id, 1, b'abcd').status_code == 409
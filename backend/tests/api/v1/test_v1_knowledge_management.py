@@ -8,7 +8,9 @@ import pytest
 import json
 import io
 import os
+import hashlib
 import tempfile
+from unittest.mock import patch
 from app import db
 from app.models.knowledge import KnowledgeDocument, ParsingJob
 from app.models.user import User
@@ -314,6 +316,73 @@ class TestKnowledgeDocumentManagement:
         assert response.status_code == 404
 
 
+class TestKnowledgeDocumentDeduplication:
+    """知识文档内容去重测试类"""
+
+    def _upload(self, client, auth_headers, content, filename='manual.txt'):
+        return client.post('/api/v1/knowledge/documents',
+                           data={'file': (io.BytesIO(content), filename), 'vendor': 'Huawei'},
+                           content_type='multipart/form-data',
+                           headers=auth_headers)
+
+    @patch('app.services.get_task_queue')
+    def test_duplicate_upload_reuses_parsed_document(self, mock_get_task_queue, client, auth_headers):
+        """测试重复上传相同内容时复用已有解析结果"""
+        content = b"OSPF neighbor troubleshooting manual"
+
+        first = self._upload(client, auth_headers, content).get_json()['data']
+        second_response = self._upload(client, auth_headers, content, 'manual_copy.txt')
+
+        assert second_response.status_code == 200
+        second = second_response.get_json()['data']
+        assert second['deduplicated'] is True
+        assert second['sourceDocId'] == first['docId']
+
+        # 只有首次上传创建了解析任务并提交到队列
+        assert mock_get_task_queue.return_value.enqueue.call_count == 1
+        assert ParsingJob.query.filter_by(document_id=second['docId']).count() == 0
+
+        canonical = db.session.get(KnowledgeDocument, first['docId'])
+        duplicate = db.session.get(KnowledgeDocument, second['docId'])
+        assert canonical.content_hash == hashlib.sha256(content).hexdigest()
+        assert duplicate.content_hash is None
+        assert duplicate.file_path == canonical.file_path
+        assert duplicate.original_filename == 'manual_copy.txt'
+
+    @patch('app.services.get_task_queue')
+    def test_failed_document_is_not_reused(self, mock_get_task_queue, client, auth_headers):
+        """测试解析失败的文档不会作为复用来源"""
+        content = b"broken vendor manual"
+
+        first = self._upload(client, auth_headers, content).get_json()['data']
+        canonical = db.session.get(KnowledgeDocument, first['docId'])
+        canonical.status = 'FAILED'
+        db.session.commit()
+
+        second = self._upload(client, auth_headers, content).get_json()['data']
+        assert 'deduplicated' not in second
+        assert db.session.get(KnowledgeDocument, first['docId']).content_hash is None
+        assert db.session.get(KnowledgeDocument, second['docId']).content_hash is not None
+
+    @patch('app.services.get_task_queue')
+    def test_delete_canonical_keeps_shared_content(self, mock_get_task_queue, client, auth_headers):
+        """测试删除被复用的文档时保留共享文件，最后一个引用删除后再清理"""
+        content = b"shared BGP configuration guide"
+
+        first = self._upload(client, auth_headers, content).get_json()['data']
+        second = self._upload(client, auth_headers, content).get_json()['data']
+        shared_path = db.session.get(KnowledgeDocument, first['docId']).file_path
+
+        response = client.delete(f"/api/v1/knowledge/documents/{first['docId']}", headers=auth_headers)
+        assert response.status_code == 204
+        assert os.path.exists(shared_path)
+
+        response = client.delete(f"/api/v1/knowledge/documents/{second['docId']}", headers=auth_headers)
+        assert response.status_code == 204
+        assert not os.path.exists(shared_path)
+        assert db.session.get(KnowledgeDocument, first['docId']).content_hash is None
+
+
 @pytest.fixture
 def sample_document(test_user):
     """创建示例文档fixture"""
@@ -375,3 +444,27 @@ def other_user_document():
     db.session.delete(document)
     db.session.delete(other_user)
     db.session.commit()
+
+    def test_parsing_result_loaded_lazily(self, app, client, auth_headers, tmp_path):
+        """测试解析结果不随详情返回，仅通过独立接口从产物存储加载"""
+        from app.services.storage.artifact_store import get_artifact_store
+
+        app.config['PARSE_ARTIFACT_FOLDER'] = str(tmp_path)
+        with patch('app.services.get_task_queue'):
+            first = self._upload(client, auth_headers, b"MPLS LDP guide").get_json()['data']
+            second = self._upload(client, auth_headers, b"MPLS LDP guide").get_json()['data']
+
+        canonical = db.session.get(KnowledgeDocument, first['docId'])
+        canonical.parsing_result_ref = get_artifact_store().save(canonical.id, {'layouts': [{'text': 'LDP'}]})
+        canonical.parsing_summary = {'chunks_count': 1}
+        db.session.commit()
+
+        detail = client.get(f"/api/v1/knowledge/documents/{first['docId']}", headers=auth_headers).get_json()['data']
+        assert detail['hasParsingResult'] is True
+        assert detail['parsingSummary'] == {'chunks_count': 1}
+        assert 'parsingResult' not in detail
+
+        # 重复文档读取规范文档持有的解析产物
+        response = client.get(f"/api/v1/knowledge/documents/{second['docId']}/parsing-result", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.get_json()['data']['parsingResult'] == {'layouts': [{'text': 'LDP'}]}
@@ -410,3 +410,53 @@ class TestKnowledgeAPIResponses:
             assert data['code'] == 400
             assert data['status'] == 'error'
             assert data['error']['type'] == 'INVALID_REQUEST'
+
+    def test_document_events_stream_ends_on_status(self, client, auth_headers, test_document):
+        """测试文档解析进度推送在收到最终状态后结束"""
+        from app.services.infrastructure.progress_bus import document_topic, publish_progress
+
+        doc_id = test_document.id
+        response = client.get(f'/api/v1/knowledge/documents/{doc_id}/events',
+                              headers=auth_headers, buffered=False)
+
+        assert response.status_code == 200
+        chunks = iter(response.response)
+        assert 'event: snapshot' in next(chunks).decode('utf-8')
+
+        publish_progress(document_topic(doc_id), 'progress', step='parsed', progress=50)
+        publish_progress(document_topic(doc_id), 'status', status='INDEXED', progress=100)
+        rest = b''.join(chunks).decode('utf-8')
+        response.close()
+
+        assert rest.index('event: progress') < rest.index('event: status') < rest.index('event: end')
+        assert '"reason": "completed"' in rest
+
+    def test_document_events_for_finished_document(self, client, auth_headers, test_document):
+        """测试已解析完成的文档只推送快照"""
+        test_document.status = 'INDEXED'
+        db.session.commit()
+        doc_id = test_document.id
+
+        response = client.get(f'/api/v1/knowledge/documents/{doc_id}/events', headers=auth_headers)
+
+        body = response.get_data(as_text=True)
+        assert response.status_code == 200
+        assert '"documentStatus": "INDEXED"' in body
+        assert 'event: end' in body
+
+    def test_search_rate_limited_response(self, app, client, auth_headers):
+        """测试搜索超出每用户限额后返回429和Retry-After"""
+        app.config['ADMISSION_CHEAP_USER_LIMIT'] = '2 per minute'
+
+        for _ in range(2):
+            response = client.post('/api/v1/knowledge/search', json={'query': '网络配置'},
+                                   headers=auth_headers)
+            assert response.status_code != 429
+
+        response = client.post('/api/v1/knowledge/search', json={'query': '网络配置'},
+                               headers=auth_headers)
+
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) > 0
+        data = response.get_json()
+        assert data['status'] == 'error'
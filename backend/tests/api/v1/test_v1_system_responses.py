@@ -50,6 +50,30 @@ class TestSystemAPIResponses:
         # 检查服务状态
         assert isinstance(health_data['services'], dict)
 
+    def test_system_health_reports_circuit_breakers(self, client):
+        """测试健康检查返回熔断器状态，依赖熔断时报告为降级而不是不健康"""
+        from unittest.mock import MagicMock
+        from app.utils.circuit_breaker import get_breaker, reset_breakers
+
+        reset_breakers()
+        try:
+            breaker = get_breaker('embedding:dashscope')
+            for _ in range(breaker.min_calls):
+                with pytest.raises(RuntimeError):
+                    breaker.call(MagicMock(side_effect=RuntimeError('503')))
+
+            response = client.get('/api/v1/system/health')
+
+            assert response.status_code == 200
+            health_data = response.get_json()['data']
+            assert health_data['circuit_breakers']['embedding:dashscope']['state'] == 'open'
+            assert health_data['degraded'] is True
+            assert health_data['degraded_dependencies'] == ['embedding:dashscope']
+            assert health_data['healthy'] == all(service['status'] == 'up'
+                                                 for service in health_data['services'].values())
+        finally:
+            reset_breakers()
+
     def test_statistics_response(self, client, auth_headers):
         """测试统计数据响应格式"""
         response = client.get('/api/v1/system/statistics', headers=auth_headers)
@@ -117,6 +141,7 @@ class TestSystemAPIResponses:
             assert 'network_io' in metrics
             assert 'request_count' in metrics
             assert 'error_rate' in metrics
+            assert 'cache' in metrics
 
     def test_system_logs_response(self, client, admin_headers):
         """测试系统日志响应格式"""
@@ -375,3 +400,30 @@ class TestSystemAPIResponses:
             assert 'files_deleted' in cleanup_data
             assert 'space_freed' in cleanup_data
             assert 'cleanup_summary' in cleanup_data
+
+    def test_queue_stats_response(self, client, auth_headers):
+        """测试任务队列统计响应包含排队深度、工作线程和按任务函数的指标"""
+        response = client.get('/api/v1/system/queue/stats', headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['success'] is True
+
+        stats = data['data']
+        for key in ('queue_length', 'running_count', 'workers_count', 'workers',
+                    'failed_jobs_count', 'lanes', 'functions', 'process_lane'):
+            assert key in stats
+
+    def test_queue_metrics_prometheus_format(self, app, client, auth_headers):
+        """测试任务队列指标以 Prometheus 文本格式输出，接受JWT或采集令牌"""
+        response = client.get('/api/v1/system/queue/metrics', headers=auth_headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert '# TYPE task_queue_lane_workers gauge' in response.get_data(as_text=True)
+
+        assert client.get('/api/v1/system/queue/metrics').status_code == 401
+
+        app.config['METRICS_SCRAPE_TOKEN'] = 'scrape-secret'
+        response = client.get('/api/v1/system/queue/metrics',
+                              headers={'Authorization': 'Bearer scrape-secret'})
+        assert response.status_code == 200
@@ -33,6 +33,9 @@ class TestConfig:
     # Redis配置（测试时使用假的Redis）
     REDIS_URL = 'redis://localhost:6379/1'
 
+    # 测试用例之间会提交相同的请求体，只按 Idempotency-Key 识别重复请求
+    IDEMPOTENCY_WINDOW_SECONDS = 0
+
     # 文件上传配置
     UPLOAD_FOLDER = tempfile.mkdtemp()
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
@@ -0,0 +1,120 @@
+"""
+本地模拟大模型服务器集成测试
+
+启动 bin/fake_llm_server.py 的应用，验证LLM服务和向量化服务可以通过接入地址指向它，
+以及耗时、流式输出、故障注入和限流的行为。
+"""
+
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from werkzeug.serving import make_server
+
+from bin.fake_llm_server import FakeServerSettings, create_app as create_fake_server, fake_embedding
+
+
+@pytest.fixture
+def fake_server():
+    """在随机端口上运行模拟服务器，返回 (基础地址, 参数)"""
+    settings = FakeServerSettings(latency_ms=20, latency_dist='fixed', tokens_per_second=0,
+                                  reply_tokens=40, embedding_latency_ms=0)
+    server = make_server('127.0.0.1', 0, create_fake_server(settings), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", settings
+    finally:
+        server.shutdown()
+
+
+@pytest.fixture
+def fake_llm_env(fake_server):
+    """让 LLMService 在测试中走真实调用路径并指向模拟服务器"""
+    base_url, settings = fake_server
+    env = {
+        'LLM_USE_MOCK': '0',
+        'DASHSCOPE_API_KEY': 'fake-key',
+        'OPENAI_API_BASE': f"{base_url}/compatible-mode/v1",
+        'LLM_MAX_RETRIES': '0'
+    }
+    with patch.dict(os.environ, env):
+        os.environ.pop('LLM_TARGETS', None)
+        yield base_url, settings
+
+
+@pytest.mark.integration
+class TestFakeLLMServer:
+    """模拟大模型服务器测试类"""
+
+    def test_llm_service_calls_fake_server(self, app, fake_llm_env):
+        """测试LLM服务通过接入地址调用模拟服务器，回复包含问题内容"""
+        from langchain.schema import HumanMessage
+        from app.services.ai.llm_service import LLMService
+
+        service = LLMService()
+        assert not service.is_mock
+
+        started_at = time.time()
+        reply = service.llm.invoke([HumanMessage(content='OSPF邻居卡在ExStart')])
+
+        assert 'OSPF邻居卡在ExStart' in reply.content
+        assert time.time() - started_at >= 0.02
+        assert service.get_router_stats()['targets'][0]['samples'] == 1
+
+    def test_streaming_respects_token_rate(self, app, fake_llm_env):
+        """测试流式输出按配置的生成速度逐段推送"""
+        from langchain.schema import HumanMessage
+        from app.services.ai.llm_service import LLMService
+
+        _, settings = fake_llm_env
+        settings.tokens_per_second = 200
+        tokens = []
+
+        started_at = time.time()
+        text = LLMService()._stream([HumanMessage(content='BGP路由黑洞')], tokens.append)
+
+        assert len(tokens) == settings.reply_tokens
+        assert text == ''.join(tokens)
+        assert time.time() - started_at >= settings.reply_tokens / settings.tokens_per_second
+
+    def test_injected_errors_use_fallback(self, app, fake_llm_env):
+        """测试注入的错误使LLM服务走降级结果"""
+        from app.services.ai.llm_service import LLMService
+
+        _, settings = fake_llm_env
+        settings.error_rate = 1.0
+
+        result = LLMService().analyze_query('交换机端口频繁up/down（故障注入）', vendor='Huawei')
+
+        assert result['fallback'] is True
+
+    def test_rate_limit_returns_retry_after(self, fake_server):
+        """测试超过限流速率时返回429和Retry-After"""
+        _, settings = fake_server
+        settings.rate_limit_rps = 0.5
+        settings.rate_limit_burst = 1
+        client = create_fake_server(settings).test_client()
+        body = {'model': 'qwen-plus', 'messages': [{'role': 'user', 'content': 'ping'}]}
+
+        assert client.post('/v1/chat/completions', json=body).status_code == 200
+        limited = client.post('/v1/chat/completions', json=body)
+
+        assert limited.status_code == 429
+        assert int(limited.headers['Retry-After']) >= 1
+        assert limited.get_json()['error']['type'] == 'rate_limit_exceeded'
+
+    def test_embedding_service_uses_dashscope_endpoint(self, fake_server):
+        """测试向量化服务通过 DashScope 接入地址获取确定性的向量"""
+        import dashscope
+        from app.services.ai.embedding_service import QwenEmbedding
+
+        base_url, _ = fake_server
+        with patch.object(dashscope, 'base_http_api_url', f"{base_url}/api/v1"):
+            vectors = QwenEmbedding(api_key='fake-key').embed_batch(['OSPF邻居建立失败', 'VLAN间无法通信'])
+
+        assert len(vectors) == 2
+        assert vectors[0] == pytest.approx(fake_embedding('OSPF邻居建立失败', 1024))
+        assert len(vectors[1]) == 1024
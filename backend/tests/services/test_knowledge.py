@@ -7,6 +7,7 @@ IP智慧解答专家系统 - 知识文档API测试
 import pytest
 import tempfile
 import io
+from unittest.mock import patch
 from app.models.knowledge import KnowledgeDocument, ParsingJob
 from app import db
 
@@ -139,6 +140,7 @@ class TestKnowledgeAPI:
         data = response.get_json()
         assert data['status'] == 'success'
         assert data['data']['status'] == 'QUEUED'
+        assert data['data']['jobId']
 
         # 验证文档状态已重置
         updated_doc = KnowledgeDocument.query.get(test_document.id)
@@ -146,6 +148,28 @@ class TestKnowledgeAPI:
         assert updated_doc.progress == 0
         assert updated_doc.error_message is None
 
+    def test_reparse_document_queue_unavailable(self, client, auth_headers, test_document):
+        """测试任务队列不可用时返回503，不在请求线程中解析，文档保持原状态"""
+        test_document.status = 'FAILED'
+        test_document.error_message = 'Test error'
+        db.session.commit()
+
+        with patch('app.services.get_task_queue', side_effect=RuntimeError('queue down')), \
+                patch('app.services.document.document_service.parse_document') as parse:
+            response = client.post(f'/api/v1/knowledge/documents/{test_document.id}/reparse',
+                                   headers=auth_headers)
+
+        assert response.status_code == 503
+        assert 'Retry-After' in response.headers
+        assert response.get_json()['error']['type'] == 'SERVICE_UNAVAILABLE'
+        parse.assert_not_called()
+
+        document = db.session.get(KnowledgeDocument, test_document.id)
+        assert document.status == 'FAILED'
+        assert document.error_message == 'Test error'
+        job = ParsingJob.query.filter_by(document_id=test_document.id).one()
+        assert job.status == 'FAILED'
+
     def test_reparse_document_not_found(self, client, auth_headers):
         """测试重新解析不存在的文档"""
         response = client.post('/api/v1/knowledge/documents/nonexistent-id/reparse',
@@ -4,16 +4,20 @@ langgraph Agent 基础组件测试
 测试 langgraph Agent 的核心组件，包括状态定义、节点函数和工作流创建。
 """
 
+import time
 import pytest
 from typing import Dict, Any
+from unittest.mock import MagicMock, patch
 
 from app.services.ai.agent_state import AgentState
 from app.services.ai.agent_nodes import (
     analyze_query, generate_clarification,
-    retrieve_knowledge, generate_solution, handle_error
+    retrieve_knowledge, generate_solution, handle_error, analyze_and_retrieve
 )
 from app.services.ai.agent_workflow import (
-    create_agent_workflow, create_response_processing_workflow
+    create_agent_workflow, create_response_processing_workflow,
+    AGENT_WORKFLOW, RESPONSE_PROCESSING_WORKFLOW, SPECULATIVE_AGENT_WORKFLOW,
+    get_workflow, reload_workflows, list_workflows
 )
 
 
@@ -106,6 +110,277 @@ class TestAgentWorkflow:
         assert response_workflow is not None
         assert str(type(response_workflow)) == "<class 'langgraph.graph.state.CompiledStateGraph'>"
 
+    def test_get_workflow_compiles_once(self):
+        """测试编译后的工作流在多次获取之间复用"""
+        reload_workflows()
+        workflow = get_workflow(AGENT_WORKFLOW)
+        assert get_workflow(AGENT_WORKFLOW) is workflow
+        assert get_workflow(RESPONSE_PROCESSING_WORKFLOW) is not workflow
+
+        compiled = {item['name']: item['compiled'] for item in list_workflows()}
+        assert compiled[AGENT_WORKFLOW] and compiled[RESPONSE_PROCESSING_WORKFLOW]
+        assert not compiled[SPECULATIVE_AGENT_WORKFLOW]
+
+    def test_reload_workflows_recompiles(self):
+        """测试重新加载后下次获取时重新编译"""
+        workflow = get_workflow(AGENT_WORKFLOW)
+        workflows = reload_workflows()
+
+        assert all(not item['compiled'] for item in workflows)
+        assert get_workflow(AGENT_WORKFLOW) is not workflow
+
+    def test_get_unknown_workflow(self):
+        """测试获取未登记的工作流"""
+        with pytest.raises(ValueError):
+            get_workflow('unknown')
+
+
+class TestSpeculativeRetrieval:
+    """测试分析与检索并行执行"""
+
+    def _run(self, test_case, need_more_info):
+        from app import db
+        from app.models.case import Node
+
+        node = Node(case_id=test_case.id, type='AI_ANALYSIS', title='分析中', status='PROCESSING')
+        db.session.add(node)
+        db.session.commit()
+
+        def slow_analysis(**kwargs):
+            time.sleep(0.3)
+            return {'analysis': '邻居无法建立', 'category': 'OSPF', 'need_more_info': need_more_info}
+
+        def slow_search(query, vendor, case_id=None):
+            time.sleep(0.3)
+            return [{'content': 'OSPF Hello 定时器需一致'}]
+
+        llm_service = MagicMock()
+        llm_service.analyze_query.side_effect = slow_analysis
+        state: AgentState = {
+            "messages": [], "context": [], "user_query": "OSPF邻居无法建立", "vendor": "Huawei",
+            "category": None, "need_more_info": False, "solution_ready": False,
+            "case_id": test_case.id, "current_node_id": node.id, "analysis_result": None,
+            "clarification": None, "solution": None, "error": None, "step": "initializing"
+        }
+
+        with patch('app.services.ai.agent_nodes.get_llm_service', return_value=llm_service), \
+                patch('app.services.ai.agent_nodes._search_context', side_effect=slow_search):
+            started_at = time.time()
+            state = analyze_and_retrieve(state)
+            elapsed = time.time() - started_at
+
+        db.session.expire_all()
+        return state, elapsed, db.session.get(Node, node.id).node_metadata['step_timings']['analyze_and_retrieve']
+
+    def test_retrieval_runs_alongside_analysis(self, app, test_case):
+        """测试检索与分析同时进行，节省的时间记录在节点元数据中"""
+        state, elapsed, timings = self._run(test_case, need_more_info=False)
+
+        assert elapsed < 0.55
+        assert state["step"] == "knowledge_retrieved"
+        assert state["context"] == [{'content': 'OSPF Hello 定时器需一致'}]
+        assert timings['saved_seconds'] > 0.1
+        assert timings['retrieval_discarded'] is False
+
+    def test_retrieval_discarded_when_clarification_needed(self, app, test_case):
+        """测试需要澄清时丢弃检索结果"""
+        state, _, timings = self._run(test_case, need_more_info=True)
+
+        assert state["context"] == []
+        assert state["step"] == "need_clarification"
+        assert timings['retrieval_discarded'] is True
+
+    def test_retrieval_follows_task_cancellation(self, app, test_case):
+        """测试预检索线程绑定任务的取消令牌，任务取消后不再等待检索结果"""
+        from app import db
+        from app.models.case import Node
+        from app.services.infrastructure.cancellation import (
+            CancellationToken, TaskCancelled, bind_token, current_token
+        )
+
+        node = Node(case_id=test_case.id, type='AI_ANALYSIS', title='分析中', status='PROCESSING')
+        db.session.add(node)
+        db.session.commit()
+        token = CancellationToken()
+        seen_tokens = []
+
+        def slow_search(query, vendor, case_id=None):
+            seen_tokens.append(current_token())
+            time.sleep(1)
+            return []
+
+        def cancelled_analysis(**kwargs):
+            token.cancel()
+            return {'analysis': '邻居无法建立', 'category': 'OSPF', 'need_more_info': False}
+
+        llm_service = MagicMock()
+        llm_service.analyze_query.side_effect = cancelled_analysis
+        state: AgentState = {
+            "messages": [], "context": [], "user_query": "OSPF邻居无法建立", "vendor": "Huawei",
+            "category": None, "need_more_info": False, "solution_ready": False,
+            "case_id": test_case.id, "current_node_id": node.id, "analysis_result": None,
+            "clarification": None, "solution": None, "error": None, "step": "initializing"
+        }
+
+        with patch('app.services.ai.agent_nodes.get_llm_service', return_value=llm_service), \
+                patch('app.services.ai.agent_nodes._search_context', side_effect=slow_search), \
+                bind_token(token):
+            started_at = time.time()
+            with pytest.raises(TaskCancelled):
+                analyze_and_retrieve(state)
+
+        assert time.time() - started_at < 0.8
+        assert seen_tokens in ([], [token])
+
+    def test_solution_metadata_saved_over_existing_metadata(self, app, test_case):
+        """测试节点已有元数据（如并行检索的 step_timings）时解决方案的元数据仍被保存"""
+        from app import db
+        from app.models.case import Node
+
+        node = Node(case_id=test_case.id, type='AI_ANALYSIS', title='分析中', status='PROCESSING',
+                    node_metadata={'step_timings': {'analyze_and_retrieve': {'elapsed_seconds': 1.0}}})
+        db.session.add(node)
+        db.session.commit()
+
+        llm_service = MagicMock()
+        llm_service.generate_solution.return_value = {
+            'answer': '检查两端MTU', 'sources': [], 'commands': [], 'context_stats': {'packed_chunks': 1}
+        }
+        state: AgentState = {
+            "messages": [], "user_query": "OSPF邻居无法建立", "vendor": "Huawei",
+            "context": [{'content': 'MTU需一致', 'document_id': 'doc-1', 'source_type': 'document'}],
+            "category": "OSPF", "need_more_info": False, "solution_ready": False,
+            "case_id": test_case.id, "current_node_id": node.id, "analysis_result": None,
+            "clarification": None, "solution": None, "error": None, "step": "knowledge_retrieved"
+        }
+
+        stream_writer = MagicMock(first_token_seconds=0.42)
+        with patch('app.services.ai.agent_nodes.get_llm_service', return_value=llm_service), \
+                patch('app.services.ai.agent_nodes.create_stream_writer', return_value=stream_writer):
+            generate_solution(state)
+
+        db.session.expire_all()
+        metadata = db.session.get(Node, node.id).node_metadata
+        assert metadata['step_timings'] == {'analyze_and_retrieve': {'elapsed_seconds': 1.0}}
+        assert metadata['source_document_ids'] == ['doc-1']
+        assert metadata['context_stats'] == {'packed_chunks': 1}
+        # 首个token耗时同样保存在已有元数据的节点上
+        assert metadata['first_token_seconds'] == 0.42
+
+    def test_speculative_workflow_compiles(self):
+        """测试并行检索工作流可以编译"""
+        workflow = get_workflow(SPECULATIVE_AGENT_WORKFLOW)
+        assert workflow is not None
+
+
+class TestWorkflowCheckpoints:
+    """测试工作流步骤检查点"""
+
+    @staticmethod
+    def _state(case_id, node_id, query="OSPF邻居无法建立") -> AgentState:
+        return {
+            "messages": [], "context": [], "user_query": query, "vendor": "Huawei",
+            "category": None, "need_more_info": False, "solution_ready": False,
+            "case_id": case_id, "current_node_id": node_id, "analysis_result": None,
+            "clarification": None, "solution": None, "error": None, "step": "initializing"
+        }
+
+    @staticmethod
+    def _workflow(retrieve, solve):
+        from langgraph.graph import StateGraph, END
+        from app.services.ai.agent_workflow import with_progress
+
+        workflow = StateGraph(AgentState)
+        workflow.add_node("retrieve_knowledge", with_progress("retrieve_knowledge", retrieve))
+        workflow.add_node("generate_solution", with_progress("generate_solution", solve))
+        workflow.set_entry_point("retrieve_knowledge")
+        workflow.add_edge("retrieve_knowledge", "generate_solution")
+        workflow.add_edge("generate_solution", END)
+        return workflow.compile()
+
+    @pytest.fixture
+    def node(self, app, test_case):
+        from app import db
+        from app.models.case import Node
+
+        node = Node(case_id=test_case.id, type='AI_ANALYSIS', title='分析中', status='PROCESSING')
+        db.session.add(node)
+        db.session.commit()
+        return node
+
+    def test_retry_resumes_after_completed_step(self, app, test_case, node):
+        """测试重试时跳过已完成的步骤，并恢复该步骤写入的节点内容"""
+        from app import db
+
+        calls = {'retrieve': 0, 'solve': 0}
+        seen_content = []
+
+        def retrieve(state):
+            calls['retrieve'] += 1
+            node.content = {'text': '已检索到2篇资料'}
+            db.session.commit()
+            state["context"] = [{'content': 'OSPF Hello 定时器需一致'}]
+            state["step"] = "knowledge_retrieved"
+            return state
+
+        def solve(state):
+            calls['solve'] += 1
+            seen_content.append(node.content)
+            if calls['solve'] == 1:
+                raise RuntimeError('LLM调用超时')
+            state["solution"] = {'answer': '检查Hello定时器'}
+            state["step"] = "solution_generated"
+            return state
+
+        workflow = self._workflow(retrieve, solve)
+        with pytest.raises(RuntimeError):
+            workflow.invoke(self._state(test_case.id, node.id))
+
+        # 任务失败处理覆盖了节点内容
+        node.content = {'error': '响应处理过程中发生错误，请重试'}
+        db.session.commit()
+
+        final_state = workflow.invoke(self._state(test_case.id, node.id))
+
+        assert calls == {'retrieve': 1, 'solve': 2}
+        assert final_state["context"] == [{'content': 'OSPF Hello 定时器需一致'}]
+        assert final_state["solution"] == {'answer': '检查Hello定时器'}
+        assert seen_content[-1] == {'text': '已检索到2篇资料'}
+
+    def test_changed_input_reruns_step(self, app, test_case, node):
+        """测试输入状态变化时不使用检查点"""
+        retrieve = MagicMock(side_effect=lambda state: {**state, "step": "knowledge_retrieved"})
+        solve = MagicMock(side_effect=lambda state: {**state, "error": "生成失败"})
+        workflow = self._workflow(retrieve, solve)
+
+        workflow.invoke(self._state(test_case.id, node.id))
+        workflow.invoke(self._state(test_case.id, node.id))
+        workflow.invoke(self._state(test_case.id, node.id, query="BGP会话频繁断开"))
+
+        # 出错的步骤不保存检查点，每次都重新执行
+        assert retrieve.call_count == 2
+        assert solve.call_count == 3
+
+    def test_clear_and_purge_checkpoints(self, app, test_case, node):
+        """测试工作流完成后删除检查点，过期的检查点被清理"""
+        from datetime import datetime, timedelta
+        from app import db
+        from app.models.case import WorkflowCheckpoint
+        from app.services.ai.workflow_checkpoint import (
+            clear_checkpoints, purge_expired_checkpoints, save_checkpoint
+        )
+
+        assert save_checkpoint('retrieve_knowledge', 'digest-1', self._state(test_case.id, node.id), node)
+        assert not save_checkpoint('handle_error', 'digest-2', self._state(test_case.id, node.id), node)
+        db.session.add(WorkflowCheckpoint(case_id=test_case.id, node_id='other-node', step='analyze_query',
+                                          input_digest='digest-3', state={},
+                                          expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+        assert purge_expired_checkpoints() == 1
+        assert clear_checkpoints(node.id) == 1
+        assert WorkflowCheckpoint.query.count() == 0
+
 
 class TestWorkflowLogic:
     """测试工作流逻辑"""
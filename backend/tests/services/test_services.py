@@ -192,6 +192,42 @@ class TestDocumentService:
             assert updated_doc.status == 'INDEXED'
 
 
+class TestParseArtifactStore:
+    """解析产物存储测试类"""
+
+    def test_save_and_load_round_trip(self, tmp_path):
+        """测试解析产物压缩保存后可完整读回"""
+        from app.services.storage.artifact_store import ParseArtifactStore
+
+        store = ParseArtifactStore(str(tmp_path))
+        payload = {'layouts': [{'type': 'table', 'text': '接口 状态'}] * 50, 'markdown': '# 手册'}
+
+        ref = store.save('doc-123', payload)
+        assert ref.startswith('do')
+        assert os.path.getsize(os.path.join(str(tmp_path), ref)) < len(str(payload))
+        assert store.load(ref) == payload
+
+        assert store.delete(ref) is True
+        assert store.load(ref) is None
+
+    def test_gzip_fallback_without_zstandard(self, tmp_path):
+        """测试未安装zstandard时回退到gzip"""
+        from app.services.storage import artifact_store
+
+        with patch.object(artifact_store, 'zstandard', None):
+            store = artifact_store.ParseArtifactStore(str(tmp_path))
+            ref = store.save('doc-456', {'content': 'display ip routing-table'})
+            assert ref.endswith('.json.gz')
+            assert store.load(ref) == {'content': 'display ip routing-table'}
+
+    def test_rejects_reference_outside_root(self, tmp_path):
+        """测试拒绝越出存储目录的引用"""
+        from app.services.storage.artifact_store import ParseArtifactStore
+
+        with pytest.raises(ValueError):
+            ParseArtifactStore(str(tmp_path)).load('../../etc/passwd')
+
+
 class TestAgentService:
     """Agent服务测试类"""
 
@@ -402,3 +438,885 @@ class TestAgentService:
             assert updated_node.status == 'COMPLETED'
             assert updated_node.content['type'] == 'analysis'
             assert 'recommendations' in updated_node.content
+
+
+class TestSolutionStreaming:
+    """解决方案流式生成测试类"""
+
+    def test_generate_solution_streams_tokens(self, app):
+        """测试提供 on_token 时以流式方式调用模型并逐段回调"""
+        from types import SimpleNamespace
+        from app.services.ai.llm_service import LLMService
+
+        service = LLMService()
+        service.is_mock = False
+        service.llm = MagicMock()
+        service.llm.stream.return_value = iter([
+            SimpleNamespace(content='检查'), SimpleNamespace(content=''), SimpleNamespace(content='接口状态')
+        ])
+
+        tokens = []
+        result = service.generate_solution('OSPF邻居无法建立', vendor='Huawei', on_token=tokens.append)
+
+        assert tokens == ['检查', '接口状态']
+        assert result['solution'] == '检查接口状态'
+        service.llm.invoke.assert_not_called()
+
+    def test_node_stream_writer_publishes_and_checkpoints(self, app, test_case):
+        """测试流式写入器推送带偏移量的片段，首个片段立即写入节点，之后按间隔写入"""
+        from app.services.ai.node_stream import NodeStreamWriter
+        from app.services.infrastructure.progress_bus import TOKEN_EVENT, get_progress_bus, node_topic
+
+        node = Node(case_id=test_case.id, type='AI_ANALYSIS', title='生成中', status='PROCESSING')
+        db.session.add(node)
+        db.session.commit()
+
+        subscription = get_progress_bus().subscribe([node_topic(node.id)])
+        try:
+            writer = NodeStreamWriter(node, checkpoint_seconds=60)
+            writer('检查')
+            writer('接口状态')
+
+            events = [subscription.get(timeout=1), subscription.get(timeout=1)]
+        finally:
+            subscription.close()
+
+        assert [event['event'] for event in events] == [TOKEN_EVENT, TOKEN_EVENT]
+        assert [(event['data']['offset'], event['data']['delta']) for event in events] == [(0, '检查'), (2, '接口状态')]
+        assert writer.first_token_seconds is not None
+
+        db.session.expire_all()
+        assert db.session.get(Node, node.id).content == {'answer': '检查', 'streaming': True}
+
+        writer.checkpoint()
+        db.session.expire_all()
+        assert db.session.get(Node, node.id).content['answer'] == '检查接口状态'
+
+
+class TestLLMClientPool:
+    """LLM共享连接池测试类"""
+
+    def test_get_llm_service_returns_shared_instance(self, app):
+        """测试 get_llm_service 在进程内返回同一实例"""
+        from app.services.ai.llm_service import get_llm_service, reset_llm_service
+
+        reset_llm_service()
+        try:
+            assert get_llm_service() is get_llm_service()
+        finally:
+            reset_llm_service()
+
+    def test_get_llm_service_recreated_after_fork(self, app):
+        """测试 fork 出的子进程（进程号变化）不沿用父进程的服务实例"""
+        from app.services.ai.llm_service import get_llm_service, reset_llm_service
+
+        reset_llm_service()
+        try:
+            parent = get_llm_service()
+            with patch('app.services.ai.llm_service.os.getpid', return_value=os.getpid() + 1):
+                child = get_llm_service()
+                assert get_llm_service() is child
+            assert child is not parent
+        finally:
+            reset_llm_service()
+
+    def test_services_share_http_clients(self, app):
+        """测试多个服务实例复用同一HTTP客户端，连接数按配置限制"""
+        from app.services.ai.llm_service import LLMService, close_llm_http_clients, get_llm_http_client
+
+        close_llm_http_clients()
+        env = {'DASHSCOPE_API_KEY': 'test-key', 'PYTEST_CURRENT_TEST': '', 'LLM_MAX_CONNECTIONS': '5'}
+        try:
+            with patch.dict(os.environ, env):
+                first, second = LLMService(), LLMService()
+                http_client = get_llm_http_client()
+
+            assert not first.is_mock
+            first_client, second_client = first.llm.targets[0].client, second.llm.targets[0].client
+            assert first_client.http_client is http_client
+            assert second_client.http_client is http_client
+            assert http_client._transport._pool._max_connections == 5
+        finally:
+            close_llm_http_clients()
+
+    def test_async_http_client_per_event_loop(self, app):
+        """测试异步调用按事件循环使用各自的连接池，同一事件循环内复用，事件循环结束时关闭"""
+        import asyncio
+        from app.services.ai.llm_service import LLMService, close_llm_http_clients, get_llm_async_http_client
+
+        close_llm_http_clients()
+        env = {'DASHSCOPE_API_KEY': 'test-key', 'PYTEST_CURRENT_TEST': ''}
+
+        async def loop_client(service):
+            http_async_client = await get_llm_async_http_client()
+            assert await get_llm_async_http_client() is http_async_client
+            model = service.llm.targets[0].client_for(http_async_client)
+            assert model.http_async_client is http_async_client
+            return http_async_client
+
+        try:
+            with patch.dict(os.environ, env):
+                service = LLMService()
+                router = service.llm
+                first_client = asyncio.run(loop_client(service))
+                second_client = asyncio.run(loop_client(service))
+
+            assert first_client is not second_client
+            assert first_client.is_closed and second_client.is_closed
+            # 同步和异步调用共用同一路由器及其统计
+            assert service.llm is router
+        finally:
+            close_llm_http_clients()
+
+    def test_ainvoke_returns_model_content(self, app):
+        """测试异步调用返回模型回复文本"""
+        import asyncio
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from langchain.schema import HumanMessage
+        from app.services.ai.llm_service import LLMService
+
+        service = LLMService()
+        service.is_mock = False
+        service.llm = MagicMock()
+        service.llm.ainvoke = AsyncMock(return_value=SimpleNamespace(content='检查接口状态'))
+
+        async def run_concurrently():
+            return await asyncio.gather(*(service.ainvoke([HumanMessage(content=q)]) for q in ('a', 'b')))
+
+        assert asyncio.run(run_concurrently()) == ['检查接口状态', '检查接口状态']
+        assert service.llm.ainvoke.await_count == 2
+
+
+class TestLLMRouter:
+    """LLM多目标路由测试类"""
+
+    class FakeModel:
+        """按固定耗时返回或抛出异常的模型客户端"""
+
+        def __init__(self, reply, delay=0.0, error=None):
+            self.reply = reply
+            self.delay = delay
+            self.error = error
+            self.calls = 0
+
+        def invoke(self, messages, **kwargs):
+            import time
+            from types import SimpleNamespace
+
+            self.calls += 1
+            time.sleep(self.delay)
+            if self.error:
+                raise self.error
+            return SimpleNamespace(content=self.reply)
+
+        def stream(self, messages, **kwargs):
+            from types import SimpleNamespace
+
+            if self.error:
+                raise self.error
+            for part in self.reply:
+                yield SimpleNamespace(content=part)
+
+    def test_prefers_fastest_healthy_target(self, app):
+        """测试按滚动耗时选择最快的目标"""
+        from app.services.ai.llm_router import LLMRouter, LLMTarget
+
+        slow, fast = LLMTarget('slow', self.FakeModel('慢')), LLMTarget('fast', self.FakeModel('快'))
+        for _ in range(5):
+            slow.record(True, 2.0)
+            fast.record(True, 0.1)
+        router = LLMRouter([slow, fast])
+
+        assert router.invoke([]).content == '快'
+        assert slow.client.calls == 0
+        assert router.get_stats()['targets'][1]['p50_seconds'] == pytest.approx(0.1, abs=0.05)
+
+    def test_fails_over_and_cools_down_failing_target(self, app):
+        """测试目标失败时改用下一个目标，连续失败后暂停使用"""
+        from app.services.ai.llm_router import LLMRouter, LLMTarget
+
+        broken = LLMTarget('broken', self.FakeModel('', error=RuntimeError('timeout')))
+        backup = LLMTarget('backup', self.FakeModel('可用'))
+        router = LLMRouter([broken, backup])
+
+        for _ in range(3):
+            assert router.invoke([]).content == '可用'
+        assert not broken.healthy()
+        assert router.ranked()[0] is backup
+        assert router.invoke([]).content == '可用'
+        assert broken.client.calls == 3
+
+    def test_hedge_returns_first_finished_response(self, app):
+        """测试首选目标超过p95耗时仍未返回时，对冲请求的结果先返回"""
+        import time
+        from app.services.ai.llm_router import LLMRouter, LLMTarget
+
+        stalled = LLMTarget('stalled', self.FakeModel('慢', delay=1.0))
+        hedge = LLMTarget('hedge', self.FakeModel('快', delay=0.01))
+        for _ in range(5):
+            stalled.record(True, 0.01)
+            hedge.record(True, 0.05)
+        router = LLMRouter([stalled, hedge], hedge_enabled=True, hedge_min_delay=0.05, hedge_max_delay=0.5)
+
+        started_at = time.time()
+        assert router.invoke([]).content == '快'
+        assert time.time() - started_at < 0.8
+        assert hedge.client.calls == 1
+
+    def test_stream_fails_over_before_first_chunk(self, app):
+        """测试流式调用在输出任何片段前失败时改用下一个目标"""
+        from app.services.ai.llm_router import LLMRouter, LLMTarget
+
+        router = LLMRouter([LLMTarget('broken', self.FakeModel('', error=RuntimeError('503'))),
+                            LLMTarget('backup', self.FakeModel(['检查', '接口']))])
+
+        assert [chunk.content for chunk in router.stream([])] == ['检查', '接口']
+
+    def test_category_uses_fast_tier_when_keywords_miss(self, app):
+        """测试关键词无法判断类别时由 fast 层级模型分类"""
+        from app.services.ai.llm_router import FAST_TIER, LLMRouter, LLMTarget
+        from app.services.ai.llm_service import LLMService
+
+        default_model, fast_model = self.FakeModel('general'), self.FakeModel('security')
+        service = LLMService()
+        service.llm = LLMRouter([LLMTarget('default', default_model), LLMTarget('fast', fast_model, tier=FAST_TIER)])
+
+        assert service._classify_category('OSPF邻居无法建立') == 'routing'
+        assert service._classify_category('设备登录被拒绝') == 'security'
+        assert fast_model.calls == 1
+        assert default_model.calls == 0
+
+        # 关键词提取本身不调用模型
+        assert service._extract_category('设备登录被拒绝') == 'general'
+        assert fast_model.calls == 1
+
+    def test_analysis_fallback_does_not_call_model_again(self, app):
+        """测试分析调用失败后的降级结果只按关键词分类，不再发起模型调用"""
+        from app.services.ai.llm_router import FAST_TIER, LLMRouter, LLMTarget
+        from app.services.ai.llm_service import LLMService
+
+        fast_model = self.FakeModel('', error=RuntimeError('503'))
+        default_model = self.FakeModel('', error=RuntimeError('503'))
+        service = LLMService()
+        service.is_mock = False
+        service.llm = LLMRouter([LLMTarget('default', default_model),
+                                 LLMTarget('fast', fast_model, tier=FAST_TIER)])
+
+        result = service.analyze_query('设备登录被拒绝', vendor='Huawei')
+
+        assert result['fallback'] is True
+        assert result['category'] == 'general'
+        assert fast_model.calls == 1
+        assert default_model.calls == 1
+
+    def test_fast_tier_falls_back_to_default_targets(self, app):
+        """测试 fast 层级的目标全部失败或熔断时由 default 层级的目标完成调用"""
+        from app.services.ai.llm_router import FAST_TIER, LLMRouter, LLMTarget
+        from app.utils.circuit_breaker import CircuitBreaker
+
+        fast_model = self.FakeModel('', error=RuntimeError('503'))
+        fast = LLMTarget('fast', fast_model, tier=FAST_TIER,
+                         breaker=CircuitBreaker('test:fast', min_calls=1, open_seconds=60))
+        default = LLMTarget('default', self.FakeModel('默认'))
+        router = LLMRouter([default, fast])
+
+        assert router.ranked(FAST_TIER) == [fast, default]
+        assert router.ranked() == [default]
+        assert router.invoke([], tier=FAST_TIER).content == '默认'
+
+        # 熔断后不再调用 fast 目标，仍由 default 层级完成
+        assert fast.breaker.state == 'open'
+        assert router.for_tier(FAST_TIER).invoke([]).content == '默认'
+        assert fast_model.calls == 1
+
+    def test_targets_from_environment(self, app):
+        """测试 LLM_TARGETS 配置多个目标，缺少密钥的目标被跳过"""
+        import json
+        from app.services.ai.llm_router import build_llm_router
+
+        specs = [
+            {'name': 'primary', 'model': 'qwen-plus'},
+            {'name': 'fast', 'model': 'qwen-turbo', 'tier': 'fast'},
+            {'name': 'other', 'model': 'gpt-4o-mini', 'api_key_env': 'MISSING_LLM_KEY'}
+        ]
+        env = {'LLM_TARGETS': json.dumps(specs), 'DASHSCOPE_API_KEY': 'test-key', 'LLM_HEDGE_ENABLED': 'true'}
+        with patch.dict(os.environ, env):
+            os.environ.pop('MISSING_LLM_KEY', None)
+            router = build_llm_router(lambda spec: self.FakeModel(spec['model']))
+
+        assert [(t.name, t.tier) for t in router.targets] == [('primary', 'default'), ('fast', 'fast')]
+        assert router.hedge_enabled
+        assert router.invoke([], tier='fast').content == 'qwen-turbo'
+
+
+class TestCircuitBreaker:
+    """外部依赖熔断器测试类"""
+
+    def test_llm_slow_threshold_defaults_to_timeout(self, monkeypatch):
+        """测试大模型的慢调用阈值缺省取 LLM_TIMEOUT，正常的长时间生成不计为慢调用"""
+        from app.utils.circuit_breaker import _breaker_settings
+
+        monkeypatch.delenv('CIRCUIT_BREAKER_LLM_SLOW_SECONDS', raising=False)
+        monkeypatch.setenv('LLM_TIMEOUT', '90')
+        assert _breaker_settings('llm:qwen-plus')['slow_seconds'] == 90.0
+        monkeypatch.setenv('CIRCUIT_BREAKER_LLM_SLOW_SECONDS', '45')
+        assert _breaker_settings('llm:qwen-plus')['slow_seconds'] == 45.0
+        assert _breaker_settings('embedding:dashscope')['slow_seconds'] == 5.0
+
+    def test_opens_after_failures_and_fails_fast(self, app):
+        """测试失败率达到阈值后熔断，之后的调用不再到达依赖"""
+        from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+        breaker = CircuitBreaker('test', min_calls=4, failure_rate=0.5, open_seconds=60)
+        dependency = MagicMock(side_effect=RuntimeError('timeout'))
+
+        for _ in range(4):
+            with pytest.raises(RuntimeError):
+                breaker.call(dependency)
+        with pytest.raises(CircuitOpenError):
+            breaker.call(dependency)
+
+        assert breaker.state == 'open'
+        assert dependency.call_count == 4
+        assert breaker.get_stats()['rejected_calls'] == 1
+
+    def test_slow_calls_trip_breaker(self, app):
+        """测试慢调用比例达到阈值后熔断"""
+        from app.utils.circuit_breaker import CircuitBreaker
+
+        breaker = CircuitBreaker('test', min_calls=3, slow_seconds=1.0, slow_rate=0.6)
+        for _ in range(3):
+            breaker.before_call()
+            breaker.after_call(True, 2.5)
+
+        assert breaker.state == 'open'
+
+    def test_half_open_probe_closes_or_reopens(self, app):
+        """测试熔断到期后半开只放行一次探测，探测成功恢复、失败重新熔断"""
+        from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+        breaker = CircuitBreaker('test', min_calls=1, open_seconds=0)
+        with pytest.raises(RuntimeError):
+            breaker.call(MagicMock(side_effect=RuntimeError('503')))
+        breaker.open_seconds = 60
+        breaker._opened_at -= 60
+
+        assert breaker.state == 'half_open'
+        ticket = breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: 'ok')
+        breaker.after_call(False, ticket=ticket)
+        assert breaker.state == 'open'
+
+        breaker._opened_at -= 60
+        assert breaker.call(lambda: 'ok') == 'ok'
+        assert breaker.state == 'closed'
+
+    def test_calls_admitted_before_opening_do_not_decide_half_open(self, app):
+        """测试熔断前发起、半开时才结束的调用不会使熔断器恢复或重新熔断"""
+        from app.utils.circuit_breaker import CircuitBreaker
+
+        breaker = CircuitBreaker('test', min_calls=1, open_seconds=60)
+        stale_ticket = breaker.before_call()
+        with pytest.raises(RuntimeError):
+            breaker.call(MagicMock(side_effect=RuntimeError('503')))
+        breaker._opened_at -= 60
+        assert breaker.state == 'half_open'
+
+        breaker.after_call(True, ticket=stale_ticket)
+        assert breaker.state == 'half_open'
+
+        probe_ticket = breaker.before_call()
+        breaker.after_call(True, ticket=probe_ticket)
+        assert breaker.state == 'closed'
+        assert breaker.get_stats()['active_calls'] == 0
+
+    def test_cancellation_is_not_a_failure(self, app):
+        """测试任务取消只释放名额，不计为依赖失败"""
+        from app.services.infrastructure.cancellation import TaskCancelled
+        from app.utils.circuit_breaker import CircuitBreaker
+
+        breaker = CircuitBreaker('test', min_calls=2, failure_rate=0.5, max_concurrent=1)
+        for _ in range(3):
+            with pytest.raises(TaskCancelled):
+                breaker.call(MagicMock(side_effect=TaskCancelled()))
+
+        stats = breaker.get_stats()
+        assert stats['state'] == 'closed'
+        assert stats['calls'] == 0
+        assert stats['active_calls'] == 0
+
+    def test_bulkhead_rejects_when_saturated(self, app):
+        """测试并发调用数达到上限时立即拒绝"""
+        from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+        breaker = CircuitBreaker('test', max_concurrent=1)
+        breaker.before_call()
+        with pytest.raises(CircuitOpenError) as excinfo:
+            breaker.call(lambda: 'ok')
+        breaker.after_call(True)
+
+        assert excinfo.value.reason == 'saturated'
+        assert breaker.call(lambda: 'ok') == 'ok'
+
+    def test_router_skips_open_target(self, app):
+        """测试LLM路由器跳过已熔断的目标，不再等待其超时"""
+        from app.services.ai.llm_router import LLMRouter, LLMTarget
+        from app.utils.circuit_breaker import CircuitBreaker
+
+        primary_model = TestLLMRouter.FakeModel('主')
+        primary = LLMTarget('primary', primary_model, breaker=CircuitBreaker('llm:primary', min_calls=1))
+        with pytest.raises(RuntimeError):
+            primary.breaker.call(MagicMock(side_effect=RuntimeError('timeout')))
+        backup = LLMTarget('backup', TestLLMRouter.FakeModel('备用'))
+        router = LLMRouter([primary, backup])
+
+        assert router.invoke([]).content == '备用'
+        assert primary_model.calls == 0
+        assert router.get_stats()['targets'][0]['circuit'] == 'open'
+
+
+class TestCacheKeys:
+    """缓存键生成与命中统计测试类"""
+
+    def test_cache_key_ignores_instance_and_normalizes_arguments(self):
+        """测试缓存键与实例无关，查询文本的空白和大小写、字典顺序和传参方式不影响缓存键"""
+        from app.services.storage.cache_service import build_cache_key
+
+        class Service:
+            def search(self, query, filters=None):
+                return []
+
+        def key(args, kwargs):
+            return build_cache_key('retrieval', Service.search, (Service(), *args), kwargs, text_args=('query',))
+
+        first = key(('OSPF  邻居\n建立失败',), {'filters': {'vendor': 'Huawei', 'type': 'doc'}})
+        second = key(('ospf 邻居 建立失败', {'type': 'doc', 'vendor': 'Huawei'}), {})
+        other = key(('BGP 邻居建立失败',), {})
+
+        assert first == second
+        assert first != other
+        assert first.startswith('retrieval:')
+        # 未标记为查询文本的参数区分大小写
+        assert key(('q', {'vendor': 'Huawei'}), {}) != key(('q', {'vendor': 'huawei'}), {})
+        # 空过滤条件与不传过滤条件等价
+        assert key(('q',), {'filters': {}}) == key(('q',), {})
+
+    def test_cache_key_keeps_unmarked_text_exact(self):
+        """测试未标记查询文本时字符串参数原样参与缓存键"""
+        from app.services.storage.cache_service import build_cache_key
+
+        def run(command):
+            return ''
+
+        assert build_cache_key('cmd', run, ('display  ip routing-table',), {}) != \
+            build_cache_key('cmd', run, ('display ip routing-table',), {})
+        assert build_cache_key('cmd', run, ('Show Run',), {}) != build_cache_key('cmd', run, ('show run',), {})
+
+    def test_cache_key_includes_version(self):
+        """测试版本变化后缓存键不同"""
+        from app.services.storage.cache_service import build_cache_key
+
+        def analyze(query):
+            return {}
+
+        assert build_cache_key('llm', analyze, ('q',), {}, version='v1') != \
+            build_cache_key('llm', analyze, ('q',), {}, version=lambda: 'v2')
+
+    def test_llm_cache_version_follows_routed_models(self, monkeypatch):
+        """测试LLM缓存版本包含路由目标的模型，调整快速模型或 LLM_TARGETS 后版本变化"""
+        from app.services.ai.llm_service import _cache_version
+
+        version = _cache_version('模板')
+        monkeypatch.delenv('LLM_TARGETS', raising=False)
+        monkeypatch.setenv('LLM_MODEL', 'qwen-plus')
+        monkeypatch.delenv('LLM_FAST_MODEL', raising=False)
+        base = version()
+        monkeypatch.setenv('LLM_FAST_MODEL', 'qwen-turbo')
+        with_fast = version()
+        monkeypatch.setenv('LLM_TARGETS', '[{"name": "a", "model": "qwen-max"}]')
+        routed = version()
+
+        assert len({base, with_fast, routed}) == 3
+        assert 'fast=qwen-turbo' in with_fast and 'default=qwen-max' in routed
+
+    def test_cached_llm_call_hits_across_instances(self):
+        """测试不同实例的相同调用命中缓存，并按前缀统计命中次数"""
+        from app.services.storage.cache_service import cache_service, cached_llm_call
+
+        calls = []
+
+        class Service:
+            @cached_llm_call('test_cross_instance', version='v1', text_args=('query',))
+            def analyze(self, query):
+                calls.append(query)
+                return {'analysis': query}
+
+        with patch.object(cache_service, 'redis_client', None):
+            first = Service().analyze('网络 不通')
+            second = Service().analyze(' 网络  不通 ')
+
+        assert first == second == {'analysis': '网络 不通'}
+        assert calls == ['网络 不通']
+        stats = cache_service.get_prefix_stats()['test_cross_instance']
+        assert stats['hits'] >= 1 and stats['misses'] >= 1
+
+
+class TestContextPacker:
+    """检索上下文打包测试类"""
+
+    def test_pack_dedupes_ranks_and_fits_budget(self, app):
+        """测试去除重复片段、按得分排序、只保留相关句子并控制在预算内"""
+        from app.services.ai.context_packer import ContextPacker, estimate_tokens
+
+        results = [
+            {'chunk_id': 'c1', 'title': '低分资料', 'score': 0.2,
+             'content': '设备巡检需要定期进行。' * 40},
+            {'chunk_id': 'c2', 'title': 'OSPF排障', 'score': 0.9,
+             'content': '机房空调温度需要保持稳定。OSPF邻居无法建立时检查Hello定时器。区域ID必须一致。'},
+            {'chunk_id': 'c3', 'title': 'OSPF排障副本', 'score': 0.8,
+             'content': '机房空调温度需要保持稳定。OSPF邻居无法建立时检查Hello定时器。区域ID必须一致。'},
+        ]
+
+        packed = ContextPacker(budget_tokens=60, chunk_tokens=200).pack('OSPF邻居无法建立', results)
+
+        assert [chunk['chunk_id'] for chunk in packed.chunks][0] == 'c2'
+        assert packed.text.startswith('[1] OSPF排障\nOSPF邻居无法建立时检查Hello定时器。')
+        assert '空调' not in packed.chunks[0]['content']
+        assert packed.duplicate_chunks == 1
+        assert packed.packed_tokens <= 60
+        assert packed.packed_tokens == sum(estimate_tokens(chunk['content']) for chunk in packed.chunks)
+        assert packed.dropped_tokens > 0
+        assert packed.stats()['packed_chunks'] == len(packed.chunks)
+
+    def test_explicit_zero_budget_packs_nothing(self, app):
+        """测试显式传入0预算时不放入任何片段，而不是退回配置的预算"""
+        from app.services.ai.context_packer import pack_context
+
+        packed = pack_context('OSPF邻居', [{'chunk_id': 'c1', 'content': 'OSPF邻居需要两端MTU一致。', 'score': 0.9}],
+                              budget_tokens=0)
+
+        assert packed.chunks == [] and packed.text == ''
+        assert packed.dropped_chunks == 1
+
+    def test_generate_solution_uses_packed_context(self, app):
+        """测试检索结果打包后作为参考资料放入提示词，并返回token统计"""
+        from types import SimpleNamespace
+        from app.services.ai.llm_service import LLMService
+
+        service = LLMService()
+        service.is_mock = False
+        service.llm = MagicMock()
+        service.llm.invoke.return_value = SimpleNamespace(content='检查Hello定时器')
+
+        result = service.generate_solution('OSPF邻居无法建立', context=[
+            {'chunk_id': 'c1', 'title': 'OSPF排障', 'score': 0.9, 'content': 'OSPF邻居无法建立时检查Hello定时器。'}
+        ], vendor='Huawei')
+
+        prompt = service.llm.invoke.call_args[0][0][1].content
+        assert '[1] OSPF排障' in prompt
+        assert "'chunk_id'" not in prompt
+        assert result['context_stats']['packed_chunks'] == 1
+
+
+class TestConversationSummary:
+    """多轮对话历史摘要测试类"""
+
+    @staticmethod
+    def _add_turns(case, count):
+        from datetime import timedelta
+
+        started_at = datetime(2024, 1, 1)
+        nodes = []
+        for i in range(count):
+            node = Node(case_id=case.id, type='USER_RESPONSE' if i % 2 else 'AI_CLARIFICATION',
+                        title=f'第{i}轮', status='COMPLETED', content={'text': f'第{i}轮内容'},
+                        created_at=started_at + timedelta(minutes=i))
+            db.session.add(node)
+            nodes.append(node)
+        db.session.commit()
+        return nodes
+
+    def test_recent_turns_verbatim_and_older_summarized(self, app, test_case):
+        """测试最近轮次原样保留，更早的轮次合并为摘要并保存在案例上"""
+        from app.services.ai.conversation_summary import SUMMARY_METADATA_KEY, ConversationWindow
+
+        nodes = self._add_turns(test_case, 6)
+        with patch('app.services.ai.llm_service.LLMService.summarize_conversation',
+                   return_value='早期摘要') as summarize:
+            context = ConversationWindow(recent_turns=2).build(test_case)
+
+        transcript = summarize.call_args[0][1]
+        assert '第0轮内容' in transcript and '第3轮内容' in transcript
+        assert '第4轮内容' not in transcript
+        assert [turn.node_id for turn in context.recent] == [nodes[4].id, nodes[5].id]
+        assert context.text.startswith('【早期对话摘要】\n早期摘要')
+        assert context.stats()['summarized_turns'] == 4
+        assert test_case.case_metadata[SUMMARY_METADATA_KEY]['node_ids'] == [n.id for n in nodes[:4]]
+
+    def test_cached_summary_reused_and_extended(self, app, test_case):
+        """测试摘要覆盖的轮次不变时直接复用，新移出窗口的轮次增量合并"""
+        from app.services.ai.conversation_summary import ConversationWindow
+
+        self._add_turns(test_case, 4)
+        window = ConversationWindow(recent_turns=2)
+        with patch('app.services.ai.llm_service.LLMService.summarize_conversation',
+                   return_value='早期摘要') as summarize:
+            window.build(test_case)
+            window.build(test_case)
+            assert summarize.call_count == 1
+
+            db.session.add(Node(case_id=test_case.id, type='USER_RESPONSE', title='第4轮', status='COMPLETED',
+                                content={'text': '第4轮内容'}, created_at=datetime(2024, 1, 2)))
+            db.session.commit()
+            context = window.build(test_case)
+
+        assert summarize.call_count == 2
+        assert summarize.call_args[0][0] == '早期摘要'
+        assert summarize.call_args[0][1] == 'AI澄清: 第2轮内容'
+        assert context.summary_rebuilt is False
+
+    def test_summary_rebuilt_after_earlier_node_changes(self, app, test_case):
+        """测试摘要覆盖的节点重新生成后摘要失效并重新生成"""
+        from app.services.ai.conversation_summary import ConversationWindow, invalidate_conversation_summary
+
+        nodes = self._add_turns(test_case, 4)
+        window = ConversationWindow(recent_turns=2)
+        with patch('app.services.ai.llm_service.LLMService.summarize_conversation',
+                   side_effect=lambda previous, transcript, max_tokens: transcript) as summarize:
+            window.build(test_case)
+            nodes[0].content = {'text': '重新生成的内容'}
+            db.session.commit()
+            context = window.build(test_case)
+
+        assert summarize.call_count == 2
+        assert context.summary_rebuilt is True
+        assert '重新生成的内容' in context.summary
+        assert invalidate_conversation_summary(test_case, nodes[3].id) is False
+        assert invalidate_conversation_summary(test_case, nodes[0].id) is True
+
+    def test_response_processing_saves_conversation_stats(self, app, test_case):
+        """测试处理用户补充后对话上下文统计写入已有元数据的案例"""
+        from app.services.ai.langgraph_agent_service import process_user_response_with_langgraph
+
+        test_case.case_metadata = {'vendor': 'Huawei', 'original_query': 'OSPF邻居无法建立'}
+        node = Node(case_id=test_case.id, type='AI_ANALYSIS', title='分析中', status='PROCESSING')
+        db.session.add(node)
+        db.session.commit()
+        workflow = MagicMock()
+        workflow.invoke.return_value = {'step': 'solution_generated', 'solution_ready': True}
+
+        with patch('app.services.ai.langgraph_agent_service.get_workflow', return_value=workflow):
+            process_user_response_with_langgraph(test_case.id, node.id, {'response': 'MTU已改为1500'})
+
+        db.session.expire_all()
+        metadata = db.session.get(Case, test_case.id).case_metadata
+        assert metadata['vendor'] == 'Huawei'
+        assert metadata['response_workflow_step'] == 'solution_generated'
+        assert 'summarized_turns' in metadata['conversation_context']
+
+    def test_continue_conversation_bounds_history(self, app):
+        """测试继续对话时每轮按token预算截断，更早的轮次合并为摘要"""
+        from types import SimpleNamespace
+        from app.services.ai.llm_service import LLMService
+
+        service = LLMService()
+        service.is_mock = False
+        service.llm = MagicMock()
+        service.llm.invoke.return_value = SimpleNamespace(content='请检查MTU')
+        history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'第{i}轮' + '很长的日志' * 500}
+                   for i in range(10)]
+
+        app.config['CONVERSATION_RECENT_TURNS'] = 2
+        with patch.object(LLMService, 'summarize_conversation', return_value='早期摘要'):
+            result = service.continue_conversation(history, 'MTU改了还是不行')
+
+        prompt = service.llm.invoke.call_args[0][0][1].content
+        assert result['response'] == '请检查MTU'
+        assert result['conversation_stats']['summarized_turns'] == 8
+        assert '早期摘要' in prompt and '第9轮' in prompt and '第7轮' not in prompt
+        assert result['conversation_stats']['context_tokens'] < 800
+
+    def test_history_summary_cached_and_extended(self, app):
+        """测试传入历史的摘要在进程内复用，历史变长时只合并新移出窗口的轮次"""
+        from app.services.ai.conversation_summary import ConversationWindow
+
+        history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'缓存测试第{i}轮'} for i in range(6)]
+        window = ConversationWindow(recent_turns=2)
+        with patch('app.services.ai.llm_service.LLMService.summarize_conversation',
+                   return_value='早期摘要') as summarize:
+            first = window.build_from_history(history)
+            second = window.build_from_history(history)
+            assert summarize.call_count == 1
+
+            longer = window.build_from_history(history + [{'role': 'user', 'content': '缓存测试第6轮'}])
+
+        assert first.summary == second.summary == '早期摘要'
+        assert summarize.call_count == 2
+        assert summarize.call_args[0][0] == '早期摘要'
+        assert summarize.call_args[0][1] == '用户: 缓存测试第4轮'
+        assert longer.summarized_turns == 5
+
+
+class TestSemanticAnswerCache:
+    """语义答案缓存测试类"""
+
+    VECTORS = {
+        'OSPF邻居卡在ExStart': [1.0, 0.0, 0.0],
+        'ospf 邻居一直停在 exstart 状态': [0.99, 0.05, 0.0],
+        'BGP会话频繁断开': [0.0, 1.0, 0.0],
+    }
+
+    @pytest.fixture
+    def cache(self, app, tmp_path):
+        from app.services.ai.semantic_cache import SemanticAnswerCache, get_semantic_cache, reset_semantic_cache
+
+        app.config['SEMANTIC_CACHE_PATH'] = str(tmp_path / 'semantic_cache')
+        reset_semantic_cache()
+        with patch.object(SemanticAnswerCache, '_embed', lambda self, query, vendor: TestSemanticAnswerCache.VECTORS[query]):
+            yield get_semantic_cache()
+        reset_semantic_cache()
+
+    def test_lookup_returns_similar_solution(self, cache):
+        """测试措辞不同的相同问题命中，厂商不同或问题不同时不命中"""
+        assert cache.lookup('OSPF邻居卡在ExStart', 1, 'Huawei') is None
+
+        assert cache.store('case-1', 'node-1', 'OSPF邻居卡在ExStart', '检查两端MTU是否一致', 1, vendor='Huawei', rating=5)
+
+        hit = cache.lookup('ospf 邻居一直停在 exstart 状态', 1, 'Huawei')
+        assert hit['answer'] == '检查两端MTU是否一致'
+        assert hit['case_id'] == 'case-1'
+        assert hit['similarity'] >= 0.92
+
+        assert cache.lookup('ospf 邻居一直停在 exstart 状态', 1, 'Cisco') is None
+        assert cache.lookup('BGP会话频繁断开', 1, 'Huawei') is None
+
+    def test_ttl_and_invalidation(self, app, cache):
+        """测试过期条目不再使用，知识库变化后清空缓存"""
+        from app.services.ai.semantic_cache import invalidate_semantic_cache
+
+        cache.store('case-1', 'node-1', 'OSPF邻居卡在ExStart', '检查两端MTU是否一致', 1, vendor='Huawei')
+
+        app.config['SEMANTIC_CACHE_TTL_SECONDS'] = -1
+        assert cache.lookup('OSPF邻居卡在ExStart', 1, 'Huawei') is None
+        app.config['SEMANTIC_CACHE_TTL_SECONDS'] = 3600
+        assert cache.lookup('OSPF邻居卡在ExStart', 1, 'Huawei') is not None
+
+        invalidate_semantic_cache('测试')
+        assert cache.get_stats()['entries'] == 0
+        assert cache.lookup('OSPF邻居卡在ExStart', 1, 'Huawei') is None
+
+    def test_entries_scoped_to_user(self, cache):
+        """测试缓存的解决方案不会复用给其他用户"""
+        cache.store('case-1', 'node-1', 'OSPF邻居卡在ExStart', '检查两端MTU是否一致', 1, vendor='Huawei')
+
+        assert cache.lookup('ospf 邻居一直停在 exstart 状态', 1, 'Huawei')['case_id'] == 'case-1'
+        assert cache.lookup('ospf 邻居一直停在 exstart 状态', 2, 'Huawei') is None
+
+    def test_other_users_do_not_crowd_out_matches(self, cache):
+        """测试其他用户的相似条目再多也不会挤掉该用户自己的条目"""
+        for i in range(6):
+            cache.store(f'other-{i}', f'node-{i}', 'OSPF邻居卡在ExStart', '其他用户的方案', 2, vendor='Huawei')
+        cache.store('case-1', 'node-1', 'OSPF邻居卡在ExStart', '检查两端MTU是否一致', 1, vendor='Huawei')
+
+        assert cache.lookup('ospf 邻居一直停在 exstart 状态', 1, 'Huawei')['case_id'] == 'case-1'
+
+    def test_concurrent_writers_keep_each_others_entries(self, tmp_path):
+        """测试共享同一目录的多个实例（多个进程）写入时不会覆盖彼此的条目"""
+        from app.services.storage.local_vector_db import LocalFileVectorDB
+
+        first, second = LocalFileVectorDB(str(tmp_path)), LocalFileVectorDB(str(tmp_path))
+        first.add_document('case-1', [{'content': '方案一'}], [[1.0, 0.0]])
+        second.add_document('case-2', [{'content': '方案二'}], [[0.0, 1.0]])
+        first.delete_document('case-1')
+
+        documents = {info['document_id'] for info in LocalFileVectorDB(str(tmp_path)).index.values()}
+        assert documents == {'case-2'}
+        assert not list(tmp_path.glob('*.tmp'))
+
+    def test_document_change_removes_only_referencing_entries(self, cache):
+        """测试知识库文档变化时只移除引用了该文档的条目"""
+        from app.services.ai.semantic_cache import invalidate_semantic_cache_for_document
+
+        cache.store('case-1', 'node-1', 'OSPF邻居卡在ExStart', '检查两端MTU是否一致', 1,
+                    vendor='Huawei', document_ids=['doc-ospf'])
+        cache.store('case-2', 'node-2', 'BGP会话频繁断开', '检查保活定时器', 1,
+                    vendor='Huawei', document_ids=['doc-bgp'])
+
+        assert invalidate_semantic_cache_for_document('doc-new', '新文档入库') == 0
+        assert invalidate_semantic_cache_for_document('doc-ospf', '文档已删除') == 1
+        assert cache.lookup('OSPF邻居卡在ExStart', 1, 'Huawei') is None
+        assert cache.lookup('BGP会话频繁断开', 1, 'Huawei')['case_id'] == 'case-2'
+
+    def test_update_from_feedback(self, cache, test_case, test_user):
+        """测试已解决且高评分的反馈写入缓存，改为未解决后移除"""
+        from app.models.feedback import Feedback
+        from app.services.ai.semantic_cache import update_from_feedback
+
+        test_case.case_metadata = {'original_query': 'OSPF邻居卡在ExStart', 'vendor': 'Huawei'}
+        db.session.add(Node(case_id=test_case.id, type='SOLUTION', title='解决方案', status='COMPLETED',
+                            content={'answer': '检查两端MTU是否一致'}))
+        feedback = Feedback(case_id=test_case.id, user_id=test_user.id, outcome='solved', rating=3)
+        db.session.add(feedback)
+        db.session.commit()
+
+        assert update_from_feedback(test_case, feedback) is False
+
+        feedback.rating = 5
+        assert update_from_feedback(test_case, feedback) is True
+        assert cache.lookup('ospf 邻居一直停在 exstart 状态', test_user.id, 'Huawei')['case_id'] == test_case.id
+
+        feedback.outcome = 'unsolved'
+        update_from_feedback(test_case, feedback)
+        assert cache.lookup('ospf 邻居一直停在 exstart 状态', test_user.id, 'Huawei') is None
+
+
+class TestResolvedCaseIndex:
+    """已解决案例索引测试类"""
+
+    def test_rebuild_indexes_resolved_cases(self, app, test_case, test_user, tmp_path):
+        """测试重建索引包含反馈为已解决的案例，并在检索时排除当前案例"""
+        from app.models.feedback import Feedback
+        from app.services.retrieval.case_index import (
+            ResolvedCaseIndex, get_case_index, rebuild_case_index, reset_case_index
+        )
+
+        app.config['RESOLVED_CASE_INDEX_PATH'] = str(tmp_path / 'resolved_cases')
+        reset_case_index()
+
+        test_case.case_metadata = {'original_query': 'OSPF邻居卡在ExStart', 'vendor': 'Huawei'}
+        db.session.add(Node(case_id=test_case.id, type='SOLUTION', title='解决方案', status='COMPLETED',
+                            content={'answer': '检查两端MTU是否一致'}))
+        db.session.add(Case(title='未解决的案例', user_id=test_user.id))
+        db.session.add(Feedback(case_id=test_case.id, user_id=test_user.id, outcome='solved', rating=5))
+        db.session.commit()
+
+        try:
+            with patch.object(ResolvedCaseIndex, '_embed', lambda self, text: [1.0, 0.0]):
+                assert rebuild_case_index() == 1
+
+                results = get_case_index().search('OSPF邻居卡在ExStart', test_user.id, vendor='Huawei')
+                assert [item['caseId'] for item in results] == [test_case.id]
+                assert results[0]['rating'] == 5
+                assert get_case_index().search('OSPF邻居卡在ExStart', test_user.id,
+                                                exclude_case_id=test_case.id) == []
+        finally:
+            reset_case_index()
+
+    def test_search_not_crowded_out_by_other_users(self, tmp_path):
+        """测试共享索引中其他用户的大量相似案例不会挤掉该用户自己的案例"""
+        from app.services.retrieval.case_index import ResolvedCaseIndex
+
+        index = ResolvedCaseIndex(str(tmp_path / 'resolved_cases'))
+        for i in range(20):
+            index._get_db().add_document(f'other-{i}', [{'content': '其他用户的方案',
+                                                           'metadata': {'user_id': '2', 'vendor': 'Huawei'}}],
+                                         [[1.0, 0.0]])
+        index._get_db().add_document('case-1', [{'content': '检查两端MTU是否一致',
+                                                 'metadata': {'user_id': '1', 'vendor': 'Huawei'}}], [[1.0, 0.0]])
+
+        with patch.object(ResolvedCaseIndex, '_embed', lambda self, text: [1.0, 0.0]):
+            results = index.search('OSPF邻居卡在ExStart', 1, vendor='Huawei', limit=1, min_similarity=0.5)
+
+        assert [item['caseId'] for item in results] == ['case-1']
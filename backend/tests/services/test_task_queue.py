@@ -0,0 +1,723 @@
+"""
+IP智慧解答专家系统 - 任务队列测试
+
+本模块测试线程池任务队列、任务车道调度、任务超时与取消、后台任务运行时、
+CPU任务进程车道、任务进度事件总线及持久化任务存储。
+"""
+
+import os
+import time
+import socket
+import threading
+import pytest
+
+from app.services.infrastructure.job_store import JobRecord, MemoryJobStore, SQLiteJobStore
+from app.services.infrastructure.task_queue import ThreadPoolQueue
+from app.services.infrastructure.lanes import LaneScheduler
+from app.services.infrastructure.cancellation import (
+    TaskCancelled, cancellable_sleep, on_cancel, parse_timeout
+)
+from app.services.infrastructure import worker_runtime
+from app.services.infrastructure.process_lane import ProcessLane
+from app.services.infrastructure import progress_bus
+from app.services.infrastructure.progress_bus import (
+    MemoryProgressBus, case_topic, report_progress, task_topic
+)
+from app.services.infrastructure.queue_metrics import Histogram, QueueMetrics, render_prometheus
+from app.services.ai.log_parsing_service import parse_log_content
+
+executed = []
+cancelled = []
+hang_release = threading.Event()
+
+
+def record_call(value):
+    """可被任务存储按路径重新导入的任务函数"""
+    executed.append(value)
+    return {'value': value}
+
+
+def record_cancel(reason, value):
+    """取消处理函数：记录被停止的任务参数和原因"""
+    cancelled.append((value, reason.status))
+
+
+@on_cancel(record_cancel)
+def poll_forever(value):
+    """持续轮询外部服务、在每次等待时检查取消令牌的任务"""
+    while True:
+        cancellable_sleep(0.05)
+
+
+@on_cancel(record_cancel)
+def hang(value):
+    """不检查取消令牌的任务，模拟卡死的外部调用"""
+    hang_release.wait(10)
+    return value
+
+
+def report_steps(case_id):
+    """逐步上报进度的任务"""
+    report_progress('analyzing', 30, case_id=case_id, node_id='node-1')
+    report_progress('answering', 80, case_id=case_id, node_id='node-1')
+    return case_id
+
+
+def fail_task(value):
+    """执行失败的任务"""
+    raise ValueError(value)
+
+
+def dead_owner():
+    """与当前进程同主机、同进程号但属于上一次启动的租约持有者"""
+    return f'{socket.gethostname()}:{os.getpid()}:deadbeef'
+
+
+def wait_for(job, timeout=5):
+    job.future.result(timeout=timeout)
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    return SQLiteJobStore(str(tmp_path / 'task_queue.db'))
+
+
+class TestDurableTaskQueue:
+    """持久化任务队列测试类"""
+
+    def setup_method(self):
+        executed.clear()
+
+    def test_finished_job_visible_after_restart(self, sqlite_store):
+        """测试任务状态在队列重建（模拟进程重启）后仍可查询"""
+        queue = ThreadPoolQueue(max_workers=1, store=sqlite_store, lease_seconds=5)
+        job = queue.enqueue(record_call, 'ospf')
+        wait_for(job)
+        queue.shutdown(wait=True)
+
+        restarted = ThreadPoolQueue(max_workers=1, store=sqlite_store, lease_seconds=5)
+        stored = restarted.get_job(job.id)
+        assert stored.get_status() == 'finished'
+        assert stored.get_result() == {'value': 'ospf'}
+        restarted.shutdown()
+
+    def test_orphaned_job_recovered_on_startup(self, sqlite_store):
+        """测试上次进程未完成的任务在启动时重新执行"""
+        sqlite_store.add(JobRecord(
+            id='orphan-1',
+            func_path=f'{__name__}:record_call',
+            args=['bgp'],
+            status='started',
+            owner=dead_owner(),
+            lease_expires_at=time.time() + 600,
+            attempts=1
+        ))
+
+        queue = ThreadPoolQueue(max_workers=1, store=sqlite_store, lease_seconds=5)
+        wait_for(queue.get_job('orphan-1'))
+
+        assert executed == ['bgp']
+        record = sqlite_store.get('orphan-1')
+        assert record.status == 'finished'
+        assert record.attempts == 2
+        queue.shutdown()
+
+    def test_live_lease_is_not_stolen(self):
+        """测试其他主机持有的未过期租约不会被接管"""
+        store = MemoryJobStore()
+        store.add(JobRecord(
+            id='remote-1',
+            func_path=f'{__name__}:record_call',
+            args=['isis'],
+            owner='other-host:1234:abcd1234',
+            lease_expires_at=time.time() + 600
+        ))
+
+        queue = ThreadPoolQueue(max_workers=1, store=store)
+        assert queue.recover_orphaned_jobs() == 0
+        assert store.get('remote-1').owner == 'other-host:1234:abcd1234'
+
+        store.get('remote-1').lease_expires_at = time.time() - 1
+        assert queue.recover_orphaned_jobs() == 1
+        wait_for(queue.get_job('remote-1'))
+        assert executed == ['isis']
+        queue.shutdown()
+
+    def test_orphan_exceeding_max_attempts_fails(self, sqlite_store):
+        """测试反复中断的任务达到最大尝试次数后标记为失败"""
+        sqlite_store.add(JobRecord(
+            id='orphan-2',
+            func_path=f'{__name__}:record_call',
+            args=['mpls'],
+            status='started',
+            owner=dead_owner(),
+            attempts=3,
+            max_attempts=3
+        ))
+
+        queue = ThreadPoolQueue(max_workers=1, store=sqlite_store, lease_seconds=5)
+        record = sqlite_store.get('orphan-2')
+        assert record.status == 'failed'
+        assert queue.get_job('orphan-2').get_error()
+        assert executed == []
+        queue.shutdown()
+
+    def test_unserializable_args_run_in_memory(self, sqlite_store):
+        """测试参数无法序列化的任务仍在内存中执行"""
+        queue = ThreadPoolQueue(max_workers=1, store=sqlite_store, lease_seconds=5)
+        job = queue.enqueue(record_call, object())
+        wait_for(job)
+        assert sqlite_store.get(job.id) is None
+        assert queue.get_job(job.id).get_status() == 'finished'
+        queue.shutdown()
+
+
+
+class TestTaskDeduplication:
+    """任务去重测试类"""
+
+    def setup_method(self):
+        executed.clear()
+        cancelled.clear()
+        hang_release.clear()
+
+    def teardown_method(self):
+        hang_release.set()
+
+    def test_duplicate_submission_returns_existing_job(self):
+        """测试同一去重键的任务未结束时重复提交返回已有任务，结束后可再次提交"""
+        queue = ThreadPoolQueue(lanes={'interactive': 1}, watchdog_interval=0.05)
+        first = queue.enqueue(hang, 'case-1', lane='interactive', dedupe_key=('case-1', 'node-1'))
+        second = queue.enqueue(hang, 'case-1', lane='interactive', dedupe_key=('case-1', 'node-1'))
+        other = queue.enqueue(hang, 'case-1', lane='interactive', dedupe_key=('case-1', 'node-2'))
+
+        assert second is first
+        assert other.id != first.id
+
+        hang_release.set()
+        wait_for(first)
+        wait_for(other)
+        third = queue.enqueue(hang, 'case-1', lane='interactive', dedupe_key=('case-1', 'node-1'))
+        assert third.id != first.id
+        wait_for(third)
+
+        stats = {item['function']: item for item in queue.stats()['functions']}
+        assert (stats['hang']['enqueued'], stats['hang']['deduplicated']) == (3, 1)
+        queue.shutdown()
+
+    def test_cancelled_job_can_be_resubmitted(self):
+        """测试被取消的执行中任务在退出前就不再占用去重键"""
+        queue = ThreadPoolQueue(max_workers=1, watchdog_interval=0.05)
+        job = queue.enqueue(poll_forever, 'doc-1', dedupe_key='doc-1')
+        deadline = time.time() + 5
+        while job.get_status() != 'started' and time.time() < deadline:
+            time.sleep(0.02)
+        assert queue.cancel(job.id) is True
+
+        retry = queue.enqueue(poll_forever, 'doc-1', dedupe_key='doc-1')
+        assert retry.id != job.id
+        queue.cancel(retry.id)
+        queue.shutdown()
+
+    def test_deduplicated_across_workers_by_store(self, sqlite_store):
+        """测试共享持久化存储的其他工作进程已提交的任务不会被重复提交"""
+        owner = ThreadPoolQueue(lanes={'ingestion': 1}, store=sqlite_store, lease_seconds=5)
+        other = ThreadPoolQueue(lanes={'ingestion': 1}, store=sqlite_store, lease_seconds=5)
+
+        job = owner.enqueue(hang, 'doc-2', dedupe_key='doc-2')
+        duplicate = other.enqueue(hang, 'doc-2', dedupe_key='doc-2')
+        assert duplicate.id == job.id
+        assert duplicate.get_status() in ('queued', 'started')
+
+        hang_release.set()
+        wait_for(job)
+        assert sqlite_store.get(job.id).status == 'finished'
+        assert other.enqueue(record_call, 'doc-2', dedupe_key='doc-2').id != job.id
+        owner.shutdown()
+        other.shutdown()
+
+    def test_sqlite_store_adds_dedupe_column_to_existing_table(self, tmp_path):
+        """测试早期版本创建的任务表在打开时补充去重键列"""
+        import sqlite3
+        path = str(tmp_path / 'legacy.db')
+        conn = sqlite3.connect(path)
+        conn.execute('''
+            CREATE TABLE task_jobs (
+                id TEXT PRIMARY KEY, func_path TEXT NOT NULL, args TEXT NOT NULL, status TEXT NOT NULL,
+                owner TEXT, lease_expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3, options TEXT, created_at REAL NOT NULL,
+                started_at REAL, completed_at REAL, result TEXT, error TEXT
+            )
+        ''')
+        conn.close()
+
+        store = SQLiteJobStore(path)
+        record = JobRecord(id='job-1', func_path=f'{__name__}:record_call', args=[], dedupe_key='key')
+        assert store.add_unique(record) is record
+        duplicate = JobRecord(id='job-2', func_path=f'{__name__}:record_call', args=[], dedupe_key='key')
+        assert store.add_unique(duplicate).id == 'job-1'
+        assert store.get('job-2') is None
+
+
+class TestTaskLanes:
+    """任务车道调度测试类"""
+
+    def _blocker(self, release):
+        def run():
+            release.wait(5)
+            return 'blocked'
+        return run
+
+    def test_interactive_not_blocked_by_ingestion(self):
+        """测试入库任务占满时交互任务仍能立即执行，且交互线程不外借给入库任务"""
+        scheduler = LaneScheduler({'interactive': 1, 'ingestion': 1})
+        release = threading.Event()
+
+        running = scheduler.submit('ingestion', self._blocker(release))
+        waiting = scheduler.submit('ingestion', lambda: 'parsed')
+
+        assert scheduler.submit('interactive', lambda: 'answer').result(timeout=2) == 'answer'
+        time.sleep(0.1)
+        assert not waiting.done()
+        assert scheduler.stats()['ingestion']['queued'] == 1
+
+        release.set()
+        assert running.result(timeout=2) == 'blocked'
+        assert waiting.result(timeout=2) == 'parsed'
+        scheduler.shutdown()
+
+    def test_idle_ingestion_worker_borrowed_by_interactive(self):
+        """测试交互车道繁忙时借用入库车道的空闲线程"""
+        scheduler = LaneScheduler({'interactive': 1, 'ingestion': 1})
+        release = threading.Event()
+
+        scheduler.submit('interactive', self._blocker(release))
+        assert scheduler.submit('interactive', lambda: 'borrowed').result(timeout=2) == 'borrowed'
+        release.set()
+        scheduler.shutdown()
+
+    def test_priority_order_within_lane(self):
+        """测试车道内按优先级执行，同优先级按提交顺序"""
+        scheduler = LaneScheduler({'ingestion': 1})
+        release = threading.Event()
+        order = []
+
+        scheduler.submit('ingestion', self._blocker(release))
+        futures = [
+            scheduler.submit('ingestion', lambda: order.append('large'), priority=0),
+            scheduler.submit('ingestion', lambda: order.append('small-1'), priority=1),
+            scheduler.submit('ingestion', lambda: order.append('small-2'), priority=1),
+        ]
+        release.set()
+        for future in futures:
+            future.result(timeout=2)
+
+        assert order == ['small-1', 'small-2', 'large']
+        scheduler.shutdown()
+
+    def test_enqueue_records_lane(self, sqlite_store):
+        """测试任务车道随任务持久化，未知车道回退到默认车道"""
+        queue = ThreadPoolQueue(max_workers=1, store=sqlite_store, lease_seconds=5)
+        job = queue.enqueue(record_call, 'vrrp', lane='interactive', priority=2)
+        wait_for(job)
+        assert job.lane == 'interactive'
+        options = sqlite_store.get(job.id).options
+        assert (options['lane'], options['priority']) == ('interactive', 2)
+
+        fallback = queue.enqueue(record_call, 'stp', lane='bulk')
+        wait_for(fallback)
+        assert fallback.lane == 'ingestion'
+        queue.shutdown()
+
+
+class TestTaskCancellation:
+    """任务超时与取消测试类"""
+
+    def setup_method(self):
+        executed.clear()
+        cancelled.clear()
+        hang_release.clear()
+
+    def teardown_method(self):
+        hang_release.set()
+
+    def _wait_status(self, queue, job_id, status, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if queue.get_job(job_id).get_status() == status:
+                return
+            time.sleep(0.02)
+        raise AssertionError(f'任务 {job_id} 未进入状态 {status}: {queue.get_job(job_id).get_status()}')
+
+    def test_job_timeout_enforced(self, sqlite_store):
+        """测试超时任务在等待检查点退出，记录为timed_out并调用取消处理函数"""
+        queue = ThreadPoolQueue(max_workers=1, store=sqlite_store, lease_seconds=5, watchdog_interval=0.05)
+        job = queue.enqueue(poll_forever, 'docmind', job_timeout=0.2)
+
+        with pytest.raises(TaskCancelled):
+            job.future.result(timeout=5)
+
+        assert job.get_status() == 'timed_out'
+        assert sqlite_store.get(job.id).status == 'timed_out'
+        assert cancelled == [('docmind', 'timed_out')]
+        queue.shutdown()
+
+    def test_cancel_running_job(self):
+        """测试取消执行中的任务"""
+        queue = ThreadPoolQueue(max_workers=1, watchdog_interval=0.05)
+        job = queue.enqueue(poll_forever, 'dashscope')
+        self._wait_status(queue, job.id, 'started')
+
+        assert queue.cancel(job.id) is True
+        with pytest.raises(TaskCancelled):
+            job.future.result(timeout=5)
+
+        assert job.get_status() == 'cancelled'
+        assert cancelled == [('dashscope', 'cancelled')]
+        assert queue.cancel(job.id) is False
+        queue.shutdown()
+
+    def test_cancel_queued_job(self, sqlite_store):
+        """测试取消排队中的任务：任务不再执行，取消处理函数仍被调用"""
+        queue = ThreadPoolQueue(lanes={'ingestion': 1}, store=sqlite_store, lease_seconds=5)
+        blocker = queue.enqueue(hang, 'blocker')
+        waiting = queue.enqueue(record_call, 'queued')
+
+        assert queue.cancel(waiting.id) is True
+        assert waiting.get_status() == 'cancelled'
+        assert sqlite_store.get(waiting.id).status == 'cancelled'
+
+        hang_release.set()
+        wait_for(blocker)
+        time.sleep(0.1)
+        assert executed == []
+        queue.shutdown()
+
+    def test_unresponsive_job_abandoned_and_worker_replaced(self):
+        """测试超时后不响应的任务被放弃，车道补充工作线程继续处理后续任务"""
+        queue = ThreadPoolQueue(lanes={'ingestion': 1}, cancel_grace=0.2, watchdog_interval=0.05)
+        stuck = queue.enqueue(hang, 'stuck', job_timeout=0.1)
+        following = queue.enqueue(record_call, 'next')
+
+        assert following.future.result(timeout=5) == {'value': 'next'}
+        assert stuck.get_status() == 'timed_out'
+        assert cancelled == [('stuck', 'timed_out')]
+        assert queue.lane_stats()['ingestion']['workers'] == 1
+
+        # 卡住的线程最终返回时不会重复清理
+        hang_release.set()
+        stuck.future.result(timeout=5)
+        assert stuck.get_status() == 'timed_out'
+        assert cancelled == [('stuck', 'timed_out')]
+        queue.shutdown()
+
+    def test_parse_timeout(self):
+        """测试超时设置解析"""
+        assert parse_timeout('10m') == 600
+        assert parse_timeout('30s') == 30
+        assert parse_timeout('1h') == 3600
+        assert parse_timeout(90) == 90
+        assert parse_timeout('0') is None
+        assert parse_timeout(None) is None
+
+
+class TestWorkerRuntime:
+    """后台任务运行时测试类"""
+
+    def setup_method(self):
+        worker_runtime.reset_worker_app()
+
+    def teardown_method(self):
+        worker_runtime.reset_worker_app()
+
+    def _run_in_thread(self, func):
+        """在没有应用上下文的新线程中执行（模拟工作线程）"""
+        outcome = {}
+
+        def target():
+            try:
+                outcome['value'] = func()
+            except BaseException as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join(5)
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('value')
+
+    def test_worker_app_created_once_per_process(self, monkeypatch):
+        """测试工作进程只创建一次应用，fork后的子进程重新创建"""
+        created = []
+
+        def fake_create_app():
+            created.append(object())
+            return created[-1]
+
+        monkeypatch.setattr('app.create_app', fake_create_app)
+        first = worker_runtime.get_worker_app()
+        assert worker_runtime.get_worker_app() is first
+        assert len(created) == 1
+
+        monkeypatch.setattr(worker_runtime.os, 'getpid', lambda: -1)
+        assert worker_runtime.get_worker_app() is not first
+        assert len(created) == 2
+
+    def test_tasks_share_app_with_isolated_sessions(self, app):
+        """测试工作线程中的任务复用同一个应用，但各自使用独立的数据库会话"""
+        from flask import current_app, has_app_context
+        from app import db
+
+        worker_runtime.set_worker_app(app)
+
+        def task():
+            with worker_runtime.worker_app_context():
+                return current_app._get_current_object(), db.session()
+
+        first_app, first_session = self._run_in_thread(task)
+        second_app, second_session = self._run_in_thread(task)
+
+        assert first_app is app and second_app is app
+        assert first_session is not second_session
+        assert self._run_in_thread(has_app_context) is False
+
+    def test_reuses_existing_app_context(self, app):
+        """测试已处于应用上下文中时直接复用当前应用"""
+        with worker_runtime.worker_app_context() as current:
+            assert current is app
+
+
+class TestProcessLane:
+    """CPU任务进程车道测试类"""
+
+    LOG = '\n'.join(['OSPF neighbor 10.0.0.2 state change from Full to Down, ExStart timeout'] * 2000)
+
+    def test_runs_inline_without_workers(self):
+        """测试未配置工作进程时在调用线程中执行"""
+        lane = ProcessLane(workers=0)
+        result = lane.run(parse_log_content, 'ospf_debug', 'Huawei', self.LOG)
+
+        assert result['logMetrics']['totalLines'] == 2000
+        stats = lane.stats()
+        assert stats['workers'] == 0
+        assert stats['inline'] == 1
+        assert stats['submitted'] == 0
+
+    def test_large_input_spilled_to_worker_process(self, tmp_path):
+        """测试大输入经由临时文件交给工作进程，结果与内联执行一致且临时文件被清理"""
+        lane = ProcessLane(workers=1, inline_bytes=1024, spill_bytes=4096, spill_dir=str(tmp_path))
+        try:
+            result = lane.run(parse_log_content, 'ospf_debug', 'Huawei', self.LOG, timeout=120)
+            small = lane.run(parse_log_content, 'ospf_debug', 'Huawei', 'OSPF ExStart', timeout=120)
+        finally:
+            lane.shutdown(wait=True)
+
+        assert result == parse_log_content('ospf_debug', 'Huawei', self.LOG)
+        assert small['logMetrics']['totalLines'] == 1
+        stats = lane.stats()
+        assert stats['submitted'] == 1
+        assert stats['completed'] == 1
+        assert stats['spilled'] == 1
+        assert stats['inline'] == 1
+        assert list(tmp_path.iterdir()) == []
+
+    def test_broken_pool_resubmits_once_then_raises(self):
+        """测试工作进程退出后重建进程池并重新提交一次，仍失败时抛出异常而不在调用线程中执行"""
+        from concurrent.futures.process import BrokenProcessPool
+
+        lane = ProcessLane(workers=1, inline_bytes=0)
+        try:
+            with pytest.raises(BrokenProcessPool):
+                lane.run(os._exit, 1, timeout=120)
+            result = lane.run(parse_log_content, 'ospf_debug', 'Huawei', 'OSPF ExStart', timeout=120)
+        finally:
+            lane.shutdown(wait=True)
+
+        assert result['logMetrics']['totalLines'] == 1
+        stats = lane.stats()
+        assert stats['restarts'] == 2
+        assert stats['failed'] == 1
+        assert stats['completed'] == 1
+        assert stats['inline'] == 0
+
+    def test_stats_do_not_start_lane(self, monkeypatch):
+        """测试查询统计不会创建进程车道"""
+        from app.services.infrastructure import process_lane
+
+        monkeypatch.setattr(process_lane, '_process_lane', None)
+        stats = process_lane.get_process_lane_stats()
+
+        assert stats['workers'] == 0
+        assert stats['submitted'] == 0
+        assert process_lane._process_lane is None
+
+
+class TestProgressBus:
+    """任务进度事件总线测试类"""
+
+    def setup_method(self):
+        progress_bus.reset_progress_bus()
+
+    def teardown_method(self):
+        progress_bus.reset_progress_bus()
+
+    def test_memory_bus_delivers_and_keeps_latest(self):
+        """测试订阅方按顺序收到事件，总线保留每类事件的最新一条，关闭订阅后不再投递"""
+        bus = MemoryProgressBus()
+        subscription = bus.subscribe(['case:1'])
+
+        bus.publish('case:1', 'progress', {'step': 'analyze_query'})
+        bus.publish('case:2', 'progress', {'step': 'ignored'})
+        bus.publish('case:1', 'node', {'status': 'COMPLETED'})
+
+        first = subscription.get(timeout=1)
+        second = subscription.get(timeout=1)
+        assert (first['event'], first['data']) == ('progress', {'step': 'analyze_query'})
+        assert second['event'] == 'node'
+        assert subscription.get(timeout=0.05) is None
+
+        assert bus.latest('case:1', 'progress')['data'] == {'step': 'analyze_query'}
+        assert bus.latest('case:1')['event'] == 'node'
+        assert bus.latest('case:3') is None
+
+        subscription.close()
+        bus.publish('case:1', 'progress', {'step': 'late'})
+        assert subscription.get(timeout=0.05) is None
+
+    def test_slow_subscriber_keeps_newest_events(self):
+        """测试订阅方缓存已满时丢弃最旧的事件"""
+        bus = MemoryProgressBus(max_pending=2)
+        subscription = bus.subscribe(['document:1'])
+        for progress in (10, 50, 70):
+            bus.publish('document:1', 'progress', {'progress': progress})
+
+        assert subscription.get(timeout=1)['data']['progress'] == 50
+        assert subscription.get(timeout=1)['data']['progress'] == 70
+
+    def test_task_lifecycle_and_reported_progress(self):
+        """测试任务队列发布任务状态变化，任务内上报的进度同时发布到案例和任务主题"""
+        bus = progress_bus.get_progress_bus()
+        task_events = bus.subscribe([task_topic('progress-job')])
+        case_events = bus.subscribe([case_topic('case-9')])
+
+        queue = ThreadPoolQueue(max_workers=1)
+        wait_for(queue.enqueue(report_steps, 'case-9', job_id='progress-job'))
+        queue.shutdown()
+
+        received = []
+        message = task_events.get(timeout=1)
+        while message is not None:
+            received.append((message['event'], message['data'].get('status') or message['data']['step']))
+            message = task_events.get(timeout=0.2)
+        assert received == [
+            ('status', 'queued'), ('status', 'started'),
+            ('progress', 'analyzing'), ('progress', 'answering'),
+            ('status', 'finished'),
+        ]
+
+        step = case_events.get(timeout=1)
+        assert step['data'] == {'step': 'analyzing', 'progress': 30, 'nodeId': 'node-1'}
+        assert bus.latest(task_topic('progress-job'), 'progress')['data']['progress'] == 80
+
+    def test_report_progress_outside_task(self):
+        """测试不在后台任务中时只发布到文档主题"""
+        bus = progress_bus.get_progress_bus()
+        report_progress('parsing', 10, document_id='doc-1', status='PARSING')
+
+        latest = bus.latest('document:doc-1', 'progress')
+        assert latest['data'] == {'step': 'parsing', 'progress': 10, 'status': 'PARSING'}
+
+
+class TestQueueMetrics:
+    """任务队列指标测试类"""
+
+    def setup_method(self):
+        executed.clear()
+        cancelled.clear()
+        hang_release.clear()
+
+    def teardown_method(self):
+        hang_release.set()
+
+    def test_histogram_buckets_and_quantiles(self):
+        """测试直方图的累计桶计数和按桶上界估计的分位数"""
+        histogram = Histogram(buckets=(1, 5, 10))
+        for value in (0.5, 0.8, 3, 7, 60):
+            histogram.observe(value)
+
+        assert histogram.cumulative() == [(1, 2), (5, 3), (10, 4), (float('inf'), 5)]
+        assert histogram.quantile(0.5) == 5
+        assert histogram.quantile(0.99) == 10
+        assert histogram.to_dict()['buckets'] == {'1': 2, '5': 3, '10': 4, '+Inf': 5}
+        assert Histogram().quantile(0.5) is None
+
+    def test_queue_records_wait_run_and_outcomes(self):
+        """测试队列按任务函数和车道记录排队深度、等待与执行时长和结束状态"""
+        queue = ThreadPoolQueue(lanes={'ingestion': 1})
+        blocker = queue.enqueue(hang, 'blocker')
+        waiting = queue.enqueue(record_call, 'waiting')
+        cancelled_job = queue.enqueue(record_call, 'cancelled')
+        failing = queue.enqueue(fail_task, 'boom')
+
+        deadline = time.time() + 5
+        while blocker.get_status() != 'started' and time.time() < deadline:
+            time.sleep(0.02)
+        stats = queue.stats()
+        assert stats['queue_length'] == 3
+        assert stats['running_count'] == 1
+        assert [worker['state'] for worker in stats['workers']] == ['busy']
+
+        assert queue.cancel(cancelled_job.id) is True
+        time.sleep(0.1)
+        hang_release.set()
+        wait_for(waiting)
+        with pytest.raises(ValueError):
+            failing.future.result(timeout=5)
+
+        stats = queue.stats()
+        functions = {item['function']: item for item in stats['functions']}
+        assert stats['queue_length'] == 0
+        assert stats['failed_jobs_count'] == 1
+        assert [worker['state'] for worker in stats['workers']] == ['idle']
+
+        record = functions['record_call']
+        assert (record['enqueued'], record['finished'], record['cancelled']) == (2, 1, 1)
+        assert (record['queued'], record['running']) == (0, 0)
+        assert record['wait_seconds']['count'] == 1
+        assert record['wait_seconds']['sum'] >= 0.1
+        assert functions['hang']['run_seconds']['count'] == 1
+        assert functions['fail_task']['failure_rate'] == 1.0
+        queue.shutdown()
+
+    def test_timed_out_job_counted(self):
+        """测试超时任务计入超时率和执行时长"""
+        queue = ThreadPoolQueue(max_workers=1, watchdog_interval=0.05)
+        job = queue.enqueue(poll_forever, 'slow', job_timeout=0.1)
+        with pytest.raises(TaskCancelled):
+            job.future.result(timeout=5)
+
+        item = queue.stats()['functions'][0]
+        assert (item['function'], item['timed_out'], item['timeout_rate']) == ('poll_forever', 1, 1.0)
+        assert item['run_seconds']['sum'] >= 0.1
+        assert item['running'] == 0
+        queue.shutdown()
+
+    def test_render_prometheus(self):
+        """测试以 Prometheus 文本格式输出指标"""
+        metrics = QueueMetrics(buckets=(1, 10))
+        metrics.enqueued('parse_document', 'ingestion')
+        metrics.started('parse_document', 'ingestion', 0.5)
+        metrics.completed('parse_document', 'ingestion', 'finished', 12)
+
+        text = render_prometheus(metrics.snapshot(),
+                                 {'ingestion': {'workers': 2, 'queued': 0, 'running': 0, 'lent': 0}})
+
+        assert '# TYPE task_queue_wait_seconds histogram' in text
+        assert 'task_queue_lane_workers{lane="ingestion"} 2' in text
+        assert 'task_queue_wait_seconds_bucket{function="parse_document",lane="ingestion",le="1"} 1' in text
+        assert 'task_queue_run_seconds_bucket{function="parse_document",lane="ingestion",le="10"} 0' in text
+        assert 'task_queue_run_seconds_bucket{function="parse_document",lane="ingestion",le="+Inf"} 1' in text
+        assert ('task_queue_jobs_completed_total'
+                '{function="parse_document",lane="ingestion",outcome="finished"} 1') in text
+        assert text.endswith('\n')
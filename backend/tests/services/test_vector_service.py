@@ -83,6 +83,24 @@ class TestVectorServiceIntegration:
         assert result[1] == [0.4, 0.5, 0.6]
         mock_embeddings.embed_documents.assert_called_once_with(texts)
 
+    @patch('app.services.ai.embedding_service.DashScopeEmbeddings')
+    def test_embed_batch_degrades_when_circuit_open(self, mock_dashscope):
+        """测试向量化已熔断时批量向量化降级为零向量，不逐条重试"""
+        from app.utils.circuit_breaker import CircuitOpenError
+
+        mock_embeddings = MagicMock()
+        mock_dashscope.return_value = mock_embeddings
+        with patch.dict(os.environ, {'DASHSCOPE_API_KEY': 'test-key'}):
+            embedding_service = QwenEmbedding()
+
+        breaker = MagicMock()
+        breaker.protect.side_effect = CircuitOpenError('embedding:dashscope')
+        with patch('app.services.ai.embedding_service.get_breaker', return_value=breaker):
+            result = embedding_service.embed_batch(["文本1", "文本2"])
+
+        assert result == [[0.0] * 1024, [0.0] * 1024]
+        mock_embeddings.embed_query.assert_not_called()
+
     def test_schema_creation(self, vector_service):
         """测试Schema创建"""
         # 测试Schema创建方法是否存在且可调用
@@ -1,4 +1,4 @@
-import { api } from './client.js';
+import { api, openEventStream } from './client.js';
 
 // 获取案例列表
 export async function getCases(params = {}) {
@@ -117,3 +117,14 @@ export async function getNodeDetail(caseId, nodeId) {
   const r = await api.get(`/cases/${caseId}/nodes/${nodeId}`);
   return r.data;
 }
+
+// 订阅案例处理进度推送（snapshot / progress / node / end），返回关闭函数；浏览器不支持时返回null
+export function subscribeCaseEvents(caseId, handlers) {
+  return openEventStream(`/cases/${caseId}/events`, handlers);
+}
+
+// 订阅节点流式生成内容（snapshot / token / node / end）。token 事件的 offset 为片段在全文中的
+// 起始位置，按 text = text.slice(0, offset) + delta 拼接即可与快照中的部分内容衔接
+export function subscribeNodeEvents(caseId, nodeId, handlers) {
+  return openEventStream(`/cases/${caseId}/nodes/${nodeId}/events`, handlers);
+}
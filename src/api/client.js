@@ -89,6 +89,12 @@ api.interceptors.response.use(
         isRefreshing = false;
       }
     }
+    if (response.status === 429) {
+      // 准入控制拒绝：附带服务端建议的等待秒数，由调用方提示用户稍后重试
+      const retryAfter = parseInt(response.headers?.['retry-after'], 10);
+      error.retryAfter = Number.isFinite(retryAfter) ? retryAfter : null;
+      error.message = response.data?.error?.message || '请求过于频繁，请稍后再试';
+    }
     return Promise.reject(error);
   }
 );
@@ -124,3 +130,55 @@ export function onAuthLogout(handler) {
   window.addEventListener('auth:logout', handler);
   return () => window.removeEventListener('auth:logout', handler);
 }
+
+// 订阅服务端进度推送（SSE）。EventSource 无法设置请求头，每次连接前用访问令牌换取一次性推送票据，
+// 经查询参数传递；票据只能使用一次，断线后换取新票据重新连接。
+// handlers: { snapshot, progress, node, status, token, end, error }，返回关闭函数。
+export function openEventStream(path, handlers = {}, retryMs = 3000) {
+  if (typeof window === 'undefined' || !window.EventSource) return null;
+  let source = null;
+  let closed = false;
+  let retryTimer = null;
+
+  const connect = async () => {
+    let ticket;
+    try {
+      const r = await api.post('/auth/stream-ticket');
+      ticket = r.data?.data?.ticket;
+    } catch (e) {
+      handlers.error?.(e);
+    }
+    if (closed) return;
+    if (!ticket) {
+      retryTimer = setTimeout(connect, retryMs);
+      return;
+    }
+    source = new EventSource(`${baseURL}${path}?ticket=${encodeURIComponent(ticket)}`);
+
+    ['snapshot', 'progress', 'node', 'status', 'token'].forEach((name) => {
+      source.addEventListener(name, (e) => {
+        try { handlers[name]?.(JSON.parse(e.data)); } catch (_) {}
+      });
+    });
+    source.addEventListener('end', (e) => {
+      closed = true;
+      source.close();
+      let data = {};
+      try { data = JSON.parse(e.data); } catch (_) {}
+      handlers.end?.(data);
+    });
+    source.onerror = (e) => {
+      handlers.error?.(e);
+      // 浏览器自动重连会复用已失效的票据，改为换取新票据后重连
+      source.close();
+      if (!closed) retryTimer = setTimeout(connect, retryMs);
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retryTimer);
+    source?.close();
+  };
+}
@@ -1,4 +1,4 @@
-import { api } from './client.js';
+import { api, openEventStream } from './client.js';
 
 // 知识检索
 export async function searchKnowledge(params) {
@@ -80,6 +80,11 @@ export async function getDocumentProcessingStatus(docId) {
   return r.data;
 }
 
+// 订阅文档解析进度推送（snapshot / progress / status / end），返回关闭函数；浏览器不支持时返回null
+export function subscribeDocumentEvents(docId, handlers) {
+  return openEventStream(`/knowledge/documents/${docId}/events`, handlers);
+}
+
 // 获取解析任务状态
 export async function getParsingJobStatus(jobId) {
   const r = await api.get(`/knowledge/idp/jobs/${jobId}/status`);
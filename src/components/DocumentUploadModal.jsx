@@ -1,7 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Modal, Button, Upload, Select, Tag, Input, Space, Progress, message } from 'antd';
 import { InboxOutlined, CloseOutlined } from '@ant-design/icons';
-import { uploadDocument, parseDocumentWithIDP, getDocumentProcessingStatus, getParsingJobStatus } from '../api/knowledge';
+import { uploadDocument, parseDocumentWithIDP, getDocumentProcessingStatus, getParsingJobStatus, subscribeDocumentEvents } from '../api/knowledge';
 
 const { Dragger } = Upload;
 const { Option } = Select;
@@ -19,6 +19,7 @@ const DocumentUploadModal = ({ open, onClose, onSuccess }) => {
   const [parsingJobId, setParsingJobId] = useState(null);
   const uploadControllerRef = useRef(null);
   const progressIntervalRef = useRef(null);
+  const progressStreamRef = useRef(null);
 
   // 进度动画相关引用
   const uploadProgressRef = useRef(0);
@@ -117,6 +118,10 @@ const DocumentUploadModal = ({ open, onClose, onSuccess }) => {
         clearInterval(progressIntervalRef.current);
         progressIntervalRef.current = null;
       }
+      if (progressStreamRef.current) {
+        progressStreamRef.current();
+        progressStreamRef.current = null;
+      }
       if (uploadAnimRef.current) {
         clearInterval(uploadAnimRef.current);
         uploadAnimRef.current = null;
@@ -177,8 +182,49 @@ const DocumentUploadModal = ({ open, onClose, onSuccess }) => {
     }
   };
 
-  // 真实解析进度跟踪
+  // 根据解析最终状态结束跟踪，返回是否已结束
+  const finishParsing = (docStatus) => {
+    if (docStatus === 'INDEXED') {
+      message.success('文档解析完成！');
+      setTimeout(() => {
+        resetModal();
+        onSuccess && onSuccess();
+        onClose();
+      }, 1000);
+      return true;
+    }
+    if (docStatus === 'FAILED') {
+      message.error('文档解析失败');
+      setParsing(false);
+      return true;
+    }
+    return false;
+  };
+
+  // 真实解析进度跟踪：优先订阅服务端进度推送，浏览器不支持时轮询状态接口
   const trackRealParsingProgress = async (docId, jobId = null) => {
+    const closeStream = subscribeDocumentEvents(docId, {
+      snapshot: (data) => {
+        const docStatus = data?.documentStatus;
+        animateParseTo(data?.progress?.progress ?? getProgressFromStatus(docStatus));
+        finishParsing(docStatus);
+      },
+      progress: (data) => {
+        if (typeof data?.progress === 'number') animateParseTo(data.progress);
+      },
+      status: (data) => {
+        animateParseTo(data?.status === 'INDEXED' ? 100 : getProgressFromStatus(data?.status));
+        finishParsing(data?.status);
+      },
+      end: (data) => {
+        // 连接达到最长时长时重新订阅
+        if (data?.reason === 'max_duration') trackRealParsingProgress(docId, jobId);
+      },
+    });
+    if (closeStream) {
+      progressStreamRef.current = closeStream;
+      return;
+    }
     
     const checkProgress = async () => {
       try {
@@ -390,11 +436,15 @@ const DocumentUploadModal = ({ open, onClose, onSuccess }) => {
     setUploadedDocId(null);
     setParsingJobId(null);
     
-    // 清理进度轮询
+    // 清理进度轮询和进度推送
     if (progressIntervalRef.current) {
       clearInterval(progressIntervalRef.current);
       progressIntervalRef.current = null;
     }
+    if (progressStreamRef.current) {
+      progressStreamRef.current();
+      progressStreamRef.current = null;
+    }
 
     // 清理动画定时器并复位引用
     if (uploadAnimRef.current) {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate, Link } from 'react-router-dom';
-import { getCaseById, getCaseNodes, getCaseEdges, submitInteraction, getNodeDetail, submitFeedback } from '../api/cases.js';
+import { getCaseById, getCaseNodes, getCaseEdges, submitInteraction, getNodeDetail, submitFeedback, subscribeCaseEvents } from '../api/cases.js';
 import { uploadFile } from '../api/files.js';
 import { analyzeLog, getAnalysisResult } from '../api/analysis.js';
 import DiagnosticCanvas from '../components/DiagnosticCanvas.jsx';
@@ -34,13 +34,28 @@ export default function CaseDetailRefactored() {
   useEffect(() => {
     if (id && id !== 'undefined') {
       loadCaseData();
-      // 设置定时刷新，检查新节点
-      const interval = setInterval(() => {
-        if (!processing && id !== 'undefined') {
-          refreshNodes();
-        }
-      }, 5000);
-      return () => clearInterval(interval);
+      // 订阅案例进度推送，节点变化时刷新；连接达到最长时长后重新订阅
+      let closeStream = null;
+      let interval = null;
+      const subscribe = () => {
+        closeStream = subscribeCaseEvents(id, {
+          node: () => { if (!processing) refreshNodes(); },
+          end: (data) => { if (data?.reason === 'max_duration') subscribe(); },
+        });
+        return closeStream;
+      };
+      if (!subscribe()) {
+        // 浏览器不支持SSE时退回定时刷新
+        interval = setInterval(() => {
+          if (!processing && id !== 'undefined') {
+            refreshNodes();
+          }
+        }, 5000);
+      }
+      return () => {
+        if (closeStream) closeStream();
+        if (interval) clearInterval(interval);
+      };
     } else if (id === 'undefined') {
       // 如果ID无效，显示错误并返回案例列表
       setError('案例ID无效');
@@ -178,8 +193,37 @@ export default function CaseDetailRefactored() {
         }, 500);
       }
 
-      // 定向轮询：等待处理中的节点完成（避免长期“运行中”）
+      // 等待处理中的节点完成（避免长期“运行中”）：优先使用进度推送，不支持时定向轮询
+      let closeWatch = null;
       if (processingNodeId) {
+        let watchTimer = null;
+        let finished = false;
+        const finishWatch = async () => {
+          if (finished) return;
+          finished = true;
+          if (closeWatch) closeWatch();
+          clearTimeout(watchTimer);
+          await refreshNodes();
+          setProcessing(false);
+        };
+        closeWatch = subscribeCaseEvents(id, {
+          snapshot: (data) => {
+            const pending = (data?.processingNodes || []).some((n) => n.id === processingNodeId);
+            if (!pending) finishWatch();
+          },
+          node: (data) => {
+            if (data?.nodeId === processingNodeId && data?.status !== 'PROCESSING') finishWatch();
+          },
+        });
+        if (closeWatch) {
+          watchTimer = setTimeout(() => {
+            closeWatch();
+            setProcessing(false);
+          }, 120000);
+        }
+      }
+
+      if (processingNodeId && !closeWatch) {
         const startTs = Date.now();
         const timeoutMs = 120000; // 最多轮询2分钟
         const pollIntervalMs = 2000;
@@ -207,7 +251,7 @@ export default function CaseDetailRefactored() {
 
         // 稍等片刻启动轮询，给后端任务提交/事务提交一些时间
         setTimeout(pollProcessing, 1000);
-      } else {
+      } else if (!processingNodeId) {
         // 无处理节点ID，直接结束processing
         setProcessing(false);
       }